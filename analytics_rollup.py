@@ -0,0 +1,486 @@
+"""
+Daily Analytics Rollups for Ather CRM System
+This module maintains the daily lead fact tables of the admin analytics page,
+so it can answer any period from rollup rows instead of reading
+``lead_master`` and ``walkin_table`` on every request. Each rollup is keyed
+only by the dimensions the page groups it by, keeping it far smaller than the
+leads it summarizes:
+
+- ``analytics_daily_rollup``: day, source, CRE, PS, branch and status
+- ``analytics_campaign_rollup``: campaign and source, with won/lost leads
+  dated by their closure (``metric_day``/``kind``)
+- ``analytics_profile_rollup``: lead category and model interested
+
+Every fact row belongs to the creation day of the leads it summarizes
+(``lead_day``). A background refresher scans the source tables for rows whose
+``updated_at`` (or ``created_at``) moved past the stored watermark and rebuilds
+only the ``lead_day`` partitions those rows belong to. Every update is seen
+because the set_updated_at trigger of database_optimization.sql stamps
+``updated_at`` (reassignments included). Deleted rows leave nothing to scan,
+so the refresher also rebuilds a trailing window of recent days every hour,
+which drops their facts; older deletions need a --rebuild.
+
+One refresher at a time rebuilds a source table: it holds a lease (a claim on
+the table's ``analytics_rollup_state`` row, renewed before every partition),
+and the facts it did not write in this run are deleted.
+
+Can be run standalone (python analytics_rollup.py [--rebuild]) or scheduled
+inside the web app with start_rollup_refresher().
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import logging
+
+import pandas as pd
+
+from query_utils import date_range_hook, iter_table_rows, quote_logic_value
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATE_TABLE = 'analytics_rollup_state'
+
+# Fact kinds: 'created' rows are dated by lead creation, 'won'/'lost' rows by
+# the won/lost timestamp (the campaign table counts closures when they happen)
+KIND_CREATED, KIND_WON, KIND_LOST = 'created', 'won', 'lost'
+
+
+class Rollup(NamedTuple):
+    """A rollup table: the ``kinds`` of lead records it sums, per ``dimensions``, into ``metrics``"""
+    table: str
+    dimensions: Tuple[str, ...]
+    metrics: Tuple[str, ...]
+    kinds: Tuple[str, ...] = (KIND_CREATED,)
+
+
+DAILY_ROLLUP = Rollup(
+    'analytics_daily_rollup',
+    ('lead_day', 'source_table', 'source', 'cre_name', 'ps_name', 'branch', 'final_status'),
+    ('leads', 'won', 'lost', 'pending_open', 'called', 'calls', 'test_drives', 'response_days_sum',
+     'response_count', 'hot', 'warm', 'cold'),
+)
+CAMPAIGN_ROLLUP = Rollup(
+    'analytics_campaign_rollup',
+    ('lead_day', 'metric_day', 'kind', 'source_table', 'source', 'campaign'),
+    ('leads', 'pending_open'),
+    (KIND_CREATED, KIND_WON, KIND_LOST),
+)
+PROFILE_ROLLUP = Rollup(
+    'analytics_profile_rollup',
+    ('lead_day', 'source_table', 'lead_category', 'model_interested'),
+    ('leads',),
+)
+ROLLUPS = (DAILY_ROLLUP, CAMPAIGN_ROLLUP, PROFILE_ROLLUP)
+
+CALL_DATE_FIELDS = tuple(f'{n}_call_date' for n in ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh'))
+
+LEAD_FIELDS = ('id, date, created_at, source, campaign, cre_name, ps_name, branch, lead_category, model_interested, '
+               'final_status, won_timestamp, lost_timestamp, test_drive_done, ' + ', '.join(CALL_DATE_FIELDS))
+WALKIN_FIELDS = 'id, created_at, status, ps_assigned, branch, lead_category, model_interested'
+
+# Rows changed shortly before the watermark may commit late; re-scanning a
+# small overlap is harmless because partitions are rebuilt idempotently
+WATERMARK_OVERLAP = timedelta(minutes=5)
+UPSERT_BATCH_SIZE = 500
+# A refresher that stops renewing its claim (crashed, or stuck on one
+# partition for this long) is taken over by the next one
+REBUILD_LEASE = timedelta(minutes=10)
+
+# Lead days rebuilt in full every TRAILING_REBUILD_SECONDS, so rows deleted
+# in that window drop out of the rollup
+TRAILING_REBUILD_DAYS = 45
+TRAILING_REBUILD_SECONDS = 3600
+
+
+def _day(value: Any) -> Optional[str]:
+    """Date part (YYYY-MM-DD) of a date or timestamp value, or None if missing/invalid"""
+    if not value:
+        return None
+    day = str(value)[:10]
+    try:
+        datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return day
+
+
+def _dim(value: Any) -> str:
+    # Dimension columns are NOT NULL so they can take part in the unique key
+    return '' if value is None else str(value)
+
+
+def _is_yes(value: Any) -> bool:
+    return str(value).lower() in ('true', 'yes', '1')
+
+
+class _FactAccumulator:
+    """Sum the metric values of lead records per dimension key of a rollup"""
+
+    def __init__(self, rollup: Rollup):
+        self.rollup = rollup
+        self.facts: Dict[Tuple[str, ...], Dict[str, int]] = {}
+
+    def add(self, record: Dict[str, Any]) -> None:
+        if record['kind'] not in self.rollup.kinds:
+            return
+        key = tuple(_dim(record.get(name)) for name in self.rollup.dimensions)
+        fact = self.facts.get(key)
+        if fact is None:
+            fact = self.facts[key] = dict.fromkeys(self.rollup.metrics, 0)
+        for name in self.rollup.metrics:
+            fact[name] += record.get(name, 0)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.rollup.dimensions, key), **metrics) for key, metrics in self.facts.items()]
+
+
+def lead_records(leads: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    One record per ``lead_master`` row (kind 'created'), plus one per won or
+    lost timestamp, with every dimension and metric any rollup takes
+    """
+    for lead in leads:
+        # Partitions are rebuilt by created_at range, so leads without it are not rolled up
+        lead_day = _day(lead.get('created_at'))
+        if not lead_day:
+            continue
+        final_status = (lead.get('final_status') or '').strip()
+        category = (lead.get('lead_category') or '').strip().lower()
+        dims = {
+            'lead_day': lead_day, 'source_table': 'lead_master', 'source': lead.get('source'),
+            'campaign': lead.get('campaign'), 'cre_name': lead.get('cre_name'), 'ps_name': lead.get('ps_name'),
+            'branch': lead.get('branch'), 'final_status': lead.get('final_status'),
+            'lead_category': lead.get('lead_category'), 'model_interested': lead.get('model_interested'),
+        }
+        won_day = _day(lead.get('won_timestamp'))
+        lost_day = _day(lead.get('lost_timestamp'))
+
+        response_days_sum = response_count = 0
+        first_call_day = _day(lead.get('first_call_date'))
+        lead_date = _day(lead.get('date'))
+        if first_call_day and lead_date:
+            response_days_sum = (date.fromisoformat(first_call_day) - date.fromisoformat(lead_date)).days
+            response_count = 1
+
+        yield dict(
+            dims, metric_day=lead_day, kind=KIND_CREATED,
+            leads=1,
+            won=int(final_status.lower() == 'won'),
+            lost=int(final_status.lower() == 'lost'),
+            pending_open=int(final_status == 'Pending' and not won_day and not lost_day),
+            called=int(bool(lead.get('first_call_date'))),
+            calls=sum(1 for field in CALL_DATE_FIELDS if lead.get(field)),
+            test_drives=int(_is_yes(lead.get('test_drive_done'))),
+            response_days_sum=response_days_sum,
+            response_count=response_count,
+            hot=int(category == 'hot'),
+            warm=int(category == 'warm'),
+            cold=int(category == 'cold'),
+        )
+        if won_day:
+            yield dict(dims, metric_day=won_day, kind=KIND_WON, leads=1)
+        if lost_day:
+            yield dict(dims, metric_day=lost_day, kind=KIND_LOST, leads=1)
+
+
+def walkin_records(walkins: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """One record (kind 'created') per ``walkin_table`` row"""
+    for walkin in walkins:
+        lead_day = _day(walkin.get('created_at'))
+        if not lead_day:
+            continue
+        status = walkin.get('status')
+        category = (walkin.get('lead_category') or '').strip().lower()
+        yield {
+            'lead_day': lead_day, 'metric_day': lead_day, 'kind': KIND_CREATED, 'source_table': 'walkin_table',
+            'ps_name': walkin.get('ps_assigned'), 'branch': walkin.get('branch'), 'final_status': status,
+            'lead_category': walkin.get('lead_category'), 'model_interested': walkin.get('model_interested'),
+            'leads': 1,
+            'won': int(status == 'Won'),
+            'lost': int(status == 'Lost'),
+            'pending_open': int(status == 'Pending'),
+            'hot': int(category == 'hot'),
+            'warm': int(category == 'warm'),
+            'cold': int(category == 'cold'),
+        }
+
+
+# source table -> (projection, record builder)
+ROLLUP_SOURCES = {
+    'lead_master': (LEAD_FIELDS, lead_records),
+    'walkin_table': (WALKIN_FIELDS, walkin_records),
+}
+
+
+def build_facts(source_table: str, rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Fact rows of every rollup (by rollup table) for rows of ``source_table``, in one pass"""
+    accumulators = [_FactAccumulator(rollup) for rollup in ROLLUPS]
+    for record in ROLLUP_SOURCES[source_table][1](rows):
+        for acc in accumulators:
+            acc.add(record)
+    return {acc.rollup.table: acc.rows() for acc in accumulators}
+
+
+def _day_runs(days: Iterable[str]) -> List[Tuple[date, date]]:
+    """Collapse a set of days into runs of consecutive days [(start, end), ...]"""
+    runs = []
+    for day in sorted(date.fromisoformat(d) for d in set(days)):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def claim_rebuild(supabase_client, source_table: str, owner: str) -> bool:
+    """
+    Take, or renew, the lease on rebuilding the rollups of ``source_table``
+    for REBUILD_LEASE. False while another refresher holds it.
+
+    The claim is one conditional UPDATE of the table's state row, so two
+    refreshers can never both win it; the row is created on first use.
+    """
+    now = datetime.now(timezone.utc)
+    claim = {'claimed_by': owner, 'claimed_until': (now + REBUILD_LEASE).isoformat()}
+    query = supabase_client.table(STATE_TABLE).update(claim).eq('source_table', source_table)
+    query.params = query.params.add(
+        'or', f'(claimed_by.eq.{quote_logic_value(owner)},claimed_until.is.null,'
+              f'claimed_until.lt.{quote_logic_value(now.isoformat())})'
+    )
+    if query.execute().data:
+        return True
+    if _get_state(supabase_client, source_table) is not None:
+        return False
+    try:
+        supabase_client.table(STATE_TABLE).insert(dict(claim, source_table=source_table)).execute()
+    except Exception:
+        # Another refresher created the row first
+        return False
+    return True
+
+
+def release_rebuild(supabase_client, source_table: str, owner: str) -> None:
+    """Give up the lease taken by claim_rebuild (no-op when it was taken over)"""
+    supabase_client.table(STATE_TABLE).update({'claimed_by': None, 'claimed_until': None}) \
+        .eq('source_table', source_table).eq('claimed_by', owner).execute()
+
+
+def rebuild_partitions(supabase_client, source_table: str, days: Iterable[str], owner: str,
+                       run_stamp: Optional[str] = None) -> int:
+    """
+    Recompute the rollup facts of ``source_table`` for the given lead days,
+    holding the claim_rebuild lease of ``owner`` (renewed before every run of
+    consecutive days; RuntimeError when it was lost).
+
+    New facts are stamped ``run_stamp`` and upserted first, then the facts of
+    the same partitions with any other stamp are deleted, so readers never see
+    a partition empty. Returns the number of fact rows written.
+    """
+    run_stamp = run_stamp or datetime.now().astimezone().isoformat()
+    written = 0
+
+    for start, end in _day_runs(days):
+        if not claim_rebuild(supabase_client, source_table, owner):
+            raise RuntimeError(f"lost the {source_table} rollup lease to another refresher")
+        rows = iter_table_rows(supabase_client, source_table, None, ROLLUP_SOURCES[source_table][0],
+                               query_hook=date_range_hook('created_at', start, end))
+        facts_by_table = build_facts(source_table, rows)
+        for rollup in ROLLUPS:
+            facts = [dict(fact, refreshed_at=run_stamp) for fact in facts_by_table[rollup.table]]
+            for i in range(0, len(facts), UPSERT_BATCH_SIZE):
+                supabase_client.table(rollup.table).upsert(
+                    facts[i:i + UPSERT_BATCH_SIZE], on_conflict=','.join(rollup.dimensions), returning='minimal'
+                ).execute()
+            written += len(facts)
+
+            supabase_client.table(rollup.table).delete(returning='minimal') \
+                .eq('source_table', source_table) \
+                .gte('lead_day', start.isoformat()).lte('lead_day', end.isoformat()) \
+                .neq('refreshed_at', run_stamp).execute()
+    return written
+
+
+def _get_state(supabase_client, source_table: str) -> Optional[Dict[str, Any]]:
+    result = supabase_client.table(STATE_TABLE).select('source_table, watermark') \
+        .eq('source_table', source_table).limit(1).execute()
+    return result.data[0] if result.data else None
+
+
+def _get_watermark(supabase_client, source_table: str) -> Optional[str]:
+    state = _get_state(supabase_client, source_table)
+    return state.get('watermark') if state else None
+
+
+def _set_watermark(supabase_client, source_table: str, watermark: Optional[str]) -> None:
+    # The state row exists: it holds this refresher's claim
+    supabase_client.table(STATE_TABLE).update({
+        'watermark': watermark,
+        'refreshed_at': datetime.now().astimezone().isoformat()
+    }).eq('source_table', source_table).execute()
+
+
+def _changed_days(supabase_client, source_table: str, since: pd.Timestamp) -> Tuple[set, Optional[pd.Timestamp]]:
+    """Creation days of rows updated or created after ``since``, and the newest change seen"""
+    days = set()
+    newest = None
+    since_str = since.isoformat()
+    for column in ('updated_at', 'created_at'):
+        rows = iter_table_rows(supabase_client, source_table, None, 'id, created_at, updated_at', order_by=column,
+                               query_hook=lambda query, column=column: query.gt(column, since_str))
+        for row in rows:
+            lead_day = _day(row.get('created_at'))
+            if lead_day:
+                days.add(lead_day)
+            changed_at = pd.to_datetime(row.get(column), errors='coerce', utc=True)
+            if pd.notna(changed_at) and (newest is None or changed_at > newest):
+                newest = changed_at
+    return days, newest
+
+
+def refresh_rollups(supabase_client, full: bool = False, trailing_days: int = 0) -> Dict[str, Any]:
+    """
+    Bring the rollup tables up to date with the source tables.
+
+    Without a stored watermark (first run) or with ``full`` every partition is
+    rebuilt; otherwise only the partitions of rows changed since the watermark,
+    plus every lead day of the last ``trailing_days`` days (today included).
+    A source table another refresher is rebuilding is skipped. Returns the
+    rebuilt day count and fact rows written per source table.
+    """
+    start_time = time.time()
+    summary = {}
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    for source_table in ROLLUP_SOURCES:
+        if not claim_rebuild(supabase_client, source_table, owner):
+            summary[source_table] = {'skipped': 'rebuilt by another refresher'}
+            continue
+        try:
+            run_stamp = datetime.now().astimezone().isoformat()
+            watermark = None if full else _get_watermark(supabase_client, source_table)
+
+            if watermark is None:
+                since = pd.Timestamp('1970-01-01', tz='UTC')
+            else:
+                since = pd.to_datetime(watermark, utc=True) - WATERMARK_OVERLAP
+            days, newest = _changed_days(supabase_client, source_table, since)
+            if trailing_days > 0:
+                today = date.today()
+                days |= {(today - timedelta(days=offset)).isoformat() for offset in range(trailing_days)}
+
+            written = rebuild_partitions(supabase_client, source_table, days, owner, run_stamp) if days else 0
+            if full:
+                # Partitions whose source rows were all deleted are only dropped by a full rebuild
+                for rollup in ROLLUPS:
+                    supabase_client.table(rollup.table).delete(returning='minimal') \
+                        .eq('source_table', source_table).neq('refreshed_at', run_stamp).execute()
+
+            new_watermark = newest.isoformat() if newest is not None else watermark
+            _set_watermark(supabase_client, source_table, new_watermark)
+            summary[source_table] = {'days': len(days), 'facts': written, 'watermark': new_watermark}
+        finally:
+            release_rebuild(supabase_client, source_table, owner)
+
+    summary['execution_time'] = round(time.time() - start_time, 3)
+    logger.info(f"analytics rollup refreshed: {summary}")
+    return summary
+
+
+def load_rollup_facts(supabase_client, rollup: Rollup, start_date: Optional[date] = None,
+                      end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Fact rows of ``rollup`` whose ``metric_day`` (``lead_day`` for rollups
+    without one) lies in [start_date, end_date] (open bounds when None)
+    """
+    day_column = 'metric_day' if 'metric_day' in rollup.dimensions else 'lead_day'
+
+    def hook(query):
+        if start_date:
+            query = query.gte(day_column, start_date.isoformat())
+        if end_date:
+            query = query.lte(day_column, end_date.isoformat())
+        return query
+
+    return list(iter_table_rows(supabase_client, rollup.table, None, ', '.join(rollup.dimensions + rollup.metrics),
+                                order_by='id', query_hook=hook))
+
+
+def rollups_ready(supabase_client) -> bool:
+    """True once every source table has been rolled up at least once"""
+    try:
+        result = supabase_client.table(STATE_TABLE).select('source_table, watermark').execute()
+    except Exception as e:
+        logger.warning(f"{STATE_TABLE} not readable, analytics rollups unavailable: {e}")
+        return False
+    built = {row.get('source_table') for row in result.data or [] if row.get('watermark')}
+    return all(source_table in built for source_table in ROLLUP_SOURCES)
+
+
+def load_analytics_facts(supabase_client, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         rollups: Iterable[Rollup] = ROLLUPS) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fact rows of ``rollups`` (by rollup table) for [start_date, end_date]
+    from the rollup tables, or computed from the source tables while the
+    rollups have not been built yet.
+    """
+    rollups = list(rollups)
+    if rollups_ready(supabase_client):
+        return {rollup.table: load_rollup_facts(supabase_client, rollup, start_date, end_date) for rollup in rollups}
+
+    start_day = start_date.isoformat() if start_date else None
+    end_day = end_date.isoformat() if end_date else None
+    facts = {rollup.table: [] for rollup in ROLLUPS}
+    for source_table, (fields, _) in ROLLUP_SOURCES.items():
+        for table, table_facts in build_facts(source_table, iter_table_rows(supabase_client, source_table, None,
+                                                                            fields)).items():
+            facts[table].extend(table_facts)
+
+    def in_window(fact):
+        day = fact.get('metric_day', fact['lead_day'])
+        return (start_day is None or day >= start_day) and (end_day is None or day <= end_day)
+
+    return {rollup.table: [fact for fact in facts[rollup.table] if in_window(fact)] for rollup in rollups}
+
+
+def start_rollup_refresher(supabase_client, interval_seconds: int = 300,
+                           trailing_days: int = TRAILING_REBUILD_DAYS,
+                           trailing_interval_seconds: int = TRAILING_REBUILD_SECONDS) -> threading.Thread:
+    """
+    Refresh the rollups now and then every ``interval_seconds`` in a daemon
+    thread, rebuilding the last ``trailing_days`` days as well every
+    ``trailing_interval_seconds``.
+
+    Under eventlet's monkey patching the thread is a green thread.
+    """
+    def loop():
+        last_trailing = None
+        while True:
+            try:
+                trailing_due = last_trailing is None or time.monotonic() - last_trailing >= trailing_interval_seconds
+                refresh_rollups(supabase_client, trailing_days=trailing_days if trailing_due else 0)
+                if trailing_due:
+                    last_trailing = time.monotonic()
+            except Exception as e:
+                logger.error(f"analytics rollup refresh failed: {e}")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name='analytics_rollup', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    client = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_ANON_KEY'])
+    print(refresh_rollups(client, full='--rebuild' in sys.argv))
@@ -298,10 +298,10 @@ def set_test_drive_state(lead_uid: str, actor_role: str, actor_name: str, new_va
             s = str(new_value_raw).strip().lower()
             if s in ['true', 'yes', '1', 'y']: desired = True
             elif s in ['false', 'no', '0', 'n', '']: desired = False
+        current = get_test_drive_state(lead_uid)
         if desired is None:
-            return {'success': True, 'locked': get_test_drive_state(lead_uid)['locked'], 'value': get_test_drive_state(lead_uid)['value'], 'message': 'No change'}
+            return {'success': True, 'locked': current['locked'], 'value': current['value'], 'message': 'No change'}
 
-        current = get_test_drive_state(lead_uid)
         if current['locked']:
             # Already locked - cannot change
             return {'success': False, 'locked': True, 'value': current['value'], 'message': 'Test Drive status is locked and cannot be changed'}
@@ -4254,6 +4254,45 @@ import math
 # Import optimized operations for faster lead updates
 from optimized_lead_operations import create_optimized_operations
 
+# Import shared query helpers (paginated reads, COUNT queries, request memo)
+from query_utils import (
+    iter_table_chunks, count_rows, count_many, RequestQueryCache, TTLCache, branch_write_invalidator, track_table_writes,
+    date_range_hook, first_date_range_hook, parse_day, resolve_date_window
+)
+
+# Import daily follow-up rollover job
+from followup_rollover import start_rollover_scheduler
+
+# Import shared lead bucketing engine for CRE/PS dashboards
+from lead_buckets import classify_cre_leads, classify_ps_leads, classify_walkin_leads, dates_within
+
+# Import single-pass branch analytics aggregator
+from branch_analytics import build_branch_analytics
+from cre_analytics import build_cre_analytics
+from export_utils import (
+    COLUMNAR_FORMATS, XLSX_MIMETYPE, iter_csv, row_values, send_temporary_file, stream_csv_response,
+    stream_text_response, write_columnar_file, write_xlsx_file
+)
+from export_cache import DEFAULT_CACHE_DIR, ExportCache, send_cached_file, table_data_version
+from uid_allocator import APP_SOURCE_CODES, format_uid, get_uid_allocator
+from lead_upload import UploadJobs, run_lead_upload
+
+# Import daily analytics rollups
+from analytics_rollup import (
+    CAMPAIGN_ROLLUP, DAILY_ROLLUP, KIND_CREATED, KIND_LOST, KIND_WON, PROFILE_ROLLUP, load_analytics_facts,
+    start_rollup_refresher
+)
+
+# Import columnar lead snapshots for the analytics endpoints
+from lead_snapshot import create_lead_snapshots, day_window_mask, start_snapshot_refresher
+from source_funnel import DEFAULT_SOURCES as FUNNEL_SOURCES, build_source_funnel
+
+# Import paginated dashboard tab builders
+from dashboard_tabs import (
+    CRE_COUNT_TABS, CRE_TAB_DATE_FIELDS, CRE_TABS, PS_COUNT_TABS, PS_TABS, InvalidTabRequest, column_options,
+    cre_tab_sources, load_tab_page, narrow_sources, parse_filter_args, parse_page_args, ps_tab_sources, tab_counts
+)
+
 # Add this instead:
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
@@ -4261,7 +4300,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from flask import send_file
+from flask import copy_current_request_context, send_file
 import tempfile
 import matplotlib
 matplotlib.use('Agg')  # For headless environments
@@ -4340,6 +4379,72 @@ except Exception as e:
     print(f"❌ Error initializing Supabase client: {e}")
     raise
 
+# Request-scoped memo for duplicated reads; writes to a table invalidate its entries
+request_query_cache = RequestQueryCache()
+track_table_writes(supabase, request_query_cache.invalidate)
+
+# Branch head KPI counts, shared by all sessions of this process
+BRANCH_KPI_TABLES = {'ps_followup_master': 'ps_branch', 'walkin_table': 'branch', 'activity_leads': 'location'}
+branch_kpi_cache = TTLCache(ttl_seconds=300)
+# Branch analytics sections keyed by (branch, date_from, date_to)
+branch_analytics_cache = TTLCache(ttl_seconds=60, max_entries=256)
+
+
+# Drop cached branch KPIs and analytics once a write to one of the KPI tables commits
+invalidate_branch_kpis = branch_write_invalidator(BRANCH_KPI_TABLES, [branch_kpi_cache, branch_analytics_cache])
+track_table_writes(supabase, invalidate_branch_kpis, pass_payload=True)
+
+# Roll overdue follow-up dates forward once a day (replaces per-lead updates on dashboard load)
+try:
+    start_rollover_scheduler(supabase)
+    print("✅ Follow-up rollover scheduler started")
+except Exception as e:
+    print(f"❌ Error starting follow-up rollover scheduler: {e}")
+
+# Keep the admin analytics rollups in sync with lead_master/walkin_table changes
+try:
+    start_rollup_refresher(supabase)
+    print("✅ Analytics rollup refresher started")
+except Exception as e:
+    print(f"❌ Error starting analytics rollup refresher: {e}")
+
+# In-process columnar snapshots of lead_master/ps_followup_master for the
+# analytics endpoints, refreshed from updated_at deltas; local writes make the
+# next read pick up changes first
+lead_snapshots = create_lead_snapshots()
+lead_snapshot = lead_snapshots['lead_master']
+ps_followup_snapshot = lead_snapshots['ps_followup_master']
+
+
+def mark_snapshot_stale(table_name, method_name, payload):
+    snapshot = lead_snapshots.get(table_name)
+    if snapshot is not None:
+        # Updates are polled by updated_at; deleted rows only go away on a full reload
+        snapshot.mark_stale(full=method_name == 'delete')
+
+
+track_table_writes(supabase, mark_snapshot_stale, pass_payload=True)
+try:
+    start_snapshot_refresher(supabase, lead_snapshots.values())
+    print("✅ Lead snapshot refresher started")
+except Exception as e:
+    print(f"❌ Error starting lead snapshot refresher: {e}")
+
+# Finished lead exports on local disk, keyed by filters, format and the
+# lead_master data version; bounded in size with LRU eviction
+export_cache = ExportCache(
+    os.environ.get('EXPORT_CACHE_DIR', DEFAULT_CACHE_DIR),
+    max_bytes=int(os.environ.get('EXPORT_CACHE_MAX_MB', '1024')) * 1024 * 1024
+)
+
+# UID sequence numbers, leased in blocks from the lead_uid_seq database sequence
+uid_allocator = get_uid_allocator(supabase)
+
+# Background lead upload jobs of this process, by job id (progress is also pushed over Socket.IO).
+# Kept in memory and dropped an hour after they finish: the app runs as one worker process
+# (see lead_upload.UploadJobs), like the Socket.IO events the upload page listens to
+upload_jobs = UploadJobs()
+
 # Initialize optimized operations for faster lead updates
 try:
     optimized_ops = create_optimized_operations(supabase)
@@ -4473,151 +4578,14 @@ def send_email_to_ps(ps_email, ps_name, lead_data, cre_name):
         return False
 
 
-def read_csv_file(filepath):
-    """Read CSV file and return list of dictionaries with memory optimization"""
-    data = []
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            for row_num, row in enumerate(csv_reader):
-                if row_num >= 10000:  # Limit to 10,000 rows
-                    print(f"Warning: File contains more than 10,000 rows. Only processing first 10,000.")
-                    break
-
-                # Clean and validate row data
-                cleaned_row = {}
-                for key, value in row.items():
-                    if key and value:  # Only include non-empty keys and values
-                        cleaned_row[key.strip()] = str(value).strip()
-
-                if cleaned_row:  # Only add non-empty rows
-                    data.append(cleaned_row)
-
-                # Memory management for large files
-                if row_num % 1000 == 0 and row_num > 0:
-                    print(f"Processed {row_num} rows...")
-
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        raise
-
-    return data
-
-
-def read_excel_file(filepath):
-    """Read Excel file and return list of dictionaries with memory optimization"""
-    data = []
-    try:
-        workbook = openpyxl.load_workbook(filepath, read_only=True)  # Read-only mode for memory efficiency
-        sheet = workbook.active
-
-        # Get headers from first row
-        headers = []
-        if sheet and sheet[1]:
-            for cell in sheet[1]:
-                if cell and cell.value:
-                    headers.append(str(cell.value).strip())
-                else:
-                    headers.append(None)
-
-        # Read data rows with limit
-        row_count = 0
-        if sheet:
-            for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                if row_count >= 10000:  # Limit to 10,000 rows
-                    print(f"Warning: File contains more than 10,000 rows. Only processing first 10,000.")
-                    break
-
-                row_data = {}
-                has_data = False
-
-                for i, value in enumerate(row):
-                    if i < len(headers) and headers[i] and value is not None:
-                        row_data[headers[i]] = str(value).strip()
-                        has_data = True
-
-                if has_data:  # Only add rows with actual data
-                    data.append(row_data)
-                    row_count += 1
-
-                # Memory management for large files
-                if row_count % 1000 == 0 and row_count > 0:
-                    print(f"Processed {row_count} rows...")
-
-        workbook.close()  # Explicitly close workbook
-
-    except Exception as e:
-        print(f"Error reading Excel file: {e}")
-        raise
-
-    return data
-
-
-def batch_insert_leads(leads_data, batch_size=100):
-    """Insert leads in batches to avoid overwhelming the database"""
-    total_inserted = 0
-    total_batches = (len(leads_data) + batch_size - 1) // batch_size
-
-    print(f"Starting batch insert: {len(leads_data)} leads in {total_batches} batches")
-
-    for i in range(0, len(leads_data), batch_size):
-        batch = leads_data[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-
-        try:
-            # Insert batch
-            result = supabase.table('lead_master').insert(batch).execute()
-
-            if result.data:
-                batch_inserted = len(result.data)
-                total_inserted += batch_inserted
-                print(f"Batch {batch_num}/{total_batches}: Inserted {batch_inserted} leads")
-            else:
-                print(f"Batch {batch_num}/{total_batches}: No data returned from insert")
-
-            # Small delay to prevent overwhelming the database
-            time.sleep(0.1)  # CHANGED from eventlet.sleep(0.1)
-
-            # Force garbage collection every 10 batches
-            if batch_num % 10 == 0:
-                gc.collect()
-
-        except Exception as e:
-            print(f"Error inserting batch {batch_num}: {e}")
-            # Continue with next batch instead of failing completely
-            continue
-
-    print(f"Batch insert completed: {total_inserted} total leads inserted")
-    return total_inserted
-
-
-def generate_uid(source, mobile_number, sequence):
-    """Generate UID based on source, mobile number, and sequence"""
-    source_map = {
-        'Google': 'G',
-        'Meta': 'M',
-        'Affiliate': 'A',
-        'Know': 'K',
-        'Whatsapp': 'W',
-        'Tele': 'T',
-        'Activity': 'AC',
-        'Walk-in': 'W',  # Walk-in mapping
-        'Walkin': 'W'    # Walkin mapping (without hyphen)
-    }
-
-    source_char = source_map.get(source, 'X')
-
-    # Get sequence character (A-Z)
-    sequence_char = chr(65 + (sequence % 26))  # A=65 in ASCII
-
-    # Get last 4 digits of mobile number
-    mobile_str = str(mobile_number).replace(' ', '').replace('-', '')
-    mobile_last4 = mobile_str[-4:] if len(mobile_str) >= 4 else mobile_str.zfill(4)
-
-    # Generate sequence number (0001, 0002, etc.)
-    seq_num = f"{(sequence % 9999) + 1:04d}"
-
-    return f"{source_char}{sequence_char}-{mobile_last4}-{seq_num}"
+def generate_uid(source, mobile_number, sequence=None):
+    """
+    Generate UID based on source, mobile number, and sequence. Without a
+    sequence, the next one is taken from the UID allocator.
+    """
+    if sequence is None:
+        sequence = uid_allocator.next()
+    return format_uid(APP_SOURCE_CODES.get(source, 'X'), mobile_number, sequence)
 
 
 def get_next_call_info(lead_data):
@@ -4654,28 +4622,41 @@ def get_next_ps_call_info(ps_data):
     return next_call, completed_calls
 
 
-def get_accurate_count(table_name, filters=None):
-    """Get accurate count from Supabase table"""
+def get_accurate_count(table_name, filters=None, count='exact'):
+    """Get accurate count from Supabase table using a COUNT query (no rows fetched)"""
     try:
-        query = supabase.table(table_name).select('id')
+        return count_rows(supabase, table_name, filters, count)
 
-        if filters:
-            for key, value in filters.items():
-                if value is not None:
-                    query = query.eq(key, value)
+    except Exception as e:
+        print(f"Error getting count from {table_name}: {e}")
+        return 0
 
-        result = query.execute()
 
-        # Count the returned data
-        return len(result.data) if result.data else 0
+def get_accurate_counts(specs, count='exact'):
+    """Get several counts in one round trip.
+
+    ``specs`` is a list of ``(table_name, filters)`` pairs; filter values may be
+    plain values (equality) or ``(operator, criteria)`` tuples such as
+    ``('not.is', 'null')``. Returns a list of ints in the same order.
+    """
+    try:
+        return count_many(supabase, specs, count)
 
     except Exception as e:
-        print(f"Error getting count from {table_name}: {e}")
-        return 0
+        print(f"Error getting counts: {e}")
+        return [0] * len(specs)
 
 
 def safe_get_data(table_name, filters=None, select_fields='*', limit=10000):
-    """Safely get data from Supabase with error handling"""
+    """Safely get data from Supabase with error handling.
+
+    Identical reads within one request are served from the request memo.
+    """
+    cache_key = request_query_cache.make_key(table_name, filters, select_fields, limit)
+    cached = request_query_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         query = supabase.table(table_name).select(select_fields)
 
@@ -4689,12 +4670,31 @@ def safe_get_data(table_name, filters=None, select_fields='*', limit=10000):
             query = query.limit(limit)
 
         result = query.execute()
-        return result.data or []
+        rows = result.data or []
+        request_query_cache.set(cache_key, rows)
+        return rows
     except Exception as e:
         print(f"Error fetching data from {table_name}: {e}")
         return []
 
 
+def safe_iter_data(table_name, filters=None, select_fields='*', order_by='id', chunk_size=1000, query_hook=None):
+    """Stream rows from Supabase in keyset-paginated chunks without a row ceiling.
+
+    Yields lists of at most ``chunk_size`` rows so callers can process the full
+    table in bounded memory. ``query_hook`` (e.g. from date_range_hook) adds
+    predicates such as a date window to every page query. A failed page query
+    is logged and re-raised, so a stream never ends early as if it were complete.
+    """
+    try:
+        for chunk in iter_table_chunks(supabase, table_name, filters, select_fields, order_by, chunk_size,
+                                       query_hook):
+            yield chunk
+    except Exception as e:
+        print(f"Error streaming data from {table_name}: {e}")
+        raise
+
+
 def sync_test_drive_to_alltest_drive(source_table, original_id, lead_data):
     """
     Sync test drive data to alltest_drive table when test_drive_done is updated
@@ -4943,53 +4943,21 @@ def track_ps_call_attempt(uid, ps_name, call_no, lead_status, call_was_recorded=
 
 
 def filter_leads_by_date(leads, filter_type, date_field='created_at'):
-    """Filter leads based on date range"""
-    if filter_type == 'all':
-        return leads
-
-    today = datetime.now().date()
+    """
+    Filter already-fetched leads by a named period (see resolve_date_window).
 
-    if filter_type == 'today':
-        start_date = today
-        end_date = today
-    elif filter_type == 'mtd':  # Month to Date
-        start_date = today.replace(day=1)
-        end_date = today
-    elif filter_type == 'week':
-        start_date = today - timedelta(days=today.weekday())  # Start of current week (Monday)
-        end_date = today
-    elif filter_type == 'month':
-        start_date = today - timedelta(days=30)
-        end_date = today
-    elif filter_type == 'quarter':
-        start_date = today - timedelta(days=90)
-        end_date = today
-    elif filter_type == 'year':
-        start_date = today - timedelta(days=365)
-        end_date = today
-    else:
+    Prefer pushing the window into the query with date_range_hook; this is for
+    rows that are already in memory. Leads without a parseable date are kept.
+    """
+    start_date, end_date = resolve_date_window(filter_type)
+    if start_date is None and end_date is None:
         return leads
 
     filtered_leads = []
     for lead in leads:
-        lead_date_str = lead.get(date_field)
-        if lead_date_str:
-            try:
-                # Handle different date formats
-                if 'T' in lead_date_str:  # ISO format with time
-                    lead_date = datetime.fromisoformat(lead_date_str.replace('Z', '+00:00')).date()
-                else:  # Date only format
-                    lead_date = datetime.strptime(lead_date_str, '%Y-%m-%d').date()
-
-                if start_date <= lead_date <= end_date:
-                    filtered_leads.append(lead)
-            except (ValueError, TypeError):
-                # If date parsing fails, include the lead
-                filtered_leads.append(lead)
-        else:
-            # If no date field, include the lead
+        lead_date = parse_day(lead.get(date_field))
+        if lead_date is None or start_date <= lead_date <= end_date:
             filtered_leads.append(lead)
-
     return filtered_leads
 
 
@@ -5473,10 +5441,12 @@ def admin_dashboard():
     # Get counts for dashboard with better error handling and actual queries
     try:
         # Get actual counts from database with proper queries
-        cre_count = get_accurate_count('cre_users')
-        ps_count = get_accurate_count('ps_users')
-        leads_count = get_accurate_count('lead_master')
-        unassigned_leads = get_accurate_count('lead_master', {'assigned': 'No'})
+        cre_count, ps_count, leads_count, unassigned_leads = get_accurate_counts([
+            ('cre_users', None),
+            ('ps_users', None),
+            ('lead_master', None),
+            ('lead_master', {'assigned': 'No'}),
+        ])
 
         print(
             f"Dashboard counts - CRE: {cre_count}, PS: {ps_count}, Total Leads: {leads_count}, Unassigned: {unassigned_leads}")
@@ -5507,96 +5477,76 @@ def admin_dashboard():
 @require_admin
 def upload_data():
     if request.method == 'POST':
-        if 'file' not in request.files:
-            flash('No file selected', 'error')
+        # The upload page posts with fetch() so it can follow the progress events
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+        def upload_error(message):
+            if is_ajax:
+                return jsonify({'success': False, 'message': message}), 400
+            flash(message, 'error')
             return redirect(request.url)
 
+        if 'file' not in request.files:
+            return upload_error('No file selected')
+
         file = request.files['file']
         source = request.form.get('source', '').strip()
 
         if not source:
-            flash('Please select a data source', 'error')
-            return redirect(request.url)
+            return upload_error('Please select a data source')
 
         if file.filename == '':
-            flash('No file selected', 'error')
-            return redirect(request.url)
-
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(str(file.filename))
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-            try:
-                file.save(filepath)
-
-                # Check file size
-                file_size = os.path.getsize(filepath)
-                if file_size > 50 * 1024 * 1024:  # 50MB limit
-                    flash('File too large. Maximum size is 50MB.', 'error')
-                    os.remove(filepath)
-                    return redirect(request.url)
-
-                print(f"Processing file: {filename} ({file_size / 1024 / 1024:.2f} MB)")
-
-                # Read the file based on extension
-                if filename.lower().endswith('.csv'):
-                    data = read_csv_file(filepath)
-                else:
-                    data = read_excel_file(filepath)
-
-                if not data:
-                    flash('No valid data found in file', 'error')
-                    os.remove(filepath)
-                    return redirect(request.url)
-
-                print(f"Read {len(data)} rows from file")
-
-                # Get current sequence number for UID generation
-                result = supabase.table('lead_master').select('uid').execute()
-                current_count = len(result.data) if result.data else 0
-
-                # Prepare leads data for batch insert
-                leads_to_insert = []
-                skipped_rows = 0
-
-                for index, row in enumerate(data):
-                    try:
-                        # Validate required fields
-                        required_fields = ['customer_name', 'customer_mobile_number', 'date']
-                        if not all(key in row and str(row[key]).strip() for key in required_fields):
-                            skipped_rows += 1
-                            continue
-
-                        uid = generate_uid(source, row['customer_mobile_number'],
-                                           current_count + len(leads_to_insert) + 1)
-
-                        lead_data = {
-                            'uid': uid,
-                            'date': str(row['date']).strip(),
-                            'customer_name': str(row['customer_name']).strip(),
-                            'customer_mobile_number': str(row['customer_mobile_number']).strip(),
-                            'source': source,
-                            'assigned': 'No',
-                            'final_status': 'Pending'
-                        }
+            return upload_error('No file selected')
 
-                        leads_to_insert.append(lead_data)
+        if not (file and file.filename and allowed_file(file.filename)):
+            return upload_error('Invalid file format. Please upload CSV or Excel files only.')
 
+        job_id = uuid.uuid4().hex
+        filename = secure_filename(str(file.filename))
+        # Prefixed with the job id so concurrent uploads of the same file do not clash
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
 
-                    except Exception as e:
-                        print(f"Error processing row {index}: {e}")
-                        skipped_rows += 1
-                        continue
+        try:
+            file.save(filepath)
+        except Exception as e:
+            print(f"Error saving upload: {e}")
+            return upload_error(f'Error processing file: {str(e)}')
+
+        # Check file size
+        file_size = os.path.getsize(filepath)
+        if file_size > 50 * 1024 * 1024:  # 50MB limit
+            os.remove(filepath)
+            return upload_error('File too large. Maximum size is 50MB.')
+
+        print(f"Processing file: {filename} ({file_size / 1024 / 1024:.2f} MB) as upload job {job_id}")
+
+        # Socket.IO id of the uploading page; progress events are sent to it
+        socket_id = request.form.get('socket_id') or None
+        upload_jobs.create(
+            job_id,
+            filename=filename,
+            source=source,
+            user_id=session.get('user_id'),
+            rows_read=0,
+            inserted=0,
+            skipped=0,
+            failed=0,
+        )
 
-                if not leads_to_insert:
-                    flash('No valid leads found to insert', 'error')
-                    os.remove(filepath)
-                    return redirect(request.url)
+        # Runs after the response has been sent, with a copy of this request's context for audit logging
+        @copy_current_request_context
+        def process_upload():
+            def emit(job):
+                if socket_id:
+                    socketio.emit('upload_progress', job, to=socket_id)
 
-                print(f"Prepared {len(leads_to_insert)} leads for insertion")
+            def report(progress):
+                emit(upload_jobs.update(job_id, progress))
 
-                # Batch insert leads
-                success_count = batch_insert_leads(leads_to_insert)
+            try:
+                summary = run_lead_upload(supabase, filepath, source, uid_allocator, progress=report)
+                emit(upload_jobs.finish(job_id, 'completed', summary))
+                print(f"[PERF] upload_data job {job_id}: {summary}")
 
                 # Log data upload
                 auth_manager.log_audit_event(
@@ -5606,34 +5556,42 @@ def upload_data():
                     resource='lead_master',
                     details={
                         'source': source,
-                        'records_uploaded': success_count,
+                        'records_uploaded': summary['inserted'],
                         'filename': filename,
                         'file_size_mb': round(file_size / 1024 / 1024, 2),
-                        'skipped_rows': skipped_rows
+                        'skipped_rows': summary['skipped'],
+                        'duplicate_sources': summary['duplicate_sources'],
+                        'skipped_duplicates': summary['skipped_duplicates'],
+                        'failed_rows': summary['failed'],
                     }
                 )
-
-                # Create success message
-                message = f'Successfully uploaded {success_count} leads'
-                if skipped_rows > 0:
-                    message += f' ({skipped_rows} rows skipped due to missing data)'
-                message += '. Please go to "Assign Leads" to assign them to CREs.'
-
-                flash(message, 'success')
-
-                # Clean up uploaded file
-                os.remove(filepath)
-
             except Exception as e:
-                print(f"Error processing file: {e}")
-                flash(f'Error processing file: {str(e)}', 'error')
+                print(f"Error processing upload job {job_id}: {e}")
+                emit(upload_jobs.finish(job_id, 'failed', {'error': str(e)}))
+            finally:
                 if os.path.exists(filepath):
                     os.remove(filepath)
-        else:
-            flash('Invalid file format. Please upload CSV or Excel files only.', 'error')
+
+        socketio.start_background_task(process_upload)
+
+        if is_ajax:
+            return jsonify({'success': True, 'job_id': job_id})
+        flash('Upload started. The leads are being imported in the background; '
+              'go to "Assign Leads" once it has finished.', 'success')
+        return redirect(request.url)
 
     return render_template('upload_data.html')
 
+
+@app.route('/api/upload_progress/<job_id>')
+@require_admin
+def upload_progress(job_id):
+    """Progress of an upload job (for pages that lost their Socket.IO connection)"""
+    job = upload_jobs.get(job_id)
+    if not job or job.get('user_id') != session.get('user_id'):
+        return jsonify({'success': False, 'message': 'Upload job not found'}), 404
+    return jsonify({'success': True, **job})
+
 @app.route('/assign_leads')
 @require_admin
 def assign_leads():
@@ -5659,13 +5617,14 @@ def assign_leads():
         # Get CREs
         cres = safe_get_data('cre_users')
 
-        # Get accurate total unassigned count
-        actual_unassigned_count = get_accurate_count('lead_master', {'assigned': 'No'})
-
-        # Get accurate per-source unassigned counts
-        source_unassigned_counts = {}
-        for source in leads_by_source.keys():
-            source_unassigned_counts[source] = get_accurate_count('lead_master', {'assigned': 'No', 'source': source})
+        # Get accurate total and per-source unassigned counts in one round trip
+        sources = list(leads_by_source.keys())
+        counts = get_accurate_counts(
+            [('lead_master', {'assigned': 'No'})] +
+            [('lead_master', {'assigned': 'No', 'source': source}) for source in sources]
+        )
+        actual_unassigned_count = counts[0]
+        source_unassigned_counts = dict(zip(sources, counts[1:]))
 
         return render_template('assign_leads.html',
                                unassigned_leads=all_unassigned_leads,
@@ -7410,13 +7369,7 @@ def add_lead_with_cre():
             'OEM': 'OEM'
         }
         uid_source = source_mapping.get(source, 'Google')
-        
-        sequence = 1
-        uid = generate_uid(uid_source, mobile_digits, sequence)
-        # Ensure UID is unique
-        while supabase.table('lead_master').select('uid').eq('uid', uid).execute().data:
-            sequence += 1
-            uid = generate_uid(uid_source, mobile_digits, sequence)
+        uid = generate_uid(uid_source, mobile_digits)
 
         # Get assigned CRE ID from form
         if is_ajax:
@@ -7594,224 +7547,129 @@ def add_lead_with_cre():
 @app.route('/cre_dashboard')
 @require_cre
 def cre_dashboard():
-    import time
-    from datetime import datetime, date
+    """KPI-first CRE dashboard: renders counts only, tab rows come from api_cre_dashboard_tab"""
     start_time = time.time()
     cre_name = session.get('cre_name')
-    
+
     # Get status parameter for Won/Lost toggle
     status = request.args.get('status', 'lost')
     # Get tab and sub_tab parameters for redirection
     tab = request.args.get('tab', '')
     sub_tab = request.args.get('sub_tab', '')
-    
-    today = date.today()
-    today_str = today.isoformat()
-
-    # --- AUTO-INCREMENT LOGIC FOR UNATTENDED LEADS (CRE) ---
-    # 1. Regular leads (lead_master)
-    all_leads = safe_get_data('lead_master', {'cre_name': cre_name})
-    for lead in all_leads:
-        follow_up_date = lead.get('follow_up_date')
-        final_status = lead.get('final_status')
-        if follow_up_date and str(follow_up_date) < today_str and final_status not in ['Won', 'Lost']:
-            supabase.table('lead_master').update({'follow_up_date': today_str}).eq('uid', lead.get('uid')).execute()
 
+    # Overdue follow-up dates are rolled forward by the daily rollover job
+    # (followup_rollover.py), so this page only reads.
 
-
-    # 3. Event leads (activity_leads)
-    event_event_leads = safe_get_data('activity_leads', {'cre_assigned': cre_name})
-    for lead in event_event_leads:
-        cre_followup_date = lead.get('cre_followup_date')
-        final_status = lead.get('final_status')
-        if cre_followup_date and str(cre_followup_date)[:10] < today_str and final_status not in ['Won', 'Lost']:
-            supabase.table('activity_leads').update({'cre_followup_date': today_str}).eq('activity_uid', lead.get('activity_uid')).execute()
-
-    # --- Date Filter Logic ---
+    # --- Date Filter Logic (applied on the 'date' column in the query) ---
     filter_type = request.args.get('filter_type', 'all')
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
+    window_start, window_end = resolve_date_window(filter_type, start_date_str, end_date_str)
 
-    all_leads = safe_get_data('lead_master', {'cre_name': cre_name})
-    
-    # Apply date filtering using the 'date' column
-    if filter_type == 'today':
-        today_str = date.today().isoformat()
-        all_leads = [lead for lead in all_leads if lead.get('date') == today_str]
-    elif filter_type == 'range' and start_date_str and end_date_str:
-        # Filter leads where lead['date'] falls within the range
-        all_leads = [
-            lead for lead in all_leads 
-            if lead.get('date') and start_date_str <= lead['date'] <= end_date_str
-        ]
-    # For 'all' filter type, we keep all leads without date filtering
+    # Badges come from count queries; tab rows are read a page at a time
+    counts = tab_counts(supabase, lambda tab_name: cre_tab_sources(cre_name, tab_name, window_start, window_end),
+                        CRE_COUNT_TABS)
 
-    print(f"Date filter applied - Type: {filter_type}, Leads count: {len(all_leads)}")
-    if filter_type == 'range':
-        print(f"Date range: {start_date_str} to {end_date_str}")
+    # Options of the PS Assigned branch / PS name filters
+    options = column_options(supabase, cre_tab_sources(cre_name, 'ps_assigned', window_start, window_end),
+                             ('branch', 'ps_name'))
+    ps_assigned_branches = options['branch']
+    ps_assigned_names = options['ps_name']
 
-    # Fetch event leads assigned to this CRE
-    event_event_leads = safe_get_data('activity_leads', {'cre_assigned': cre_name})
+    print(f"[PERF] cre_dashboard TOTAL took {time.time() - start_time:.3f} seconds")
+    return render_template(
+        'cre_dashboard.html',
+        counts=counts,
+        untouched_count=counts['untouched'],
+        called_count=counts['called'],
+        follow_up_count=counts['follow_up'],
+        total_fresh_leads=counts['fresh'],
+        ps_assigned_branches=ps_assigned_branches,
+        ps_assigned_names=ps_assigned_names,
+        won_leads=[],  # Won/Lost rows are fetched from /cre_dashboard_leads when the tab opens
+        lost_leads=[],
+        filter_type=filter_type,  # Pass filter type to template
+        start_date=start_date_str,  # Pass start date to template
+        end_date=end_date_str,  # Pass end date to template
+        status=status,  # Pass status parameter to template
+        return_tab=tab,  # Pass tab parameter to template
+        return_sub_tab=sub_tab  # Pass sub_tab parameter to template
+    )
 
-    print("Fetched leads for CRE:", cre_name, "Count:", len(all_leads))
-    print("Status parameter from URL:", status)
 
-    # Initialize buckets for leads for mutual exclusivity
-    untouched_leads = []
-    called_leads = []
-    follow_up_leads = []  # New list for "Call me Back" leads
-    attended_leads = []
-    assigned_to_ps = []
-    won_leads = []
-    lost_leads = []
+@app.route('/api/cre_dashboard/tab/<tab_name>')
+@require_cre
+def api_cre_dashboard_tab(tab_name):
+    """
+    One page of a CRE dashboard tab.
+
+    Query args: page, per_page (max 200), sort, order (asc|desc), search,
+    filter_type/start_date/end_date (applied in the database query),
+    date_start/date_end (the tab's own time filter, e.g. CRE assignment date
+    for fresh leads), branch/ps_name/lead_category, cursor (the previous
+    response's cursor, for tabs spread over several tables) and format=html
+    to get the rendered table rows instead of JSON rows. Filters, search,
+    order and page are all applied in the database query.
+    """
+    if tab_name not in CRE_TABS:
+        return jsonify({'success': False, 'message': f'Unknown tab: {tab_name}'}), 404
+    try:
+        cre_name = session.get('cre_name')
+        page, per_page, sort, descending, search = parse_page_args(request.args)
+        window_start, window_end = resolve_date_window(
+            request.args.get('filter_type', 'all'), request.args.get('start_date'), request.args.get('end_date')
+        )
+        tab_start, tab_end, column_filters = parse_filter_args(request.args)
 
-    non_contact_statuses = ['RNR', 'Busy on another Call', 'Call me Back', 'Call Disconnected', 'Call not Connected']
+        sources = narrow_sources(cre_tab_sources(cre_name, tab_name, window_start, window_end),
+                                 CRE_TAB_DATE_FIELDS.get(tab_name), tab_start, tab_end, column_filters, search)
+        leads, total, cursor = load_tab_page(supabase, sources, tab_name, page, per_page, sort, descending,
+                                             request.args.get('cursor'))
 
-    for lead in all_leads:
-        lead_status = (lead.get('lead_status') or '').strip()
-        final_status = lead.get('final_status')
-        has_first_call = lead.get('first_call_date') is not None
+        response = {
+            'success': True,
+            'tab': tab_name,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': max((total + per_page - 1) // per_page, 1),
+            'cursor': cursor,
+        }
+        if request.args.get('format') == 'html':
+            response['html'] = render_template('cre_dashboard_rows.html', tab=tab_name, leads=leads)
+        else:
+            response['rows'] = leads
+        return jsonify(response)
+    except InvalidTabRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"Error loading CRE dashboard tab {tab_name}: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
 
-        if final_status == 'Won':
-            won_leads.append(lead)
-            continue
-        if final_status == 'Lost':
-            lost_leads.append(lead)
-            continue
+@app.route('/update_lead/<uid>', methods=['GET', 'POST'])
+@require_cre
+def update_lead(uid):
+    # Get return_tab parameter for redirection
+    return_tab = request.args.get('return_tab', '')
+    try:
+        # Get lead data
+        lead_result = supabase.table('lead_master').select('*').eq('uid', uid).execute()
+        if not lead_result.data:
+            flash('Lead not found', 'error')
+            return redirect(url_for('cre_dashboard'))
 
-        # PS Assigned: any lead with a PS assigned
-        if lead.get('ps_name'):
-            assigned_to_ps.append(lead)
+        lead_data = lead_result.data[0]
 
-        # Pending Leads: only leads with final_status == 'Pending' AND qualifying call completed (first_call_date IS NOT NULL)
-        if final_status == 'Pending' and has_first_call:
-            attended_leads.append(lead)
+        # Verify this lead belongs to the current CRE
+        if lead_data.get('cre_name') != session.get('cre_name'):
+            flash('Access denied - This lead is not assigned to you', 'error')
+            return redirect(url_for('cre_dashboard'))
 
-        # Untouched Leads (Fresh leads that are still pending)
-        if not has_first_call and lead_status == 'Pending':
-            untouched_leads.append(lead)
-            continue
+        # Get next call info
+        next_call, completed_calls = get_next_call_info(lead_data)
 
-        # Called Fresh Leads: Non-contact status on FIRST update only
-        if lead_status in non_contact_statuses and not has_first_call:
-            # Separate "Call me Back" leads into follow_up_leads
-            if lead_status == 'Call me Back':
-                follow_up_leads.append(lead)
-            else:
-                called_leads.append(lead)
-            continue
-
-    print(f"Won leads count: {len(won_leads)}")
-    print(f"Lost leads count: {len(lost_leads)}")
-    
-    untouched_count = len(untouched_leads)
-    called_count = len(called_leads)
-    follow_up_count = len(follow_up_leads)
-    total_fresh_leads = untouched_count + called_count + follow_up_count
-
-    fresh_leads_sorted = sorted(
-        untouched_leads + called_leads + follow_up_leads,
-        key=lambda l: l.get('date') or '',  # Sort by 'date' column
-        reverse=True
-    )
-
-    # Get today's followups
-    today = date.today()
-    today_str = today.isoformat()
-    # Get all leads with follow-up date <= today, final_status = 'Pending', qualifying call completed (first_call_date IS NOT NULL)
-    todays_followups = []
-    for lead in all_leads:
-        follow_up_date = lead.get('follow_up_date')
-        final_status = lead.get('final_status')
-        has_first_call = lead.get('first_call_date') is not None
-        
-        if follow_up_date and final_status == 'Pending' and has_first_call:
-            # Parse follow_up_date and check if it's <= today
-            try:
-                if 'T' in str(follow_up_date):
-                    followup_date_parsed = datetime.fromisoformat(str(follow_up_date).replace('Z', '+00:00')).date()
-                else:
-                    followup_date_parsed = datetime.strptime(str(follow_up_date)[:10], '%Y-%m-%d').date()
-                
-                if followup_date_parsed <= datetime.now().date():
-                    # Add overdue flag for highlighting
-                    lead['is_overdue'] = followup_date_parsed < datetime.now().date()
-                    lead['overdue_days'] = (datetime.now().date() - followup_date_parsed).days
-                    todays_followups.append(lead)
-            except (ValueError, TypeError):
-                # If date parsing fails, include the lead for manual review
-                lead['is_overdue'] = False
-                lead['overdue_days'] = 0
-                todays_followups.append(lead)
-
-    # Add event leads with today's cre_followup_date to the follow-up list
-    event_leads_today = []
-    for lead in event_event_leads:
-        cre_followup_date = lead.get('cre_followup_date')
-        if cre_followup_date and str(cre_followup_date)[:10] == today_str:
-            event_lead_row = {
-                'is_event_lead': True,
-                'activity_uid': lead.get('activity_uid'),
-                'customer_name': lead.get('customer_name'),
-                'customer_phone_number': lead.get('customer_phone_number'),
-                'lead_status': lead.get('lead_status'),
-                'location': lead.get('location'),
-                'activity_name': lead.get('activity_name'),
-            }
-            event_leads_today.append(event_lead_row)
-    
-    todays_followups.extend(event_leads_today)
-
-    print(f"[PERF] cre_dashboard TOTAL took {time.time() - start_time:.3f} seconds")
-    return render_template(
-        'cre_dashboard.html',
-        untouched_count=untouched_count,
-        called_count=called_count,
-        follow_up_count=follow_up_count,
-        total_fresh_leads=total_fresh_leads,
-        fresh_leads_sorted=fresh_leads_sorted,
-        untouched_leads=untouched_leads,
-        called_leads=called_leads,
-        follow_up_leads=follow_up_leads,
-        pending_leads=attended_leads,
-        todays_followups=todays_followups,
-        attended_leads=attended_leads,
-        assigned_to_ps=assigned_to_ps,
-        won_leads=won_leads,
-        lost_leads=lost_leads,
-        event_event_leads=event_event_leads,
-        filter_type=filter_type,  # Pass filter type to template
-        start_date=start_date_str,  # Pass start date to template
-        end_date=end_date_str,  # Pass end date to template
-        status=status,  # Pass status parameter to template
-        return_tab=tab,  # Pass tab parameter to template
-        return_sub_tab=sub_tab  # Pass sub_tab parameter to template
-    )
-
-@app.route('/update_lead/<uid>', methods=['GET', 'POST'])
-@require_cre
-def update_lead(uid):
-    # Get return_tab parameter for redirection
-    return_tab = request.args.get('return_tab', '')
-    try:
-        # Get lead data
-        lead_result = supabase.table('lead_master').select('*').eq('uid', uid).execute()
-        if not lead_result.data:
-            flash('Lead not found', 'error')
-            return redirect(url_for('cre_dashboard'))
-
-        lead_data = lead_result.data[0]
-
-        # Verify this lead belongs to the current CRE
-        if lead_data.get('cre_name') != session.get('cre_name'):
-            flash('Access denied - This lead is not assigned to you', 'error')
-            return redirect(url_for('cre_dashboard'))
-
-        # Get next call info
-        next_call, completed_calls = get_next_call_info(lead_data)
-
-        # Get PS users for branch selection
-        ps_users = safe_get_data('ps_users')
+        # Get PS users for branch selection
+        ps_users = safe_get_data('ps_users')
 
         # Model options
         rizta_models = [
@@ -8058,22 +7916,9 @@ def update_lead(uid):
     except Exception as e:
         flash(f'Error loading lead: {str(e)}', 'error')
         return redirect(url_for('cre_dashboard'))
-@app.route('/ps_dashboard')
-@require_ps
-def ps_dashboard():
-    start_time = time.time()
-    ps_name = session.get('ps_name')
-    
-    # Debug session data
-    print(f"[DEBUG] PS Dashboard - Session data: {dict(session)}")
-    print(f"[DEBUG] PS Dashboard - ps_name from session: {ps_name}")
-    
-    # Fallback to username if ps_name is not available
-    if not ps_name:
-        ps_name = session.get('username')
-        print(f"[DEBUG] PS Dashboard - Using username as fallback: {ps_name}")
-    
-    # If still no name, try to get from database
+def _resolve_ps_name():
+    """PS name of the logged-in user: session name, then username, then ps_users"""
+    ps_name = session.get('ps_name') or session.get('username')
     if not ps_name:
         user_id = session.get('user_id')
         if user_id:
@@ -8081,633 +7926,125 @@ def ps_dashboard():
                 ps_user = supabase.table('ps_users').select('name,username').eq('id', user_id).execute()
                 if ps_user.data:
                     ps_name = ps_user.data[0].get('name') or ps_user.data[0].get('username')
-                    print(f"[DEBUG] PS Dashboard - Retrieved from DB: {ps_name}")
             except Exception as e:
-                print(f"[DEBUG] PS Dashboard - Error fetching PS data: {e}")
-    
+                print(f"Error fetching PS data for dashboard: {e}")
+    return ps_name
+
+
+@app.route('/ps_dashboard')
+@require_ps
+def ps_dashboard():
+    """KPI-first PS dashboard: renders counts only, tab rows come from api_ps_dashboard_tab"""
+    start_time = time.time()
+    ps_name = _resolve_ps_name()
     if not ps_name:
         flash('Error: Could not determine PS name. Please log in again.', 'error')
         return redirect(url_for('logout'))
-    
-    today = datetime.now().date()
-    today_str = today.isoformat()
-
-    # --- AUTO-INCREMENT LOGIC FOR UNATTENDED LEADS ---
-    # 1. ps_followup_master
-    assigned_leads = safe_get_data('ps_followup_master', {'ps_name': ps_name})
-    for lead in assigned_leads:
-        follow_up_date = lead.get('follow_up_date')
-        final_status = lead.get('final_status')
-        if follow_up_date and str(follow_up_date) < today_str and final_status not in ['Won', 'Lost']:
-            supabase.table('ps_followup_master').update({'follow_up_date': today_str}).eq('lead_uid', lead.get('lead_uid')).execute()
-
-
 
-    # 3. activity_leads
-    event_leads = safe_get_data('activity_leads', {'ps_name': ps_name})
-    for lead in event_leads:
-        ps_followup_date_ts = lead.get('ps_followup_date_ts')
-        final_status = lead.get('final_status')
-        if ps_followup_date_ts and str(ps_followup_date_ts)[:10] < today_str and final_status not in ['Won', 'Lost']:
-            if not lead.get('ps_first_call_date'):
-                supabase.table('activity_leads').update({'ps_followup_date_ts': today_str}).eq('activity_uid', lead.get('activity_uid')).execute()
+    # Overdue follow-up dates are rolled forward by the daily rollover job
+    # (followup_rollover.py), so this page only reads.
 
     # Get filter parameters from query string
     filter_type = request.args.get('filter_type', 'all')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     status_filter = request.args.get('status_filter', '')
-    status = request.args.get('status', 'lost')  # <-- Add this line
-    tab = request.args.get('tab', 'fresh-leads')  # <-- Add tab parameter
-    category_filter = request.args.get('category_filter', '')  # <-- Add category filter parameter
+    status = request.args.get('status', 'lost')
+    tab = request.args.get('tab', 'fresh-leads')
+    category_filter = request.args.get('category_filter', '')
 
     try:
-        t0 = time.time()
-        # Get all assigned leads for this PS
-        print(f"[DEBUG] PS Dashboard - Fetching leads for PS: {ps_name}")
-        assigned_leads = safe_get_data('ps_followup_master', {'ps_name': ps_name})
-        print(f"[DEBUG] PS Dashboard - Assigned leads count: {len(assigned_leads) if assigned_leads else 0}")
-
-        # Apply date filtering to assigned leads using ps_assigned_at for ps_followup_master table
-        filtered_leads = filter_leads_by_date(assigned_leads, filter_type, 'ps_assigned_at')
-        print(f"[DEBUG] PS Dashboard - Filtered leads count: {len(filtered_leads) if filtered_leads else 0}")
-
-        # Initialize lists for different lead categories
-        todays_followups_regular = []
-
-        todays_followups_event = []  # Separate list for event followups
-        fresh_leads = []
-        # Initialize three subsections for fresh leads (similar to CRE dashboard)
-        untouched_leads = []
-        called_leads = []
-        follow_up_leads = []
-        pending_leads = []
-        attended_leads = []
-        won_leads = []
-        lost_leads = []
-        event_leads = []  # Separate list for event leads
-
-        # Define statuses that should be excluded from Today's Follow-up and Pending Leads
-        excluded_statuses = ['Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed']
-
-
-
-        print(f"[PERF] ps_dashboard: data fetching took {time.time() - t0:.3f} seconds")
-        print(f"[DEBUG] Total assigned leads fetched: {len(assigned_leads)}")
-        print(f"[DEBUG] Total filtered leads: {len(filtered_leads)}")
-        print(f"[DEBUG] PS Name: {ps_name}")
-        print(f"[DEBUG] Filter type: {filter_type}")
-
-        t1 = time.time()
-        # --- Process Regular Assigned Leads ---
-        for lead in filtered_leads:
-            lead_dict = dict(lead)  # Make a copy to avoid mutating the original
-            lead_dict['lead_uid'] = lead.get('lead_uid')  # Ensure lead_uid for template compatibility
-
-            final_status = lead.get('final_status')
-            lead_status = lead.get('lead_status')
-
-            # DEBUG: Print lead details for troubleshooting
-            print(f"[DEBUG] Processing lead: {lead.get('lead_uid')} | final_status: {final_status} | lead_status: {lead_status} | first_call_date: {lead.get('first_call_date')} | ps_name: {lead.get('ps_name')}")
-
-            # Categorize leads based on final_status and first_call_date
-            if final_status == 'Won':
-                won_leads.append(lead_dict)
-            elif final_status == 'Lost':
-                lost_leads.append(lead_dict)
-            elif final_status == 'Pending':
-                # Check if lead has been called (has first_call_date)
-                if lead.get('first_call_date'):
-                    # Lead has been called, goes to pending_leads
-                    print(f"[DEBUG] Found lead with final_status == 'Pending' and first_call_date: {lead.get('lead_uid')} | first_call_date: {lead.get('first_call_date')} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Set default lead_category if missing
-                        if 'lead_category' not in lead_dict or not lead_dict['lead_category']:
-                            lead_dict['lead_category'] = 'Not Set'
-                        pending_leads.append(lead_dict)
-                        print(f"[DEBUG] Added to pending_leads (Pending status with first_call_date): {lead.get('lead_uid')}")
-                    else:
-                        print(f"[DEBUG] Lead {lead.get('lead_uid')} excluded from pending_leads due to lead_status: {lead_status}")
-                else:
-                    # Lead hasn't been called yet, categorize into fresh leads subsections
-                    print(f"[DEBUG] Found lead with final_status == 'Pending' but no first_call_date: {lead.get('lead_uid')} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Set default lead_category if missing
-                        if 'lead_category' not in lead_dict or not lead_dict['lead_category']:
-                            lead_dict['lead_category'] = 'Not Set'
-                        
-                        # Categorize into fresh leads subsections based on lead_status
-                        if lead_status == 'Call me Back':
-                            follow_up_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to follow_up_leads (Call me Back status): {lead.get('lead_uid')}")
-                        elif lead_status in ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']:
-                            called_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to called_leads (Non-contact status): {lead.get('lead_uid')}")
-                        else:
-                            untouched_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to untouched_leads (Pending status): {lead.get('lead_uid')}")
-                        
-                        # Also add to fresh_leads for backward compatibility
-                        fresh_leads.append(lead_dict)
-                    else:
-                        print(f"[DEBUG] Lead {lead.get('lead_uid')} excluded from fresh_leads due to lead_status: {lead_status}")
-            elif not final_status:  # Include leads with no final_status
-                if lead.get('first_call_date'):
-                    # Lead has been called, goes to pending_leads
-                    print(f"[DEBUG] Found lead with no final_status but has first_call_date: {lead.get('lead_uid')} | first_call_date: {lead.get('first_call_date')} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Set default lead_category if missing
-                        if 'lead_category' not in lead_dict or not lead_dict['lead_category']:
-                            lead_dict['lead_category'] = 'Not Set'
-                        pending_leads.append(lead_dict)
-                        print(f"[DEBUG] Added to pending_leads (no final_status with first_call_date): {lead.get('lead_uid')}")
-                    else:
-                        print(f"[DEBUG] Lead {lead.get('lead_uid')} excluded from pending_leads due to lead_status: {lead_status}")
-                else:
-                    # Lead hasn't been called yet, categorize into fresh leads subsections
-                    print(f"[DEBUG] Found lead with no final_status and no first_call_date: {lead.get('lead_uid')} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Set default lead_category if missing
-                        if 'lead_category' not in lead_dict or not lead_dict['lead_category']:
-                            lead_dict['lead_category'] = 'Not Set'
-                        
-                        # Categorize into fresh leads subsections based on lead_status
-                        if lead_status == 'Call me Back':
-                            follow_up_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to follow_up_leads (Call me Back status): {lead.get('lead_uid')}")
-                        elif lead_status in ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']:
-                            called_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to called_leads (Non-contact status): {lead.get('lead_uid')}")
-                        else:
-                            untouched_leads.append(lead_dict)
-                            print(f"[DEBUG] Added to untouched_leads (Pending status): {lead.get('lead_uid')}")
-                        
-                        # Also add to fresh_leads for backward compatibility
-                        fresh_leads.append(lead_dict)
-                    else:
-                        print(f"[DEBUG] Lead {lead.get('lead_uid')} excluded from fresh_leads due to lead_status: {lead_status}")
-
-            # Add to today's followups if applicable (exclude Won/Lost and specific statuses)
-            # Show leads that need follow-up today (regardless of qualifying call status)
-            follow_up_date = lead.get('follow_up_date')
-            if (follow_up_date and final_status == 'Pending' and
-                (not lead_status or lead_status not in excluded_statuses)):
-                # Parse follow_up_date and check if it's <= today
-                try:
-                    if 'T' in str(follow_up_date):
-                        followup_date_parsed = datetime.fromisoformat(str(follow_up_date).replace('Z', '+00:00')).date()
-                    else:
-                        followup_date_parsed = datetime.strptime(str(follow_up_date)[:10], '%Y-%m-%d').date()
-                    
-                    if followup_date_parsed <= datetime.now().date():
-                        # Add overdue flag for highlighting
-                        lead_dict['is_overdue'] = followup_date_parsed < datetime.now().date()
-                        lead_dict['overdue_days'] = (datetime.now().date() - followup_date_parsed).days
-                        todays_followups_regular.append(lead_dict)
-                        print(f"[DEBUG] Added to today's followups: {lead.get('lead_uid')} - Follow-up date: {follow_up_date}, Parsed: {followup_date_parsed}, Today: {datetime.now().date()}, Overdue: {lead_dict['is_overdue']}")
-                    else:
-                        print(f"[DEBUG] Lead {lead.get('lead_uid')} NOT added - Follow-up date {followup_date_parsed} is in the future (Today: {datetime.now().date()})")
-                        print(f"[DEBUG] Date comparison: {followup_date_parsed} <= {datetime.now().date()} = {followup_date_parsed <= datetime.now().date()}")
-                        print(f"[DEBUG] Date types - followup_date_parsed: {type(followup_date_parsed)}, today: {type(datetime.now().date())}")
-                except (ValueError, TypeError):
-                    # If date parsing fails, include the lead for manual review
-                    lead_dict['is_overdue'] = False
-                    lead_dict['overdue_days'] = 0
-                    todays_followups_regular.append(lead_dict)
-                    print(f"[DEBUG] Added to today's followups (date parse failed): {lead.get('lead_uid')} - Error: {e}")
-            else:
-                # Debug why lead is not being added
-                if follow_up_date and final_status == 'Pending':
-                    print(f"[DEBUG] Lead {lead.get('lead_uid')} NOT added to today's followups:")
-                    print(f"  - Has follow_up_date: {bool(follow_up_date)}")
-                    print(f"  - Lead status excluded: {lead_status in excluded_statuses if lead_status else False}")
-                    print(f"  - Lead status: {lead_status}")
-                    print(f"  - Final status: {final_status}")
-                    print(f"  - Follow-up date: {follow_up_date}")
-
-
-
-        print(f"[PERF] ps_dashboard: regular leads processing took {time.time() - t1:.3f} seconds")
-        print(f"[DEBUG] Fresh leads count: {len(fresh_leads)}")
-        print(f"[DEBUG] Attended leads count: {len(attended_leads)}")
-        print(f"[DEBUG] Won leads count: {len(won_leads)}")
-        print(f"[DEBUG] Lost leads count: {len(lost_leads)}")
-        print(f"[DEBUG] Today's followups (regular) count: {len(todays_followups_regular)}")
-        
-        # Debug: Check lead_category values in attended_leads
-        print(f"[DEBUG] Attended leads with lead_category:")
-        for lead in attended_leads:
-            category = lead.get('lead_category')
-            source = lead.get('source', 'Unknown')
-            print(f"  - {lead.get('lead_uid')}: {category} (Source: {source})")
-            
-        # Debug: Check raw lead_category values from database
-        print(f"[DEBUG] Raw lead_category values from database:")
-        for lead in assigned_leads:
-            category = lead.get('lead_category')
-            print(f"  - {lead.get('lead_uid')}: {category} (Type: {type(category)})")
-
-
-
-
-
-        t3 = time.time()
-        # Fetch event leads for this PS
-        fetched_event_leads = safe_get_data('activity_leads', {'ps_name': ps_name})
-        
-        # Fetch walk-in leads for this PS
-        print(f"[DEBUG] PS Dashboard - Fetching walk-in leads for PS: {ps_name}")
-        walkin_leads = safe_get_data('walkin_table', {'ps_assigned': ps_name})
-        print(f"[DEBUG] PS Dashboard - Walk-in leads count: {len(walkin_leads) if walkin_leads else 0}")
-        if walkin_leads:
-            print(f"[DEBUG] Walk-in leads details:")
-            for lead in walkin_leads:
-                print(f"  - ID: {lead.get('id')}, UID: {lead.get('uid')}, Status: {lead.get('status')}, First Call: {lead.get('first_call_date')}")
-
-
-
-        # --- Process Event Leads ---
-        print(f"[DEBUG] Processing {len(fetched_event_leads)} event leads")
-        for lead in fetched_event_leads:
-            lead_dict = dict(lead)  # Make a copy to avoid mutating the original
-            lead_dict['lead_uid'] = lead.get('activity_uid') or lead.get('uid')
-            lead_dict['customer_mobile_number'] = lead.get('customer_phone_number')  # For template compatibility
-            
-            # For event leads, use 'final_status' instead of 'ps_final_status'
-            final_status = lead.get('final_status')
-            lead_status = lead.get('lead_status')
-            ps_first_call_date = lead.get('ps_first_call_date')
-            
-            print(f"[DEBUG] Event lead: {lead_dict['lead_uid']} | final_status: {final_status} | lead_status: {lead_status} | ps_first_call_date: {ps_first_call_date}")
-
-            # Always add event leads to event_leads list first
-            if 'lead_category' not in lead_dict or not lead_dict['lead_category']:
-                lead_dict['lead_category'] = 'Not Set'
-            event_leads.append(lead_dict)
-            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to event_leads list")
-            
-            # Also categorize event leads for other tabs based on final_status
-            if final_status == 'Won':
-                won_leads.append(lead_dict)
-                print(f"[DEBUG] Event lead {lead_dict['lead_uid']} also added to won_leads")
-            elif final_status == 'Lost':
-                lost_leads.append(lead_dict)
-                print(f"[DEBUG] Event lead {lead_dict['lead_uid']} also added to lost_leads")
-            elif final_status == 'Pending':
-                # Check if event lead has been called (has ps_first_call_date)
-                if ps_first_call_date:
-                    # Event lead has been called, goes to pending_leads
-                    print(f"[DEBUG] Event lead with final_status == 'Pending' and ps_first_call_date: {lead_dict['lead_uid']} | ps_first_call_date: {ps_first_call_date} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        pending_leads.append(lead_dict)
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} also added to pending_leads (Pending status with ps_first_call_date)")
-                    else:
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} excluded from pending_leads due to lead_status: {lead_status}")
-                else:
-                    # Event lead hasn't been called yet, categorize into fresh leads subsections
-                    print(f"[DEBUG] Event lead with final_status == 'Pending' but no ps_first_call_date: {lead_dict['lead_uid']} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Categorize into fresh leads subsections based on lead_status
-                        if lead_status == 'Call me Back':
-                            follow_up_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to follow_up_leads (Call me Back status)")
-                        elif lead_status in ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']:
-                            called_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to called_leads (Non-contact status)")
-                        else:
-                            untouched_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to untouched_leads (Pending status)")
-                        
-                        # Also add to fresh_leads for backward compatibility
-                        fresh_leads.append(lead_dict)
-                    else:
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} excluded from fresh_leads due to lead_status: {lead_status}")
-            elif not final_status:  # Include leads with no final_status
-                if ps_first_call_date:
-                    # Event lead has been called, goes to pending_leads
-                    print(f"[DEBUG] Event lead with no final_status but has ps_first_call_date: {lead_dict['lead_uid']} | ps_first_call_date: {ps_first_call_date} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        pending_leads.append(lead_dict)
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} also added to pending_leads (no final_status with ps_first_call_date)")
-                    else:
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} excluded from pending_leads due to lead_status: {lead_status}")
-                else:
-                    # Event lead hasn't been called yet, categorize into fresh leads subsections
-                    print(f"[DEBUG] Event lead with no final_status and no ps_first_call_date: {lead_dict['lead_uid']} | lead_status: {lead_status}")
-                    if not lead_status or lead_status not in excluded_statuses:
-                        # Categorize into fresh leads subsections based on lead_status
-                        if lead_status == 'Call me Back':
-                            follow_up_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to follow_up_leads (Call me Back status)")
-                        elif lead_status in ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']:
-                            called_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to called_leads (Non-contact status)")
-                        else:
-                            untouched_leads.append(lead_dict)
-                            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to untouched_leads (Pending status)")
-                        
-                        # Also add to fresh_leads for backward compatibility
-                        fresh_leads.append(lead_dict)
-                    else:
-                        print(f"[DEBUG] Event lead {lead_dict['lead_uid']} excluded from fresh_leads due to lead_status: {lead_status}")
-
-            # Add event leads with today's ps_followup_date_ts to today's followups
-            # Show leads that need follow-up today (regardless of qualifying call status)
-            ps_followup_date_ts = lead.get('ps_followup_date_ts')
-            print(f"[DEBUG] Event lead {lead_dict['lead_uid']} - ps_followup_date_ts: {ps_followup_date_ts}, final_status: {final_status}, lead_status: {lead_status}")
-            if (ps_followup_date_ts and
-                str(ps_followup_date_ts)[:10] == today_str and
-                final_status not in ['Won', 'Lost'] and
-                (not lead_status or lead_status not in excluded_statuses)):
-                # Set follow_up_date for template compatibility
-                lead_dict['follow_up_date'] = str(ps_followup_date_ts)
-                todays_followups_event.append(lead_dict)
-                print(f"[DEBUG] Event lead {lead_dict['lead_uid']} added to today's followups - Follow-up date: {ps_followup_date_ts}, Today string: {today_str}")
-            else:
-                if ps_followup_date_ts and final_status not in ['Won', 'Lost']:
-                    print(f"[DEBUG] Event lead {lead_dict['lead_uid']} NOT added to today's followups:")
-                    print(f"  - Has ps_followup_date_ts: {bool(ps_followup_date_ts)}")
-                    print(f"  - Date string comparison: {str(ps_followup_date_ts)[:10]} == {today_str} = {str(ps_followup_date_ts)[:10] == today_str}")
-                    print(f"  - Lead status excluded: {lead_status in excluded_statuses if lead_status else False}")
-                    print(f"  - Lead status: {lead_status}")
-                    print(f"  - Final status: {final_status}")
-
-        print(f"[PERF] ps_dashboard: event leads processing took {time.time() - t3:.3f} seconds")
-
-        t3_5 = time.time()
-        # --- Process Walk-in Leads ---
-        print(f"[DEBUG] Processing {len(walkin_leads)} walk-in leads")
-        todays_followups_walkin = []
-        
-        for lead in walkin_leads:
-            lead_dict = dict(lead)  # Make a copy to avoid mutating the original
-            
-            # Ensure UID is properly set for walkin leads
-            if lead.get('uid'):
-                lead_dict['lead_uid'] = lead.get('uid')
-            else:
-                # Generate UID if not present (for older records)
-                lead_dict['lead_uid'] = f"W{lead.get('id')}"
-            
-            # Also set the uid field for consistency
-            lead_dict['uid'] = lead_dict['lead_uid']
-            print(f"[DEBUG] Walkin lead UID: {lead_dict['lead_uid']} for ID: {lead.get('id')}")
-            lead_dict['customer_mobile_number'] = lead.get('mobile_number', '')  # For template compatibility
-            lead_dict['customer_name'] = lead.get('customer_name', '')  # Ensure customer_name is set
-            lead_dict['source'] = 'Walk-in'  # Set source for consistency
-            lead_dict['is_walkin'] = True  # Flag to identify walk-in leads
-            lead_dict['walkin_id'] = lead.get('id')  # Store the walk-in ID for URL generation
-            lead_dict['cre_name'] = ''  # Set empty cre_name for walk-in leads
-            lead_dict['created_at'] = lead.get('created_at', '')  # Add created_at for template compatibility
-            lead_dict['lead_category'] = lead.get('lead_category', 'Not Set')  # Add lead_category for template compatibility
-            
-            final_status = lead.get('status')
-            lead_status = lead.get('lead_status')  # Add lead_status for walk-in leads
-            followup_no = lead.get('followup_no', 1)
-            next_followup_date = lead.get('next_followup_date')
-            
-            print(f"[DEBUG] Walk-in lead: {lead_dict['lead_uid']} | status: {final_status} | lead_status: {lead_status} | followup_no: {followup_no} | next_followup_date: {next_followup_date}")
-
-            # Categorize walk-in leads based on status
-            if final_status == 'Won':
-                # Add won timestamp for filtering
-                lead_dict['won_timestamp'] = lead.get('updated_at') or datetime.now().isoformat()
-                won_leads.append(lead_dict)
-                print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to won_leads")
-            elif final_status == 'Lost':
-                # Add lost timestamp for filtering
-                lead_dict['lost_timestamp'] = lead.get('updated_at') or datetime.now().isoformat()
-                lost_leads.append(lead_dict)
-                print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to lost_leads")
-            elif final_status == 'Pending' or not final_status:
-                # Add to today's followups if next_followup_date is <= today
-                # Show leads that need follow-up today (regardless of qualifying call status)
-                print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} - next_followup_date: {next_followup_date}")
-                if next_followup_date:
-                    try:
-                        if 'T' in str(next_followup_date):
-                            followup_date_parsed = datetime.fromisoformat(str(next_followup_date).replace('Z', '+00:00')).date()
-                        else:
-                            followup_date_parsed = datetime.strptime(str(next_followup_date)[:10], '%Y-%m-%d').date()
-                        
-                        if followup_date_parsed <= datetime.now().date():
-                            # Add overdue flag for highlighting
-                            lead_dict['is_overdue'] = followup_date_parsed < datetime.now().date()
-                            lead_dict['overdue_days'] = (datetime.now().date() - followup_date_parsed).days
-                            lead_dict['follow_up_date'] = str(next_followup_date)
-                            todays_followups_walkin.append(lead_dict)
-                            print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to today's followups - Follow-up date: {next_followup_date}, Parsed: {followup_date_parsed}, Today: {datetime.now().date()}, Overdue: {lead_dict['is_overdue']}")
-                    except (ValueError, TypeError):
-                        # If date parsing fails, include the lead for manual review
-                        lead_dict['is_overdue'] = False
-                        lead_dict['overdue_days'] = 0
-                        lead_dict['follow_up_date'] = str(next_followup_date)
-                        todays_followups_walkin.append(lead_dict)
-                        print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to today's followups (date parse failed)")
-                
-                # Add to pending leads if no first call has been made yet
-                if not next_followup_date:
-                    print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} NOT added to today's followups - missing next_followup_date")
-                # Get lead_status for walk-in leads (use status field or default to None)
-                lead_status = lead.get('status') or lead.get('lead_status')
-                print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} - lead_status: {lead_status}")
-                
-                # For walk-in leads, check if any call dates exist
-                has_any_call = any(lead.get(f'{i}_call_date') for i in range(1, 8))
-                print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} - has_any_call: {has_any_call}")
-                
-                if not has_any_call and (not lead_status or lead_status not in excluded_statuses):
-                    pending_leads.append(lead_dict)
-                    print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to pending_leads")
-                else:
-                    # Add to attended leads if any call has been made
-                    attended_leads.append(lead_dict)
-                    print(f"[DEBUG] Walk-in lead {lead_dict['lead_uid']} added to attended_leads")
+        window_start, window_end = resolve_date_window(filter_type, start_date, end_date)
+        counts = tab_counts(supabase, lambda tab_name: ps_tab_sources(ps_name, tab_name, window_start, window_end),
+                            PS_COUNT_TABS)
+        print(f"[PERF] ps_dashboard TOTAL took {time.time() - start_time:.3f} seconds")
 
-        # Update the walkin_leads list with processed data for template
-        processed_walkin_leads = []
-        for lead in walkin_leads:
-            lead_dict = dict(lead)  # Make a copy to avoid mutating the original
-            
-            # Ensure UID is properly set for walkin leads
-            if lead.get('uid'):
-                lead_dict['lead_uid'] = lead.get('uid')
-            else:
-                # Generate UID if not present (for older records)
-                lead_dict['lead_uid'] = f"W{lead.get('id')}"
-            
-            # Also set the uid field for consistency
-            lead_dict['uid'] = lead_dict['lead_uid']
-            lead_dict['customer_mobile_number'] = lead.get('mobile_number', '')
-            lead_dict['customer_name'] = lead.get('customer_name', '')
-            lead_dict['source'] = 'Walk-in'
-            lead_dict['is_walkin'] = True
-            lead_dict['walkin_id'] = lead.get('id')
-            lead_dict['cre_name'] = ''
-            lead_dict['created_at'] = lead.get('created_at', '')
-            lead_dict['lead_category'] = lead.get('lead_category', 'Not Set')
-            
-            processed_walkin_leads.append(lead_dict)
-        
-        # Replace the original walkin_leads with processed data
-        walkin_leads = processed_walkin_leads
-        
-        print(f"[PERF] ps_dashboard: walk-in leads processing took {time.time() - t3_5:.3f} seconds")
-
-        t4 = time.time()
-        # Apply date filtering to lost leads using lost_timestamp
-        def filter_lost_by_timestamp(leads_list):
-            if filter_type == 'all':
-                return leads_list
-            elif filter_type == 'today':
-                return [lead for lead in leads_list if lead.get('lost_timestamp') and str(lead.get('lost_timestamp')).startswith(today_str)]
-            elif filter_type == 'range' and start_date and end_date:
-                filtered = []
-                for lead in leads_list:
-                    ts = lead.get('lost_timestamp')
-                    if ts:
-                        try:
-                            date_val = ts[:10]
-                            if start_date <= date_val <= end_date:
-                                filtered.append(lead)
-                        except Exception:
-                            continue
-                return filtered
-            else:
-                return leads_list
-
-        # Apply timestamp filtering to lost leads
-        lost_leads = filter_lost_by_timestamp(lost_leads)
-
-        print(f"[PERF] ps_dashboard: lost leads timestamp filtering took {time.time() - t4:.3f} seconds")
-
-        t5 = time.time()
-        # Merge today's followup lists
-        todays_followups = todays_followups_regular + todays_followups_event + todays_followups_walkin
-
-        print(f"[DEBUG] Today's followups breakdown:")
-        print(f"  - Regular leads: {len(todays_followups_regular)}")
-        print(f"  - Event leads: {len(todays_followups_event)}")
-        print(f"  - Walk-in leads: {len(todays_followups_walkin)}")
-        print(f"  - Total: {len(todays_followups)}")
-        print(f"[DEBUG] Regular leads in today's followups: {[lead.get('lead_uid') for lead in todays_followups_regular]}")
-        print(f"[DEBUG] Event leads in today's followups: {[lead.get('lead_uid') for lead in todays_followups_event]}")
-        print(f"[DEBUG] Walk-in leads in today's followups: {[lead.get('lead_uid') for lead in todays_followups_walkin]}")
-
-        print(f"[PERF] ps_dashboard: final processing took {time.time() - t5:.3f} seconds")
-
-        t6 = time.time()
-        # Render template with all lead categories and the new status variable
-        result = render_template('ps_dashboard.html',
-                               assigned_leads=assigned_leads,
-                               fresh_leads=fresh_leads,
-                               pending_leads=pending_leads,
-                               todays_followups=todays_followups,
-                               attended_leads=attended_leads,
-                               won_leads=won_leads,
-                               lost_leads=lost_leads,
-                               event_leads=event_leads,
-                               walkin_leads=walkin_leads,
+        return render_template('ps_dashboard.html',
+                               counts=counts,
+                               untouched_count=counts['untouched'],
+                               called_count=counts['called'],
+                               follow_up_count=counts['follow_up'],
+                               total_fresh_leads=counts['fresh'],
+                               today_count=counts['followups_today'],
+                               overdue_count=counts['followups_overdue'],
+                               won_leads=[],
+                               lost_leads=[],
                                filter_type=filter_type,
                                start_date=start_date,
                                end_date=end_date,
                                status_filter=status_filter,
-                               status=status)  # <-- Add status here
-
-        print(f"[PERF] ps_dashboard: render_template took {time.time() - t6:.3f} seconds")
-        # Calculate counts for fresh leads subsections
-        untouched_count = len(untouched_leads)
-        called_count = len(called_leads)
-        follow_up_count = len(follow_up_leads)
-        total_fresh_leads = untouched_count + called_count + follow_up_count
-        
-        print(f"[DEBUG] FINAL COUNTS - Fresh: {len(fresh_leads)}, Pending: {len(pending_leads)}, Attended: {len(attended_leads)}, Won: {len(won_leads)}, Lost: {len(lost_leads)}, Event: {len(event_leads)}")
-        print(f"[DEBUG] Fresh leads subsections - Untouched: {untouched_count}, Called: {called_count}, Follow Up: {follow_up_count}")
-        print(f"[DEBUG] Fresh leads being sent to template: {[lead.get('lead_uid') for lead in fresh_leads]}")
-        print(f"[DEBUG] Pending leads being sent to template: {[lead.get('lead_uid') for lead in pending_leads]}")
-        print(f"[DEBUG] Won leads being sent to template: {[lead.get('lead_uid') for lead in won_leads]}")
-        print(f"[DEBUG] Lost leads being sent to template: {[lead.get('lead_uid') for lead in lost_leads]}")
-        print(f"[DEBUG] Event leads being sent to template: {[lead.get('lead_uid') for lead in event_leads]}")
-        print(f"[DEBUG] Walk-in leads count: {len(walkin_leads) if walkin_leads else 0}")
-        print(f"[DEBUG] Today's followups being sent to template: {[lead.get('lead_uid') for lead in todays_followups]}")
-        print(f"[DEBUG] Today's followups count being sent to template: {len(todays_followups)}")
-        print(f"[DEBUG] Today's followups breakdown:")
-        print(f"  - Regular leads: {len(todays_followups_regular)}")
-        print(f"  - Event leads: {len(todays_followups_event)}")
-        print(f"  - Walk-in leads: {len(todays_followups_walkin)}")
-        print(f"[DEBUG] Today's followups details:")
-        for i, lead in enumerate(todays_followups):
-            print(f"  {i+1}. {lead.get('lead_uid', 'N/A')} - {lead.get('customer_name', 'N/A')} - Follow-up: {lead.get('follow_up_date', 'N/A')}")
-        
-        # Debug date comparison issues
-        print(f"[DEBUG] Date comparison debug:")
-        print(f"  - date.today(): {date.today()}")
-        print(f"  - datetime.now().date(): {datetime.now().date()}")
-        print(f"  - today_str: {today_str if 'today_str' in locals() else 'Not defined'}")
-        
-        print(f"[PERF] ps_dashboard TOTAL took {time.time() - start_time:.3f} seconds")
-        
-        # Add session data to template context for debugging
-        template_data = {
-            'assigned_leads': assigned_leads,
-            'fresh_leads': fresh_leads,
-            'untouched_leads': untouched_leads,
-            'called_leads': called_leads,
-            'follow_up_leads': follow_up_leads,
-            'untouched_count': untouched_count,
-            'called_count': called_count,
-            'follow_up_count': follow_up_count,
-            'total_fresh_leads': total_fresh_leads,
-            'pending_leads': pending_leads,
-            'todays_followups': todays_followups,
-            'attended_leads': attended_leads,
-            'won_leads': won_leads,
-            'lost_leads': lost_leads,
-            'event_leads': event_leads,
-            'walkin_leads': walkin_leads,
-            'filter_type': filter_type,
-            'start_date': start_date,
-            'end_date': end_date,
-            'status_filter': status_filter,
-            'status': status,
-            'tab': tab,  # Add tab parameter
-            'category_filter': category_filter,  # Add category filter parameter
-            'ps_name': ps_name,  # Pass ps_name directly to template
-            'debug_info': {
-                'session_data': dict(session),
-                'ps_name': ps_name,
-                'total_leads': len(assigned_leads) if assigned_leads else 0
-            }
-        }
-        
-        result = render_template('ps_dashboard.html', **template_data)
-        return result
+                               status=status,
+                               tab=tab,
+                               category_filter=category_filter,
+                               ps_name=ps_name)
 
     except Exception as e:
         print(f"[PERF] ps_dashboard failed after {time.time() - start_time:.3f} seconds: {e}")
         flash(f'Error loading dashboard: {str(e)}', 'error')
         return render_template('ps_dashboard.html',
-                             assigned_leads=[],
-                             fresh_leads=[],
-                             pending_leads=[],
-                             todays_followups=[],
-                             attended_leads=[],
-                             won_leads=[],
-                             lost_leads=[],
-                             event_leads=[],
-                             walkin_leads=[],
-                             filter_type=filter_type,
-                             start_date=start_date,
-                             end_date=end_date,
-                             status_filter=status_filter,
-                             status=status,
-                             ps_name=ps_name if 'ps_name' in locals() else 'Unknown',
-                             debug_info={
-                                 'session_data': dict(session),
-                                 'ps_name': ps_name if 'ps_name' in locals() else 'Unknown',
-                                 'error': str(e)
-                             })
+                               counts=defaultdict(int),
+                               won_leads=[],
+                               lost_leads=[],
+                               filter_type=filter_type,
+                               start_date=start_date,
+                               end_date=end_date,
+                               status_filter=status_filter,
+                               status=status,
+                               tab=tab,
+                               category_filter=category_filter,
+                               ps_name=ps_name)
+
+
+@app.route('/api/ps_dashboard/tab/<tab_name>')
+@require_ps
+def api_ps_dashboard_tab(tab_name):
+    """
+    One page of a PS dashboard tab.
+
+    Query args: page, per_page (max 200), sort, order (asc|desc), search,
+    filter_type/start_date/end_date, branch/ps_name/lead_category (e.g. the
+    Hot/Warm/Cold toggles), cursor (the previous response's cursor, for tabs
+    spread over several tables) and format=html to get the rendered table
+    rows instead of JSON rows. Filters, search, order and page are all
+    applied in the database query.
+    """
+    if tab_name not in PS_TABS:
+        return jsonify({'success': False, 'message': f'Unknown tab: {tab_name}'}), 404
+    try:
+        ps_name = _resolve_ps_name()
+        if not ps_name:
+            return jsonify({'success': False, 'message': 'Could not determine PS name. Please log in again.'}), 401
+        page, per_page, sort, descending, search = parse_page_args(request.args)
+        window_start, window_end = resolve_date_window(
+            request.args.get('filter_type', 'all'), request.args.get('start_date'), request.args.get('end_date')
+        )
+
+        _, _, column_filters = parse_filter_args(request.args)
 
+        sources = narrow_sources(ps_tab_sources(ps_name, tab_name, window_start, window_end),
+                                 filters=column_filters, search=search)
+        leads, total, cursor = load_tab_page(supabase, sources, tab_name, page, per_page, sort, descending,
+                                             request.args.get('cursor'))
+
+        response = {
+            'success': True,
+            'tab': tab_name,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': max((total + per_page - 1) // per_page, 1),
+            'cursor': cursor,
+        }
+        if request.args.get('format') == 'html':
+            response['html'] = render_template('ps_dashboard_rows.html', tab=tab_name, leads=leads)
+        else:
+            response['rows'] = leads
+        return jsonify(response)
+    except InvalidTabRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        print(f"Error loading PS dashboard tab {tab_name}: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 
 @app.route('/update_walkin_lead/<int:walkin_id>', methods=['GET', 'POST'])
@@ -9565,12 +8902,18 @@ def performance_metrics():
     Get performance metrics for monitoring
     """
     try:
-        # Get basic metrics
+        # Get basic metrics (COUNT queries, nothing is downloaded)
+        total_leads, total_ps_followups, active_cre_users, active_ps_users = get_accurate_counts([
+            ('lead_master', None),
+            ('ps_followup_master', None),
+            ('cre_users', {'is_active': True}),
+            ('ps_users', {'is_active': True}),
+        ])
         metrics = {
-            'total_leads': len(safe_get_data('lead_master')),
-            'total_ps_followups': len(safe_get_data('ps_followup_master')),
-            'active_cre_users': len([u for u in safe_get_data('cre_users') if u.get('is_active')]),
-            'active_ps_users': len([u for u in safe_get_data('ps_users') if u.get('is_active')])
+            'total_leads': total_leads,
+            'total_ps_followups': total_ps_followups,
+            'active_cre_users': active_cre_users,
+            'active_ps_users': active_ps_users
         }
 
         return jsonify({
@@ -9605,6 +8948,8 @@ def ensure_static_directories():
     except Exception as e:
         print(f"Error creating static directories: {e}")
         return None
+
+
 @app.route('/analytics')
 @require_auth(['admin'])
 def analytics():
@@ -9616,162 +8961,145 @@ def analytics():
         today_filter = request.args.get('today', 'false') == 'true'
 
         today = datetime.now().date()
-        start_date = None
-        end_date = None
-        
+
         if today_filter:
-            # Today filter - set both start and end to today
-            start_date = today
-            end_date = today
+            start_date, end_date = resolve_date_window('today')
         elif start_date_str and end_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                # Ensure end_date includes the full day by setting it to end of day
-                end_date = end_date
-            except Exception:
-                start_date = None
-                end_date = None
+            start_date, end_date = resolve_date_window('range', start_date_str, end_date_str)
         elif period == 'all':
-            start_date = None
+            start_date, end_date = None, None
         else:
+            # Trailing N days (N from the period selector)
             days = int(period) if period.isdigit() else 30
-            start_date = today - timedelta(days=days)
-            end_date = today
+            start_date, end_date = today - timedelta(days=days), today
+
+        # Daily fact rollups (by day, source, CRE, PS, branch and status; by
+        # campaign; by category and model, see analytics_rollup.py) replace
+        # reading the raw lead tables
+        all_cres = safe_get_data('cre_users', select_fields='id')
+        all_ps = safe_get_data('ps_users', select_fields='name, branch')
+        window_facts = load_analytics_facts(supabase, start_date, end_date)
+        campaign_facts = window_facts[CAMPAIGN_ROLLUP.table]
+        if (start_date is None or start_date <= today) and (end_date is None or end_date >= today):
+            todays_facts = [f for f in campaign_facts if f['metric_day'] == today.isoformat()]
+        else:
+            todays_facts = load_analytics_facts(supabase, today, today, [CAMPAIGN_ROLLUP])[CAMPAIGN_ROLLUP.table]
 
-        # Get all data
-        all_leads = safe_get_data('lead_master')
-        all_cres = safe_get_data('cre_users')
-        all_ps = safe_get_data('ps_users')
-        ps_followups = safe_get_data('ps_followup_master')
-        all_walkins = safe_get_data('walkin_table')  # Add walkin table data
+        # Facts dated by lead creation; campaign won/lost facts are dated by closure
+        lead_facts = [f for f in window_facts[DAILY_ROLLUP.table] if f['source_table'] == 'lead_master']
+        walkin_facts = [f for f in window_facts[DAILY_ROLLUP.table] if f['source_table'] == 'walkin_table']
+        profile_facts = [f for f in window_facts[PROFILE_ROLLUP.table] if f['source_table'] == 'lead_master']
 
-        # Filter leads by date if needed
-        filtered_leads = []
-        for lead in all_leads:
-            lead_date_str = lead.get('created_at') or lead.get('date')
-            if lead_date_str:
-                try:
-                    if 'T' in lead_date_str:
-                        lead_date = datetime.fromisoformat(lead_date_str.replace('Z', '+00:00')).date()
-                    else:
-                        lead_date = datetime.strptime(lead_date_str, '%Y-%m-%d').date()
-                except (ValueError, TypeError):
-                    filtered_leads.append(lead)
-                    continue
-                if start_date and end_date:
-                    # Include both start and end dates (inclusive)
-                    if start_date <= lead_date <= end_date:
-                        filtered_leads.append(lead)
-                elif start_date:
-                    if lead_date >= start_date:
-                        filtered_leads.append(lead)
-                else:
-                    filtered_leads.append(lead)
-            else:
-                filtered_leads.append(lead)
-        leads = filtered_leads
+        def count_facts(facts, metric='leads'):
+            return sum(f[metric] for f in facts)
 
-        # Filter walkins by date if needed
-        filtered_walkins = []
-        for walkin in all_walkins:
-            walkin_date_str = walkin.get('created_at')
-            if walkin_date_str:
-                try:
-                    if 'T' in walkin_date_str:
-                        walkin_date = datetime.fromisoformat(walkin_date_str.replace('Z', '+00:00')).date()
-                    else:
-                        walkin_date = datetime.strptime(walkin_date_str, '%Y-%m-%d').date()
-                except (ValueError, TypeError):
-                    filtered_walkins.append(walkin)
-                    continue
-                if start_date and end_date:
-                    # Include both start and end dates (inclusive)
-                    if start_date <= walkin_date <= end_date:
-                        filtered_walkins.append(walkin)
-                elif start_date:
-                    if walkin_date >= start_date:
-                        filtered_walkins.append(walkin)
-                else:
-                    filtered_walkins.append(walkin)
-            else:
-                filtered_walkins.append(walkin)
-        walkins = filtered_walkins
+        # Calculate Campaign & Platform Lead Counts
+        campaign_platform_data = {}
+
+        def campaign_entry(fact):
+            campaign = fact.get('campaign')
+            source = fact.get('source')
+            # Normalize and check for empty, whitespace, or 'none' (case-insensitive)
+            campaign_clean = campaign.strip().lower()
+            source_clean = source.strip().lower()
+            if not campaign_clean or campaign_clean == 'none' or not source_clean or source_clean == 'none':
+                return None
+            key = f"{campaign}|{source}"
+            if key not in campaign_platform_data:
+                campaign_platform_data[key] = {
+                    'campaign': campaign,
+                    'platform': source,
+                    'total_leads': 0,
+                    'todays_leads': 0,
+                    'lost': 0,
+                    'pending': 0,
+                    'won': 0
+                }
+            return campaign_platform_data[key]
+
+        for fact in campaign_facts:
+            if fact['source_table'] != 'lead_master':
+                continue
+            entry = campaign_entry(fact)
+            if entry is None:
+                continue
+            if fact['kind'] == KIND_CREATED:
+                # Total and pending leads (created_at within date filter)
+                entry['total_leads'] += fact['leads']
+                entry['pending'] += fact['pending_open']
+            elif fact['kind'] == KIND_WON:
+                # Won leads (won_timestamp within date filter)
+                entry['won'] += fact['leads']
+            elif fact['kind'] == KIND_LOST:
+                # Lost leads (lost_timestamp within date filter)
+                entry['lost'] += fact['leads']
+
+        # Today's Leads (ignores date filter)
+        for fact in todays_facts:
+            if fact['kind'] == KIND_CREATED and fact['source_table'] == 'lead_master':
+                entry = campaign_entry(fact)
+                if entry is not None:
+                    entry['todays_leads'] += fact['leads']
+
+        all_leads_count = count_rows(supabase, 'lead_master')
 
         # Calculate KPIs
-        total_leads = len(leads)
-        won_leads = len([l for l in leads if l.get('final_status') == 'Won'])
+        total_leads = count_facts(lead_facts)
+        # Won as everywhere on this page: final_status 'won', ignoring case and spaces
+        won_leads = count_facts(lead_facts, 'won')
         conversion_rate = round((won_leads / total_leads * 100) if total_leads > 0 else 0, 1)
 
         # Calculate walkin KPIs
-        total_walkins = len(walkins)
-        won_walkins = len([w for w in walkins if w.get('status') == 'Won'])
+        total_walkins = count_facts(walkin_facts)
+        won_walkins = count_facts(walkin_facts, 'won')
         walkin_conversion_rate = round((won_walkins / total_walkins * 100) if total_walkins > 0 else 0, 1)
 
-
-
         # Calculate average response time (days to first call)
-        response_times = []
-        for lead in leads:
-            if lead.get('first_call_date') and lead.get('date'):
-                try:
-                    lead_date = datetime.strptime(lead['date'], '%Y-%m-%d').date()
-                    call_date = datetime.strptime(lead['first_call_date'], '%Y-%m-%d').date()
-                    response_times.append((call_date - lead_date).days)
-                except (ValueError, TypeError):
-                    continue
-        avg_response_time = f"{round(sum(response_times) / len(response_times), 1)} days" if response_times else "N/A"
+        response_count = count_facts(lead_facts, 'response_count')
+        avg_response_time = (f"{round(count_facts(lead_facts, 'response_days_sum') / response_count, 1)} days"
+                             if response_count else "N/A")
 
         # Active CREs (CREs with leads assigned)
-        active_cres = len(set([l.get('cre_name') for l in leads if l.get('cre_name')]))
+        active_cres = len(set([f['cre_name'] for f in lead_facts if f['cre_name']]))
         total_cres = len(all_cres)
 
         # Source distribution
-        source_counts = Counter([l.get('source', 'Unknown') for l in leads])
+        source_counts = Counter()
+        for fact in lead_facts:
+            source_counts[fact['source'] or 'Unknown'] += fact['leads']
         source_labels = list(source_counts.keys())
         source_data = list(source_counts.values())
 
         # Lead trends (last 30 days)
+        leads_per_day = Counter()
+        for fact in lead_facts:
+            leads_per_day[fact['lead_day']] += fact['leads']
         trend_data = []
         trend_labels = []
         for i in range(29, -1, -1):
             date = today - timedelta(days=i)
-            count = len([l for l in leads if l.get('date') == str(date)])
-            trend_data.append(count)
+            trend_data.append(leads_per_day.get(str(date), 0))
             trend_labels.append(date.strftime('%m/%d'))
 
         # Top performing CREs with new parameters
-        cre_performance = defaultdict(lambda: {'total': 0, 'hot': 0, 'warm': 0, 'cold': 0, 'won': 0, 'lost': 0, 'calls': []})
-        for lead in leads:
-            cre_name = lead.get('cre_name')
+        cre_performance = defaultdict(lambda: {'total': 0, 'hot': 0, 'warm': 0, 'cold': 0, 'won': 0, 'lost': 0, 'calls': 0})
+        for fact in lead_facts:
+            cre_name = fact['cre_name']
             if cre_name:
-                cre_performance[cre_name]['total'] += 1
+                cre_performance[cre_name]['total'] += fact['leads']
                 # Hot/Warm/Cold by lead_category
-                category = (lead.get('lead_category') or '').strip().lower()
-                if category == 'hot':
-                    cre_performance[cre_name]['hot'] += 1
-                elif category == 'warm':
-                    cre_performance[cre_name]['warm'] += 1
-                elif category == 'cold':
-                    cre_performance[cre_name]['cold'] += 1
+                for category in ('hot', 'warm', 'cold'):
+                    cre_performance[cre_name][category] += fact[category]
                 # Won/Lost by final_status
-                if (lead.get('final_status') or '').strip().lower() == 'won':
-                    cre_performance[cre_name]['won'] += 1
-                elif (lead.get('final_status') or '').strip().lower() == 'lost':
-                    cre_performance[cre_name]['lost'] += 1
+                cre_performance[cre_name]['won'] += fact['won']
+                cre_performance[cre_name]['lost'] += fact['lost']
                 # Count calls made
-                call_count = 0
-                call_fields = ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh']
-                for call_field in call_fields:
-                    if lead.get(f'{call_field}_call_date'):
-                        call_count += 1
-                cre_performance[cre_name]['calls'].append(call_count)
+                cre_performance[cre_name]['calls'] += fact['calls']
 
         # Calculate conversion rates and average calls for CREs
         top_cres = []
         for cre_name, data in cre_performance.items():
-            total_calls = sum(data['calls'])
-            avg_calls = round(total_calls / len(data['calls']), 1) if data['calls'] else 0
+            avg_calls = round(data['calls'] / data['total'], 1) if data['total'] else 0
             conversion_rate_cre = round((data['won'] / data['total'] * 100) if data['total'] > 0 else 0, 1)
             top_cres.append({
                 'name': cre_name,
@@ -9788,10 +9116,11 @@ def analytics():
         top_cres = sorted(top_cres, key=lambda x: x['won_leads'], reverse=True)[:5]
 
         # Lead categories (add Won and Lost as categories)
-        category_counts = Counter([l.get('lead_category', 'None') for l in leads])
-        won_count = len([l for l in leads if (l.get('final_status') or '').strip().lower() == 'won'])
-        lost_count = len([l for l in leads if (l.get('final_status') or '').strip().lower() == 'lost'])
-        total_leads = len(leads)
+        category_counts = Counter()
+        for fact in profile_facts:
+            category_counts[fact['lead_category'] or 'None'] += fact['leads']
+        won_count = count_facts(lead_facts, 'won')
+        lost_count = count_facts(lead_facts, 'lost')
         lead_categories = []
         # Add regular categories
         for category, count in category_counts.items():
@@ -9816,7 +9145,9 @@ def analytics():
             })
 
         # Model interest
-        model_counts = Counter([l.get('model_interested', 'Not specified') for l in leads])
+        model_counts = Counter()
+        for fact in profile_facts:
+            model_counts[fact['model_interested'] or 'Not specified'] += fact['leads']
         model_interest = []
         for model, count in model_counts.items():
             percentage = round((count / total_leads * 100) if total_leads > 0 else 0, 1)
@@ -9827,26 +9158,32 @@ def analytics():
             })
 
         # Branch performance
+        leads_per_ps = Counter()
+        won_per_ps = Counter()
+        for fact in lead_facts:
+            if fact['ps_name']:
+                leads_per_ps[fact['ps_name']] += fact['leads']
+                won_per_ps[fact['ps_name']] += fact['won']
         branch_performance = []
         branches = set([ps.get('branch') for ps in all_ps if ps.get('branch') and ps.get('branch') != 'TEST'])
         for branch in branches:
             branch_ps = [ps for ps in all_ps if ps.get('branch') == branch]
-            ps_names = [ps['name'] for ps in branch_ps]
-            branch_leads = [l for l in leads if l.get('ps_name') in ps_names]
-            branch_won = len([l for l in branch_leads if l.get('final_status') == 'Won'])
-            success_rate = round((branch_won / len(branch_leads) * 100) if branch_leads else 0, 1)
+            ps_names = set(ps['name'] for ps in branch_ps)
+            branch_assigned = sum(leads_per_ps[name] for name in ps_names)
+            branch_won = sum(won_per_ps[name] for name in ps_names)
+            success_rate = round((branch_won / branch_assigned * 100) if branch_assigned else 0, 1)
             branch_performance.append({
                 'name': branch,
                 'ps_count': len(branch_ps),
-                'assigned_leads': len(branch_leads),
+                'assigned_leads': branch_assigned,
                 'won_leads': branch_won,
                 'success_rate': success_rate
             })
 
         # Funnel data
-        assigned_cre = len([l for l in leads if l.get('cre_name')])
-        first_call = len([l for l in leads if l.get('first_call_date')])
-        assigned_ps = len([l for l in leads if l.get('ps_name')])
+        assigned_cre = count_facts([f for f in lead_facts if f['cre_name']])
+        first_call = count_facts(lead_facts, 'called')
+        assigned_ps = count_facts([f for f in lead_facts if f['ps_name']])
         funnel = {
             'total': total_leads,
             'assigned_cre': assigned_cre,
@@ -9881,86 +9218,6 @@ def analytics():
         # Calculate leads growth (mock calculation)
         leads_growth = 15
 
-        # Calculate Campaign & Platform Lead Counts
-        def parse_timestamp(timestamp_str):
-            """Parse timestamp string to datetime object"""
-            if not timestamp_str:
-                return None
-            try:
-                if 'T' in timestamp_str:
-                    return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                else:
-                    return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
-                return None
-
-        def is_within_date_filter(target_date, start_date, end_date):
-            """Check if target date is within the filter range"""
-            if not target_date:
-                return False
-            if start_date and end_date:
-                return start_date <= target_date.date() <= end_date
-            elif start_date:
-                return target_date.date() >= start_date
-            return True
-
-        # Get today's date for "Today's Leads" calculation
-        today = datetime.now().date()
-        
-        # Group leads by campaign and source
-        campaign_platform_data = {}
-        
-        for lead in all_leads:
-            campaign = lead.get('campaign')
-            source = lead.get('source')
-            # Normalize and check for None, empty, whitespace, or 'none' (case-insensitive)
-            campaign_clean = str(campaign).strip().lower() if campaign is not None else ''
-            source_clean = str(source).strip().lower() if source is not None else ''
-            if not campaign_clean or campaign_clean == 'none' or not source_clean or source_clean == 'none':
-                continue
-            key = f"{campaign}|{source}"
-            
-            if key not in campaign_platform_data:
-                campaign_platform_data[key] = {
-                    'campaign': campaign,
-                    'platform': source,
-                    'total_leads': 0,
-                    'todays_leads': 0,
-                    'lost': 0,
-                    'pending': 0,
-                    'won': 0
-                }
-            
-            # Parse timestamps
-            created_at = parse_timestamp(lead.get('created_at'))
-            won_timestamp = parse_timestamp(lead.get('won_timestamp'))
-            lost_timestamp = parse_timestamp(lead.get('lost_timestamp'))
-            final_status = lead.get('final_status', '').strip()
-            
-            # Total Leads (respects date filter)
-            if created_at and is_within_date_filter(created_at, start_date, end_date):
-                campaign_platform_data[key]['total_leads'] += 1
-            
-            # Today's Leads (ignores date filter)
-            if created_at and created_at.date() == today:
-                campaign_platform_data[key]['todays_leads'] += 1
-            
-            # Lost leads (lost_timestamp within date filter)
-            if lost_timestamp and is_within_date_filter(lost_timestamp, start_date, end_date):
-                campaign_platform_data[key]['lost'] += 1
-            
-            # Pending leads (final_status = 'Pending', no won/lost timestamp, created_at within filter)
-            if (final_status == 'Pending' and 
-                not won_timestamp and 
-                not lost_timestamp and 
-                created_at and 
-                is_within_date_filter(created_at, start_date, end_date)):
-                campaign_platform_data[key]['pending'] += 1
-            
-            # Won leads (won_timestamp within date filter)
-            if won_timestamp and is_within_date_filter(won_timestamp, start_date, end_date):
-                campaign_platform_data[key]['won'] += 1
-        
         # Calculate conversion rates and format data
         campaign_platform_counts = []
         for key, data in campaign_platform_data.items():
@@ -10007,7 +9264,7 @@ def analytics():
             'funnel': funnel,
             'recent_activities': recent_activities,
             'campaign_platform_counts': campaign_platform_counts,
-            'all_leads_count': len(all_leads)
+            'all_leads_count': all_leads_count
         }
 
         # Log analytics access
@@ -10097,13 +9354,8 @@ def branch_head_dashboard():
         pending_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).eq('status', 'Pending').execute().data or []
         pending_leads_count = len(pending_followup) + len(pending_event) + len(pending_walkin)
         
-        # Today's follow-ups count
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        # Get followups with date <= today and status = Pending
-        followup_today = supabase.table('ps_followup_master').select('*').eq('ps_branch', branch).eq('final_status', 'Pending').lte('follow_up_date', today_str).execute().data or []
-        event_today = supabase.table('activity_leads').select('*').eq('location', branch).eq('final_status', 'Pending').lte('ps_followup_date_ts', today_str).execute().data or []
-        walkin_today = supabase.table('walkin_table').select('*').eq('branch', branch).eq('status', 'Pending').lte('next_followup_date', today_str).execute().data or []
-        followup_leads_count = len(followup_today) + len(event_today) + len(walkin_today)
+        # Today's follow-ups count (followups with date <= today and status = Pending)
+        followup_leads_count = get_branch_head_kpis(branch)['followup_leads_count']
         
         # Event leads count
         event_leads = supabase.table('activity_leads').select('*').eq('location', branch).execute().data or []
@@ -10132,6 +9384,52 @@ def branch_head_dashboard():
                          event_leads_count=event_leads_count,
                          won_leads_count=won_leads_count,
                          lost_leads_count=lost_leads_count)
+
+
+def get_branch_head_kpis(branch):
+    """
+    Fresh and today's follow-up counts of a branch, per source (PS leads,
+    walk-ins, events) and in total.
+
+    The six counts are resolved in one round trip via count_many and kept in
+    branch_kpi_cache for 5 minutes; writes through this process to the lead
+    tables of the branch drop the entry earlier.
+    """
+    if not branch:
+        return {'by_source': {}, 'fresh_leads_count': 0, 'followup_leads_count': 0}
+
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    cache_key = (branch, today_str)
+    cached = branch_kpi_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = branch_kpi_cache.generation()
+
+    specs = [
+        # Fresh: no follow-up date yet and still pending
+        ('ps_followup_master', {'ps_branch': branch, 'final_status': 'Pending', 'follow_up_date': ('is', 'null')}),
+        ('walkin_table', {'branch': branch, 'status': 'Pending', 'next_followup_date': ('is', 'null')}),
+        ('activity_leads', {'location': branch, 'final_status': 'Pending', 'ps_followup_date_ts': ('is', 'null')}),
+        # Today's follow-ups: follow-up date up to today and still pending
+        ('ps_followup_master', {'ps_branch': branch, 'final_status': 'Pending', 'follow_up_date': ('lte', today_str)}),
+        ('walkin_table', {'branch': branch, 'status': 'Pending', 'next_followup_date': ('lte', today_str)}),
+        ('activity_leads', {'location': branch, 'final_status': 'Pending', 'ps_followup_date_ts': ('lte', today_str)}),
+    ]
+    ps_fresh, walkin_fresh, event_fresh, ps_today, walkin_today, event_today = count_many(supabase, specs)
+
+    kpis = {
+        'by_source': {
+            'ps': {'fresh': ps_fresh, 'followup_today': ps_today},
+            'walkin': {'fresh': walkin_fresh, 'followup_today': walkin_today},
+            'event': {'fresh': event_fresh, 'followup_today': event_today},
+        },
+        'fresh_leads_count': ps_fresh + walkin_fresh + event_fresh,
+        'followup_leads_count': ps_today + walkin_today + event_today,
+    }
+    # Not stored if a write was committed while counting
+    branch_kpi_cache.set(cache_key, kpis, generation)
+    return kpis
+
 @app.route('/api/branch_head_dashboard_data')
 def api_branch_head_dashboard_data():
     """Get data for branch head dashboard"""
@@ -10143,52 +9441,11 @@ def api_branch_head_dashboard_data():
     # Get branch from session
     branch = session.get('branch_head_branch')
 
-    # OPTIMIZED: Calculate KPI counts using efficient count queries with caching
+    # Fresh / today's follow-up KPI counts: one round trip, cached per branch for all sessions
     try:
-        # Cache key for KPI counts
-        cache_key = f"branch_kpi_{branch}_{datetime.now().strftime('%Y-%m-%d')}"
-        
-        # Check if we have cached KPI counts (cache for 5 minutes)
-        cached_kpis = session.get(cache_key)
-        if cached_kpis and (datetime.now() - cached_kpis.get('timestamp', datetime.now())).seconds < 300:
-            fresh_leads_count = cached_kpis.get('fresh_leads_count', 0)
-            followup_leads_count = cached_kpis.get('followup_leads_count', 0)
-        else:
-            # Fresh leads count - EXCLUDE those with today's follow-up date
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            
-            # PS fresh leads count - ONLY those with NULL follow_up_date AND final_status = 'Pending'
-            ps_fresh_count = supabase.table('ps_followup_master').select('*', count='exact').eq('ps_branch', branch).eq('final_status', 'Pending').is_('follow_up_date', 'null').execute().count or 0
-            
-            # Walk-in fresh leads count - ONLY those with NULL next_followup_date AND status = 'Pending'
-            walkin_fresh_count = supabase.table('walkin_table').select('*', count='exact').eq('branch', branch).eq('status', 'Pending').is_('next_followup_date', 'null').execute().count or 0
-            
-            # Event fresh leads count - ONLY those with NULL ps_followup_date_ts AND final_status = 'Pending'
-            event_fresh_count = supabase.table('activity_leads').select('*', count='exact').eq('location', branch).eq('final_status', 'Pending').is_('ps_followup_date_ts', 'null').execute().count or 0
-            
-            fresh_leads_count = ps_fresh_count + walkin_fresh_count + event_fresh_count
-            
-            # Today's follow-ups count (using exact date matching like your SQL query)
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            
-            # Use the same logic as data loading for accurate counts - followup_date <= today
-            followup_today_count = supabase.table('ps_followup_master').select('*', count='exact').eq('ps_branch', branch).eq('final_status', 'Pending').lte('follow_up_date', today_str).execute().count or 0
-            
-            # Event count with ps_followup_date_ts <= today AND final_status = 'Pending'
-            event_today_count = supabase.table('activity_leads').select('*', count='exact').eq('location', branch).eq('final_status', 'Pending').lte('ps_followup_date_ts', today_str).execute().count or 0
-            
-            # Walk-in count with next_followup_date <= today AND status = 'Pending'
-            walkin_today_count = supabase.table('walkin_table').select('*', count='exact').eq('branch', branch).eq('status', 'Pending').lte('next_followup_date', today_str).execute().count or 0
-            
-            followup_leads_count = followup_today_count + event_today_count + walkin_today_count
-            
-            # Cache the results
-            session[cache_key] = {
-                'fresh_leads_count': fresh_leads_count,
-                'followup_leads_count': followup_leads_count,
-                'timestamp': datetime.now()
-            }
-        
+        kpis = get_branch_head_kpis(branch)
+        fresh_leads_count = kpis['fresh_leads_count']
+        followup_leads_count = kpis['followup_leads_count']
     except Exception as e:
         print(f"Error calculating KPI counts: {str(e)}")
         fresh_leads_count = followup_leads_count = 0
@@ -11401,22 +10658,9 @@ def export_leads_csv():
         if not filter_type or not filter_value:
             return jsonify({'success': False, 'message': 'Filter type and value are required'})
 
-        # Get all leads
-        all_leads = safe_get_data('lead_master')
-
-        # Filter based on type
-        if filter_type == 'final_status':
-            filtered_leads = [l for l in all_leads if l.get('final_status') == filter_value]
-        elif filter_type == 'lead_category':
-            filtered_leads = [l for l in all_leads if l.get('lead_category') == filter_value]
-        else:
+        if filter_type not in ('final_status', 'lead_category'):
             return jsonify({'success': False, 'message': 'Invalid filter type'})
 
-        # Create CSV content
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write headers
         headers = [
             'UID', 'Date', 'Customer Name', 'Mobile Number', 'Source', 'CRE Name', 'PS Name',
             'Lead Category', 'Model Interested', 'Branch', 'Lead Status', 'Final Status',
@@ -11425,62 +10669,30 @@ def export_leads_csv():
             'Fifth Call Date', 'Fifth Remark', 'Sixth Call Date', 'Sixth Remark',
             'Seventh Call Date', 'Seventh Remark', 'Assigned'
         ]
-        writer.writerow(headers)
-
-        # Write data rows
-        for lead in filtered_leads:
-            row = [
-                lead.get('uid', ''),
-                lead.get('date', ''),
-                lead.get('customer_name', ''),
-                lead.get('customer_mobile_number', ''),
-                lead.get('source', ''),
-                lead.get('cre_name', ''),
-                lead.get('ps_name', ''),
-                lead.get('lead_category', ''),
-                lead.get('model_interested', ''),
-                lead.get('branch', ''),
-                lead.get('lead_status', ''),
-                lead.get('final_status', ''),
-                lead.get('follow_up_date', ''),
-                lead.get('first_call_date', ''),
-                lead.get('first_remark', ''),
-                lead.get('second_call_date', ''),
-                lead.get('second_remark', ''),
-                lead.get('third_call_date', ''),
-                lead.get('third_remark', ''),
-                lead.get('fourth_call_date', ''),
-                lead.get('fourth_remark', ''),
-                lead.get('fifth_call_date', ''),
-                lead.get('fifth_remark', ''),
-                lead.get('sixth_call_date', ''),
-                lead.get('sixth_remark', ''),
-                lead.get('seventh_call_date', ''),
-                lead.get('seventh_remark', ''),
-                lead.get('assigned', '')
-            ]
-            writer.writerow(row)
-
-        # Log CSV export
-        auth_manager.log_audit_event(
-            user_id=session.get('user_id'),
-            user_type=session.get('user_type'),
-            action='CSV_EXPORT',
-            resource='lead_master',
-            details={'filter_type': filter_type, 'filter_value': filter_value, 'exported_count': len(filtered_leads)}
-        )
+        columns = [
+            'uid', 'date', 'customer_name', 'customer_mobile_number', 'source', 'cre_name', 'ps_name',
+            'lead_category', 'model_interested', 'branch', 'lead_status', 'final_status',
+            'follow_up_date', 'first_call_date', 'first_remark', 'second_call_date', 'second_remark',
+            'third_call_date', 'third_remark', 'fourth_call_date', 'fourth_remark',
+            'fifth_call_date', 'fifth_remark', 'sixth_call_date', 'sixth_remark',
+            'seventh_call_date', 'seventh_remark', 'assigned'
+        ]
 
-        # Create response
-        output.seek(0)
-        response = app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename=leads_{filter_type}_{filter_value}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            }
-        )
+        def log_export(exported_count, completed):
+            # Log CSV export when the stream ends, also when the download is cancelled or fails
+            auth_manager.log_audit_event(
+                user_id=session.get('user_id'),
+                user_type=session.get('user_type'),
+                action='CSV_EXPORT',
+                resource='lead_master',
+                details={'filter_type': filter_type, 'filter_value': filter_value, 'exported_count': exported_count,
+                         'completed': completed}
+            )
 
-        return response
+        # Stream the matching leads page by page as they are read
+        filename = f'leads_{filter_type}_{filter_value}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return stream_csv_response(filename, headers, safe_iter_data('lead_master', {filter_type: filter_value}),
+                                   row_values(columns), log_export)
 
     except Exception as e:
         print(f"Error exporting CSV: {e}")
@@ -11582,35 +10794,6 @@ def export_leads_by_date_csv():
         if date_field not in valid_date_fields:
             return jsonify({'success': False, 'message': 'Invalid date field'})
 
-        # Get all leads
-        all_leads = safe_get_data('lead_master')
-
-        # Filter by date range
-        filtered_leads = []
-        for lead in all_leads:
-            lead_date_str = lead.get(date_field)
-            if lead_date_str:
-                try:
-                    # Handle different date formats
-                    if 'T' in lead_date_str:  # ISO format with time
-                        lead_date = datetime.fromisoformat(lead_date_str.replace('Z', '+00:00')).date()
-                    else:  # Date only format
-                        lead_date = datetime.strptime(lead_date_str, '%Y-%m-%d').date()
-
-                    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-
-                    if start_date_obj <= lead_date <= end_date_obj:
-                        filtered_leads.append(lead)
-                except (ValueError, TypeError):
-                    # Skip leads with invalid dates
-                    continue
-
-        # Create CSV content
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write headers
         headers = [
             'UID', 'Date', 'Customer Name', 'Mobile Number', 'Source', 'CRE Name', 'PS Name',
             'Lead Category', 'Model Interested', 'Branch', 'Lead Status', 'Final Status',
@@ -11619,68 +10802,36 @@ def export_leads_by_date_csv():
             'Fifth Call Date', 'Fifth Remark', 'Sixth Call Date', 'Sixth Remark',
             'Seventh Call Date', 'Seventh Remark', 'Assigned', 'Created At'
         ]
-        writer.writerow(headers)
-
-        # Write data rows
-        for lead in filtered_leads:
-            row = [
-                lead.get('uid', ''),
-                lead.get('date', ''),
-                lead.get('customer_name', ''),
-                lead.get('customer_mobile_number', ''),
-                lead.get('source', ''),
-                lead.get('cre_name', ''),
-                lead.get('ps_name', ''),
-                lead.get('lead_category', ''),
-                lead.get('model_interested', ''),
-                lead.get('branch', ''),
-                lead.get('lead_status', ''),
-                lead.get('final_status', ''),
-                lead.get('follow_up_date', ''),
-                lead.get('first_call_date', ''),
-                lead.get('first_remark', ''),
-                lead.get('second_call_date', ''),
-                lead.get('second_remark', ''),
-                lead.get('third_call_date', ''),
-                lead.get('third_remark', ''),
-                lead.get('fourth_call_date', ''),
-                lead.get('fourth_remark', ''),
-                lead.get('fifth_call_date', ''),
-                lead.get('fifth_remark', ''),
-                lead.get('sixth_call_date', ''),
-                lead.get('sixth_remark', ''),
-                lead.get('seventh_call_date', ''),
-                lead.get('seventh_remark', ''),
-                lead.get('assigned', ''),
-                lead.get('created_at', '')
-            ]
-            writer.writerow(row)
-
-        # Log CSV export
-        auth_manager.log_audit_event(
-            user_id=session.get('user_id'),
-            user_type=session.get('user_type'),
-            action='DATE_RANGE_CSV_EXPORT',
-            resource='lead_master',
-            details={
-                'start_date': start_date,
-                'end_date': end_date,
-                'date_field': date_field,
-                'exported_count': len(filtered_leads)
-            }
-        )
+        columns = [
+            'uid', 'date', 'customer_name', 'customer_mobile_number', 'source', 'cre_name', 'ps_name',
+            'lead_category', 'model_interested', 'branch', 'lead_status', 'final_status',
+            'follow_up_date', 'first_call_date', 'first_remark', 'second_call_date', 'second_remark',
+            'third_call_date', 'third_remark', 'fourth_call_date', 'fourth_remark',
+            'fifth_call_date', 'fifth_remark', 'sixth_call_date', 'sixth_remark',
+            'seventh_call_date', 'seventh_remark', 'assigned', 'created_at'
+        ]
 
-        # Create response
-        output.seek(0)
-        response = app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename=leads_date_range_{start_date}_to_{end_date}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            }
-        )
+        def log_export(exported_count, completed):
+            # Log CSV export when the stream ends, also when the download is cancelled or fails
+            auth_manager.log_audit_event(
+                user_id=session.get('user_id'),
+                user_type=session.get('user_type'),
+                action='DATE_RANGE_CSV_EXPORT',
+                resource='lead_master',
+                details={
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'date_field': date_field,
+                    'exported_count': exported_count,
+                    'completed': completed
+                }
+            )
 
-        return response
+        # The date range is applied in the query; leads are streamed page by page
+        date_hook = date_range_hook(date_field, *resolve_date_window('range', start_date, end_date))
+        filename = f'leads_date_range_{start_date}_to_{end_date}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return stream_csv_response(filename, headers, safe_iter_data('lead_master', query_hook=date_hook),
+                                   row_values(columns), log_export)
 
     except Exception as e:
         print(f"Error exporting date range CSV: {e}")
@@ -11732,76 +10883,35 @@ def export_test_drive_csv():
     try:
         filter_type = request.args.get('filter_type', 'all')  # all, yes, no
         
-        # Get all test drive leads
-        test_drive_leads = safe_get_data('alltest_drive')
-        
-        # Filter based on type
-        if filter_type == 'yes':
-            filtered_leads = [l for l in test_drive_leads if l.get('test_drive_done') == 'Yes']
-        elif filter_type == 'no':
-            filtered_leads = [l for l in test_drive_leads if l.get('test_drive_done') == 'No']
-        else:  # all
-            filtered_leads = test_drive_leads
-        
-        # Create CSV content
-        output = io.StringIO()
-        writer = csv.writer(output)
+        # Filter based on type in the query
+        filters = {'yes': {'test_drive_done': 'Yes'}, 'no': {'test_drive_done': 'No'}}.get(filter_type)
         
-        # Write headers
         headers = [
             'Original ID', 'Customer Name', 'Mobile Number', 'Test Drive Done',
             'Lead Status', 'Lead Category', 'Model Interested', 'Final Status', 'PS Name',
             'Branch', 'Created At', 'Updated At', 'Remarks', 'Activity Name', 'Activity Location',
             'Customer Location', 'Customer Profession', 'Gender', 'Lead Source', 'CRE Name'
         ]
-        writer.writerow(headers)
-        
-        # Write data
-        for lead in filtered_leads:
-            row = [
-                lead.get('original_id', ''),
-                lead.get('customer_name', ''),
-                lead.get('mobile_number', ''),
-                lead.get('test_drive_done', ''),
-                lead.get('lead_status', ''),
-                lead.get('lead_category', ''),
-                lead.get('model_interested', ''),
-                lead.get('final_status', ''),
-                lead.get('ps_name', ''),
-                lead.get('branch', ''),
-                lead.get('created_at', ''),
-                lead.get('updated_at', ''),
-                lead.get('remarks', ''),
-                lead.get('activity_name', ''),
-                lead.get('activity_location', ''),
-                lead.get('customer_location', ''),
-                lead.get('customer_profession', ''),
-                lead.get('gender', ''),
-                lead.get('lead_source', ''),
-                lead.get('cre_name', '')
-            ]
-            writer.writerow(row)
-        
-        # Log export
-        auth_manager.log_audit_event(
-            user_id=session.get('user_id'),
-            user_type=session.get('user_type'),
-            action='TEST_DRIVE_EXPORT',
-            resource='alltest_drive',
-            details={'filter_type': filter_type, 'exported_count': len(filtered_leads)}
-        )
+        columns = [
+            'original_id', 'customer_name', 'mobile_number', 'test_drive_done',
+            'lead_status', 'lead_category', 'model_interested', 'final_status', 'ps_name',
+            'branch', 'created_at', 'updated_at', 'remarks', 'activity_name', 'activity_location',
+            'customer_location', 'customer_profession', 'gender', 'lead_source', 'cre_name'
+        ]
         
-        # Create response
-        output.seek(0)
-        response = app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename=test_drive_leads_{filter_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            }
-        )
+        def log_export(exported_count, completed):
+            # Log export when the stream ends, also when the download is cancelled or fails
+            auth_manager.log_audit_event(
+                user_id=session.get('user_id'),
+                user_type=session.get('user_type'),
+                action='TEST_DRIVE_EXPORT',
+                resource='alltest_drive',
+                details={'filter_type': filter_type, 'exported_count': exported_count, 'completed': completed}
+            )
         
-        return response
+        filename = f'test_drive_leads_{filter_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return stream_csv_response(filename, headers, safe_iter_data('alltest_drive', filters),
+                                   row_values(columns), log_export)
         
     except Exception as e:
         print(f"Error exporting test drive CSV: {e}")
@@ -12145,155 +11255,25 @@ def source_analysis_data():
     try:
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
-        today = datetime.now().date()
-        start_date = None
-        end_date = None
+        start_date, end_date = None, None
         if start_date_str and end_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            except Exception:
-                start_date = None
-                end_date = None
-        sources = [
-            'Google (KNOW)', 'Google', 'Meta(KNOW)', 'Know', 'OEM Web', 'OEM Tele',
-            'Affiliate Bikewale', 'Affiliate 91wheels', 'Affiliate Bikedekho',
-            'BTL (KNOW)', 'Meta'
-        ]
-        all_leads = safe_get_data('lead_master')
-        all_followups = safe_get_data('ps_followup_master')
-        def in_date_range(lead):
-            lead_date_str = lead.get('created_at') or lead.get('date')
-            if not lead_date_str:
-                return True
-            try:
-                if 'T' in lead_date_str:
-                    lead_date = datetime.fromisoformat(lead_date_str.replace('Z', '+00:00')).date()
-                else:
-                    lead_date = datetime.strptime(lead_date_str, '%Y-%m-%d').date()
-            except Exception:
-                return True
-            if start_date and end_date:
-                return start_date <= lead_date <= end_date
-            elif start_date:
-                return lead_date >= start_date
-            else:
-                return True
-        leads = [l for l in all_leads if in_date_range(l)]
-        data = {}
-        for source in sources:
-            data[source] = {
-                'calls_allocated': 0,
-                'calls_attempted': 0,
-                'calls_connected': 0,
-                'pending_total': 0,
-                'pending_interested': 0,
-                'pending_hot': 0,
-                'pending_warm': 0,
-                'pending_cold': 0,
-                'pending_callback': 0,
-                'pending_rnr': 0,
-                'pending_disconnected': 0,
-                'closed_lost_total': 0,
-                'closed_lost_competition': 0,
-                'closed_lost_not_interested': 0,
-                'closed_lost_did_not_enquire': 0,
-                'closed_lost_wrong_lead': 0,
-                'closed_lost_rnr_lost': 0,
-                'closed_lost_finance_reject': 0,
-                'closed_lost_co_dealer': 0,
-                'sales_pipeline_total': 0,
-                'call_progress': {},
-                'latest_remark': '',
-            }
-        def get_source(lead):
-            s = lead.get('source', '').strip()
-            for src in sources:
-                if s.lower() == src.lower():
-                    return src
-            for src in sources:
-                if src.lower() in s.lower():
-                    return src
-            return None
-        for lead in leads:
-            src = get_source(lead)
-            if not src:
-                continue
-            data[src]['calls_allocated'] += 1
-            attempted = any(lead.get(f'{c}_call_date') for c in ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh'])
-            if attempted:
-                data[src]['calls_attempted'] += 1
-            call_statuses = [lead.get(f'{c}_call_status', '').lower() for c in ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh']]
-            connected = any(s and s not in ['rnr', 'busy', 'busy on another call'] for s in call_statuses)
-            if connected:
-                data[src]['calls_connected'] += 1
-            status = (lead.get('lead_status') or '').strip().lower()
-            if status in ['interested', 'call back', 'rnr', 'call disconnected']:
-                data[src]['pending_total'] += 1
-                if status == 'interested':
-                    data[src]['pending_interested'] += 1
-                    cat = (lead.get('lead_category') or '').strip().lower()
-                    if cat == 'hot':
-                        data[src]['pending_hot'] += 1
-                    elif cat == 'warm':
-                        data[src]['pending_warm'] += 1
-                    elif cat == 'cold':
-                        data[src]['pending_cold'] += 1
-                elif status == 'call back':
-                    data[src]['pending_callback'] += 1
-                elif status == 'rnr':
-                    data[src]['pending_rnr'] += 1
-                elif status == 'call disconnected':
-                    data[src]['pending_disconnected'] += 1
-            # --- NEW LOGIC: Use latest follow-up for final_status and lead_status for lost reasons ---
-            uid = lead.get('uid')
-            latest_final_status = (lead.get('final_status') or '').strip().lower()
-            latest_lost_reason = (lead.get('lost_reason') or '').strip().lower()
-            latest_lead_status = (lead.get('lead_status') or '').strip().lower()
-            if uid:
-                followups = [f for f in all_followups if f.get('lead_uid') == uid]
-                if followups:
-                    latest_fu = max(followups, key=lambda f: f.get('created_at', ''))
-                    if latest_fu.get('final_status'):
-                        latest_final_status = latest_fu.get('final_status').strip().lower()
-                    if latest_fu.get('lost_reason'):
-                        latest_lost_reason = latest_fu.get('lost_reason').strip().lower()
-                    if latest_fu.get('lead_status'):
-                        latest_lead_status = latest_fu.get('lead_status').strip().lower()
-            # --- END NEW LOGIC ---
-            if latest_final_status == 'lost':
-                data[src]['closed_lost_total'] += 1
-                # Use lead_status for lost reason
-                if latest_lead_status == 'rnr-lost':
-                    data[src]['closed_lost_rnr_lost'] += 1
-                elif latest_lead_status == 'did not enquire':
-                    data[src]['closed_lost_did_not_enquire'] += 1
-                elif latest_lead_status == 'not interested':
-                    data[src]['closed_lost_not_interested'] += 1
-                elif latest_lead_status == 'lost to competition':
-                    data[src]['closed_lost_competition'] += 1
-                elif latest_lead_status == 'lost to co-dealer':
-                    data[src]['closed_lost_co_dealer'] += 1
-                elif latest_lead_status == 'finance rejected':
-                    data[src]['closed_lost_finance_reject'] += 1
-                elif latest_lead_status == 'wrong lead':
-                    data[src]['closed_lost_wrong_lead'] += 1
-            if latest_final_status == 'won':
-                data[src]['sales_pipeline_total'] += 1
-            call_progress = None
-            for idx, c in enumerate(['seventh', 'sixth', 'fifth', 'fourth', 'third', 'second', 'first']):
-                if lead.get(f'{c}_call_date'):
-                    call_progress = c.capitalize()
-                    break
-            if call_progress:
-                data[src]['call_progress'][lead.get('uid')] = call_progress
-            if uid:
-                followups = [f for f in all_followups if f.get('lead_uid') == uid]
-                if followups:
-                    latest = max(followups, key=lambda f: f.get('created_at', ''))
-                    data[src]['latest_remark'] = latest.get('remark', '')
-        total_row = {k: sum(data[src][k] for src in sources) if isinstance(data[sources[0]][k], int) else {} for k in data[sources[0]].keys()}
-        data['Total'] = total_row
+            start_date, end_date = resolve_date_window('range', start_date_str, end_date_str)
+        # Any source list can be requested (?source=Meta&source=Google); the
+        # funnel defaults to the sources shown on the admin page
+        sources = request.args.getlist('source') or list(FUNNEL_SOURCES)
+        start_time = time.time()
+        # Read both tables from the in-process snapshots: leads in the date window
+        # (on created_at, or date when created_at is missing) and the latest
+        # follow-up per lead
+        lead_frame = lead_snapshot.get_frame(supabase)
+        lead_dates = lead_frame['created_at'].fillna(lead_frame['date'])
+        leads = lead_frame[day_window_mask(lead_dates, start_date, end_date)]
+        followup_frame = ps_followup_snapshot.get_frame(supabase)
+        latest_followups = (followup_frame[followup_frame['lead_uid'].notna()]
+                            .sort_values('created_at', na_position='first', kind='stable')
+                            .drop_duplicates('lead_uid', keep='last'))
+        data = build_source_funnel(leads, latest_followups, sources)
+        print(f"[PERF] source_analysis_data: {len(leads)} leads x {len(sources)} sources in {time.time() - start_time:.3f} seconds")
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -12721,62 +11701,105 @@ def lead_journey_report(uid):
         print(f"Error generating lead journey PDF: {e}")
         return f"Error generating PDF: {str(e)}", 500
 
-@app.route('/export_filtered_leads')
-@require_admin
-def export_filtered_leads():
-    """Export filtered leads as CSV or Excel with selected columns."""
-    import io
-    import csv
-    import openpyxl
-    from flask import send_file
-    # Get filters from query params
-    cre_id = request.args.get('cre_id')
-    source = request.args.get('source')
-    qualification = request.args.get('qualification', 'all')
-    date_filter = request.args.get('date_filter', 'all')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    final_status = request.args.get('final_status', '')
+# Column types of lead_master in Parquet/Arrow exports (other columns are strings)
+LEAD_EXPORT_COLUMN_TYPES = {
+    **{column: 'date' for column in ['date'] + [f'{c}_call_date' for c in
+                                               ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh']]},
+    **{column: 'timestamp' for column in ['created_at', 'cre_assigned_at', 'ps_assigned_at', 'won_timestamp',
+                                          'lost_timestamp']},
+    **{column: 'category' for column in ['source', 'sub_source', 'campaign', 'cre_name', 'ps_name', 'branch',
+                                         'lead_category', 'lead_status', 'final_status', 'model_interested']},
+}
+
+
+def send_columnar_export(columns, row_chunks, format_, filename_prefix):
+    """Send lead rows as a typed Parquet file or Arrow IPC stream (format_ is a COLUMNAR_FORMATS key)"""
+    path = write_columnar_file(columns, row_chunks, LEAD_EXPORT_COLUMN_TYPES, format_)
+    extension, mimetype = COLUMNAR_FORMATS[format_]
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return send_temporary_file(path, filename, mimetype)
+
+
+def send_lead_export(endpoint, filters, format_, filename_prefix, sheet_title, headers, to_row, columns, row_chunks):
+    """
+    Send a lead_master export as CSV, Excel, Parquet or Arrow, served from
+    export_cache when the same export was built since lead_master last changed.
+    ``row_chunks`` must be lazy (e.g. safe_iter_data) so a cache hit reads nothing,
+    and must raise when a read fails: only exports whose reader ran to the end
+    are cached, so a failed read never leaves a short file to be served again.
+    """
+    if format_ in COLUMNAR_FORMATS:
+        extension, mimetype = COLUMNAR_FORMATS[format_]
+    elif format_ == 'excel':
+        extension, mimetype = 'xlsx', XLSX_MIMETYPE
+    else:
+        format_, extension, mimetype = 'csv', 'csv', 'text/csv'
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+    try:
+        cache_key = export_cache.make_key(endpoint, filters, format_, table_data_version(supabase, 'lead_master'))
+    except Exception as e:
+        print(f"Export cache disabled for {endpoint}: {e}")
+        cache_key = None
+
+    if cache_key:
+        cached_path = export_cache.get(cache_key)
+        stats = export_cache.stats()
+        print(f"[PERF] {endpoint}: export cache {'hit' if cached_path else 'miss'} "
+              f"(hits={stats['hits']}, misses={stats['misses']}, bytes={stats['bytes']})")
+        if cached_path:
+            return send_cached_file(cached_path, filename, mimetype)
+
+    if format_ == 'csv':
+        pieces = iter_csv(headers, row_chunks, to_row)
+        return stream_text_response(filename, export_cache.tee(cache_key, pieces) if cache_key else pieces)
+
+    if format_ in COLUMNAR_FORMATS:
+        path = write_columnar_file(columns, row_chunks, LEAD_EXPORT_COLUMN_TYPES, format_)
+    else:
+        path = write_xlsx_file(sheet_title, headers, row_chunks, to_row)
+    cached_path = export_cache.put(cache_key, path) if cache_key else None
+    if cached_path:
+        return send_cached_file(cached_path, filename, mimetype)
+    return send_temporary_file(path, filename, mimetype)
+
+@app.route('/export_filtered_leads')
+@require_admin
+def export_filtered_leads():
+    """Export filtered leads as CSV, Excel, Parquet or Arrow with selected columns."""
+    # Get filters from query params
+    cre_id = request.args.get('cre_id')
+    source = request.args.get('source')
+    qualification = request.args.get('qualification', 'all')
+    date_filter = request.args.get('date_filter', 'all')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    final_status = request.args.get('final_status', '')
     search_uid = request.args.get('search_uid', '').strip()
     format_ = request.args.get('format', 'csv')
-    # Get CREs for name lookup
-    cres = safe_get_data('cre_users')
-    selected_cre = None
-    leads = []
+    # Build the filters for the lead_master query; leads are read page by page
+    filters = {}
+    date_hook = None
     if cre_id:
+        cres = safe_get_data('cre_users')
         selected_cre = next((cre for cre in cres if str(cre.get('id')) == str(cre_id)), None)
-        filters = {'cre_name': selected_cre['name']} if selected_cre else {}
+        if selected_cre:
+            filters['cre_name'] = selected_cre['name']
         if source:
             filters['source'] = source
-        leads = safe_get_data('lead_master', filters)
-        if search_uid:
-            leads = [lead for lead in leads if search_uid.lower() in str(lead.get('uid', '')).lower()]
         if qualification == 'qualified':
-            leads = [lead for lead in leads if lead.get('first_call_date')]
+            filters['first_call_date'] = ('not.is', 'null')
         elif qualification == 'unqualified':
-            leads = [lead for lead in leads if not lead.get('first_call_date')]
+            filters['first_call_date'] = ('is', 'null')
         if final_status:
-            leads = [lead for lead in leads if (lead.get('final_status') or '') == final_status]
+            filters['final_status'] = final_status
         if date_filter == 'today':
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            leads = [lead for lead in leads if (lead.get('cre_assigned_at') or '').startswith(today_str)]
+            date_hook = date_range_hook('cre_assigned_at', *resolve_date_window('today'))
         elif date_filter == 'range' and start_date and end_date:
-            def in_range(ld):
-                dt = ld.get('cre_assigned_at')
-                if not dt:
-                    return False
-                try:
-                    dt_val = dt[:10]
-                    return start_date <= dt_val <= end_date
-                except Exception:
-                    return False
-            leads = [lead for lead in leads if in_range(lead)]
-    else:
-        all_leads = safe_get_data('lead_master')
-        if search_uid:
-            leads = [lead for lead in all_leads if search_uid.lower() in str(lead.get('uid', '')).lower()]
-        else:
-            leads = all_leads
+            date_hook = date_range_hook('cre_assigned_at', *resolve_date_window('range', start_date, end_date))
+    if search_uid:
+        filters['uid'] = ('ilike', f'*{search_uid}*')
+    lead_chunks = safe_iter_data('lead_master', filters, query_hook=date_hook)
     # Columns to export
     export_columns = [
         ('uid', 'UID'),
@@ -12787,37 +11810,22 @@ def export_filtered_leads():
         ('ps_name', 'PS Name'),
         ('final_status', 'Final Status')
     ]
-    if format_ == 'excel':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = 'Leads'
-        ws.append([col[1] for col in export_columns])
-        for lead in leads:
-            ws.append([lead.get(col[0], '') for col in export_columns])
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+    headers = [col[1] for col in export_columns]
+    to_row = row_values([col[0] for col in export_columns])
+    if format_ in COLUMNAR_FORMATS:
+        return send_columnar_export([col[0] for col in export_columns], lead_chunks, format_, 'leads_export')
+    elif format_ == 'excel':
+        path = write_xlsx_file('Leads', headers, lead_chunks, to_row)
         filename = f"leads_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return send_file(output, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return send_temporary_file(path, filename)
     else:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([col[1] for col in export_columns])
-        for lead in leads:
-            writer.writerow([lead.get(col[0], '') for col in export_columns])
-        output.seek(0)
         filename = f"leads_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        return send_file(io.BytesIO(output.getvalue().encode('utf-8')), as_attachment=True, download_name=filename, mimetype='text/csv')
+        return stream_csv_response(filename, headers, lead_chunks, to_row)
 
 @app.route('/export_all_cre_leads')
 @require_admin
 def export_all_cre_leads():
-    """Export all leads assigned to all CREs as CSV or Excel."""
-    import io
-    import csv
-    import openpyxl
-    from flask import send_file
-    
+    """Export all leads assigned to all CREs as CSV, Excel, Parquet or Arrow."""
     print(f"Export All CREs route called with format: {request.args.get('format', 'csv')}")
     format_ = request.args.get('format', 'csv')
     
@@ -12826,11 +11834,6 @@ def export_all_cre_leads():
         cres = safe_get_data('cre_users')
         active_cres = [cre for cre in cres if cre.get('is_active', True)]
         
-        # Get all leads assigned to any CRE
-        all_leads = safe_get_data('lead_master')
-        assigned_leads = [lead for lead in all_leads if lead.get('cre_name')]
-        print(f"Total leads found: {len(all_leads)}, Assigned leads: {len(assigned_leads)}")
-        
         # Columns to export
         export_columns = [
             ('uid', 'UID'),
@@ -12848,84 +11851,39 @@ def export_all_cre_leads():
             ('lead_category', 'Lead Category')
         ]
         
-        if format_ == 'excel':
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = 'All CRE Leads'
-            
-            # Add header
-            ws.append([col[1] for col in export_columns])
-            
-            # Add data
-            for lead in assigned_leads:
-                row_data = []
-                for col_key, col_name in export_columns:
-                    value = lead.get(col_key, '')
-                    # Format dates if they exist
-                    if col_key in ['cre_assigned_at', 'first_call_date', 'last_call_date'] and value:
-                        try:
-                            value = value[:10] if len(value) >= 10 else value  # Get just the date part
-                        except:
-                            pass
-                    row_data.append(value)
-                ws.append(row_data)
-            
-            # Auto-adjust column widths
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
+        def export_row(lead):
+            row_data = []
+            for col_key, col_name in export_columns:
+                value = lead.get(col_key, '')
+                # Format dates if they exist
+                if col_key in ['cre_assigned_at', 'first_call_date', 'last_call_date'] and value:
                     try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
+                        value = value[:10] if len(value) >= 10 else value  # Get just the date part
                     except:
                         pass
-                adjusted_width = min(max_length + 2, 50)  # Cap at 50 characters
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            output = io.BytesIO()
-            wb.save(output)
-            output.seek(0)
-            filename = f"all_cre_leads_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            return send_file(output, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        else:
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Add header
-            writer.writerow([col[1] for col in export_columns])
-            
-            # Add data
-            for lead in assigned_leads:
-                row_data = []
-                for col_key, col_name in export_columns:
-                    value = lead.get(col_key, '')
-                    # Format dates if they exist
-                    if col_key in ['cre_assigned_at', 'first_call_date', 'last_call_date'] and value:
-                        try:
-                            value = value[:10] if len(value) >= 10 else value  # Get just the date part
-                        except:
-                            pass
-                    row_data.append(value)
-                writer.writerow(row_data)
-            
-            output.seek(0)
-            filename = f"all_cre_leads_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            return send_file(io.BytesIO(output.getvalue().encode('utf-8')), as_attachment=True, download_name=filename, mimetype='text/csv')
+                row_data.append(value)
+            return row_data
+        
+        def assigned_lead_chunks():
+            # Leads assigned to any CRE, read page by page
+            for chunk in safe_iter_data('lead_master', {'cre_name': ('not.is', 'null')}):
+                yield [lead for lead in chunk if lead.get('cre_name')]
+        
+        return send_lead_export('export_all_cre_leads', {}, format_, 'all_cre_leads_export', 'All CRE Leads',
+                                [col[1] for col in export_columns], export_row,
+                                [col[0] for col in export_columns], assigned_lead_chunks())
     
     except Exception as e:
         flash(f'Error exporting all CRE leads: {str(e)}', 'error')
         return redirect(url_for('manage_leads'))
 
+# Date columns of a lead_master export row, in order of preference
+LEAD_MASTER_EXPORT_DATE_FIELDS = ['date', 'created_at', 'cre_assigned_at', 'first_call_date']
+
 @app.route('/download_lead_master')
 @require_admin
 def download_lead_master():
     """Download leads from lead_master table with date filtering and comprehensive columns."""
-    import io
-    import csv
-    import openpyxl
-    from flask import send_file
-    
     try:
         # Get filters from query params
         date_filter = request.args.get('date_filter', 'all')
@@ -12933,65 +11891,10 @@ def download_lead_master():
         end_date = request.args.get('end_date')
         format_ = request.args.get('format', 'excel')
         
-        # Get all leads from lead_master
-        all_leads = safe_get_data('lead_master')
-        
-        # Apply date filtering
-        filtered_leads = []
-        today = datetime.now().date()
-        
-        for lead in all_leads:
-            lead_date = None
-            # Try to get date from various date fields
-            date_fields = ['date', 'created_at', 'cre_assigned_at', 'first_call_date']
-            for field in date_fields:
-                if lead.get(field):
-                    try:
-                        # Handle different date formats
-                        date_str = str(lead.get(field))
-                        if 'T' in date_str:
-                            date_str = date_str.split('T')[0]
-                        elif ' ' in date_str:
-                            date_str = date_str.split(' ')[0]
-                        lead_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                        break
-                    except:
-                        continue
-            
-            if not lead_date:
-                # If no valid date found, include the lead
-                filtered_leads.append(lead)
-                continue
-                
-            # Apply date filtering
-            if date_filter == 'today':
-                if lead_date == today:
-                    filtered_leads.append(lead)
-            elif date_filter == 'yesterday':
-                if lead_date == today - timedelta(days=1):
-                    filtered_leads.append(lead)
-            elif date_filter == 'this_week':
-                week_start = today - timedelta(days=today.weekday())
-                if week_start <= lead_date <= today:
-                    filtered_leads.append(lead)
-            elif date_filter == 'this_month':
-                if lead_date.year == today.year and lead_date.month == today.month:
-                    filtered_leads.append(lead)
-            elif date_filter == 'last_month':
-                last_month = today.replace(day=1) - timedelta(days=1)
-                if lead_date.year == last_month.year and lead_date.month == last_month.month:
-                    filtered_leads.append(lead)
-            elif date_filter == 'range' and start_date and end_date:
-                try:
-                    start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-                    end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-                    if start_dt <= lead_date <= end_dt:
-                        filtered_leads.append(lead)
-                except:
-                    # If date parsing fails, include the lead
-                    filtered_leads.append(lead)
-            else:  # 'all' or any other value
-                filtered_leads.append(lead)
+        # Resolve the period to a date window applied in the database query; the
+        # lead date is the first of date, created_at, cre_assigned_at, first_call_date
+        window_start, window_end = resolve_date_window(date_filter, start_date, end_date)
+        date_hook = first_date_range_hook(LEAD_MASTER_EXPORT_DATE_FIELDS, window_start, window_end)
         
         # Define export columns with all required fields
         export_columns = [
@@ -13026,80 +11929,33 @@ def download_lead_master():
             ('sub_source', 'Sub Source')
         ]
         
-        if format_ == 'excel':
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = 'Lead Master Data'
-            
-            # Add header
-            ws.append([col[1] for col in export_columns])
-            
-            # Add data
-            for lead in filtered_leads:
-                row_data = []
-                for col_key, col_name in export_columns:
-                    value = lead.get(col_key, '')
-                    # Format dates if they exist
-                    if 'date' in col_key and value:
-                        try:
-                            if isinstance(value, str):
-                                if 'T' in value:
-                                    value = value.split('T')[0]
-                                elif ' ' in value:
-                                    value = value.split(' ')[0]
-                            value = str(value)[:10] if len(str(value)) >= 10 else str(value)
-                        except:
-                            pass
-                    row_data.append(value)
-                ws.append(row_data)
-            
-            # Auto-adjust column widths
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
+        def export_row(lead):
+            row_data = []
+            for col_key, col_name in export_columns:
+                value = lead.get(col_key, '')
+                # Format dates if they exist
+                if 'date' in col_key and value:
                     try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
+                        if isinstance(value, str):
+                            if 'T' in value:
+                                value = value.split('T')[0]
+                            elif ' ' in value:
+                                value = value.split(' ')[0]
+                        value = str(value)[:10] if len(str(value)) >= 10 else str(value)
                     except:
                         pass
-                adjusted_width = min(max_length + 2, 50)  # Cap at 50 characters
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            output = io.BytesIO()
-            wb.save(output)
-            output.seek(0)
-            filename = f"lead_master_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            return send_file(output, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        else:
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Add header
-            writer.writerow([col[1] for col in export_columns])
-            
-            # Add data
-            for lead in filtered_leads:
-                row_data = []
-                for col_key, col_name in export_columns:
-                    value = lead.get(col_key, '')
-                    # Format dates if they exist
-                    if 'date' in col_key and value:
-                        try:
-                            if isinstance(value, str):
-                                if 'T' in value:
-                                    value = value.split('T')[0]
-                                elif ' ' in value:
-                                    value = value.split(' ')[0]
-                            value = str(value)[:10] if len(str(value)) >= 10 else str(value)
-                        except:
-                            pass
-                    row_data.append(value)
-                writer.writerow(row_data)
-            
-            output.seek(0)
-            filename = f"lead_master_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            return send_file(io.BytesIO(output.getvalue().encode('utf-8')), as_attachment=True, download_name=filename, mimetype='text/csv')
+                row_data.append(value)
+            return row_data
+        
+        # Read lead_master page by page so exports are not capped at 10,000 rows
+        # and are never held in memory as a whole
+        export_fields = [col[0] for col in export_columns] + ['created_at', 'cre_assigned_at']
+        lead_chunks = safe_iter_data('lead_master', select_fields=', '.join(export_fields), query_hook=date_hook)
+        # Filters are normalized to the resolved window, so e.g. 'mtd' and the
+        # equivalent explicit range share cached files
+        return send_lead_export('download_lead_master', {'start': window_start, 'end': window_end}, format_,
+                                'lead_master_export', 'Lead Master Data', [col[1] for col in export_columns],
+                                export_row, export_fields, lead_chunks)
     
     except Exception as e:
         print(f"Error downloading lead master data: {str(e)}")
@@ -13469,458 +12325,71 @@ def cre_analytics():
                 'assigned': total_assigned,
                 'conversion_rate': round(overall_rate, 2)
             }
-        
-        # Get live stats for logged-in CRE (pending and conversion rate always live)
-        def get_cre_live_stats():
-            cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
-            total_pending = len([lead for lead in cre_leads if lead.get('final_status') == 'Pending'])
-            total_won_live = len([lead for lead in cre_leads if lead.get('final_status') == 'Won'])
-            total_assigned = len([lead for lead in cre_leads if lead.get('cre_assigned_at')])
-            
-            live_conversion_rate = (total_won_live / total_assigned * 100) if total_assigned > 0 else 0
-            
-            return {
-                'pending': total_pending,
-                'conversion_rate': round(live_conversion_rate, 2)
-            }
-        
-        # Prepare data for template
-        analytics_data = {
-            'current_cre': current_cre,
-            'top_5_leaderboard': get_top_5_cre_leaderboard(),
-            'cre_platform_conversion': get_cre_platform_conversion(),
-            'cre_platform_conversion_live': get_cre_platform_conversion_live(),
-            'cre_overall_stats': get_cre_overall_stats(),
-            'cre_live_stats': get_cre_live_stats()
-        }
-        
-        return render_template('cre_analytics.html', analytics=analytics_data)
-        
-    except Exception as e:
-        flash(f'Error loading CRE analytics: {str(e)}', 'error')
-        return redirect(url_for('cre_dashboard'))
-
-
-@app.route('/cre_analytics_data')
-@require_cre
-def cre_analytics_data():
-    """API endpoint to get filtered analytics data"""
-    try:
-        # Get filter parameters
-        from_date_str = request.args.get('from_date')
-        to_date_str = request.args.get('to_date')
-        
-        # Get current CRE name from session
-        current_cre = session.get('cre_name')
-        print(f"DEBUG: Session CRE name: '{current_cre}'")
-        print(f"DEBUG: Session data: {dict(session)}")
-        
-        # Get all leads data
-        all_leads = safe_get_data('lead_master')
-        cre_users = safe_get_data('cre_users')
-        active_cre_users = [cre for cre in cre_users if cre.get('is_active', True)]
-        
-        # Debug: Check available CRE names in data
-        unique_cre_names = set(lead.get('cre_name') for lead in all_leads if lead.get('cre_name'))
-        print(f"DEBUG: Available CRE names in database: {sorted(unique_cre_names)}")
-        print(f"DEBUG: Active CRE users: {[cre.get('name') for cre in active_cre_users]}")
-        
-        # Helper function to parse timestamps
-        def parse_timestamp(timestamp_str):
-            if not timestamp_str:
-                return None
-            try:
-                if 'T' in timestamp_str:
-                    return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                elif ' ' in timestamp_str:
-                    return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                else:
-                    return datetime.strptime(timestamp_str, '%Y-%m-%d')
-            except:
-                return None
-        
-        # Helper function to parse date from HTML5 date input (yyyy-mm-dd format)
-        def parse_date_input(date_str):
-            if not date_str:
-                return None
-            try:
-                return datetime.strptime(date_str, '%Y-%m-%d').date()
-            except:
-                return None
-        
-        # Helper function to check if date is within filter range
-        def is_within_date_filter(target_date):
-            if not target_date:
-                return True  # Include records without dates if no filter
-            
-            if not from_date_str or not to_date_str:
-                return True  # No date filter applied
-            
-            target_date_obj = target_date.date() if isinstance(target_date, datetime) else target_date
-            from_date_obj = parse_date_input(from_date_str)
-            to_date_obj = parse_date_input(to_date_str)
-            
-            print(f"DEBUG: Date filter - from_date_str: {from_date_str}, to_date_str: {to_date_str}")
-            print(f"DEBUG: Date filter - from_date_obj: {from_date_obj}, to_date_obj: {to_date_obj}")
-            print(f"DEBUG: Date filter - target_date: {target_date}, target_date_obj: {target_date_obj}")
-            
-            if not from_date_obj or not to_date_obj:
-                print(f"DEBUG: Invalid date format, including all")
-                return True  # Invalid date format, include all
-            
-            result = from_date_obj <= target_date_obj <= to_date_obj
-            print(f"DEBUG: Date filter result: {result}")
-            return result
-        
-        # Get filtered leaderboard for all active CREs
-        def get_filtered_all_cre_leaderboard():
-            cre_performance = {}
-            for cre in active_cre_users:
-                cre_name = cre.get('name')
-                if cre_name:
-                    cre_performance[cre_name] = {
-                        'won': 0,
-                        'pending_live': 0,
-                        'lost': 0,
-                        'total_leads_handled': 0
-                    }
-            
-            # Apply date filter to total_leads_handled based on cre_assigned_at timestamp
-            for lead in all_leads:
-                cre_name = lead.get('cre_name')
-                if cre_name in cre_performance:
-                    if lead.get('cre_assigned_at'):
-                        assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                        if is_within_date_filter(assigned_date):
-                            cre_performance[cre_name]['total_leads_handled'] += 1
-                    if lead.get('final_status') == 'Pending':
-                        cre_performance[cre_name]['pending_live'] += 1
-            
-            for lead in all_leads:
-                cre_name = lead.get('cre_name')
-                if cre_name in cre_performance:
-                    if lead.get('final_status') == 'Won':
-                        won_date = parse_timestamp(lead.get('won_timestamp'))
-                        if is_within_date_filter(won_date):
-                            cre_performance[cre_name]['won'] += 1
-                    elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
-                        lost_date = parse_timestamp(lead.get('lost_timestamp')) or parse_timestamp(lead.get('won_timestamp'))
-                        if is_within_date_filter(lost_date):
-                            cre_performance[cre_name]['lost'] += 1
-            sorted_cre = sorted(cre_performance.items(), key=lambda x: x[1]['won'], reverse=True)
-            return sorted_cre
-        
-        # Get filtered platform conversion data for logged-in CRE
-        def get_filtered_cre_platform_conversion():
-            platform_data = {}
-            for lead in all_leads:
-                if lead.get('cre_name') == current_cre:
-                    platform = lead.get('source', 'Unknown')
-                    if platform not in platform_data:
-                        platform_data[platform] = {
-                            'won': 0,
-                            'pending_live': 0,
-                            'lost': 0,
-                            'assigned': 0
-                        }
-                    if lead.get('cre_assigned_at'):
-                        platform_data[platform]['assigned'] += 1
-                    if lead.get('final_status') == 'Won':
-                        won_date = parse_timestamp(lead.get('won_timestamp'))
-                        if is_within_date_filter(won_date):
-                            platform_data[platform]['won'] += 1
-                    elif lead.get('final_status') == 'Pending':
-                        platform_data[platform]['pending_live'] += 1
-                    elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
-                        lost_date = parse_timestamp(lead.get('lost_timestamp')) or parse_timestamp(lead.get('won_timestamp'))
-                        if is_within_date_filter(lost_date):
-                            platform_data[platform]['lost'] += 1
-            # Calculate conversion rates (always live - use all won cases, not date filtered)
-            for platform in platform_data:
-                # Count all won cases for this platform (live data)
-                all_won = len([lead for lead in all_leads 
-                              if lead.get('cre_name') == current_cre 
-                              and (lead.get('source') or 'Unknown') == platform
-                              and lead.get('final_status') == 'Won'])
-                assigned = platform_data[platform]['assigned']
-                conversion_rate = (all_won / assigned * 100) if assigned > 0 else 0
-                platform_data[platform]['conversion_rate'] = round(conversion_rate, 2)
-            return platform_data
-        
-        # Get filtered overall stats for logged-in CRE
-        def get_filtered_cre_overall_stats():
-            cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
-            
-            total_won = 0
-            total_lost = 0
-            total_assigned = len([lead for lead in cre_leads if lead.get('cre_assigned_at')])
-            
-            for lead in cre_leads:
-                if lead.get('final_status') == 'Won':
-                    won_date = parse_timestamp(lead.get('won_timestamp'))
-                    if is_within_date_filter(won_date):
-                        total_won += 1
-                elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
-                    lost_date = parse_timestamp(lead.get('lost_timestamp')) or parse_timestamp(lead.get('won_timestamp'))
-                    if is_within_date_filter(lost_date):
-                        total_lost += 1
-            
-            overall_rate = (total_won / total_assigned * 100) if total_assigned > 0 else 0
-            return {
-                'won': total_won,
-                'lost': total_lost,
-                'assigned': total_assigned,
-                'conversion_rate': round(overall_rate, 2)
-            }
-        
-        # Get live platform conversion data for logged-in CRE (not affected by date filter)
-        def get_cre_platform_conversion_live():
-            platform_data = {}
-            for lead in all_leads:
-                if lead.get('cre_name') == current_cre:
-                    platform = lead.get('source', 'Unknown')
-                    if platform not in platform_data:
-                        platform_data[platform] = {
-                            'won': 0,
-                            'pending': 0,
-                            'lost': 0,
-                            'assigned': 0
-                        }
-                    if lead.get('cre_assigned_at'):
-                        platform_data[platform]['assigned'] += 1
-                    if lead.get('final_status') == 'Won':
-                        platform_data[platform]['won'] += 1
-                    elif lead.get('final_status') == 'Pending':
-                        platform_data[platform]['pending'] += 1
-                    elif lead.get('final_status') == 'Lost':
-                        platform_data[platform]['lost'] += 1
-            for platform in platform_data:
-                assigned = platform_data[platform]['assigned']
-                won = platform_data[platform]['won']
-                conversion_rate = (won / assigned * 100) if assigned > 0 else 0
-                platform_data[platform]['conversion_rate'] = round(conversion_rate, 2)
-            return platform_data
-        
-        # Get leads assigned by category for all CREs
-        def get_leads_assigned_by_category():
-            category_data = {}
-            
-            print(f"DEBUG: active_cre_users count: {len(active_cre_users)}")
-            print(f"DEBUG: all_leads count: {len(all_leads)}")
-            print(f"DEBUG: Sample all_leads: {all_leads[:3] if len(all_leads) > 0 else 'No leads'}")
-            
-            # Initialize data structure for all active CREs
-            for cre in active_cre_users:
-                cre_name = cre.get('name')
-                if cre_name:
-                    category_data[cre_name] = {
-                        'hot': 0,
-                        'cold': 0,
-                        'warm': 0,
-                        'not_interested': 0,
-                        'not_set': 0
-                    }
-            
-            print(f"DEBUG: Initialized category_data for CREs: {list(category_data.keys())}")
-            print(f"DEBUG: Sample active_cre_users: {active_cre_users[:3] if len(active_cre_users) > 0 else 'No active CRE users'}")
-            
-            # Process leads and count by category
-            processed_leads = 0
-            filtered_leads = 0
-            for lead in all_leads:
-                processed_leads += 1
-                cre_name = lead.get('cre_name')
-                # Handle None values safely
-                lead_category_raw = lead.get('lead_category')
-                lead_category = lead_category_raw.lower() if lead_category_raw else ''
-                
-                if processed_leads <= 5:  # Debug first 5 leads
-                    print(f"DEBUG: Lead {processed_leads}: cre_name={cre_name}, lead_category={lead_category}, cre_assigned_at={lead.get('cre_assigned_at')}")
-                
-                if cre_name in category_data and lead.get('cre_assigned_at'):
-                    # Check if lead is within date filter
-                    assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                    if is_within_date_filter(assigned_date):
-                        filtered_leads += 1
-                        # Map lead categories to our table columns
-                        if lead_category in ['hot']:
-                            category_data[cre_name]['hot'] += 1
-                        elif lead_category in ['cold']:
-                            category_data[cre_name]['cold'] += 1
-                        elif lead_category in ['warm']:
-                            category_data[cre_name]['warm'] += 1
-                        elif lead_category in ['not interested', 'not_interested']:
-                            category_data[cre_name]['not_interested'] += 1
-                        elif lead_category in ['not set', 'not_set', ''] or not lead_category:
-                            category_data[cre_name]['not_set'] += 1
-                    else:
-                        if processed_leads <= 5:  # Debug first 5 leads
-                            print(f"DEBUG: Lead {processed_leads} filtered out by date: assigned_date={assigned_date}")
-                else:
-                    if processed_leads <= 5:  # Debug first 5 leads
-                        if cre_name not in category_data:
-                            print(f"DEBUG: Lead {processed_leads} skipped - cre_name '{cre_name}' not in active CREs")
-                        if not lead.get('cre_assigned_at'):
-                            print(f"DEBUG: Lead {processed_leads} skipped - no cre_assigned_at")
-            
-            print(f"DEBUG: Processed {processed_leads} leads, filtered {filtered_leads} leads")
-            print(f"DEBUG: Final category_data: {category_data}")
-            return category_data
-        
-        leads_category_data = get_leads_assigned_by_category()
-        print(f"DEBUG: Final response leads_assigned_by_category: {leads_category_data}")
-        
-        # Get summary metrics for current CRE
-        def get_summary_metrics():
-            cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
-            print(f"DEBUG: Current CRE: {current_cre}")
-            print(f"DEBUG: Total leads in database: {len(all_leads)}")
-            print(f"DEBUG: Leads for current CRE: {len(cre_leads)}")
-            
-            # Debug: Show sample lead data
-            if cre_leads:
-                sample_lead = cre_leads[0]
-                print(f"DEBUG: Sample lead data: {sample_lead}")
-                print(f"DEBUG: Sample lead_status: '{sample_lead.get('lead_status')}'")
-                print(f"DEBUG: Sample lead_category: '{sample_lead.get('lead_category')}'")
-                print(f"DEBUG: Sample final_status: '{sample_lead.get('final_status')}'")
-                print(f"DEBUG: Sample cre_name: '{sample_lead.get('cre_name')}'")
-            
-            # Parse date filters
-            from_date = None
-            to_date = None
-            if from_date_str:
-                from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-            if to_date_str:
-                to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-            
-            # Total leads assigned to current CRE (DATE FILTERED based on cre_assigned_at)
-            total_leads = 0
-            for lead in cre_leads:
-                if lead.get('cre_assigned_at'):
-                    assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                    if assigned_date:
-                        assigned_date_only = assigned_date.date()
-                        # Apply date filter if provided
-                        if from_date and assigned_date_only < from_date:
-                            continue
-                        if to_date and assigned_date_only > to_date:
-                            continue
-                        total_leads += 1
-            
-            # Hot leads (lead_category = 'Hot') (DATE FILTERED based on cre_assigned_at)
-            hot_leads = 0
-            for lead in cre_leads:
-                lead_category = lead.get('lead_category')
-                if lead_category == 'Hot':
-                    # Apply date filter based on cre_assigned_at
-                    if lead.get('cre_assigned_at'):
-                        assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                        if assigned_date:
-                            assigned_date_only = assigned_date.date()
-                            # Apply date filter if provided
-                            if from_date and assigned_date_only < from_date:
-                                continue
-                            if to_date and assigned_date_only > to_date:
-                                continue
-                            hot_leads += 1
-                            print(f"DEBUG: Found Hot lead: {lead.get('customer_name')} - lead_category: {lead_category}")
-            
-            print(f"DEBUG: Total cre_leads for {current_cre}: {len(cre_leads)}")
-            print(f"DEBUG: Hot leads count: {hot_leads}")
-            
-            # FTD Assigned (Today's leads assigned using cre_assigned_at timestamp) - INDEPENDENT OF DATE FILTER
-            ftd_assigned = 0
-            today = datetime.now().date()
-            for lead in cre_leads:
-                if lead.get('cre_assigned_at'):
-                    assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                    if assigned_date and assigned_date.date() == today:
-                        ftd_assigned += 1
-            
-            # MTD Assigned (Current ongoing month leads assigned) - INDEPENDENT OF DATE FILTER
-            mtd_assigned = 0
-            current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            current_month_end = (current_month_start.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
-            
-            for lead in cre_leads:
-                if lead.get('cre_assigned_at'):
-                    assigned_date = parse_timestamp(lead.get('cre_assigned_at'))
-                    if assigned_date and current_month_start <= assigned_date <= current_month_end:
-                        mtd_assigned += 1
-            
-            # FTD Retails (Today's retails using won_timestamp = today date) - INDEPENDENT OF DATE FILTER
-            ftd_retails = 0
-            for lead in cre_leads:
-                if lead.get('final_status') == 'Won' and lead.get('won_timestamp'):
-                    won_date = parse_timestamp(lead.get('won_timestamp'))
-                    if won_date and won_date.date() == today:
-                        ftd_retails += 1
-                        print(f"DEBUG: Found today's retail: {lead.get('customer_name')} - won_timestamp: {lead.get('won_timestamp')}")
-            
-            # MTD Retails (Ongoing month retails using won_timestamp = ongoing month) - INDEPENDENT OF DATE FILTER
-            mtd_retails = 0
-            for lead in cre_leads:
-                if lead.get('final_status') == 'Won' and lead.get('won_timestamp'):
-                    won_date = parse_timestamp(lead.get('won_timestamp'))
-                    if won_date and current_month_start <= won_date <= current_month_end:
-                        mtd_retails += 1
-                        print(f"DEBUG: Found current month retail: {lead.get('customer_name')} - won_timestamp: {lead.get('won_timestamp')}")
-            
-            # Total Retails (All won cases for current CRE) - DATE FILTERED based on won_timestamp
-            total_retails = 0
-            for lead in cre_leads:
-                if lead.get('final_status') == 'Won' and lead.get('won_timestamp'):
-                    won_date = parse_timestamp(lead.get('won_timestamp'))
-                    if won_date:
-                        won_date_only = won_date.date()
-                        # Apply date filter if provided
-                        if from_date and won_date_only < from_date:
-                            continue
-                        if to_date and won_date_only > to_date:
-                            continue
-                        total_retails += 1
-                        print(f"DEBUG: Found retail (date filtered): {lead.get('customer_name')} - won_timestamp: {lead.get('won_timestamp')}")
-            
-            print(f"DEBUG: Today's date: {today}")
-            print(f"DEBUG: Current month range: {current_month_start.date()} to {current_month_end.date()}")
-            print(f"DEBUG: FTD retails count: {ftd_retails}")
-            print(f"DEBUG: MTD retails count: {mtd_retails}")
-            print(f"DEBUG: Total retails count (date filtered): {total_retails}")
+        
+        # Get live stats for logged-in CRE (pending and conversion rate always live)
+        def get_cre_live_stats():
+            cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
+            total_pending = len([lead for lead in cre_leads if lead.get('final_status') == 'Pending'])
+            total_won_live = len([lead for lead in cre_leads if lead.get('final_status') == 'Won'])
+            total_assigned = len([lead for lead in cre_leads if lead.get('cre_assigned_at')])
             
-            print(f"DEBUG: Summary metrics calculation:")
-            print(f"DEBUG: - Total leads (date filtered): {total_leads}")
-            print(f"DEBUG: - Hot leads (date filtered): {hot_leads}")
-            print(f"DEBUG: - FTD Assigned (today, independent): {ftd_assigned}")
-            print(f"DEBUG: - MTD Assigned (current month, independent): {mtd_assigned}")
-            print(f"DEBUG: - FTD Retails (today, independent): {ftd_retails}")
-            print(f"DEBUG: - MTD Retails (current month, independent): {mtd_retails}")
-            print(f"DEBUG: - Total Retails (date filtered): {total_retails}")
+            live_conversion_rate = (total_won_live / total_assigned * 100) if total_assigned > 0 else 0
             
             return {
-                'total_leads': total_leads,
-                'hot_leads': hot_leads,
-                'ftd_assigned': ftd_assigned,
-                'mtd_assigned': mtd_assigned,
-                'ftd_retails': ftd_retails,
-                'mtd_retails': mtd_retails,
-                'total_retails': total_retails
+                'pending': total_pending,
+                'conversion_rate': round(live_conversion_rate, 2)
             }
         
-        summary_metrics = get_summary_metrics()
+        # Prepare data for template
+        analytics_data = {
+            'current_cre': current_cre,
+            'top_5_leaderboard': get_top_5_cre_leaderboard(),
+            'cre_platform_conversion': get_cre_platform_conversion(),
+            'cre_platform_conversion_live': get_cre_platform_conversion_live(),
+            'cre_overall_stats': get_cre_overall_stats(),
+            'cre_live_stats': get_cre_live_stats()
+        }
+        
+        return render_template('cre_analytics.html', analytics=analytics_data)
+        
+    except Exception as e:
+        flash(f'Error loading CRE analytics: {str(e)}', 'error')
+        return redirect(url_for('cre_dashboard'))
+
+
+@app.route('/cre_analytics_data')
+@require_cre
+def cre_analytics_data():
+    """API endpoint to get filtered analytics data"""
+    try:
+        # Get filter parameters
+        from_date_str = request.args.get('from_date')
+        to_date_str = request.args.get('to_date')
         
+        # Get current CRE name from session
+        current_cre = session.get('cre_name')
+
+        cre_users = safe_get_data('cre_users')
+        active_cres = [cre.get('name') for cre in cre_users if cre.get('is_active', True) and cre.get('name')]
+
+        # Without both bounds no date filter is applied to the leaderboard and
+        # conversion blocks; the summary KPIs use whichever bound is valid
+        window_start, window_end = resolve_date_window('range', from_date_str, to_date_str)
+
+        start_time = time.time()
+        analytics_data = build_cre_analytics(
+            lead_snapshot.get_frame(supabase), active_cres, current_cre,
+            window_start, window_end, datetime.now().date()
+        )
+        print(f"[PERF] cre_analytics_data: computed in {time.time() - start_time:.3f} seconds")
+
         return jsonify({
             'success': True,
             'from_date': from_date_str,
             'to_date': to_date_str,
-            'top_5_leaderboard': get_filtered_all_cre_leaderboard()[:5],
-            'cre_platform_conversion': get_filtered_cre_platform_conversion(),
-            'cre_platform_conversion_live': get_cre_platform_conversion_live(),
-            'cre_overall_stats': get_filtered_cre_overall_stats(),
-            'leads_assigned_by_category': leads_category_data,
-            'summary_metrics': summary_metrics
+            **analytics_data
         })
-        
+
     except Exception as e:
         return jsonify({
             'success': False,
@@ -15198,21 +13667,9 @@ def cre_dashboard_leads():
         # Get all leads for this CRE
         all_leads = safe_get_data('lead_master', {'cre_name': cre_name})
         
-        # Initialize lists
-        won_leads = []
-        lost_leads = []
-        
-        # Process leads
-        for lead in all_leads:
-            final_status = lead.get('final_status')
-            
-            if final_status == 'Won':
-                won_leads.append(lead)
-            elif final_status == 'Lost':
-                lost_leads.append(lead)
-        
-        # Select the appropriate list based on status
-        leads_list = won_leads if status == 'won' else lost_leads
+        # Select the appropriate bucket based on status
+        buckets = classify_cre_leads(all_leads)
+        leads_list = buckets.rows(all_leads, 'won' if status == 'won' else 'lost')
         
         # Sort leads by won/lost date in descending order
         if status == 'won':
@@ -15230,6 +13687,37 @@ def cre_dashboard_leads():
     except Exception as e:
         return f'<div class="alert alert-danger">Error loading leads: {str(e)}</div>'
 
+def _wonlost_window(wonlost_filter, range_start, range_end):
+    """(start, end) dates for the PS Won/Lost toggle; (None, None) for 'all'"""
+    if wonlost_filter == 'all':
+        return None, None
+    today = datetime.now().date()
+    # default mtd
+    start_date = today.replace(day=1)
+    end_date = today
+    if wonlost_filter == 'today':
+        start_date = today
+    elif wonlost_filter == 'range':
+        try:
+            if range_start:
+                start_date = datetime.strptime(range_start[:10], '%Y-%m-%d').date()
+            if range_end:
+                end_date = datetime.strptime(range_end[:10], '%Y-%m-%d').date()
+        except Exception:
+            pass
+    return start_date, end_date
+
+
+def _closed_leads_in_window(leads, buckets, bucket, timestamp_field, window):
+    """Leads in the won/lost bucket whose timestamp falls in the Won/Lost window"""
+    closed = buckets.rows(leads, bucket)
+    start_date, end_date = window
+    if start_date is None and end_date is None:
+        return closed
+    within = dates_within([lead.get(timestamp_field) for lead in closed], start_date, end_date)
+    return [lead for lead, keep in zip(closed, within) if keep]
+
+
 @app.route('/ps_dashboard_leads')
 @require_ps
 def ps_dashboard_leads():
@@ -15241,73 +13729,31 @@ def ps_dashboard_leads():
     ps_name = session.get('ps_name')
     
     try:
-        # Get all assigned leads for this PS (reuse logic from ps_dashboard)
-        assigned_leads = safe_get_data('ps_followup_master', {'ps_name': ps_name})
-        event_leads = safe_get_data('activity_leads', {'ps_name': ps_name})
-        
-        # Initialize lists
-        won_leads = []
-        lost_leads = []
-        
-        # Helper to check if a timestamp passes the selected filter
-        def _in_filter(ts_str: str) -> bool:
-            if wonlost_filter == 'all':
-                return True
-            today = datetime.now().date()
-            # default mtd
-            start_date = today.replace(day=1)
-            end_date = today
-            if wonlost_filter == 'today':
-                start_date = today
-                end_date = today
-            elif wonlost_filter == 'range':
-                try:
-                    if range_start:
-                        start_date = datetime.strptime(range_start[:10], '%Y-%m-%d').date()
-                    if range_end:
-                        end_date = datetime.strptime(range_end[:10], '%Y-%m-%d').date()
-                except Exception:
-                    pass
-            if not ts_str:
-                return False
-            try:
-                ts_date = datetime.fromisoformat(str(ts_str).replace('Z', '+00:00')).date() if 'T' in str(ts_str) else datetime.strptime(str(ts_str)[:10], '%Y-%m-%d').date()
-                return start_date <= ts_date <= end_date
-            except Exception:
-                return False
-
-        # Process regular assigned leads
-        for lead in assigned_leads:
-            lead_dict = dict(lead)
-            lead_dict['lead_uid'] = lead.get('lead_uid')
-            final_status = lead.get('final_status')
-            
-            if final_status == 'Won':
-                if _in_filter(lead.get('won_timestamp')):
-                    won_leads.append(lead_dict)
-            elif final_status == 'Lost':
-                if _in_filter(lead.get('lost_timestamp')):
-                    lost_leads.append(lead_dict)
-        
+        window = _wonlost_window(wonlost_filter, range_start, range_end)
+        bucket = 'won' if status == 'won' else 'lost'
+        timestamp_field = f'{bucket}_timestamp'
+
+        # Regular assigned leads
+        assigned_leads = [dict(lead) for lead in safe_get_data('ps_followup_master', {'ps_name': ps_name})]
+        leads_list = _closed_leads_in_window(
+            assigned_leads, classify_ps_leads(assigned_leads), bucket, timestamp_field, window
+        )
 
-        
-        # Process event leads (include if they have timestamps and pass filter; otherwise skip)
-        for lead in event_leads:
+        # Event leads (included only if their timestamp passes the filter)
+        event_leads = []
+        for lead in safe_get_data('activity_leads', {'ps_name': ps_name}):
             lead_dict = dict(lead)
             lead_dict['lead_uid'] = lead.get('activity_uid', '') or lead.get('uid', '')
             lead_dict['customer_mobile_number'] = lead.get('customer_phone_number', '')
-            final_status = lead.get('final_status', '')
-            
-            if final_status == 'Won':
-                if _in_filter(lead.get('won_timestamp')):
-                    won_leads.append(lead_dict)
-            elif final_status == 'Lost':
-                if _in_filter(lead.get('lost_timestamp')):
-                    lost_leads.append(lead_dict)
-        
-        # Process walk-in leads
-        walkin_leads = safe_get_data('walkin_table', {'ps_assigned': ps_name})
-        for lead in walkin_leads:
+            event_leads.append(lead_dict)
+        leads_list += _closed_leads_in_window(
+            event_leads, classify_ps_leads(event_leads, first_call_field='ps_first_call_date'),
+            bucket, timestamp_field, window
+        )
+
+        # Walk-in leads, timestamped by their last update
+        walkin_leads = []
+        for lead in safe_get_data('walkin_table', {'ps_assigned': ps_name}):
             lead_dict = dict(lead)
             lead_dict['lead_uid'] = lead.get('uid', f"W{lead.get('id')}")
             lead_dict['customer_mobile_number'] = lead.get('mobile_number', '')
@@ -15315,20 +13761,11 @@ def ps_dashboard_leads():
             lead_dict['is_walkin'] = True
             lead_dict['walkin_id'] = lead.get('id')
             lead_dict['cre_name'] = ''
-            final_status = lead.get('status')
-            
-            # Add timestamp for filtering
-            if final_status == 'Won':
-                lead_dict['won_timestamp'] = lead.get('updated_at') or datetime.now().isoformat()
-                if _in_filter(lead_dict['won_timestamp']):
-                    won_leads.append(lead_dict)
-            elif final_status == 'Lost':
-                lead_dict['lost_timestamp'] = lead.get('updated_at') or datetime.now().isoformat()
-                if _in_filter(lead_dict['lost_timestamp']):
-                    lost_leads.append(lead_dict)
-        
-        # Select the appropriate list based on status
-        leads_list = won_leads if status == 'won' else lost_leads
+            walkin_leads.append(lead_dict)
+        walkin_buckets = classify_walkin_leads(walkin_leads)
+        for lead_dict in walkin_buckets.rows(walkin_leads, bucket):
+            lead_dict[timestamp_field] = lead_dict.get('updated_at') or datetime.now().isoformat()
+        leads_list += _closed_leads_in_window(walkin_leads, walkin_buckets, bucket, timestamp_field, window)
         
         # Render only the table HTML
         return render_template('ps_dashboard_leads_table.html', 
@@ -15347,47 +13784,17 @@ def ps_dashboard_leads_counts():
     range_end = request.args.get('end_date')
     ps_name = session.get('ps_name')
     try:
+        window = _wonlost_window(wonlost_filter, range_start, range_end)
         assigned_leads = safe_get_data('ps_followup_master', {'ps_name': ps_name})
         walkin_leads = safe_get_data('walkin_table', {'ps_assigned': ps_name})
 
-        def _in_filter(ts_str: str) -> bool:
-            if wonlost_filter == 'all':
-                return True
-            today = datetime.now().date()
-            start_date = today.replace(day=1)
-            end_date = today
-            if wonlost_filter == 'today':
-                start_date = today
-                end_date = today
-            elif wonlost_filter == 'range':
-                try:
-                    if range_start:
-                        start_date = datetime.strptime(range_start[:10], '%Y-%m-%d').date()
-                    if range_end:
-                        end_date = datetime.strptime(range_end[:10], '%Y-%m-%d').date()
-                except Exception:
-                    pass
-            if not ts_str:
-                return False
-            try:
-                ts_date = datetime.fromisoformat(str(ts_str).replace('Z', '+00:00')).date() if 'T' in str(ts_str) else datetime.strptime(str(ts_str)[:10], '%Y-%m-%d').date()
-                return start_date <= ts_date <= end_date
-            except Exception:
-                return False
-
-        won_count = 0
-        lost_count = 0
-        for lead in assigned_leads:
-            if lead.get('final_status') == 'Won' and _in_filter(lead.get('won_timestamp')):
-                won_count += 1
-            elif lead.get('final_status') == 'Lost' and _in_filter(lead.get('lost_timestamp')):
-                lost_count += 1
+        assigned_buckets = classify_ps_leads(assigned_leads)
+        walkin_buckets = classify_walkin_leads(walkin_leads)
 
-        for lead in walkin_leads:
-            if lead.get('status') == 'Won' and _in_filter(lead.get('updated_at')):
-                won_count += 1
-            elif lead.get('status') == 'Lost' and _in_filter(lead.get('updated_at')):
-                lost_count += 1
+        won_count = (len(_closed_leads_in_window(assigned_leads, assigned_buckets, 'won', 'won_timestamp', window)) +
+                     len(_closed_leads_in_window(walkin_leads, walkin_buckets, 'won', 'updated_at', window)))
+        lost_count = (len(_closed_leads_in_window(assigned_leads, assigned_buckets, 'lost', 'lost_timestamp', window)) +
+                      len(_closed_leads_in_window(walkin_leads, walkin_buckets, 'lost', 'updated_at', window)))
 
         return jsonify({'success': True, 'won_count': won_count, 'lost_count': lost_count})
     except Exception as e:
@@ -15437,32 +13844,18 @@ def rec_dashboard():
     branch = session.get('rec_branch')
     
     try:
-        # Calculate KPI counts for the receptionist's branch
-        # Total walk-in leads
-        total_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).execute().data or []
-        total_walkin_count = len(total_walkin)
-        
-        # Won leads
-        won_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).eq('status', 'Won').execute().data or []
-        won_leads_count = len(won_walkin)
-        
-        # Lost leads
-        lost_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).eq('status', 'Lost').execute().data or []
-        lost_leads_count = len(lost_walkin)
-        
-        # Pending leads
-        pending_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).eq('status', 'Pending').execute().data or []
-        pending_leads_count = len(pending_walkin)
-        
-        # Today's walk-in leads
+        # Calculate KPI counts for the receptionist's branch in one round trip:
+        # total, won, lost, pending, today's walk-ins and leads with a first call
         today_str = datetime.now().strftime('%Y-%m-%d')
-        today_walkin = supabase.table('walkin_table').select('*').eq('branch', branch).eq('created_at', today_str).execute().data or []
-        today_leads_count = len(today_walkin)
-        
-        # First call response rate calculation
-        # Get leads that have at least one call recorded
-        leads_with_calls = supabase.table('walkin_table').select('*').eq('branch', branch).not_.is_('first_call_date', 'null').execute().data or []
-        leads_with_calls_count = len(leads_with_calls)
+        (total_walkin_count, won_leads_count, lost_leads_count, pending_leads_count,
+         today_leads_count, leads_with_calls_count) = get_accurate_counts([
+            ('walkin_table', {'branch': branch}),
+            ('walkin_table', {'branch': branch, 'status': 'Won'}),
+            ('walkin_table', {'branch': branch, 'status': 'Lost'}),
+            ('walkin_table', {'branch': branch, 'status': 'Pending'}),
+            ('walkin_table', {'branch': branch, 'created_at': today_str}),
+            ('walkin_table', {'branch': branch, 'first_call_date': ('not.is', 'null')}),
+        ])
         
         # Calculate first call response rate
         first_call_response_rate = 0
@@ -15817,13 +14210,8 @@ def add_walkin_lead():
             flash('Error checking for duplicates. Please try again.', 'error')
             return render_template('add_walkin_lead.html', models=models, branches=branches, ps_options_json=ps_options_json, default_branch=branch)
         
-        # Generate UID for walk-in lead
-        # Get count of existing walk-in leads for this mobile number
-        existing_count = get_accurate_count('walkin_table', {'mobile_number': mobile_number})
-        sequence = existing_count + 1
-        
         # Generate UID using 'Walk-in' as source (which maps to 'W')
-        uid = generate_uid('Walk-in', mobile_number, sequence)
+        uid = generate_uid('Walk-in', mobile_number)
         
         # Check if this is a duplicate with new source (phone exists but not as Walk-in)
         is_duplicate_new_source = False
@@ -15962,57 +14350,55 @@ def add_walkin_lead():
         default_ps_name=default_ps_name
     )
 
+def get_branch_analytics(branch, date_from, date_to):
+    """
+    All branch analytics sections for a date window, from one read of each
+    lead table (see branch_analytics.py).
+
+    Results are kept in branch_analytics_cache for a minute so the section
+    endpoints, which the dashboard calls side by side, share a single scan.
+    """
+    cache_key = (branch, date_from, date_to)
+    analytics = branch_analytics_cache.get(cache_key)
+    if analytics is None:
+        generation = branch_analytics_cache.generation()
+        analytics = build_branch_analytics(supabase, branch, date_from, date_to)
+        timings = analytics['timings']
+        print(f"[PERF] branch analytics for {branch} ({date_from} to {date_to}) took {timings['total']:.3f} seconds "
+              f"(ps_followup_master={timings['fetch_ps_followup_master']:.3f}s, "
+              f"walkin_table={timings['fetch_walkin_table']:.3f}s, aggregate={timings['aggregate']:.3f}s)")
+        branch_analytics_cache.set(cache_key, analytics, generation)
+    return analytics
+
+
+def branch_analytics_window(default_mtd=False):
+    """Read date_from/date_to from the query string; MTD when missing and default_mtd is set"""
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    if (not date_from or not date_to) and default_mtd:
+        today = datetime.now()
+        date_from = today.replace(day=1).strftime('%Y-%m-%d')
+        date_to = today.strftime('%Y-%m-%d')
+    if date_from and date_to and not (is_valid_date(date_from) and is_valid_date(date_to)):
+        return None, None
+    return date_from, date_to
+
+
 @app.route('/api/branch_analytics/ps_performance')
 def api_branch_analytics_ps_performance():
-    """API endpoint for Product Specialist Performance data - OPTIMIZED"""
+    """API endpoint for Product Specialist Performance data"""
     try:
-        # Get branch from session
         branch = session.get('branch_head_branch')
         if not branch:
             return jsonify({'success': False, 'message': 'Branch not found in session'})
         
-        # Get date filter parameters
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
         # Require both date parameters
+        date_from, date_to = branch_analytics_window()
         if not date_from or not date_to:
             return jsonify({'success': False, 'message': 'Both date_from and date_to parameters are required'})
         
-        # OPTIMIZATION: Single query to get all PS performance data at once
-        # Use a more efficient query with proper aggregation
-        performance_query = supabase.table('ps_followup_master').select(
-            'ps_name, ps_assigned_at, lead_status'
-        ).eq('ps_branch', branch).gte('ps_assigned_at', date_from).lte('ps_assigned_at', date_to).execute()
-        
-        if not performance_query.data:
-            return jsonify({'success': True, 'data': []})
-        
-        # Process data in Python (much faster than multiple DB queries)
-        ps_performance = {}
-        for lead in performance_query.data:
-            ps_name = lead.get('ps_name')
-            if not ps_name:
-                continue
-                
-            if ps_name not in ps_performance:
-                ps_performance[ps_name] = {'leads_assigned': 0, 'leads_contacted': 0}
-            
-            ps_performance[ps_name]['leads_assigned'] += 1
-            if lead.get('lead_status'):
-                ps_performance[ps_name]['leads_contacted'] += 1
-        
-        # Format result
-        result_data = []
-        for ps_name, stats in ps_performance.items():
-            result_data.append({
-                'ps_name': ps_name,
-                'leads_assigned': stats['leads_assigned'],
-                'leads_contacted': stats['leads_contacted'],
-                'gap': stats['leads_assigned'] - stats['leads_contacted']
-            })
-        
-        return jsonify({'success': True, 'data': result_data})
+        analytics = get_branch_analytics(branch, date_from, date_to)
+        return jsonify({'success': True, 'data': analytics['ps_performance']})
         
     except Exception as e:
         print(f"Error in ps_performance API: {str(e)}")
@@ -16020,77 +14406,19 @@ def api_branch_analytics_ps_performance():
 
 @app.route('/api/branch_analytics/source_leads')
 def api_branch_analytics_source_leads():
-    """API endpoint for Source-wise Leads Analysis data - OPTIMIZED"""
+    """API endpoint for Source-wise Leads Analysis data"""
     try:
-        # Get branch from session
         branch = session.get('branch_head_branch')
         if not branch:
             return jsonify({'success': False, 'message': 'Branch not found in session'})
         
-        # Get date filter parameters
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
         # Require both date parameters
+        date_from, date_to = branch_analytics_window()
         if not date_from or not date_to:
             return jsonify({'success': False, 'message': 'Both date_from and date_to parameters are required'})
         
-        # OPTIMIZATION: Single query to get all leads data at once
-        # Select only necessary columns and filter at database level
-        leads_query = supabase.table('ps_followup_master').select(
-            'ps_name, source, final_status'
-        ).eq('ps_branch', branch).gte('ps_assigned_at', date_from).lte('ps_assigned_at', date_to).execute()
-        
-        if not leads_query.data:
-            return jsonify({'success': True, 'data': [], 'sources': []})
-        
-        # Process data in Python (much faster than multiple DB queries)
-        ps_data = {}
-        all_sources = set()
-        
-        for lead in leads_query.data:
-            ps_name = lead.get('ps_name')
-            source = lead.get('source', 'Unknown')
-            final_status = lead.get('final_status', 'Pending')
-            
-            if not ps_name:
-                continue
-                
-            if ps_name not in ps_data:
-                ps_data[ps_name] = {'total_leads': 0, 'won_leads': 0, 'sources': {}}
-            
-            ps_data[ps_name]['total_leads'] += 1
-            if final_status == 'Won':
-                ps_data[ps_name]['won_leads'] += 1
-            
-            # Track source breakdown
-            if source not in ps_data[ps_name]['sources']:
-                ps_data[ps_name]['sources'][source] = {'total_leads': 0, 'won_leads': 0}
-            
-            ps_data[ps_name]['sources'][source]['total_leads'] += 1
-            if final_status == 'Won':
-                ps_data[ps_name]['sources'][source]['won_leads'] += 1
-            
-            all_sources.add(source)
-        
-        # Format result data
-        result_data = []
-        for ps_name, stats in ps_data.items():
-            result_data.append({
-                'ps_name': ps_name,
-                'total_leads': stats['total_leads'],
-                'won_leads': stats['won_leads'],
-                'source_breakdown': stats['sources']
-            })
-        
-        # Convert all_sources to sorted list for consistent column order
-        all_sources_list = sorted(list(all_sources))
-        
-        return jsonify({
-            'success': True, 
-            'data': result_data,
-            'sources': all_sources_list
-        })
+        analytics = get_branch_analytics(branch, date_from, date_to)
+        return jsonify({'success': True, 'data': analytics['source_leads'], 'sources': analytics['sources']})
         
     except Exception as e:
         print(f"Error in source_leads API: {str(e)}")
@@ -16098,90 +14426,19 @@ def api_branch_analytics_source_leads():
 
 @app.route('/api/branch_analytics/walkin_leads')
 def api_branch_analytics_walkin_leads():
-    """API endpoint for Walk-in Leads Summary data - OPTIMIZED"""
+    """API endpoint for Walk-in Leads Summary data"""
     try:
-        # Get branch from session
         branch = session.get('branch_head_branch')
         if not branch:
             return jsonify({'success': False, 'message': 'Branch not found in session'})
         
-        # Get date filter parameters
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
         # Require both date parameters
+        date_from, date_to = branch_analytics_window()
         if not date_from or not date_to:
             return jsonify({'success': False, 'message': 'Both date_from and date_to parameters are required'})
         
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        
-        # OPTIMIZATION: Single query to get all walk-in leads data at once
-        # Select only necessary columns and filter at database level
-        walkin_query = supabase.table('walkin_table').select(
-            'ps_assigned, status, next_followup_date'
-        ).eq('branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        
-        if not walkin_query.data:
-            return jsonify({'success': True, 'data': []})
-        
-        # Process data in Python (much faster than multiple DB queries)
-        ps_data = {}
-        
-        for lead in walkin_query.data:
-            ps_name = lead.get('ps_assigned')
-            status = lead.get('status', 'Pending')
-            next_followup_date = lead.get('next_followup_date')
-            
-            if not ps_name:
-                continue
-                
-            if ps_name not in ps_data:
-                ps_data[ps_name] = {
-                    'total_walkin_leads': 0,
-                    'pending_leads': 0,
-                    'lost_leads': 0,
-                    'won_leads': 0,
-                    'today_followups': 0
-                }
-            
-            ps_data[ps_name]['total_walkin_leads'] += 1
-            
-            # Count by status
-            if status == 'Pending':
-                ps_data[ps_name]['pending_leads'] += 1
-            elif status == 'Lost':
-                ps_data[ps_name]['lost_leads'] += 1
-            elif status == 'Won':
-                ps_data[ps_name]['won_leads'] += 1
-            
-            # Count follow-ups with date <= today and final_status = 'Pending'
-            final_status = lead.get('final_status')
-            if next_followup_date and final_status == 'Pending':
-                try:
-                    if 'T' in str(next_followup_date):
-                        followup_date_parsed = datetime.fromisoformat(str(next_followup_date).replace('Z', '+00:00')).date()
-                    else:
-                        followup_date_parsed = datetime.strptime(str(next_followup_date)[:10], '%Y-%m-%d').date()
-                    
-                    if followup_date_parsed <= datetime.now().date():
-                        ps_data[ps_name]['today_followups'] += 1
-                except (ValueError, TypeError):
-                    # If date parsing fails, include for manual review
-                    ps_data[ps_name]['today_followups'] += 1
-        
-        # Format result data
-        result_data = []
-        for ps_name, stats in ps_data.items():
-            result_data.append({
-                'ps_name': ps_name,
-                'total_walkin_leads': stats['total_walkin_leads'],
-                'pending_leads': stats['pending_leads'],
-                'lost_leads': stats['lost_leads'],
-                'won_leads': stats['won_leads'],
-                'today_followups': stats['today_followups']
-            })
-        
-        return jsonify({'success': True, 'data': result_data})
+        analytics = get_branch_analytics(branch, date_from, date_to)
+        return jsonify({'success': True, 'data': analytics['walkin_leads']})
         
     except Exception as e:
         print(f"Error in walkin_leads API: {str(e)}")
@@ -16217,255 +14474,36 @@ def api_branch_sources():
 
 @app.route('/api/branch_analytics/all')
 def api_branch_analytics_all():
-    """OPTIMIZED: Single endpoint to get all analytics data at once - reduces API calls"""
+    """Single endpoint returning every analytics section, built from one read of each lead table"""
     start_time = time.time()
-    print(f"[DEBUG] /api/branch_analytics/all called at {datetime.now()}")
-    
     try:
         branch = session.get('branch_head_branch')
-        print(f"[DEBUG] Branch from session: {branch}")
         if not branch:
-            print("[DEBUG] No branch found in session")
             return jsonify({'success': False, 'message': 'Branch not found in session'})
         
-        # Get date filter parameters
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        print(f"[DEBUG] Date filter: {date_from} to {date_to}")
-        
         # If no date parameters provided, use MTD (Month to Date) as default
-        if not date_from or not date_to:
-            today = datetime.now()
-            date_from = today.replace(day=1).strftime('%Y-%m-%d')
-            date_to = today.strftime('%Y-%m-%d')
-            print(f"[DEBUG] Using default dates: {date_from} to {date_to}")
-        
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        print(f"[DEBUG] Today's date: {today_str}")
-        
-        # OPTIMIZATION: Single query for each table with all necessary data
-        # This reduces database round trips significantly
-        
-        print("[DEBUG] Starting database queries...")
-        query_start = time.time()
-        
-        # Get PS performance data
-        print("[DEBUG] Querying ps_followup_master for performance data...")
-        ps_performance_query = supabase.table('ps_followup_master').select(
-            'ps_name, ps_assigned_at, lead_status'
-        ).eq('ps_branch', branch).gte('ps_assigned_at', date_from).lte('ps_assigned_at', date_to).execute()
-        print(f"[DEBUG] PS performance query completed in {time.time() - query_start:.3f}s, got {len(ps_performance_query.data or [])} records")
-        
-        # Get source leads data
-        print("[DEBUG] Querying ps_followup_master for source leads data...")
-        source_leads_query = supabase.table('ps_followup_master').select(
-            'ps_name, source, final_status'
-        ).eq('ps_branch', branch).gte('ps_assigned_at', date_from).lte('ps_assigned_at', date_to).execute()
-        print(f"[DEBUG] Source leads query completed in {time.time() - query_start:.3f}s, got {len(source_leads_query.data or [])} records")
-        
-        # Get walkin leads data
-        print("[DEBUG] Querying walkin_table for walkin leads data...")
-        walkin_leads_query = supabase.table('walkin_table').select(
-            'ps_assigned, status, next_followup_date'
-        ).eq('branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        print(f"[DEBUG] Walkin leads query completed in {time.time() - query_start:.3f}s, got {len(walkin_leads_query.data or [])} records")
-        
-        # Get summary data
-        print("[DEBUG] Querying for summary data...")
-        ps_summary_query = supabase.table('ps_followup_master').select(
-            'final_status'
-        ).eq('ps_branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        print(f"[DEBUG] PS summary query completed in {time.time() - query_start:.3f}s, got {len(ps_summary_query.data or [])} records")
-        
-        walkin_summary_query = supabase.table('walkin_table').select(
-            'status'
-        ).eq('branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        print(f"[DEBUG] Walkin summary query completed in {time.time() - query_start:.3f}s, got {len(walkin_summary_query.data or [])} records")
-        
-        total_query_time = time.time() - query_start
-        print(f"[DEBUG] All database queries completed in {total_query_time:.3f}s")
-        
-        # Process PS Performance data
-        print("[DEBUG] Processing PS performance data...")
-        process_start = time.time()
-        ps_performance = {}
-        if ps_performance_query.data:
-            for lead in ps_performance_query.data:
-                ps_name = lead.get('ps_name')
-                if not ps_name:
-                    continue
-                    
-                if ps_name not in ps_performance:
-                    ps_performance[ps_name] = {'leads_assigned': 0, 'leads_contacted': 0}
-                
-                ps_performance[ps_name]['leads_assigned'] += 1
-                if lead.get('lead_status'):
-                    ps_performance[ps_name]['leads_contacted'] += 1
-        
-        # Process Source Leads data
-        print("[DEBUG] Processing source leads data...")
-        source_data = {}
-        all_sources = set()
-        if source_leads_query.data:
-            for lead in source_leads_query.data:
-                ps_name = lead.get('ps_name')
-                source = lead.get('source', 'Unknown')
-                final_status = lead.get('final_status', 'Pending')
-                
-                if not ps_name:
-                    continue
-                    
-                if ps_name not in source_data:
-                    source_data[ps_name] = {'total_leads': 0, 'won_leads': 0, 'sources': {}}
-                
-                source_data[ps_name]['total_leads'] += 1
-                if final_status == 'Won':
-                    source_data[ps_name]['won_leads'] += 1
-                
-                if source not in source_data[ps_name]['sources']:
-                    source_data[ps_name]['sources'][source] = {'total_leads': 0, 'won_leads': 0}
-                
-                source_data[ps_name]['sources'][source]['total_leads'] += 1
-                if final_status == 'Won':
-                    source_data[ps_name]['sources'][source]['won_leads'] += 1
-                
-                all_sources.add(source)
-        
-        # Process Walkin Leads data
-        print("[DEBUG] Processing walkin leads data...")
-        walkin_data = {}
-        if walkin_leads_query.data:
-            for lead in walkin_leads_query.data:
-                ps_name = lead.get('ps_assigned')
-                status = lead.get('status', 'Pending')
-                next_followup_date = lead.get('next_followup_date')
-                
-                if not ps_name:
-                    continue
-                    
-                if ps_name not in walkin_data:
-                    walkin_data[ps_name] = {
-                        'total_walkin_leads': 0,
-                        'pending_leads': 0,
-                        'lost_leads': 0,
-                        'won_leads': 0,
-                        'today_followups': 0
-                    }
-                
-                walkin_data[ps_name]['total_walkin_leads'] += 1
-                
-                if status == 'Pending':
-                    walkin_data[ps_name]['pending_leads'] += 1
-                elif status == 'Lost':
-                    walkin_data[ps_name]['lost_leads'] += 1
-                elif status == 'Won':
-                    walkin_data[ps_name]['won_leads'] += 1
-                
-                # Count follow-ups with date <= today and status = 'Pending'
-                if next_followup_date and status == 'Pending':
-                    try:
-                        if 'T' in str(next_followup_date):
-                            followup_date_parsed = datetime.fromisoformat(str(next_followup_date).replace('Z', '+00:00')).date()
-                        else:
-                            followup_date_parsed = datetime.strptime(str(next_followup_date)[:10], '%Y-%m-%d').date()
-                        
-                        if followup_date_parsed <= datetime.now().date():
-                            walkin_data[ps_name]['today_followups'] += 1
-                    except (ValueError, TypeError):
-                        # If date parsing fails, include for manual review
-                        walkin_data[ps_name]['today_followups'] += 1
-        
-        # Process Summary data
-        print("[DEBUG] Processing summary data...")
-        ps_total = ps_pending = ps_won = ps_lost = 0
-        if ps_summary_query.data:
-            for row in ps_summary_query.data:
-                ps_total += 1
-                status = row.get('final_status', 'Pending')
-                if status == 'Pending':
-                    ps_pending += 1
-                elif status == 'Won':
-                    ps_won += 1
-                elif status == 'Lost':
-                    ps_lost += 1
-        
-        walkin_total = walkin_pending = walkin_won = walkin_lost = 0
-        if walkin_summary_query.data:
-            for row in walkin_summary_query.data:
-                walkin_total += 1
-                status = row.get('status', 'Pending')
-                if status == 'Pending':
-                    walkin_pending += 1
-                elif status == 'Won':
-                    walkin_won += 1
-                elif status == 'Lost':
-                    walkin_lost += 1
-        
-        process_time = time.time() - process_start
-        print(f"[DEBUG] Data processing completed in {process_time:.3f}s")
-        
-        # Format all data
-        print("[DEBUG] Formatting result data...")
-        format_start = time.time()
-        ps_performance_result = []
-        for ps_name, stats in ps_performance.items():
-            ps_performance_result.append({
-                'ps_name': ps_name,
-                'leads_assigned': stats['leads_assigned'],
-                'leads_contacted': stats['leads_contacted'],
-                'gap': stats['leads_assigned'] - stats['leads_contacted']
-            })
-        
-        source_leads_result = []
-        for ps_name, stats in source_data.items():
-            source_leads_result.append({
-                'ps_name': ps_name,
-                'total_leads': stats['total_leads'],
-                'won_leads': stats['won_leads'],
-                'source_breakdown': stats['sources']
-            })
-        
-        walkin_leads_result = []
-        for ps_name, stats in walkin_data.items():
-            walkin_leads_result.append({
-                'ps_name': ps_name,
-                'total_walkin_leads': stats['total_walkin_leads'],
-                'pending_leads': stats['pending_leads'],
-                'lost_leads': stats['lost_leads'],
-                'won_leads': stats['won_leads'],
-                'today_followups': stats['today_followups']
-            })
+        date_from, date_to = branch_analytics_window(default_mtd=True)
+        if not date_from:
+            return jsonify({'success': False, 'message': 'Invalid date_from or date_to'})
         
-        summary_result = {
-            'total_leads_assigned': ps_total + walkin_total,
-            'total_pending_leads': ps_pending + walkin_pending,
-            'total_won_leads': ps_won + walkin_won,
-            'total_lost_leads': ps_lost + walkin_lost
-        }
-        
-        format_time = time.time() - format_start
-        print(f"[DEBUG] Data formatting completed in {format_time:.3f}s")
-        
-        total_time = time.time() - start_time
-        print(f"[DEBUG] Total API response time: {total_time:.3f}s")
-        print(f"[DEBUG] Breakdown: Queries={total_query_time:.3f}s, Processing={process_time:.3f}s, Formatting={format_time:.3f}s")
+        analytics = get_branch_analytics(branch, date_from, date_to)
         
         return jsonify({
             'success': True,
             'data': {
-                'ps_performance': ps_performance_result,
-                'source_leads': source_leads_result,
-                'walkin_leads': walkin_leads_result,
-                'summary': summary_result,
-                'sources': sorted(list(all_sources))
-            }
+                'ps_performance': analytics['ps_performance'],
+                'source_leads': analytics['source_leads'],
+                'walkin_leads': analytics['walkin_leads'],
+                'summary': analytics['summary'],
+                'sources': analytics['sources']
+            },
+            'timings': analytics['timings']
         })
         
     except Exception as e:
-        total_time = time.time() - start_time
-        print(f"[DEBUG] Error in combined analytics API after {total_time:.3f}s: {str(e)}")
-        print(f"[DEBUG] Full error traceback:", exc_info=True)
+        print(f"Error in combined analytics API after {time.time() - start_time:.3f}s: {str(e)}")
         return jsonify({'success': False, 'message': f'Error loading analytics data: {str(e)}'})
+
 @app.route('/api/branch_summary')
 def api_branch_summary():
     """Get branch-wise lead summary with untouched, called, and total counts"""
@@ -16536,57 +14574,24 @@ def api_untouched_leads():
         if not branch_name:
             return jsonify({'success': False, 'message': 'Branch name is required'})
         
-        # Base query for this branch
-        base_query = supabase.table('ps_followup_master').select('*').eq('ps_branch', branch_name)
-        
-        # Apply date filter if provided
-        if start_date:
-            base_query = base_query.gte('ps_assigned_at', start_date)
-        if end_date:
-            # For end_date, we need to include the full day
-            # Add 1 day to end_date to make it inclusive
-            end_date_plus_one = (datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)).strftime('%Y-%m-%d')
-            base_query = base_query.lt('ps_assigned_at', end_date_plus_one)
-        
-        # Get all leads for this branch
-        all_leads = base_query.execute().data or []
-        
-        # Filter for untouched leads (follow_up_date is NULL and final_status is Pending)
-        untouched_leads = [lead for lead in all_leads 
-                          if not lead.get('follow_up_date') and lead.get('final_status') == 'Pending']
+        # Untouched leads of this branch (follow_up_date is NULL and final_status is
+        # Pending), filtered in the query and read page by page
+        filters = {'ps_branch': branch_name, 'follow_up_date': ('is', 'null'), 'final_status': 'Pending'}
+        date_hook = date_range_hook('ps_assigned_at', *resolve_date_window('range', start_date, end_date))
+        untouched_chunks = safe_iter_data('ps_followup_master', filters, query_hook=date_hook)
         
         if export_csv:
-            # Return CSV format
-            import csv
-            import io
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write headers
-            writer.writerow(['Lead UID', 'Customer Name', 'Mobile Number', 'Source', 'Lead Category', 'PS Assigned', 'PS Assigned Date', 'Status'])
-            
-            # Write data
-            for lead in untouched_leads:
-                writer.writerow([
-                    lead.get('lead_uid', ''),
-                    lead.get('customer_name', ''),
-                    lead.get('customer_mobile_number', ''),
-                    lead.get('source', ''),
-                    lead.get('lead_category', ''),
-                    lead.get('ps_name', ''),
-                    lead.get('ps_assigned_at', ''),
-                    lead.get('final_status', '')
-                ])
-            
-            output.seek(0)
-            
-            return Response(
-                output.getvalue(),
-                mimetype='text/csv',
-                headers={'Content-Disposition': f'attachment; filename=untouched_leads_{branch_name}_{start_date or "all"}_{end_date or "all"}.csv'}
+            # Stream CSV format
+            filename = f'untouched_leads_{branch_name}_{start_date or "all"}_{end_date or "all"}.csv'
+            return stream_csv_response(
+                filename,
+                ['Lead UID', 'Customer Name', 'Mobile Number', 'Source', 'Lead Category', 'PS Assigned', 'PS Assigned Date', 'Status'],
+                untouched_chunks,
+                row_values(['lead_uid', 'customer_name', 'customer_mobile_number', 'source', 'lead_category', 'ps_name', 'ps_assigned_at', 'final_status'])
             )
         
+        untouched_leads = [lead for chunk in untouched_chunks for lead in chunk]
+        
         # Return JSON format for modal display
         return jsonify({
             'success': True,
@@ -16599,84 +14604,19 @@ def api_untouched_leads():
 
 @app.route('/api/branch_analytics/summary')
 def api_branch_analytics_summary():
-    """API endpoint for Branch Summary KPI data - OPTIMIZED"""
+    """API endpoint for Branch Summary KPI data"""
     try:
         branch = session.get('branch_head_branch')
         if not branch:
             return jsonify({'success': False, 'message': 'Branch not found in session'})
         
-        # Get date filter parameters
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
         # If no date parameters provided, use MTD (Month to Date) as default
-        if not date_from or not date_to:
-            today = datetime.now()
-            date_from = today.replace(day=1).strftime('%Y-%m-%d')
-            date_to = today.strftime('%Y-%m-%d')
-        
-        # OPTIMIZATION: Use count queries with proper filtering instead of fetching all data
-        # These are much faster as they only return counts, not actual data
-        
-        # Get counts from ps_followup_master
-        ps_stats = supabase.table('ps_followup_master').select(
-            'final_status', count='exact'
-        ).eq('ps_branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        
-        # Get counts from walkin_table  
-        walkin_stats = supabase.table('walkin_table').select(
-            'status', count='exact'
-        ).eq('branch', branch).gte('created_at', date_from).lte('created_at', date_to).execute()
-        
-        # Process ps_followup_master data
-        ps_total = 0
-        ps_pending = 0
-        ps_won = 0
-        ps_lost = 0
-        
-        if ps_stats.data:
-            for row in ps_stats.data:
-                ps_total += 1
-                status = row.get('final_status', 'Pending')
-                if status == 'Pending':
-                    ps_pending += 1
-                elif status == 'Won':
-                    ps_won += 1
-                elif status == 'Lost':
-                    ps_lost += 1
-        
-        # Process walkin_table data
-        walkin_total = 0
-        walkin_pending = 0
-        walkin_won = 0
-        walkin_lost = 0
-        
-        if walkin_stats.data:
-            for row in walkin_stats.data:
-                walkin_total += 1
-                status = row.get('status', 'Pending')
-                if status == 'Pending':
-                    walkin_pending += 1
-                elif status == 'Won':
-                    walkin_won += 1
-                elif status == 'Lost':
-                    walkin_lost += 1
-        
-        # Calculate totals
-        total_leads_assigned = ps_total + walkin_total
-        total_pending_leads = ps_pending + walkin_pending
-        total_won_leads = ps_won + walkin_won
-        total_lost_leads = ps_lost + walkin_lost
+        date_from, date_to = branch_analytics_window(default_mtd=True)
+        if not date_from:
+            return jsonify({'success': False, 'message': 'Invalid date_from or date_to'})
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'total_leads_assigned': total_leads_assigned,
-                'total_pending_leads': total_pending_leads,
-                'total_won_leads': total_won_leads,
-                'total_lost_leads': total_lost_leads
-            }
-        })
+        analytics = get_branch_analytics(branch, date_from, date_to)
+        return jsonify({'success': True, 'data': analytics['summary']})
         
     except Exception as e:
         print(f"Error in branch summary API: {str(e)}")
@@ -19531,59 +17471,34 @@ def api_ps_performance_analytics():
         end_date = request.args.get('end_date')
         branch_filter = request.args.get('branch')
         
-        # Build query for ps_followup_master
-        query = supabase.table('ps_followup_master').select('ps_name, ps_branch, ps_assigned_at, lead_status')
-        
-        # Apply date filters
-        if start_date:
-            query = query.gte('ps_assigned_at', start_date)
-        if end_date:
-            query = query.lte('ps_assigned_at', end_date)
-        
-        # Apply branch filter
+        # Vectorized over the in-process ps_followup_master snapshot
+        frame = ps_followup_snapshot.get_frame(supabase)
+        mask = frame['ps_name'].notna().to_numpy().copy()
+        if start_date or end_date:
+            mask &= day_window_mask(frame['ps_assigned_at'], parse_day(start_date), parse_day(end_date))
         if branch_filter:
-            query = query.eq('ps_branch', branch_filter)
-        
-        result = query.execute()
-        
-        if not result.data:
-            return jsonify({
-                'success': True,
-                'data': []
-            })
-        
-        # Process data to calculate performance metrics
-        ps_performance = {}
-        for lead in result.data:
-            ps_name = lead.get('ps_name')
-            branch = lead.get('ps_branch')
-            
-            if not ps_name:
-                continue
-            
-            if ps_name not in ps_performance:
-                ps_performance[ps_name] = {
-                    'ps_name': ps_name,
-                    'branch': branch,
-                    'leads_assigned': 0,
-                    'leads_contacted': 0
-                }
-            
-            ps_performance[ps_name]['leads_assigned'] += 1
-            if lead.get('lead_status'):
-                ps_performance[ps_name]['leads_contacted'] += 1
-        
-        # Calculate gap and format result
-        result_data = []
-        for ps_name, stats in ps_performance.items():
-            gap = stats['leads_assigned'] - stats['leads_contacted']
-            result_data.append({
-                'ps_name': stats['ps_name'],
-                'branch': stats['branch'],
-                'leads_assigned': stats['leads_assigned'],
-                'leads_contacted': stats['leads_contacted'],
-                'gap': gap
-            })
+            mask &= (frame['ps_branch'] == branch_filter).to_numpy()
+        selected = frame[mask]
+
+        contacted = selected['lead_status'].astype(object).fillna('').astype(str).ne('')
+        grouped = pd.DataFrame({
+            'ps_name': selected['ps_name'].astype(object),
+            'branch': selected['ps_branch'].astype(object),
+            'contacted': contacted.astype(int),
+        }).groupby('ps_name', sort=False).agg(
+            branch=('branch', 'first'), leads_assigned=('contacted', 'size'), leads_contacted=('contacted', 'sum')
+        )
+
+        result_data = [
+            {
+                'ps_name': ps_name,
+                'branch': None if pd.isna(row.branch) else row.branch,
+                'leads_assigned': int(row.leads_assigned),
+                'leads_contacted': int(row.leads_contacted),
+                'gap': int(row.leads_assigned - row.leads_contacted)
+            }
+            for ps_name, row in grouped.iterrows()
+        ]
         
         # Sort by leads assigned (descending)
         result_data.sort(key=lambda x: x['leads_assigned'], reverse=True)
@@ -19644,6 +17559,13 @@ def websocket_health():
         }), 500
 
 
+@app.route('/api/export_cache_stats')
+@require_admin
+def export_cache_stats():
+    """Hit/miss statistics of the on-disk export cache for admin monitoring."""
+    return jsonify(dict(export_cache.stats(), timestamp=datetime.now().isoformat()))
+
+
 @app.route('/api/websocket_stats')
 @require_admin
 def websocket_stats():
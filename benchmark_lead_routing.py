@@ -0,0 +1,177 @@
+"""
+Lead Routing Benchmark for Ather CRM System
+This script times the Knowlarity ingestion on a synthetic call log (50,000
+calls by default): the row-wise path (a dict per call through ingest_leads)
+against the frame path now used by batch_process_leads_optimized
+(ingest_lead_frame). Both run against an in-memory stand-in for the Supabase
+client, so only the local work is timed, and the rows each path writes are
+compared to check that the routing is identical.
+
+    python benchmark_lead_routing.py [calls] [seed]
+"""
+
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from knowlaritytosupabase import NEW_LEAD_DEFAULTS, batch_process_leads_optimized, generate_uid
+from lead_dedup import SOURCE_SLOTS, ingest_leads
+
+# Knowlarity sources (see knowlaritytosupabase.number_to_source_mapping) plus
+# the other sources an existing phone may already have
+CALL_SOURCES = [('META', 'Meta Know'), ('GOOGLE', 'Google Know'), ('BTL', 'BTL Know')]
+OTHER_SOURCES = [('META', 'Meta'), ('GOOGLE', 'Google'), ('Walk-in', 'Showroom'), ('Tele', 'Inbound')]
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+    def execute(self):
+        return self
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = None
+        self.phones = set()
+        self.rows = []
+
+    def select(self, *args):
+        self.action = 'select'
+        return self
+
+    def in_(self, column, values):
+        self.phones = set(values)
+        return self
+
+    def insert(self, rows):
+        self.action, self.rows = 'insert', rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.action, self.rows = 'upsert', rows
+        return self
+
+    def execute(self):
+        if self.action == 'select':
+            records = self.client.tables[self.table]
+            return _Result([records[phone] for phone in self.phones if phone in records])
+        written = []
+        for row in self.rows:
+            if self.table == 'lead_master':
+                self.client.next_id += 1
+                row = {**row, 'id': self.client.next_id}
+            written.append(row)
+        self.client.writes.append((self.table, self.action, written))
+        return _Result(written)
+
+
+class InMemorySupabase:
+    """Just enough of the Supabase client for lead_dedup: IN lookups, inserts, upserts and UID leases"""
+
+    def __init__(self, master_records, duplicate_records):
+        self.tables = {'lead_master': master_records, 'duplicate_leads': duplicate_records}
+        self.writes = []
+        self.next_id = 10 ** 7
+        self.next_block = 10000
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        starts = list(range(self.next_block, self.next_block + 100 * params['p_blocks'], 100))
+        self.next_block += 100 * params['p_blocks']
+        return _Result(starts)
+
+
+def synthetic_call_log(calls: int, seed: int):
+    """Call log lead frame and the lead_master/duplicate_leads records of the phones already known"""
+    rng = random.Random(seed)
+    # Fewer phones than calls, so phones repeat within the day
+    phones = [f"9{rng.randrange(10 ** 9):09d}" for _ in range(calls // 2)]
+    rows = []
+    for _ in range(calls):
+        source, sub_source = rng.choice(CALL_SOURCES)
+        rows.append({
+            'date': f"2025-01-{rng.randint(1, 28):02d}",
+            'customer_name': 'No Name(Knowlarity)',
+            # Knowlarity sends numbers with the country code
+            'customer_mobile_number': f"+91{rng.choice(phones)}",
+            'source': source,
+            'sub_source': sub_source,
+        })
+
+    master_records, duplicate_records = {}, {}
+    for i, phone in enumerate(rng.sample(phones, len(phones) * 2 // 5)):
+        source, sub_source = rng.choice(CALL_SOURCES + OTHER_SOURCES)
+        master_records[phone] = {'id': i, 'uid': f"X-{phone[-4:]}-{i:04d}", 'customer_mobile_number': phone,
+                                 'customer_name': 'Existing', 'source': source, 'sub_source': sub_source,
+                                 'date': '2024-12-01'}
+        if rng.random() < 0.3:
+            # Some records are nearly or entirely full
+            used = rng.randint(2, SOURCE_SLOTS)
+            record = {'id': 10 ** 6 + i, 'uid': master_records[phone]['uid'], 'customer_mobile_number': phone,
+                      'original_lead_id': i, 'duplicate_count': used}
+            for slot in range(1, SOURCE_SLOTS + 1):
+                pair = rng.choice(CALL_SOURCES + OTHER_SOURCES) if slot <= used else (None, None)
+                record[f'source{slot}'], record[f'sub_source{slot}'] = pair
+                record[f'date{slot}'] = '2024-12-01' if slot <= used else None
+            duplicate_records[phone] = record
+    return pd.DataFrame(rows), master_records, duplicate_records
+
+
+def row_wise_ingest(df_processed, supabase, batch_size=50):
+    """batch_process_leads_optimized as it was before the frame path: one dict per call"""
+    current_time = datetime.now().isoformat()
+    leads = [
+        {**NEW_LEAD_DEFAULTS, **row, 'created_at': current_time, 'updated_at': current_time}
+        for row in df_processed[['date', 'customer_name', 'customer_mobile_number', 'source', 'sub_source']]
+        .to_dict(orient='records')
+    ]
+    return ingest_leads(
+        supabase, leads,
+        uid_for=lambda lead, sequence: generate_uid(lead['source'], lead['customer_mobile_number'], sequence),
+        batch_size=batch_size
+    )
+
+
+def written_rows(client):
+    """Rows written per table and action, without the timestamps taken while routing"""
+    def strip(row):
+        return {key: value for key, value in row.items() if key not in ('created_at', 'updated_at')}
+    return [(table, action, [strip(row) for row in rows]) for table, action, rows in client.writes]
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    df, master_records, duplicate_records = synthetic_call_log(calls, seed)
+    print(f"📞 {len(df)} calls, {len(master_records)} known phones, {len(duplicate_records)} duplicate records")
+
+    timings, writes = {}, {}
+    for name, ingest in (('row-wise', row_wise_ingest), ('frame', batch_process_leads_optimized)):
+        best = None
+        for _ in range(3):
+            client = InMemorySupabase(master_records, duplicate_records)
+            start = time.perf_counter()
+            results = ingest(df, client, batch_size=500)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name], writes[name] = best, written_rows(client)
+        counts = {key: value for key, value in results.items() if key not in ('new_leads', 'failed_phones')}
+        print(f"⏱️ {name}: {best * 1000:.1f} ms (best of 3) {counts}")
+
+    same = writes['row-wise'] == writes['frame']
+    print(f"{'✅' if same else '❌'} Written rows {'identical' if same else 'DIFFER'}")
+    print(f"🚀 Speedup: {timings['row-wise'] / timings['frame']:.2f}x")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
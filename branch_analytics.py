@@ -0,0 +1,185 @@
+"""
+Branch Analytics for Ather CRM System
+This module builds every section of the branch head analytics tab (PS
+performance, source-wise leads, walk-in summary and the KPI summary) from one
+read of ``ps_followup_master`` and one read of ``walkin_table``.
+
+PS performance and source leads count the PS leads assigned in the window
+(``ps_assigned_at``), while the summary counts the leads created in it
+(``created_at``). Both windows are fetched together with the union of the
+columns the sections need, and each row is routed to the sections whose window
+it falls in during a single pass.
+
+``date_to`` is inclusive: the window runs up to (not including) midnight after
+it. The per-endpoint queries this replaced used ``lte(column, date_to)``,
+which Postgres compares as midnight at the start of ``date_to`` and so left
+out the timestamps of the last day; counts for a window ending today now
+include today's leads.
+"""
+
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from query_utils import iter_table_rows
+
+PS_ANALYTICS_FIELDS = 'ps_name, ps_assigned_at, created_at, lead_status, source, final_status'
+WALKIN_ANALYTICS_FIELDS = 'ps_assigned, status, next_followup_date, created_at'
+
+SUMMARY_STATUSES = ('Pending', 'Won', 'Lost')
+
+
+def _window_hook(columns: Iterable[str], date_from: str, date_to: str):
+    """``query_hook`` keeping rows whose date in any of ``columns`` lies in [date_from, date_to] (whole days)"""
+    columns = list(columns)
+    end_exclusive = (datetime.strptime(date_to, '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+
+    def hook(query):
+        if len(columns) == 1:
+            return query.gte(columns[0], date_from).lt(columns[0], end_exclusive)
+        windows = ','.join(f'and({column}.gte.{date_from},{column}.lt.{end_exclusive})' for column in columns)
+        query.params = query.params.add('or', f'({windows})')
+        return query
+
+    return hook
+
+
+def _in_window(value: Any, date_from: str, date_to: str) -> bool:
+    """True when the date part (YYYY-MM-DD) of ``value`` lies in [date_from, date_to]"""
+    return bool(value) and date_from <= str(value)[:10] <= date_to
+
+
+def _followup_due(value: Any, today: date) -> bool:
+    """True when a follow-up date is today or earlier; unparseable dates are kept for manual review"""
+    try:
+        if 'T' in str(value):
+            followup_date = datetime.fromisoformat(str(value).replace('Z', '+00:00')).date()
+        else:
+            followup_date = datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+        return followup_date <= today
+    except (ValueError, TypeError):
+        return True
+
+
+def build_branch_analytics(supabase_client, branch: str, date_from: str, date_to: str,
+                           today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Compute all branch analytics sections for ``branch`` between ``date_from``
+    and ``date_to`` (YYYY-MM-DD, both days included).
+
+    Returns a dict with ``ps_performance``, ``source_leads``, ``walkin_leads``,
+    ``summary`` and ``sources`` in the shape of /api/branch_analytics/all, plus
+    ``timings`` (seconds spent per phase).
+    """
+    today = today or datetime.now().date()
+    timings = {}
+    start_time = time.time()
+
+    phase_start = time.time()
+    ps_rows = list(iter_table_rows(
+        supabase_client, 'ps_followup_master', {'ps_branch': branch}, PS_ANALYTICS_FIELDS,
+        query_hook=_window_hook(('ps_assigned_at', 'created_at'), date_from, date_to)
+    ))
+    timings['fetch_ps_followup_master'] = time.time() - phase_start
+
+    phase_start = time.time()
+    walkin_rows = list(iter_table_rows(
+        supabase_client, 'walkin_table', {'branch': branch}, WALKIN_ANALYTICS_FIELDS,
+        query_hook=_window_hook(('created_at',), date_from, date_to)
+    ))
+    timings['fetch_walkin_table'] = time.time() - phase_start
+
+    phase_start = time.time()
+    performance = {}
+    source_data = {}
+    all_sources = set()
+    summary_counts = {'total': 0, 'Pending': 0, 'Won': 0, 'Lost': 0}
+
+    for lead in ps_rows:
+        final_status = lead.get('final_status')
+
+        if _in_window(lead.get('created_at'), date_from, date_to):
+            summary_counts['total'] += 1
+            if final_status in SUMMARY_STATUSES:
+                summary_counts[final_status] += 1
+
+        ps_name = lead.get('ps_name')
+        if not ps_name or not _in_window(lead.get('ps_assigned_at'), date_from, date_to):
+            continue
+
+        stats = performance.setdefault(ps_name, {'leads_assigned': 0, 'leads_contacted': 0})
+        stats['leads_assigned'] += 1
+        if lead.get('lead_status'):
+            stats['leads_contacted'] += 1
+
+        source = lead.get('source') or 'Unknown'
+        won = 1 if final_status == 'Won' else 0
+        ps_sources = source_data.setdefault(ps_name, {'total_leads': 0, 'won_leads': 0, 'sources': {}})
+        ps_sources['total_leads'] += 1
+        ps_sources['won_leads'] += won
+        source_stats = ps_sources['sources'].setdefault(source, {'total_leads': 0, 'won_leads': 0})
+        source_stats['total_leads'] += 1
+        source_stats['won_leads'] += won
+        all_sources.add(source)
+
+    walkin_data = {}
+    for lead in walkin_rows:
+        status = lead.get('status')
+        summary_counts['total'] += 1
+        if status in SUMMARY_STATUSES:
+            summary_counts[status] += 1
+
+        ps_name = lead.get('ps_assigned')
+        if not ps_name:
+            continue
+
+        stats = walkin_data.setdefault(ps_name, {
+            'total_walkin_leads': 0,
+            'pending_leads': 0,
+            'lost_leads': 0,
+            'won_leads': 0,
+            'today_followups': 0
+        })
+        stats['total_walkin_leads'] += 1
+        if status == 'Pending':
+            stats['pending_leads'] += 1
+            next_followup_date = lead.get('next_followup_date')
+            if next_followup_date and _followup_due(next_followup_date, today):
+                stats['today_followups'] += 1
+        elif status == 'Lost':
+            stats['lost_leads'] += 1
+        elif status == 'Won':
+            stats['won_leads'] += 1
+    timings['aggregate'] = time.time() - phase_start
+
+    timings['total'] = time.time() - start_time
+
+    return {
+        'ps_performance': [
+            {
+                'ps_name': ps_name,
+                'leads_assigned': stats['leads_assigned'],
+                'leads_contacted': stats['leads_contacted'],
+                'gap': stats['leads_assigned'] - stats['leads_contacted']
+            }
+            for ps_name, stats in performance.items()
+        ],
+        'source_leads': [
+            {
+                'ps_name': ps_name,
+                'total_leads': stats['total_leads'],
+                'won_leads': stats['won_leads'],
+                'source_breakdown': stats['sources']
+            }
+            for ps_name, stats in source_data.items()
+        ],
+        'walkin_leads': [dict(ps_name=ps_name, **stats) for ps_name, stats in walkin_data.items()],
+        'summary': {
+            'total_leads_assigned': summary_counts['total'],
+            'total_pending_leads': summary_counts['Pending'],
+            'total_won_leads': summary_counts['Won'],
+            'total_lost_leads': summary_counts['Lost']
+        },
+        'sources': sorted(all_sources),
+        'timings': timings,
+    }
@@ -0,0 +1,166 @@
+"""
+CRE Analytics for Ather CRM System
+This module computes every block of the CRE analytics page (leaderboard,
+platform conversion, overall stats, leads by category and summary KPIs) from a
+lead_master frame in a few vectorized group-bys, instead of scanning all leads
+once per CRE and per metric.
+
+The frame is the lead_master snapshot (see lead_snapshot.py): timestamps are
+datetime64 and may be NaT.
+"""
+
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from lead_snapshot import day_window_mask
+
+CATEGORY_COLUMNS = {
+    'hot': ('hot',),
+    'cold': ('cold',),
+    'warm': ('warm',),
+    'not_interested': ('not interested', 'not_interested'),
+    'not_set': ('not set', 'not_set', ''),
+}
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Text column as plain strings, '' for missing values"""
+    return series.astype(object).where(series.notna(), '').astype(str)
+
+
+def _counts(keys: pd.Series, **flags: np.ndarray) -> pd.DataFrame:
+    """Sum each boolean flag per key in one group-by"""
+    frame = pd.DataFrame({name: flag.astype(np.int64) for name, flag in flags.items()})
+    frame['_key'] = keys.to_numpy()
+    return frame.groupby('_key', sort=False).sum()
+
+
+def _rate(numerator: int, denominator: int) -> float:
+    return round((numerator / denominator * 100) if denominator > 0 else 0, 2)
+
+
+def build_cre_analytics(leads: pd.DataFrame, active_cres: List[str], current_cre: Optional[str],
+                        window_start: Optional[date], window_end: Optional[date], today: date) -> Dict[str, Any]:
+    """
+    All CRE analytics blocks for ``current_cre``.
+
+    The leaderboard, platform conversion, overall stats and category blocks
+    apply the window only when both bounds are set, and count closures without
+    a timestamp as in the window. The summary KPIs apply each bound on its own.
+    """
+    cre_name = _text(leads['cre_name'])
+    final_status = _text(leads['final_status'])
+    source = _text(leads['source']).replace('', 'Unknown')
+    category = _text(leads['lead_category'])
+    assigned_at = leads['cre_assigned_at']
+    won_at = leads['won_timestamp']
+    closed_at = leads['lost_timestamp'].fillna(won_at)
+
+    has_window = window_start is not None and window_end is not None
+
+    def in_window_or_undated(series: pd.Series) -> np.ndarray:
+        if not has_window:
+            return np.ones(len(series), dtype=bool)
+        return series.isna().to_numpy() | day_window_mask(series, window_start, window_end)
+
+    is_won = (final_status == 'Won').to_numpy()
+    is_pending = (final_status == 'Pending').to_numpy()
+    is_lost = (final_status == 'Lost').to_numpy()
+    is_assigned = assigned_at.notna().to_numpy()
+    won_in_window = is_won & in_window_or_undated(won_at)
+    # Leads count as lost when marked Lost or when they carry a lost timestamp
+    lost_in_window = ~is_won & (is_lost | leads['lost_timestamp'].notna().to_numpy()) & in_window_or_undated(closed_at)
+    assigned_in_window = is_assigned & in_window_or_undated(assigned_at)
+
+    # Leaderboard of active CREs, by won leads (ties keep the CRE list order)
+    per_cre = _counts(cre_name, won=won_in_window, pending_live=is_pending, lost=lost_in_window,
+                      total_leads_handled=assigned_in_window)
+    leaderboard = []
+    for name in active_cres:
+        stats = per_cre.loc[name] if name in per_cre.index else None
+        leaderboard.append((name, {
+            'won': int(stats['won']) if stats is not None else 0,
+            'pending_live': int(stats['pending_live']) if stats is not None else 0,
+            'lost': int(stats['lost']) if stats is not None else 0,
+            'total_leads_handled': int(stats['total_leads_handled']) if stats is not None else 0,
+        }))
+    leaderboard.sort(key=lambda item: item[1]['won'], reverse=True)
+
+    # Leads assigned in the window per category, for all active CREs
+    per_category = _counts(
+        cre_name,
+        **{column: assigned_in_window & category.str.lower().isin(values).to_numpy()
+           for column, values in CATEGORY_COLUMNS.items()}
+    )
+    leads_by_category = {
+        name: {column: int(per_category.at[name, column]) if name in per_category.index else 0
+               for column in CATEGORY_COLUMNS}
+        for name in active_cres
+    }
+
+    # Per-platform blocks and stats for the logged-in CRE
+    mine = (cre_name == (current_cre or '')).to_numpy() & bool(current_cre)
+    per_platform = _counts(
+        source[mine],
+        assigned=is_assigned[mine],
+        won=won_in_window[mine],
+        pending_live=is_pending[mine],
+        lost=lost_in_window[mine] & ~is_pending[mine],
+        won_live=is_won[mine],
+        lost_live=is_lost[mine],
+    )
+    platform_conversion = {}
+    platform_conversion_live = {}
+    for platform, stats in per_platform.iterrows():
+        assigned = int(stats['assigned'])
+        platform_conversion[platform] = {
+            'won': int(stats['won']),
+            'pending_live': int(stats['pending_live']),
+            'lost': int(stats['lost']),
+            'assigned': assigned,
+            # Conversion is always live: all won cases, not date filtered
+            'conversion_rate': _rate(int(stats['won_live']), assigned),
+        }
+        platform_conversion_live[platform] = {
+            'won': int(stats['won_live']),
+            'pending': int(stats['pending_live']),
+            'lost': int(stats['lost_live']),
+            'assigned': assigned,
+            'conversion_rate': _rate(int(stats['won_live']), assigned),
+        }
+
+    total_assigned = int(is_assigned[mine].sum())
+    total_won = int(won_in_window[mine].sum())
+    overall_stats = {
+        'won': total_won,
+        'lost': int(lost_in_window[mine].sum()),
+        'assigned': total_assigned,
+        'conversion_rate': _rate(total_won, total_assigned),
+    }
+
+    # Summary KPIs: date filtered totals use each bound on its own, FTD/MTD ignore the filter
+    month_start = today.replace(day=1)
+    month_end = (pd.Timestamp(month_start) + pd.offsets.MonthEnd(0)).date()
+    assigned_filtered = day_window_mask(assigned_at, window_start, window_end)
+    won_with_date = is_won & won_at.notna().to_numpy()
+    summary_metrics = {
+        'total_leads': int((mine & assigned_filtered).sum()),
+        'hot_leads': int((mine & assigned_filtered & (category == 'Hot').to_numpy()).sum()),
+        'ftd_assigned': int((mine & day_window_mask(assigned_at, today, today)).sum()),
+        'mtd_assigned': int((mine & day_window_mask(assigned_at, month_start, month_end)).sum()),
+        'ftd_retails': int((mine & won_with_date & day_window_mask(won_at, today, today)).sum()),
+        'mtd_retails': int((mine & won_with_date & day_window_mask(won_at, month_start, month_end)).sum()),
+        'total_retails': int((mine & won_with_date & day_window_mask(won_at, window_start, window_end)).sum()),
+    }
+
+    return {
+        'top_5_leaderboard': leaderboard[:5],
+        'cre_platform_conversion': platform_conversion,
+        'cre_platform_conversion_live': platform_conversion_live,
+        'cre_overall_stats': overall_stats,
+        'leads_assigned_by_category': leads_by_category,
+        'summary_metrics': summary_metrics,
+    }
@@ -0,0 +1,599 @@
+"""
+Dashboard Tabs for Ather CRM System
+This module serves the CRE and PS dashboard tabs from the database: every
+tab is described as one or more tab sources (a table plus the PostgREST
+conditions of the tab's rule in lead_buckets), so the dashboard page only
+runs count queries for its KPI badges and each tab request reads one sorted,
+searchable page.
+
+Rows are first read as "slim" rows: a narrow projection plus ``_table`` (the
+table to hydrate the full row from, or None when the row is already final)
+and ``_extra`` (per-tab annotations such as overdue flags). Only the rows of
+the requested page are hydrated with ``select('*')``.
+
+A tab spread over several tables is paged with a keyset cursor holding the
+last (sort value, id) read from each table, and can only be sorted by date
+columns or id: their order is the same in Python as in Postgres, while text
+would be merged by a different collation.
+"""
+
+import base64
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from lead_buckets import cre_bucket_conditions, ps_bucket_conditions, walkin_bucket_conditions
+from query_utils import conditions_hook, count_rows, date_range_conditions, iter_table_rows, quote_logic_value
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Count queries run at once when the dashboard page resolves its badges
+COUNT_CONCURRENCY = 8
+
+# Narrow projections: classification, follow-up, sort and search columns only
+PS_LEAD_FIELDS = ('id, lead_uid, customer_name, customer_mobile_number, source, cre_name, final_status, '
+                  'lead_status, lead_category, first_call_date, follow_up_date, ps_assigned_at, created_at, '
+                  'won_timestamp, lost_timestamp')
+PS_EVENT_FIELDS = ('id, activity_uid, customer_name, customer_phone_number, final_status, lead_status, '
+                   'lead_category, ps_first_call_date, ps_followup_date_ts, created_at, won_timestamp, lost_timestamp')
+CRE_LEAD_FIELDS = ('id, uid, customer_name, customer_mobile_number, source, campaign, branch, ps_name, '
+                   'final_status, lead_status, lead_category, first_call_date, follow_up_date, date, '
+                   'cre_assigned_at, ps_assigned_at, created_at, won_timestamp, lost_timestamp')
+CRE_EVENT_FIELDS = ('id, activity_uid, customer_name, customer_phone_number, lead_status, location, '
+                    'activity_name, cre_followup_date, created_at')
+# Walk-in call dates live in 1_call_date .. 7_call_date; walk-ins are few per PS
+WALKIN_FIELDS = '*'
+WALKIN_COLUMNS = ('id, uid, customer_name, mobile_number, branch, status, lead_status, lead_category, '
+                  'next_followup_date, created_at, updated_at')
+
+PS_TABS = ('untouched', 'called', 'follow_up', 'fresh', 'followups', 'pending', 'attended',
+           'won', 'lost', 'event', 'walkin')
+CRE_TABS = ('untouched', 'called', 'follow_up', 'fresh', 'followups', 'pending', 'ps_assigned',
+            'won', 'lost', 'event')
+# Tabs counted for the badges; fresh is the sum of its three sub-tabs and
+# followups_overdue splits the followups badge
+PS_COUNT_TABS = tuple(tab for tab in PS_TABS if tab != 'fresh') + ('followups_overdue',)
+CRE_COUNT_TABS = tuple(tab for tab in CRE_TABS if tab != 'fresh') + ('followups_overdue',)
+
+# Default (column, descending) per tab; other tabs sort by created_at, newest first
+DEFAULT_TAB_SORT = {
+    'followups': ('follow_up_date', False),
+    'won': ('won_timestamp', True),
+    'lost': ('lost_timestamp', True),
+}
+# Sorts a tab spread over several tables can be merged on
+MERGEABLE_SORT_COLUMNS = {'id', 'created_at', 'ps_assigned_at', 'date', 'follow_up_date', 'won_timestamp',
+                          'lost_timestamp'}
+SORTABLE_COLUMNS = MERGEABLE_SORT_COLUMNS | {'customer_name', 'lead_status', 'lead_category', 'source'}
+SEARCH_COLUMNS = ('lead_uid', 'uid', 'activity_uid', 'customer_name', 'customer_mobile_number',
+                  'customer_phone_number', 'mobile_number', 'source', 'campaign', 'cre_name', 'ps_name',
+                  'branch', 'lead_category')
+
+# Column behind each CRE dashboard tab's own time filter
+CRE_TAB_DATE_FIELDS = {
+    'untouched': 'cre_assigned_at',
+    'called': 'cre_assigned_at',
+    'follow_up': 'cre_assigned_at',
+    'fresh': 'cre_assigned_at',
+    'pending': 'first_call_date',
+    'ps_assigned': 'ps_assigned_at',
+}
+# Columns a tab can be narrowed on with an exact match (?branch=..., ?ps_name=...)
+FILTER_COLUMNS = ('branch', 'ps_name', 'lead_category')
+
+# Dashboard column -> table column where a table names it differently
+PS_EVENT_ALIASES = {'lead_uid': 'activity_uid', 'customer_mobile_number': 'customer_phone_number',
+                    'follow_up_date': 'ps_followup_date_ts'}
+CRE_EVENT_ALIASES = {'lead_uid': 'activity_uid', 'customer_mobile_number': 'customer_phone_number',
+                     'follow_up_date': 'cre_followup_date'}
+WALKIN_ALIASES = {'lead_uid': 'uid', 'customer_mobile_number': 'mobile_number', 'follow_up_date': 'next_followup_date',
+                  'won_timestamp': 'updated_at', 'lost_timestamp': 'updated_at'}
+
+
+class InvalidTabRequest(ValueError):
+    """A tab page that cannot be served as asked (unmergeable sort, missing or stale cursor)"""
+
+
+class TabSource(NamedTuple):
+    """
+    One table's share of a dashboard tab: the rows of ``table`` matching every
+    PostgREST condition in ``conditions``, read with the ``fields`` projection.
+    ``columns`` are the table's columns usable for sorting, searching and
+    filtering, ``aliases`` maps dashboard column names to them, and
+    ``annotate`` gives the ``_extra`` annotations of a row.
+    """
+    table: str
+    fields: str
+    conditions: Tuple[str, ...]
+    columns: FrozenSet[str]
+    aliases: Dict[str, str]
+    annotate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    hydrate: bool = True
+
+    def column(self, name: str) -> Optional[str]:
+        """Table column behind dashboard column ``name``, or None if this table has none"""
+        column = self.aliases.get(name, name)
+        return column if column in self.columns else None
+
+
+def _columns(fields: str) -> FrozenSet[str]:
+    return frozenset(field.strip() for field in fields.split(',') if field.strip())
+
+
+def _parse_date(value: Any) -> date:
+    text = str(value)
+    if 'T' in text:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).date()
+    return datetime.strptime(text[:10], '%Y-%m-%d').date()
+
+
+def _due_followup(value: Any, today: date) -> Optional[Dict[str, Any]]:
+    """
+    Overdue annotations if the follow-up ``value`` is due on or before today.
+
+    Unparseable dates are treated as due so they get manual review, as the
+    dashboards always did.
+    """
+    try:
+        followup_date = _parse_date(value)
+    except (ValueError, TypeError):
+        return {'is_overdue': False, 'overdue_days': 0}
+    if followup_date > today:
+        return None
+    return {'is_overdue': followup_date < today, 'overdue_days': (today - followup_date).days}
+
+
+def _due_by(column: str, day: date) -> str:
+    """``column`` is set and falls before ``day``"""
+    return f'and({column}.not.is.null,{column}.lt.{day.isoformat()})'
+
+
+def _on_day(column: str, day: date) -> str:
+    return f'and({column}.gte.{day.isoformat()},{column}.lt.{(day + timedelta(days=1)).isoformat()})'
+
+
+def decorate_event_lead(lead: Dict[str, Any]) -> Dict[str, Any]:
+    """Template aliases for activity_leads rows"""
+    lead['lead_uid'] = lead.get('activity_uid') or lead.get('uid')
+    lead['customer_mobile_number'] = lead.get('customer_phone_number')
+    if not lead.get('lead_category'):
+        lead['lead_category'] = 'Not Set'
+    return lead
+
+
+def decorate_walkin_lead(lead: Dict[str, Any]) -> Dict[str, Any]:
+    """Template aliases for walkin_table rows (older records have no uid)"""
+    lead['lead_uid'] = lead.get('uid') or f"W{lead.get('id')}"
+    lead['uid'] = lead['lead_uid']
+    lead['customer_mobile_number'] = lead.get('mobile_number', '')
+    lead['customer_name'] = lead.get('customer_name', '')
+    lead['source'] = 'Walk-in'
+    lead['is_walkin'] = True
+    lead['walkin_id'] = lead.get('id')
+    lead['cre_name'] = ''
+    lead['created_at'] = lead.get('created_at', '')
+    lead['lead_category'] = lead.get('lead_category', 'Not Set')
+    return lead
+
+
+ROW_DECORATORS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    'activity_leads': decorate_event_lead,
+    'walkin_table': decorate_walkin_lead,
+}
+
+
+def ps_tab_sources(ps_name: str, tab: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                   today: Optional[date] = None) -> List[TabSource]:
+    """
+    Sources of one PS dashboard tab (or 'followups_overdue').
+
+    Assigned leads are restricted to ``ps_assigned_at`` in [start_date, end_date]
+    (leads without an assignment date are kept); event and walk-in leads are
+    not date filtered.
+    """
+    today = today or date.today()
+    tomorrow = today + timedelta(days=1)
+    overdue = tab == 'followups_overdue'
+
+    def regular(*conditions, annotate=None):
+        base = (f'ps_name.eq.{quote_logic_value(ps_name)}',
+                *date_range_conditions('ps_assigned_at', start_date, end_date, include_null=True))
+
+        def annotate_regular(row):
+            extra = {}
+            if row.get('final_status') not in ('Won', 'Lost'):
+                extra['lead_category'] = row.get('lead_category') or 'Not Set'
+            if annotate:
+                extra.update(annotate(row))
+            return extra
+
+        return TabSource('ps_followup_master', PS_LEAD_FIELDS, base + conditions, _columns(PS_LEAD_FIELDS), {},
+                         annotate_regular)
+
+    def event(*conditions, annotate=None):
+        base = (f'ps_name.eq.{quote_logic_value(ps_name)}',)
+        return TabSource('activity_leads', PS_EVENT_FIELDS, base + conditions, _columns(PS_EVENT_FIELDS),
+                         PS_EVENT_ALIASES, annotate)
+
+    def walkin(*conditions, annotate=None):
+        base = (f'ps_assigned.eq.{quote_logic_value(ps_name)}',)
+        return TabSource('walkin_table', WALKIN_FIELDS, base + conditions,
+                         _columns(WALKIN_COLUMNS) | {f'{call_no}_call_date' for call_no in range(1, 8)},
+                         WALKIN_ALIASES, annotate, hydrate=False)
+
+    lead_buckets = ps_bucket_conditions()
+    event_buckets = ps_bucket_conditions(first_call_field='ps_first_call_date')
+    walkin_buckets = walkin_bucket_conditions()
+    closed_at = lambda field: lambda row: {field: row.get('updated_at') or datetime.now().isoformat()}
+
+    if tab in ('untouched', 'called', 'follow_up', 'fresh'):
+        return [regular(*lead_buckets[tab]), event(*event_buckets[tab])]
+    if tab == 'pending':
+        return [regular(*lead_buckets['pending']), event(*event_buckets['pending']),
+                walkin(*walkin_buckets['untouched'])]
+    if tab == 'attended':
+        return [walkin(*walkin_buckets['pending'])]
+    if tab in ('won', 'lost'):
+        return [regular(*lead_buckets[tab]), event(*event_buckets[tab]),
+                walkin(*walkin_buckets[tab], annotate=closed_at(f'{tab}_timestamp'))]
+    if tab == 'event':
+        return [event()]
+    if tab == 'walkin':
+        return [walkin()]
+    if tab in ('followups', 'followups_overdue'):
+        due_day = today if overdue else tomorrow
+        not_excluded = lead_buckets['open'][1]
+        sources = [
+            regular(_due_by('follow_up_date', due_day), 'final_status.eq.Pending', not_excluded,
+                    annotate=lambda row: _due_followup(row['follow_up_date'], today) or {}),
+            walkin(*walkin_buckets['open'], _due_by('next_followup_date', due_day),
+                   annotate=lambda row: {'follow_up_date': str(row['next_followup_date']),
+                                         **(_due_followup(row['next_followup_date'], today) or {})}),
+        ]
+        if not overdue:
+            # Event follow-ups are listed on their day only, so they are never overdue
+            sources.insert(1, event(
+                _on_day('ps_followup_date_ts', today), 'or(final_status.is.null,final_status.not.in.(Won,Lost))',
+                not_excluded, annotate=lambda row: {'follow_up_date': str(row['ps_followup_date_ts'])}
+            ))
+        return sources
+    raise ValueError(f'Unknown PS tab: {tab}')
+
+
+def cre_tab_sources(cre_name: str, tab: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                    today: Optional[date] = None) -> List[TabSource]:
+    """
+    Sources of one CRE dashboard tab (or 'followups_overdue').
+
+    Leads are restricted to their ``date`` column in [start_date, end_date];
+    event leads are not date filtered.
+    """
+    today = today or date.today()
+    tomorrow = today + timedelta(days=1)
+
+    def leads(*conditions, annotate=None):
+        base = (f'cre_name.eq.{quote_logic_value(cre_name)}', *date_range_conditions('date', start_date, end_date))
+        return TabSource('lead_master', CRE_LEAD_FIELDS, base + conditions, _columns(CRE_LEAD_FIELDS), {}, annotate)
+
+    def events(*conditions, annotate=None, hydrate=True):
+        base = (f'cre_assigned.eq.{quote_logic_value(cre_name)}',)
+        return TabSource('activity_leads', CRE_EVENT_FIELDS, base + conditions, _columns(CRE_EVENT_FIELDS),
+                         CRE_EVENT_ALIASES, annotate, hydrate)
+
+    buckets = cre_bucket_conditions()
+    if tab in ('untouched', 'called', 'follow_up', 'fresh', 'pending', 'won', 'lost'):
+        return [leads(*buckets[tab])]
+    if tab == 'ps_assigned':
+        # Any open (not Won/Lost) lead with a PS assigned
+        return [leads(*buckets['open'], 'ps_name.not.is.null', 'ps_name.neq.""')]
+    if tab == 'event':
+        return [events()]
+    if tab in ('followups', 'followups_overdue'):
+        # Follow-up due, final_status Pending, qualifying call done
+        sources = [leads(_due_by('follow_up_date', today if tab == 'followups_overdue' else tomorrow),
+                         'final_status.eq.Pending', 'first_call_date.not.is.null',
+                         annotate=lambda row: _due_followup(row['follow_up_date'], today) or {})]
+        if tab == 'followups':
+            # Event leads with today's cre_followup_date are listed as they are
+            sources.append(events(_on_day('cre_followup_date', today), hydrate=False, annotate=lambda row: {
+                'is_event_lead': True, 'follow_up_date': str(row['cre_followup_date']),
+            }))
+        return sources
+    raise ValueError(f'Unknown CRE tab: {tab}')
+
+
+def narrow_sources(sources: List[TabSource], date_field: Optional[str] = None, start_date: Optional[date] = None,
+                   end_date: Optional[date] = None, filters: Optional[Dict[str, str]] = None,
+                   search: str = '') -> List[TabSource]:
+    """
+    Add a tab's own filters to its sources: ``date_field`` within
+    [start_date, end_date], exact column ``filters`` and a case-insensitive
+    ``search`` over SEARCH_COLUMNS. A source without the filtered column has
+    no matching rows and is dropped, like rows without a value always were.
+    """
+    narrowed = []
+    for source in sources:
+        conditions = list(source.conditions)
+        if date_field and (start_date or end_date):
+            column = source.column(date_field)
+            if column is None:
+                continue
+            conditions += date_range_conditions(column, start_date, end_date)
+        if filters and any(source.column(name) is None for name in filters):
+            continue
+        conditions += [f'{source.column(name)}.eq.{quote_logic_value(value)}' for name, value in (filters or {}).items()]
+        if search:
+            columns = list(dict.fromkeys(column for column in map(source.column, SEARCH_COLUMNS) if column))
+            if not columns:
+                continue
+            pattern = quote_logic_value(f'*{search}*')
+            conditions.append(f'or({",".join(f"{column}.ilike.{pattern}" for column in columns)})')
+        narrowed.append(source._replace(conditions=tuple(conditions)))
+    return narrowed
+
+
+def count_source(supabase_client, source: TabSource) -> int:
+    return count_rows(supabase_client, source.table, query_hook=conditions_hook(list(source.conditions)))
+
+
+def tab_counts(supabase_client, sources_for: Callable[[str], List[TabSource]],
+               tabs: Sequence[str]) -> Dict[str, int]:
+    """
+    Badge counts of ``tabs`` (e.g. PS_COUNT_TABS) from count queries, run
+    COUNT_CONCURRENCY at a time. 'fresh' and the due-today share of the
+    followups are derived when their parts are counted.
+    """
+    specs = [(tab, source) for tab in tabs for source in sources_for(tab)]
+    with ThreadPoolExecutor(max_workers=COUNT_CONCURRENCY) as executor:
+        totals = list(executor.map(lambda spec: count_source(supabase_client, spec[1]), specs))
+
+    counts = dict.fromkeys(tabs, 0)
+    for (tab, _), total in zip(specs, totals):
+        counts[tab] += total
+    if all(tab in counts for tab in ('untouched', 'called', 'follow_up')):
+        counts['fresh'] = counts['untouched'] + counts['called'] + counts['follow_up']
+    if 'followups' in counts and 'followups_overdue' in counts:
+        counts['followups_today'] = counts['followups'] - counts['followups_overdue']
+    return counts
+
+
+def column_options(supabase_client, sources: List[TabSource], names: Sequence[str]) -> Dict[str, List[str]]:
+    """Sorted distinct values of dashboard columns ``names`` over the rows of ``sources`` (e.g. filter options)"""
+    options: Dict[str, set] = {name: set() for name in names}
+    for source in sources:
+        columns = {name: source.column(name) for name in names if source.column(name)}
+        if not columns:
+            continue
+        for row in iter_table_rows(supabase_client, source.table, None, ', '.join(columns.values()),
+                                   query_hook=conditions_hook(list(source.conditions))):
+            for name, column in columns.items():
+                if row.get(column):
+                    options[name].add(row[column])
+    return {name: sorted(values) for name, values in options.items()}
+
+
+def _merge_value(value: Any) -> Optional[float]:
+    """
+    Sort value of a merged tab as a number: ids as they are, dates and
+    timestamps as UTC instants (naive ones taken as UTC). None when missing
+    or unparseable.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _merge_key(descending: bool) -> Callable[[Dict[str, Any]], Tuple[bool, float]]:
+    """Merge key matching ``ORDER BY column [DESC] NULLS LAST``; rows without a value sort last"""
+    def key(row):
+        value = _merge_value(row['_sort'])
+        if value is None:
+            return (not descending, 0.0)
+        return (descending, value)
+    return key
+
+
+def _order(column: Optional[str], descending: bool) -> str:
+    """Source order: ``column [DESC] NULLS LAST, id`` (id alone without the column)"""
+    if column is None:
+        return 'id'
+    if column == 'id':
+        return 'id.desc' if descending else 'id'
+    return f'{column}{".desc" if descending else ""}.nullslast,id'
+
+
+def _after(column: Optional[str], descending: bool, position: Sequence[Any]) -> str:
+    """Condition for the rows after ``position``, the (sort value, id) of a row, in _order(column, descending)"""
+    value, last_id = position
+    after_id = f'id.gt.{quote_logic_value(last_id)}'
+    if column is None:
+        return after_id
+    op = 'lt' if descending else 'gt'
+    if column == 'id':
+        return f'id.{op}.{quote_logic_value(last_id)}'
+    if value is None:
+        return f'and({column}.is.null,{after_id})'
+    value = quote_logic_value(value)
+    return f'or({column}.{op}.{value},{column}.is.null,and({column}.eq.{value},{after_id}))'
+
+
+def _read_source(supabase_client, source: TabSource, sort: str, descending: bool, limit: int,
+                 offset: int = 0, after: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Slim rows ``offset``..``offset + limit`` of a source in ``sort`` order (id
+    order without the column), or the first ``limit`` rows after the
+    ``after`` position (see _after)
+    """
+    column = source.column(sort)
+    fields = source.fields
+    if column and fields.strip() != '*' and column not in _columns(fields):
+        fields = f'{fields}, {column}'
+    conditions = list(source.conditions)
+    if after is not None:
+        conditions.append(_after(column, descending, after))
+    query = supabase_client.table(source.table).select(fields)
+    query = conditions_hook(conditions)(query)
+    query = query.order(_order(column, descending)).limit(limit)
+    if offset:
+        query.params = query.params.add('offset', str(offset))
+    rows = query.execute().data or []
+
+    decorator = None if source.hydrate else ROW_DECORATORS.get(source.table)
+    slim_rows = []
+    for row in rows:
+        slim = dict(row)
+        slim['_table'] = source.table if source.hydrate else None
+        slim['_extra'] = source.annotate(row) if source.annotate else {}
+        slim['_sort'] = row.get(column) if column else None
+        slim['_position'] = (slim['_sort'], row['id'])
+        if decorator:
+            decorator(slim)
+        slim_rows.append(slim)
+    return slim_rows
+
+
+def _encode_cursor(sort: str, descending: bool, positions: List[Any], seen: int) -> str:
+    payload = json.dumps({'sort': sort, 'desc': descending, 'after': positions, 'seen': seen},
+                         separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str, sort: str, descending: bool, sources: int) -> Tuple[List[Any], int]:
+    """(positions, rows seen) of a cursor from _encode_cursor for the same sort and number of sources"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions, seen = payload['after'], int(payload['seen'])
+        valid = (payload['sort'], payload['desc'], len(positions)) == (sort, descending, sources)
+    except (ValueError, KeyError, TypeError):
+        valid = False
+    if not valid:
+        raise InvalidTabRequest('Invalid or stale cursor; reload the tab from its first page')
+    return positions, seen
+
+
+def load_tab_page(supabase_client, sources: List[TabSource], tab: str, page: int = 1,
+                  per_page: int = DEFAULT_PAGE_SIZE, sort: Optional[str] = None, descending: bool = True,
+                  cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+    """
+    One page of a tab, hydrated for the templates, the tab's total and the
+    cursor of the next page.
+
+    A tab read from one table is paged by ``page`` and has no cursor. A tab
+    spread over several tables is paged by ``cursor`` (None for its first
+    page; the cursor is None after the last page): each table reads at most
+    ``per_page`` rows after its last row on the previous page, however deep
+    the page, and the rows are merged in sort order. Such tabs take only
+    MERGEABLE_SORT_COLUMNS; other sorts raise InvalidTabRequest. Unknown sort
+    columns fall back to the tab default; rows without a value sort last in
+    either direction.
+    """
+    if sort not in SORTABLE_COLUMNS:
+        sort, descending = DEFAULT_TAB_SORT.get(tab, ('created_at', True))
+
+    total = sum(count_source(supabase_client, source) for source in sources)
+    if len(sources) <= 1:
+        offset = (page - 1) * per_page
+        if offset >= total:
+            return [], total, None
+        page_rows = _read_source(supabase_client, sources[0], sort, descending, per_page, offset)
+        return hydrate_rows(supabase_client, page_rows), total, None
+
+    if sort not in MERGEABLE_SORT_COLUMNS:
+        raise InvalidTabRequest(f'The {tab} tab spans several tables and cannot be sorted by {sort}')
+    if cursor:
+        positions, seen = _decode_cursor(cursor, sort, descending, len(sources))
+    elif page > 1:
+        raise InvalidTabRequest(f'Pages of the {tab} tab after the first need the cursor of the previous page')
+    else:
+        positions, seen = [None] * len(sources), 0
+
+    merged = heapq.merge(
+        *([dict(row, _source=index) for row in
+           _read_source(supabase_client, source, sort, descending, per_page, after=positions[index])]
+          for index, source in enumerate(sources)),
+        key=_merge_key(descending), reverse=descending
+    )
+    page_rows = []
+    for row in merged:
+        if len(page_rows) == per_page:
+            break
+        positions[row['_source']] = row['_position']
+        page_rows.append(row)
+    seen += len(page_rows)
+    next_cursor = _encode_cursor(sort, descending, positions, seen) if page_rows and seen < total else None
+    return hydrate_rows(supabase_client, page_rows), total, next_cursor
+
+
+def parse_page_args(args) -> Tuple[int, int, Optional[str], bool, str]:
+    """(page, per_page, sort, descending, search) from request args, clamped"""
+    try:
+        page = max(int(args.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        per_page = min(max(int(args.get('per_page', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PAGE_SIZE
+    sort = args.get('sort') or None
+    descending = (args.get('order') or '').lower() != 'asc' if sort else True
+    search = (args.get('search') or '').strip().lower()
+    return page, per_page, sort, descending, search
+
+
+def parse_filter_args(args) -> Tuple[Optional[date], Optional[date], Dict[str, str]]:
+    """(date_start, date_end, column filters) of a tab's own filters in request args"""
+    bounds = []
+    for key in ('date_start', 'date_end'):
+        try:
+            bounds.append(datetime.strptime(args.get(key, ''), '%Y-%m-%d').date())
+        except (TypeError, ValueError):
+            bounds.append(None)
+    filters = {column: args[column] for column in FILTER_COLUMNS if args.get(column)}
+    return bounds[0], bounds[1], filters
+
+
+def hydrate_rows(supabase_client, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace slim rows by their full table rows, in order.
+
+    Full rows are fetched with one ``id IN (...)`` query per table, decorated
+    for the templates and given the slim row's annotations.
+    """
+    ids_by_table: Dict[str, List[Any]] = {}
+    for row in rows:
+        if row['_table']:
+            ids_by_table.setdefault(row['_table'], []).append(row['id'])
+
+    full_rows: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+    for table_name, ids in ids_by_table.items():
+        result = supabase_client.table(table_name).select('*').in_('id', list(dict.fromkeys(ids))).execute()
+        for full in result.data or []:
+            full_rows[(table_name, full['id'])] = full
+
+    hydrated = []
+    for row in rows:
+        if row['_table']:
+            full = full_rows.get((row['_table'], row['id']))
+            if full is None:
+                # Deleted or reassigned since the page was read
+                continue
+            lead = dict(full)
+            decorator = ROW_DECORATORS.get(row['_table'])
+            if decorator:
+                decorator(lead)
+        else:
+            lead = {k: v for k, v in row.items()
+                    if k not in ('_table', '_extra', '_sort', '_position', '_source')}
+        lead.update(row['_extra'])
+        hydrated.append(lead)
+    return hydrated
@@ -209,3 +209,209 @@ BEGIN
       AND (ps_name_param IS NULL OR ps_name = ps_name_param);
 END;
 $$ LANGUAGE plpgsql;
+
+-- Resolve several filtered counts in one round trip (used by query_utils.count_many)
+-- specs: [{"table": "lead_master", "filters": [["assigned", "eq", "No"], ...]}, ...]
+-- Runs as the caller, so row level security still applies.
+CREATE OR REPLACE FUNCTION crm_count_many(specs JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    spec JSONB;
+    flt JSONB;
+    query_sql TEXT;
+    condition_sql TEXT;
+    row_count BIGINT;
+    counts JSONB := '[]'::JSONB;
+BEGIN
+    FOR spec IN SELECT value FROM jsonb_array_elements(specs) LOOP
+        query_sql := format('SELECT COUNT(*) FROM %I WHERE TRUE', spec->>'table');
+        FOR flt IN SELECT value FROM jsonb_array_elements(COALESCE(spec->'filters', '[]'::JSONB)) LOOP
+            condition_sql := CASE flt->>1
+                WHEN 'eq' THEN format(' AND %I = %L', flt->>0, flt->>2)
+                WHEN 'neq' THEN format(' AND %I <> %L', flt->>0, flt->>2)
+                WHEN 'gt' THEN format(' AND %I > %L', flt->>0, flt->>2)
+                WHEN 'gte' THEN format(' AND %I >= %L', flt->>0, flt->>2)
+                WHEN 'lt' THEN format(' AND %I < %L', flt->>0, flt->>2)
+                WHEN 'lte' THEN format(' AND %I <= %L', flt->>0, flt->>2)
+                WHEN 'is' THEN format(' AND %I IS NULL', flt->>0)
+                WHEN 'not.is' THEN format(' AND %I IS NOT NULL', flt->>0)
+            END;
+            IF condition_sql IS NULL THEN
+                RAISE EXCEPTION 'crm_count_many: unsupported operator %', flt->>1;
+            END IF;
+            query_sql := query_sql || condition_sql;
+        END LOOP;
+        EXECUTE query_sql INTO row_count;
+        counts := counts || to_jsonb(row_count);
+    END LOOP;
+    RETURN counts;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Idempotency markers for once-per-day jobs (used by followup_rollover.py)
+CREATE TABLE IF NOT EXISTS daily_job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job_name TEXT NOT NULL,
+    run_date DATE NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    started_at TIMESTAMPTZ DEFAULT NOW(),
+    completed_at TIMESTAMPTZ,
+    details JSONB,
+    UNIQUE (job_name, run_date)
+);
+
+-- Indexes for the daily follow-up rollover UPDATEs
+CREATE INDEX IF NOT EXISTS idx_lead_master_follow_up_date ON lead_master(follow_up_date);
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'ps_followup_master') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_ps_followup_follow_up_date ON ps_followup_master(follow_up_date)';
+    END IF;
+    IF EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'activity_leads') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_activity_leads_cre_followup_date ON activity_leads(cre_followup_date)';
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_activity_leads_ps_followup_date_ts ON activity_leads(ps_followup_date_ts)';
+    END IF;
+END $$;
+
+-- Daily analytics rollups (maintained by analytics_rollup.py)
+-- Each rollup is keyed by lead creation day (lead_day), the source table and
+-- only the dimensions the admin analytics page groups it by. Dimensions are ''
+-- instead of NULL so they can take part in the unique key used by the
+-- refresher's upserts.
+CREATE TABLE IF NOT EXISTS analytics_daily_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    lead_day DATE NOT NULL,
+    source_table TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    cre_name TEXT NOT NULL DEFAULT '',
+    ps_name TEXT NOT NULL DEFAULT '',
+    branch TEXT NOT NULL DEFAULT '',
+    final_status TEXT NOT NULL DEFAULT '',
+    leads INTEGER NOT NULL DEFAULT 0,
+    won INTEGER NOT NULL DEFAULT 0,
+    lost INTEGER NOT NULL DEFAULT 0,
+    pending_open INTEGER NOT NULL DEFAULT 0,
+    called INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    test_drives INTEGER NOT NULL DEFAULT 0,
+    response_days_sum INTEGER NOT NULL DEFAULT 0,
+    response_count INTEGER NOT NULL DEFAULT 0,
+    hot INTEGER NOT NULL DEFAULT 0,
+    warm INTEGER NOT NULL DEFAULT 0,
+    cold INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (lead_day, source_table, source, cre_name, ps_name, branch, final_status)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_rollup_partition ON analytics_daily_rollup(source_table, lead_day);
+
+-- Leads per campaign and source; won/lost facts (kind) are dated by their
+-- closure (metric_day), created facts by lead_day
+CREATE TABLE IF NOT EXISTS analytics_campaign_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    lead_day DATE NOT NULL,
+    metric_day DATE NOT NULL,
+    kind TEXT NOT NULL,
+    source_table TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    campaign TEXT NOT NULL DEFAULT '',
+    leads INTEGER NOT NULL DEFAULT 0,
+    pending_open INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (lead_day, metric_day, kind, source_table, source, campaign)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_campaign_rollup_metric_day ON analytics_campaign_rollup(metric_day);
+CREATE INDEX IF NOT EXISTS idx_analytics_campaign_rollup_partition ON analytics_campaign_rollup(source_table, lead_day);
+
+-- Leads per lead category and model interested
+CREATE TABLE IF NOT EXISTS analytics_profile_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    lead_day DATE NOT NULL,
+    source_table TEXT NOT NULL,
+    lead_category TEXT NOT NULL DEFAULT '',
+    model_interested TEXT NOT NULL DEFAULT '',
+    leads INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (lead_day, source_table, lead_category, model_interested)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_profile_rollup_partition ON analytics_profile_rollup(source_table, lead_day);
+
+-- Refresh watermark per source table (max updated_at/created_at rolled up) and
+-- the lease of the one refresher allowed to rebuild it (claimed_by, renewed
+-- until claimed_until)
+CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+    source_table TEXT PRIMARY KEY,
+    watermark TIMESTAMPTZ,
+    refreshed_at TIMESTAMPTZ DEFAULT NOW(),
+    claimed_by TEXT,
+    claimed_until TIMESTAMPTZ
+);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'walkin_table') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_walkin_table_created_at ON walkin_table(created_at)';
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_walkin_table_updated_at ON walkin_table(updated_at)';
+    END IF;
+END $$;
+
+-- Indexes for date windows pushed down by resolve_date_window/date_range_hook
+CREATE INDEX IF NOT EXISTS idx_lead_master_date ON lead_master(date);
+CREATE INDEX IF NOT EXISTS idx_lead_master_cre_assigned_at ON lead_master(cre_assigned_at);
+CREATE INDEX IF NOT EXISTS idx_lead_master_won_timestamp ON lead_master(won_timestamp);
+CREATE INDEX IF NOT EXISTS idx_lead_master_lost_timestamp ON lead_master(lost_timestamp);
+
+-- UID allocator (uid_allocator.py)
+-- Each nextval reserves a block of 100 UID sequence numbers (UID_BLOCK_SIZE).
+-- Starts above 9999 so new UIDs cannot clash with the older, wrapped ones.
+CREATE SEQUENCE IF NOT EXISTS lead_uid_seq START WITH 10000 INCREMENT BY 100;
+
+CREATE OR REPLACE FUNCTION lease_uid_blocks(p_blocks INTEGER DEFAULT 1)
+RETURNS BIGINT[]
+LANGUAGE sql
+VOLATILE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT array_agg(nextval('lead_uid_seq')) FROM generate_series(1, GREATEST(p_blocks, 1));
+$$;
+
+GRANT EXECUTE ON FUNCTION lease_uid_blocks(INTEGER) TO anon, authenticated, service_role;
+
+-- Incremental sync state (metatosupabase.py): newest lead created_time
+-- written per source and stream (one row per Meta lead form)
+CREATE TABLE IF NOT EXISTS lead_sync_state (
+    source TEXT NOT NULL,
+    stream_key TEXT NOT NULL,
+    watermark TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (source, stream_key)
+);
+
+-- updated_at maintenance
+-- Export cache keys (export_cache.py), lead snapshots (lead_snapshot.py) and
+-- analytics rollups (analytics_rollup.py) detect changed rows by updated_at,
+-- but many writes (CRE transfers, unassignments, TAT updates) do not set it.
+-- Every UPDATE stamps it here instead, whatever the client sends.
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$;
+
+DO $$
+DECLARE
+    table_name_param TEXT;
+BEGIN
+    FOREACH table_name_param IN ARRAY ARRAY['lead_master', 'ps_followup_master', 'walkin_table', 'duplicate_leads'] LOOP
+        IF EXISTS (SELECT FROM information_schema.columns
+                   WHERE table_name = table_name_param AND column_name = 'updated_at') THEN
+            EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_updated_at ON %I', table_name_param, table_name_param);
+            EXECUTE format('CREATE TRIGGER trg_%s_updated_at BEFORE UPDATE ON %I '
+                           'FOR EACH ROW EXECUTE FUNCTION set_updated_at()', table_name_param, table_name_param);
+        END IF;
+    END LOOP;
+END $$;
@@ -0,0 +1,186 @@
+"""
+Export Cache for Ather CRM System
+This module keeps finished export files on local disk, keyed by the content
+they were built from: the endpoint, its normalized filters, the format and a
+data-version token of the source table. A repeated download with the same
+filters is served from disk until the table changes, which changes the token
+and therefore the key (the token relies on the updated_at trigger of
+database_optimization.sql). The cache is bounded in bytes and evicts the least
+recently used files first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+from flask import Response, send_file
+
+from query_utils import count_rows
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ather_crm_export_cache')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+
+def table_data_version(supabase_client, table_name: str) -> str:
+    """
+    Token that changes whenever rows of ``table_name`` are inserted, updated
+    or deleted: the row count and the newest ``updated_at`` and ``created_at``
+    (rows never updated have no ``updated_at``). Updates are only seen when
+    they stamp ``updated_at``, which the set_updated_at trigger of
+    database_optimization.sql does for every UPDATE; without it, writes that
+    leave ``updated_at`` alone (CRE transfers, unassignments) would keep
+    serving the older file.
+    """
+    parts = [str(count_rows(supabase_client, table_name))]
+    for column in ('updated_at', 'created_at'):
+        # DESC sorts NULLs first in PostgreSQL, so they are filtered out
+        result = (supabase_client.table(table_name).select(column)
+                  .filter(column, 'not.is', 'null')
+                  .order(column, desc=True).limit(1).execute())
+        parts.append(str(result.data[0][column]) if result.data else '')
+    return '|'.join(parts)
+
+
+class ExportCache:
+    """
+    Size-bounded, least recently used cache of export files on local disk.
+
+    Files are named by their key, so entries survive a restart: the index is
+    rebuilt from the directory, oldest modification time first (a hit touches
+    the file). Worker processes sharing the directory also share the files; a
+    file stored by another worker joins the index on its first hit. Entries
+    are only ever added or removed as whole files.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            if name.startswith('.partial_'):
+                # Left over by a stream interrupted by a restart
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(endpoint: str, filters: Dict[str, Any], format_: str, data_version: str) -> str:
+        """Content address of an export: hash of the endpoint, normalized filters and data version"""
+        normalized = json.dumps(
+            {'endpoint': endpoint, 'filters': filters, 'format': format_, 'data_version': data_version},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _evict(self) -> None:
+        """Drop least recently used files until the cache fits in max_bytes (lock held)"""
+        total = sum(self._entries.values())
+        while self._entries and total > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached file for ``key``, or None (counted as a hit or a miss)"""
+        with self._lock:
+            path = self._path(key)
+            try:
+                size = os.path.getsize(path)
+                os.utime(path)
+            except OSError:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def put(self, key: str, source_path: str) -> Optional[str]:
+        """
+        Move a finished export file into the cache and return its cached path.
+        Files larger than the whole cache are not stored (None is returned and
+        the file is left where it is).
+        """
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return None
+        path = self._path(key)
+        shutil.move(source_path, path)
+        with self._lock:
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict()
+        return path if key in self._entries else None
+
+    def tee(self, key: str, pieces: Iterator[str]) -> Iterator[str]:
+        """
+        Pass a streamed text export through unchanged while writing it to disk;
+        the file is stored under ``key`` only when ``pieces`` is exhausted. A
+        stream that raises, or is closed early by a disconnecting client, is
+        discarded, so ``pieces`` must raise on a failed read rather than end.
+        """
+        fd, temp_path = tempfile.mkstemp(prefix='.partial_', dir=self.directory)
+        completed = False
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as partial:
+                for piece in pieces:
+                    partial.write(piece)
+                    yield piece
+            completed = True
+            if self.put(key, temp_path) is None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+def send_cached_file(path: str, download_name: str, mimetype: str) -> Response:
+    """
+    send_file for a cached export. The file is opened before returning, so a
+    concurrent eviction cannot pull it from under the response.
+    """
+    cached_file = open(path, 'rb')
+    response = send_file(cached_file, as_attachment=True, download_name=download_name, mimetype=mimetype)
+    response.content_length = os.fstat(cached_file.fileno()).st_size
+    return response
@@ -0,0 +1,223 @@
+"""
+Export Utilities for Ather CRM System
+This module streams CSV exports straight from the paginated table readers: the
+header is sent before the first query runs and every page of rows is written
+to the response as soon as it arrives, so memory stays flat and the download
+starts immediately however many rows are exported.
+
+Excel exports are written page by page with an openpyxl write-only workbook
+into a temporary file, which is deleted once it has been sent. Parquet and
+Arrow exports are written the same way, one row group (or record batch) at a
+time, with typed columns for analysts who load the files into pandas.
+"""
+
+import csv
+import io
+import os
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import openpyxl
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from flask import Response, send_file, stream_with_context
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Columnar export formats: file extension and MIME type
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+# Rows buffered per Parquet row group / Arrow record batch
+COLUMNAR_ROW_GROUP_SIZE = 50000
+
+
+def row_values(columns: Sequence[str]) -> Callable[[Dict[str, Any]], List[Any]]:
+    """Row formatter returning the values of ``columns`` ('' for missing keys)"""
+    return lambda row: [row.get(column, '') for column in columns]
+
+
+def iter_csv(header: Sequence[str], row_chunks: Iterable[List[Dict[str, Any]]],
+             to_row: Callable[[Dict[str, Any]], List[Any]],
+             on_finish: Optional[Callable[[int, bool], None]] = None) -> Iterator[str]:
+    """
+    Yield a CSV document piece by piece: the header first, then one piece per
+    chunk of rows. ``on_finish`` receives the number of rows sent and whether
+    the export completed, also when the download is cancelled (the generator
+    is closed) or a chunk fails to read.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return text
+
+    exported_count, completed = 0, False
+    try:
+        writer.writerow(header)
+        yield drain()
+
+        for chunk in row_chunks:
+            writer.writerows(to_row(row) for row in chunk)
+            exported_count += len(chunk)
+            yield drain()
+        completed = True
+    finally:
+        if on_finish:
+            on_finish(exported_count, completed)
+
+
+def stream_text_response(filename: str, pieces: Iterator[str], mimetype: str = 'text/csv') -> Response:
+    """Attachment streamed from ``pieces`` with the request context kept available to the generator"""
+    return Response(
+        stream_with_context(pieces),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            # Ask proxies (nginx) not to buffer the stream
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+def stream_csv_response(filename: str, header: Sequence[str], row_chunks: Iterable[List[Dict[str, Any]]],
+                        to_row: Callable[[Dict[str, Any]], List[Any]],
+                        on_finish: Optional[Callable[[int, bool], None]] = None) -> Response:
+    """
+    CSV download streamed from ``row_chunks`` (e.g. safe_iter_data). The
+    request context stays available to the generator, so ``on_finish`` may
+    use the session (for audit logging).
+    """
+    return stream_text_response(filename, iter_csv(header, row_chunks, to_row, on_finish))
+
+
+def write_xlsx_file(sheet_title: str, header: Sequence[str], row_chunks: Iterable[List[Dict[str, Any]]],
+                    to_row: Callable[[Dict[str, Any]], List[Any]], max_column_width: int = 50) -> str:
+    """
+    Write a one-sheet workbook into a temporary file and return its path.
+
+    The workbook is write-only, so rows are flushed to disk as they are
+    appended and memory does not grow with the export. Column widths must be
+    set before the first row, so they are sized from the header and the first
+    chunk of rows (capped at ``max_column_width``).
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_title)
+
+    chunks = iter(row_chunks)
+    first_rows = [to_row(row) for row in next(chunks, [])]
+    for index, title in enumerate(header):
+        longest = max([len(str(title))] + [len(str(row[index])) for row in first_rows if row[index] is not None])
+        worksheet.column_dimensions[get_column_letter(index + 1)].width = min(longest + 2, max_column_width)
+
+    worksheet.append(list(header))
+    for row in first_rows:
+        worksheet.append(row)
+    for chunk in chunks:
+        for row in chunk:
+            worksheet.append(to_row(row))
+
+    fd, path = tempfile.mkstemp(prefix='export_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def send_temporary_file(path: str, download_name: str, mimetype: str = XLSX_MIMETYPE) -> Response:
+    """
+    send_file for a temporary export. The file is opened and unlinked right
+    away, so its disk space is released as soon as the response is closed.
+    """
+    export_file = open(path, 'rb')
+    os.remove(path)
+    response = send_file(export_file, as_attachment=True, download_name=download_name, mimetype=mimetype)
+    response.content_length = os.fstat(export_file.fileno()).st_size
+    return response
+
+
+def _columnar_type(pa, kind: str):
+    return {
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'date': pa.date32(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+    }.get(kind, pa.string())
+
+
+def _columnar_batch(pa, schema, rows: List[Dict[str, Any]], column_types: Dict[str, str]):
+    """Record batch of ``rows`` typed per ``column_types`` (unparseable dates become nulls)"""
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        kind = column_types.get(field.name, 'string')
+        if kind in ('timestamp', 'date'):
+            parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', utc=True, format='ISO8601')
+            if kind == 'date':
+                # Plain dates are kept as the calendar day they were stored with
+                parsed = parsed.dt.tz_convert(None).dt.normalize()
+            array = pa.Array.from_pandas(parsed).cast(field.type)
+        else:
+            array = pa.array([None if value is None or value == '' else str(value) for value in values],
+                             type=pa.string())
+            if kind == 'category':
+                array = array.dictionary_encode()
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_columnar_file(columns: Sequence[str], row_chunks: Iterable[List[Dict[str, Any]]],
+                        column_types: Optional[Dict[str, str]] = None, file_format: str = 'parquet',
+                        row_group_size: int = COLUMNAR_ROW_GROUP_SIZE) -> str:
+    """
+    Write rows into a Parquet file or an Arrow IPC stream in a temporary file
+    and return its path.
+
+    ``column_types`` maps columns to 'timestamp', 'date' or 'category'
+    (dictionary-encoded strings); other columns are strings. Rows are
+    buffered up to ``row_group_size`` and written as one row group (Parquet)
+    or record batch (Arrow), so memory is bounded by one group.
+    """
+    # pyarrow is only needed by the columnar exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    column_types = column_types or {}
+    schema = pa.schema([pa.field(column, _columnar_type(pa, column_types.get(column, 'string')))
+                        for column in columns])
+
+    fd, path = tempfile.mkstemp(prefix='export_', suffix=f'.{COLUMNAR_FORMATS[file_format][0]}')
+    os.close(fd)
+    try:
+        if file_format == 'parquet':
+            writer = pq.ParquetWriter(path, schema, compression='zstd')
+            write_batch = lambda batch: writer.write_table(pa.Table.from_batches([batch], schema=schema))
+        else:
+            sink = pa.OSFile(path, 'wb')
+            # The stream format (unlike the file format) allows each batch its own dictionaries
+            writer = pa.ipc.new_stream(sink, schema)
+            write_batch = writer.write_batch
+
+        pending = []
+        for chunk in row_chunks:
+            pending.extend(chunk)
+            if len(pending) >= row_group_size:
+                write_batch(_columnar_batch(pa, schema, pending, column_types))
+                pending = []
+        if pending:
+            write_batch(_columnar_batch(pa, schema, pending, column_types))
+
+        writer.close()
+        if file_format != 'parquet':
+            sink.close()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
@@ -0,0 +1,225 @@
+"""
+Daily Follow-up Rollover for Ather CRM System
+This module rolls overdue follow-up dates forward to today with one
+set-based UPDATE per table, once per day, instead of one UPDATE per lead on
+every dashboard load.
+
+Can be run standalone (python followup_rollover.py) or scheduled inside the
+web app with start_rollover_scheduler(). A failed run is retried the same
+day with backoff, and a claim left 'running' by a worker that died is taken
+over once it is older than STALE_CLAIM_MINUTES.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'followup_rollover'
+MARKER_TABLE = 'daily_job_runs'
+
+# A 'running' marker older than this belongs to a worker that died mid-run
+STALE_CLAIM_MINUTES = 30
+# Same-day retries after a failed or blocked run: 1, 2, 4 ... minutes, capped
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 30 * 60
+
+# (table, follow-up column, owner column, extra null-check column)
+# Mirrors the per-lead rules the CRE and PS dashboards used to apply on load:
+# only pending (not Won/Lost) leads with an owner are rolled forward, and PS
+# event leads only until their first PS call.
+ROLLOVER_RULES = [
+    ('lead_master', 'follow_up_date', 'cre_name', None),
+    ('ps_followup_master', 'follow_up_date', 'ps_name', None),
+    ('activity_leads', 'cre_followup_date', 'cre_assigned', None),
+    ('activity_leads', 'ps_followup_date_ts', 'ps_name', 'ps_first_call_date'),
+]
+
+_last_completed_date: Optional[date] = None
+
+
+def roll_forward_table(supabase_client, table_name: str, date_column: str, owner_column: str,
+                       required_null_column: Optional[str], today_str: str) -> int:
+    """Set ``date_column`` to today on every overdue pending row with a single UPDATE"""
+    query = supabase_client.table(table_name).update(
+        {date_column: today_str}, count='exact', returning='minimal'
+    ).lt(date_column, today_str).not_.is_(owner_column, 'null')
+    if required_null_column:
+        query = query.is_(required_null_column, 'null')
+    # final_status NOT IN (Won, Lost), keeping rows where final_status is NULL
+    query.params = query.params.add('or', '(final_status.is.null,final_status.not.in.(Won,Lost))')
+    result = query.execute()
+    return result.count or 0
+
+
+def _take_over_stale_claim(supabase_client, run_date: str, now: datetime) -> Optional[bool]:
+    """
+    Claim today's run from a 'running' marker older than STALE_CLAIM_MINUTES.
+
+    Returns True if this worker took the claim over, None if the marker is
+    'done' and False if it is still held by a live run. The UPDATE only
+    matches a stale marker, so of several workers at most one wins it.
+    """
+    cutoff = (now - timedelta(minutes=STALE_CLAIM_MINUTES)).isoformat()
+    taken = supabase_client.table(MARKER_TABLE).update({'started_at': now.isoformat()}) \
+        .eq('job_name', JOB_NAME).eq('run_date', run_date) \
+        .eq('status', 'running').lt('started_at', cutoff).execute()
+    if taken.data:
+        logger.warning(f"Taking over a stale {JOB_NAME} claim for {run_date}")
+        return True
+    marker = supabase_client.table(MARKER_TABLE).select('status') \
+        .eq('job_name', JOB_NAME).eq('run_date', run_date).execute()
+    if marker.data and marker.data[0].get('status') == 'done':
+        return None
+    return False
+
+
+def _claim_run(supabase_client, run_date: str) -> Optional[bool]:
+    """
+    Record today's run in the marker table.
+
+    Returns True if this worker should run, None if today's run is already
+    done and False if another worker is running it now. If the marker table
+    is missing the job still runs (the UPDATEs are idempotent anyway).
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        supabase_client.table(MARKER_TABLE).insert({
+            'job_name': JOB_NAME,
+            'run_date': run_date,
+            'status': 'running',
+            'started_at': now.isoformat()
+        }).execute()
+        return True
+    except Exception as e:
+        if '23505' not in str(e) and 'duplicate key' not in str(e):
+            logger.warning(f"Could not record {JOB_NAME} marker, running without it: {e}")
+            return True
+    try:
+        return _take_over_stale_claim(supabase_client, run_date, now)
+    except Exception as e:
+        logger.warning(f"Could not check the {JOB_NAME} marker for {run_date}: {e}")
+        return False
+
+
+def _finish_run(supabase_client, run_date: str, details: Dict[str, Any]) -> None:
+    try:
+        supabase_client.table(MARKER_TABLE).update({
+            'status': 'done',
+            'completed_at': datetime.now(timezone.utc).isoformat(),
+            'details': details
+        }).eq('job_name', JOB_NAME).eq('run_date', run_date).execute()
+    except Exception as e:
+        logger.warning(f"Could not complete {JOB_NAME} marker: {e}")
+
+
+def _release_run(supabase_client, run_date: str) -> None:
+    """Drop a failed claim so the next attempt can retry today"""
+    try:
+        supabase_client.table(MARKER_TABLE).delete().eq('job_name', JOB_NAME).eq('run_date', run_date).execute()
+    except Exception as e:
+        logger.warning(f"Could not release {JOB_NAME} marker: {e}")
+
+
+def run_daily_rollover(supabase_client, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Roll overdue follow-ups forward to today, at most once per day.
+
+    Returns a summary with the number of rows updated per table, or
+    ``{'skipped': True}`` when today's run was already done, with
+    ``'in_progress': True`` when another worker is still running it.
+    """
+    global _last_completed_date
+
+    today = today or date.today()
+    today_str = today.isoformat()
+
+    if _last_completed_date == today:
+        return {'skipped': True, 'run_date': today_str}
+    claimed = _claim_run(supabase_client, today_str)
+    if claimed is None:
+        _last_completed_date = today
+        logger.info(f"{JOB_NAME} already ran for {today_str}")
+        return {'skipped': True, 'run_date': today_str}
+    if not claimed:
+        logger.info(f"{JOB_NAME} for {today_str} is running in another worker")
+        return {'skipped': True, 'in_progress': True, 'run_date': today_str}
+
+    start_time = time.time()
+    updated = {}
+    try:
+        for table_name, date_column, owner_column, required_null_column in ROLLOVER_RULES:
+            updated[f'{table_name}.{date_column}'] = roll_forward_table(
+                supabase_client, table_name, date_column, owner_column, required_null_column, today_str
+            )
+    except Exception as e:
+        logger.error(f"{JOB_NAME} failed for {today_str}: {e}")
+        _release_run(supabase_client, today_str)
+        raise
+
+    summary = {
+        'skipped': False,
+        'run_date': today_str,
+        'updated': updated,
+        'execution_time': round(time.time() - start_time, 3)
+    }
+    _finish_run(supabase_client, today_str, summary)
+    _last_completed_date = today
+    logger.info(f"{JOB_NAME} completed for {today_str}: {updated}")
+    return summary
+
+
+def _seconds_until_next_run(now: datetime, offset_minutes: int) -> float:
+    next_run = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    next_run += timedelta(minutes=offset_minutes)
+    return max((next_run - now).total_seconds(), 1.0)
+
+
+def _retry_delay(now: datetime, offset_minutes: int, failures: int) -> float:
+    """Seconds to the next attempt: the next midnight run, or sooner to retry after ``failures`` failures"""
+    until_next_run = _seconds_until_next_run(now, offset_minutes)
+    if not failures:
+        return until_next_run
+    backoff = min(RETRY_BASE_SECONDS * 2 ** (failures - 1), RETRY_MAX_SECONDS)
+    return min(backoff, until_next_run)
+
+
+def start_rollover_scheduler(supabase_client, offset_minutes: int = 1) -> threading.Thread:
+    """
+    Run the rollover now and then shortly after every midnight in a daemon thread.
+
+    Under eventlet's monkey patching the thread is a green thread. Several
+    workers may start a scheduler; the marker table keeps it to one run a day.
+    A failed run, or one left to another worker that has not finished, is
+    tried again the same day after a backoff (see _retry_delay).
+    """
+    def loop():
+        failures = 0
+        while True:
+            try:
+                summary = run_daily_rollover(supabase_client)
+                done = not summary.get('in_progress')
+            except Exception as e:
+                logger.error(f"{JOB_NAME} scheduler run failed: {e}")
+                done = False
+            failures = 0 if done else failures + 1
+            time.sleep(_retry_delay(datetime.now(), offset_minutes, failures))
+
+    thread = threading.Thread(target=loop, name=JOB_NAME, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    client = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_ANON_KEY'])
+    print(run_daily_rollover(client))
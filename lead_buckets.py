@@ -0,0 +1,245 @@
+"""
+Lead Bucketing Engine for Ather CRM System
+This module classifies CRE, PS and walk-in leads into the dashboard tabs
+(untouched, called, follow-up, pending, won, lost) in one vectorized pass so
+every dashboard view uses the same rules. The same rules are also available
+as PostgREST conditions, so a tab can be counted and paged in the database.
+"""
+
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from query_utils import quote_logic_value
+
+# Bucket codes (index into BUCKET_NAMES)
+WON, LOST, PENDING, UNTOUCHED, CALLED, FOLLOW_UP, OTHER = range(7)
+BUCKET_NAMES = ('won', 'lost', 'pending', 'untouched', 'called', 'follow_up', 'other')
+
+# Statuses of a first call that did not reach the customer
+NON_CONTACT_STATUSES = ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']
+CALL_ME_BACK = 'Call me Back'
+
+# PS lead statuses that keep a lead out of fresh/pending/today's follow-up tabs
+PS_EXCLUDED_STATUSES = ['Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed']
+
+
+class LeadBuckets:
+    """Bucket code per lead plus helpers to slice the original rows"""
+
+    def __init__(self, codes: np.ndarray):
+        self.codes = codes
+
+    def mask(self, *buckets: str) -> np.ndarray:
+        return np.isin(self.codes, [BUCKET_NAMES.index(bucket) for bucket in buckets])
+
+    def indices(self, *buckets: str) -> np.ndarray:
+        return np.flatnonzero(self.mask(*buckets))
+
+    def rows(self, leads: Sequence[Dict[str, Any]], *buckets: str) -> List[Dict[str, Any]]:
+        """Return the leads in any of the given buckets, preserving input order"""
+        return [leads[i] for i in self.indices(*buckets)]
+
+    def counts(self) -> Dict[str, int]:
+        counts = np.bincount(self.codes, minlength=len(BUCKET_NAMES)) if len(self.codes) else np.zeros(len(BUCKET_NAMES), dtype=int)
+        return {name: int(counts[code]) for code, name in enumerate(BUCKET_NAMES)}
+
+
+def _column(leads: Sequence[Dict[str, Any]], field: str) -> pd.Series:
+    """Extract one field of a list of row dicts as an object Series"""
+    return pd.Series([lead.get(field) for lead in leads], dtype=object)
+
+
+def _text(series: pd.Series, strip: bool = False) -> pd.Series:
+    text = series.fillna('').astype(str)
+    return text.str.strip() if strip else text
+
+
+def _truthy(series: pd.Series) -> np.ndarray:
+    return (series.notna() & (series.astype(str) != '')).to_numpy()
+
+
+def classify_cre_leads(leads: Sequence[Dict[str, Any]]) -> LeadBuckets:
+    """
+    CRE dashboard rules (lead_master):
+    Won/Lost by final_status; Pending with a first call -> pending;
+    no first call and lead_status 'Pending' -> untouched; no first call and a
+    non-contact status -> called ('Call me Back' -> follow_up).
+    """
+    final_status = _text(_column(leads, 'final_status')).to_numpy()
+    lead_status = _text(_column(leads, 'lead_status'), strip=True).to_numpy()
+    has_first_call = _column(leads, 'first_call_date').notna().to_numpy()
+
+    codes = np.select(
+        [
+            final_status == 'Won',
+            final_status == 'Lost',
+            (final_status == 'Pending') & has_first_call,
+            ~has_first_call & (lead_status == 'Pending'),
+            ~has_first_call & (lead_status == CALL_ME_BACK),
+            ~has_first_call & np.isin(lead_status, NON_CONTACT_STATUSES),
+        ],
+        [WON, LOST, PENDING, UNTOUCHED, FOLLOW_UP, CALLED],
+        default=OTHER,
+    )
+    return LeadBuckets(codes)
+
+
+def classify_ps_leads(leads: Sequence[Dict[str, Any]], first_call_field: str = 'first_call_date') -> LeadBuckets:
+    """
+    PS dashboard rules (ps_followup_master, and activity_leads with
+    first_call_field='ps_first_call_date'):
+    Won/Lost by final_status; open leads (final_status Pending or empty) whose
+    lead_status is not excluded go to pending once called, otherwise to
+    follow_up ('Call me Back'), called (non-contact) or untouched.
+    """
+    final_status = _text(_column(leads, 'final_status')).to_numpy()
+    lead_status = _text(_column(leads, 'lead_status')).to_numpy()
+    has_first_call = _truthy(_column(leads, first_call_field))
+
+    is_open = ((final_status == 'Pending') | (final_status == '')) & ~np.isin(lead_status, PS_EXCLUDED_STATUSES)
+    fresh = is_open & ~has_first_call
+
+    codes = np.select(
+        [
+            final_status == 'Won',
+            final_status == 'Lost',
+            is_open & has_first_call,
+            fresh & (lead_status == CALL_ME_BACK),
+            fresh & np.isin(lead_status, NON_CONTACT_STATUSES),
+            fresh,
+        ],
+        [WON, LOST, PENDING, FOLLOW_UP, CALLED, UNTOUCHED],
+        default=OTHER,
+    )
+    return LeadBuckets(codes)
+
+
+def classify_walkin_leads(leads: Sequence[Dict[str, Any]]) -> LeadBuckets:
+    """
+    Walk-in rules (walkin_table): Won/Lost by status; open walk-ins with no
+    call recorded and a non-excluded status are untouched (listed under the
+    PS dashboard's pending tab), other open walk-ins are pending (listed under
+    attended).
+    """
+    status = _text(_column(leads, 'status')).to_numpy()
+    lead_status = np.where(status != '', status, _text(_column(leads, 'lead_status')).to_numpy())
+    has_any_call = np.zeros(len(leads), dtype=bool)
+    for call_no in range(1, 8):
+        has_any_call |= _truthy(_column(leads, f'{call_no}_call_date'))
+
+    is_open = (status == 'Pending') | (status == '')
+    codes = np.select(
+        [
+            status == 'Won',
+            status == 'Lost',
+            is_open & ~has_any_call & ~np.isin(lead_status, PS_EXCLUDED_STATUSES),
+            is_open,
+        ],
+        [WON, LOST, UNTOUCHED, PENDING],
+        default=OTHER,
+    )
+    return LeadBuckets(codes)
+
+
+def _eq(column: str, value: Any) -> str:
+    return f'{column}.eq.{quote_logic_value(value)}'
+
+
+def _in(column: str, values: Sequence[Any]) -> str:
+    return f'{column}.in.({",".join(quote_logic_value(value) for value in values)})'
+
+
+def _not_in(column: str, values: Sequence[Any]) -> str:
+    """``column`` NULL or not one of ``values`` (NOT IN alone drops NULLs)"""
+    return f'or({column}.is.null,{column}.not.in.({",".join(quote_logic_value(value) for value in values)}))'
+
+
+def _or(*conditions: str) -> str:
+    return f'or({",".join(conditions)})'
+
+
+def _and(*conditions: str) -> str:
+    return f'and({",".join(conditions)})'
+
+
+def cre_bucket_conditions() -> Dict[str, Tuple[str, ...]]:
+    """
+    classify_cre_leads as PostgREST conditions per bucket (see
+    query_utils.conditions_hook), plus 'fresh' (untouched, called or
+    follow_up) and 'open' (neither Won nor Lost). lead_status is compared
+    as stored rather than stripped.
+    """
+    is_open = _not_in('final_status', ('Won', 'Lost'))
+    fresh = (is_open, 'first_call_date.is.null')
+    return {
+        'won': (_eq('final_status', 'Won'),),
+        'lost': (_eq('final_status', 'Lost'),),
+        'pending': (_eq('final_status', 'Pending'), 'first_call_date.not.is.null'),
+        'untouched': fresh + (_eq('lead_status', 'Pending'),),
+        'follow_up': fresh + (_eq('lead_status', CALL_ME_BACK),),
+        'called': fresh + (_in('lead_status', NON_CONTACT_STATUSES),),
+        'fresh': fresh + (_in('lead_status', ['Pending', CALL_ME_BACK] + NON_CONTACT_STATUSES),),
+        'open': (is_open,),
+    }
+
+
+def ps_bucket_conditions(first_call_field: str = 'first_call_date') -> Dict[str, Tuple[str, ...]]:
+    """
+    classify_ps_leads as PostgREST conditions per bucket, plus 'fresh'
+    (untouched, called or follow_up) and 'open'.
+    """
+    is_open = (_or('final_status.is.null', _in('final_status', ('', 'Pending'))),
+               _not_in('lead_status', PS_EXCLUDED_STATUSES))
+    fresh = is_open + (f'{first_call_field}.is.null',)
+    return {
+        'won': (_eq('final_status', 'Won'),),
+        'lost': (_eq('final_status', 'Lost'),),
+        'pending': is_open + (f'{first_call_field}.not.is.null',),
+        'follow_up': fresh + (_eq('lead_status', CALL_ME_BACK),),
+        'called': fresh + (_in('lead_status', NON_CONTACT_STATUSES),),
+        'untouched': fresh + (_not_in('lead_status', [CALL_ME_BACK] + NON_CONTACT_STATUSES),),
+        'fresh': fresh,
+        'open': is_open,
+    }
+
+
+def walkin_bucket_conditions() -> Dict[str, Tuple[str, ...]]:
+    """
+    classify_walkin_leads as PostgREST conditions per bucket, plus 'open'
+    (untouched or pending). The effective lead status is ``status`` unless
+    that is empty, then ``lead_status``.
+    """
+    is_open = _or('status.is.null', _in('status', ('', 'Pending')))
+    calls = [f'{call_no}_call_date' for call_no in range(1, 8)]
+    return {
+        'won': (_eq('status', 'Won'),),
+        'lost': (_eq('status', 'Lost'),),
+        'untouched': (is_open, _and(*(f'{call}.is.null' for call in calls)),
+                      _or(_eq('status', 'Pending'), 'lead_status.is.null',
+                          f'lead_status.not.in.({",".join(quote_logic_value(s) for s in PS_EXCLUDED_STATUSES)})')),
+        'pending': (is_open, _or(*(f'{call}.not.is.null' for call in calls),
+                                 _and(_in('lead_status', PS_EXCLUDED_STATUSES),
+                                      _or('status.is.null', _eq('status', ''))))),
+        'open': (is_open,),
+    }
+
+
+def dates_within(values: Sequence[Any], start_date: Optional[date], end_date: Optional[date]) -> np.ndarray:
+    """
+    Vectorized check that the date part (first 10 chars, YYYY-MM-DD) of each
+    timestamp lies in [start_date, end_date]. Missing or unparseable values
+    are outside the window; a None bound is open.
+    """
+    parsed = pd.to_datetime(
+        pd.Series(list(values), dtype=object).astype(str).str[:10],
+        format='%Y-%m-%d', errors='coerce'
+    )
+    within = parsed.notna()
+    if start_date:
+        within &= parsed >= pd.Timestamp(start_date)
+    if end_date:
+        within &= parsed <= pd.Timestamp(end_date)
+    return within.to_numpy()
@@ -0,0 +1,483 @@
+"""
+Lead Deduplication for Ather CRM System
+This module routes incoming leads against ``lead_master`` and
+``duplicate_leads`` with set-based queries: the phones of a batch are looked
+up with one chunked ``IN`` query per table, and every lead is then classified
+in memory as a new lead, a new source for an existing phone (stored in the
+next free ``sourceN``/``sub_sourceN``/``dateN`` slot of its duplicate_leads
+record) or a skip (the phone already has that source and sub-source).
+
+Changes to duplicate_leads are collected per record, so a batch ends with one
+bulk upsert and one bulk insert however many of its leads were duplicates.
+
+ingest_leads runs the whole pipeline for the sync scripts (Meta,
+Salesforce), which only map their records to lead_master rows: normalize,
+drop repeats within the batch, look up, route, and write in bulk.
+ingest_lead_frame does the same for a batch that arrives as a DataFrame (the
+Knowlarity call logs): repeats are dropped and leads are routed on whole
+columns, with the same results as ingest_leads.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from uid_allocator import get_uid_allocator
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# source1..source10 (with sub_sourceN and dateN) per duplicate_leads record
+SOURCE_SLOTS = 10
+
+# Phones per IN (...) lookup, small enough to keep the request URL short
+LOOKUP_CHUNK_SIZE = 300
+
+# Stands in for None in the key columns of _route_frame (merges and
+# groupbys drop missing keys, while route_leads compares None like any value)
+_NULL_KEY = '\x00'
+
+ROUTING_KEY = ['phone', 'source', 'sub_source']
+
+# lead_master rows per insert request
+INSERT_BATCH_SIZE = 500
+
+MASTER_LOOKUP_FIELDS = 'id, uid, customer_mobile_number, customer_name, source, sub_source, date'
+
+
+def normalize_phone(value: Any) -> str:
+    """10-digit mobile number: digits only, without the 91/0 prefixes"""
+    if value is None:
+        return ''
+    text = str(value).strip()
+    if text.endswith('.0'):
+        # Numeric Excel cells read as floats
+        text = text[:-2]
+    digits = ''.join(filter(str.isdigit, text))
+    if digits.startswith('91') and len(digits) == 12:
+        digits = digits[2:]
+    elif digits.startswith('0') and len(digits) == 11:
+        digits = digits[1:]
+    return digits[-10:] if len(digits) >= 10 else digits
+
+
+def has_source(record: Dict[str, Any], source: Any, sub_source: Any) -> bool:
+    """Whether a lead_master row or duplicate_leads record already has this source/sub-source pair"""
+    if 'source' in record:
+        return record.get('source') == source and record.get('sub_source') == sub_source
+    return any(record.get(f'source{i}') == source and record.get(f'sub_source{i}') == sub_source
+               for i in range(1, SOURCE_SLOTS + 1))
+
+
+def next_free_slot(record: Dict[str, Any]) -> Optional[int]:
+    """First empty source slot of a duplicate_leads record, or None when all are taken"""
+    for i in range(1, SOURCE_SLOTS + 1):
+        if record.get(f'source{i}') is None:
+            return i
+    return None
+
+
+def new_duplicate_record(original: Dict[str, Any], lead: Dict[str, Any], now: str) -> Dict[str, Any]:
+    """duplicate_leads record for a lead_master row that just got a second source"""
+    record = {
+        'uid': original['uid'],
+        'customer_mobile_number': original['customer_mobile_number'],
+        'customer_name': original.get('customer_name'),
+        'original_lead_id': original['id'],
+        'duplicate_count': 2,
+        'created_at': now,
+        'updated_at': now,
+    }
+    slots = [(original.get('source'), original.get('sub_source'), original.get('date')),
+             (lead.get('source'), lead.get('sub_source'), lead.get('date'))]
+    for i in range(1, SOURCE_SLOTS + 1):
+        source, sub_source, day = slots[i - 1] if i <= len(slots) else (None, None, None)
+        record[f'source{i}'] = source
+        record[f'sub_source{i}'] = sub_source
+        record[f'date{i}'] = day
+    return record
+
+
+def fetch_existing_by_phone(supabase_client, phones: Iterable[str],
+                            chunk_size: int = LOOKUP_CHUNK_SIZE) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    lead_master rows and duplicate_leads records of ``phones``, keyed by
+    phone, with one IN query per table and chunk of phones.
+    """
+    phones = sorted({phone for phone in phones if phone})
+    master_records, duplicate_records = {}, {}
+    for start in range(0, len(phones), chunk_size):
+        chunk = phones[start:start + chunk_size]
+        result = (supabase_client.table('lead_master').select(MASTER_LOOKUP_FIELDS)
+                  .in_('customer_mobile_number', chunk).execute())
+        master_records.update({row['customer_mobile_number']: row for row in result.data or []})
+        # Whole records: changed ones are written back with a bulk upsert
+        result = (supabase_client.table('duplicate_leads').select('*')
+                  .in_('customer_mobile_number', chunk).execute())
+        duplicate_records.update({row['customer_mobile_number']: row for row in result.data or []})
+    return master_records, duplicate_records
+
+
+class LeadRouting:
+    """Outcome of route_leads for one batch"""
+
+    def __init__(self):
+        self.new_leads: List[Dict[str, Any]] = []
+        # duplicate_leads records with new sources, by id (written with one upsert)
+        self.duplicate_updates: Dict[Any, Dict[str, Any]] = {}
+        # New duplicate_leads records, by phone (written with one insert)
+        self.duplicate_inserts: Dict[str, Dict[str, Any]] = {}
+        # Leads with another source for a phone that is new in this batch; route
+        # them again once the new leads are written and have ids
+        self.deferred: List[Dict[str, Any]] = []
+        self.duplicate_sources = 0
+        self.skipped_duplicates = 0
+        self.slots_full = 0
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            'new_leads': len(self.new_leads),
+            'duplicate_sources': self.duplicate_sources,
+            'skipped_duplicates': self.skipped_duplicates,
+            'slots_full': self.slots_full,
+            'deferred': len(self.deferred),
+        }
+
+
+def route_leads(leads: Iterable[Dict[str, Any]], master_records: Dict[str, Dict],
+                duplicate_records: Dict[str, Dict]) -> LeadRouting:
+    """
+    Classify leads (with normalized ``customer_mobile_number``, ``source``,
+    ``sub_source`` and ``date``) against the existing records of their phones.
+
+    Leads are taken in order, and each one sees the effect of the earlier ones:
+    a repeated phone/source pair is skipped, and several new sources for the
+    same phone fill consecutive slots of the same record. The input records
+    are not modified.
+    """
+    routing = LeadRouting()
+    now = datetime.now().isoformat()
+    batch_new = {}
+
+    def append_source(record: Dict[str, Any], lead: Dict[str, Any]) -> bool:
+        slot = next_free_slot(record)
+        if slot is None:
+            routing.slots_full += 1
+            return False
+        record[f'source{slot}'] = lead.get('source')
+        record[f'sub_source{slot}'] = lead.get('sub_source')
+        record[f'date{slot}'] = lead.get('date')
+        record['duplicate_count'] = (record.get('duplicate_count') or 0) + 1
+        record['updated_at'] = now
+        return True
+
+    for lead in leads:
+        phone = lead['customer_mobile_number']
+        source, sub_source = lead.get('source'), lead.get('sub_source')
+
+        if phone in routing.duplicate_inserts:
+            record = routing.duplicate_inserts[phone]
+        elif phone in duplicate_records:
+            original = duplicate_records[phone]
+            record = routing.duplicate_updates.get(original['id']) or dict(original)
+        elif phone in master_records:
+            original = master_records[phone]
+            if has_source(original, source, sub_source):
+                routing.skipped_duplicates += 1
+            else:
+                routing.duplicate_inserts[phone] = new_duplicate_record(original, lead, now)
+                routing.duplicate_sources += 1
+            continue
+        elif phone in batch_new:
+            if has_source(batch_new[phone], source, sub_source):
+                routing.skipped_duplicates += 1
+            else:
+                routing.deferred.append(lead)
+            continue
+        else:
+            batch_new[phone] = lead
+            routing.new_leads.append(lead)
+            continue
+
+        if has_source(record, source, sub_source):
+            routing.skipped_duplicates += 1
+        elif append_source(record, lead):
+            routing.duplicate_sources += 1
+            if 'id' in record:
+                routing.duplicate_updates[record['id']] = record
+
+    return routing
+
+
+def _route_frame(keys: pd.DataFrame, master_records: Dict[str, Dict], duplicate_records: Dict[str, Dict],
+                 lead_rows: Callable[[List[int]], List[Dict[str, Any]]]) -> LeadRouting:
+    """
+    route_leads computed on the ``phone``/``source``/``sub_source`` columns
+    of a batch: repeats are found with duplicated, pairs a record already has
+    with a merge against its slots, and the k-th new pair of a phone is
+    matched to the k-th free slot of its record with another merge. The
+    routing (lead lists, records and counts, in the same order) is the one
+    route_leads returns; only the leads that end up in it are built, with one
+    ``lead_rows(positions)`` call per outcome.
+
+    Every lead must have a source (sub-sources may be missing): route_leads
+    treats a slot holding a lead without one as free again, which a merge
+    against the slots cannot follow, so a batch with a sourceless lead
+    raises ValueError.
+    """
+    routing = LeadRouting()
+    if keys.empty:
+        return routing
+    if keys['source'].isna().any():
+        raise ValueError("_route_frame needs a source on every lead; route the batch with route_leads")
+    now = datetime.now().isoformat()
+
+    frame = keys[ROUTING_KEY].astype(object).fillna(_NULL_KEY).reset_index(drop=True)
+    frame['pos'] = range(len(frame))
+    frame['repeat'] = frame.duplicated(ROUTING_KEY)
+    outcome = pd.Series('', index=frame.index, dtype=object)
+
+    in_duplicates = frame['phone'].isin(list(duplicate_records))
+    in_master = ~in_duplicates & frame['phone'].isin(list(master_records))
+    unknown = ~in_duplicates & ~in_master
+
+    # Phones new to the database: the first lead is new, leads with its pair
+    # are skipped, other pairs wait until the new lead has an id
+    fresh = frame[unknown]
+    first_pair = fresh.groupby('phone')[['source', 'sub_source']].transform('first')
+    is_first = ~fresh.duplicated('phone')
+    same_pair = (fresh['source'] == first_pair['source']) & (fresh['sub_source'] == first_pair['sub_source'])
+    outcome[fresh.index[is_first]] = 'new'
+    outcome[fresh.index[~is_first & same_pair]] = 'skip'
+    outcome[fresh.index[~is_first & ~same_pair]] = 'defer'
+
+    # Pairs each existing record has (every slot of a duplicate_leads record,
+    # the row itself for a lead_master row) and its free slots, in order
+    pairs, free = [], []
+    for phone in frame.loc[in_duplicates, 'phone'].unique():
+        record = duplicate_records[phone]
+        for i in range(1, SOURCE_SLOTS + 1):
+            pairs.append((phone, record.get(f'source{i}'), record.get(f'sub_source{i}')))
+            if record.get(f'source{i}') is None:
+                free.append((phone, i))
+    for phone in frame.loc[in_master, 'phone'].unique():
+        record = master_records[phone]
+        pairs.append((phone, record.get('source'), record.get('sub_source')))
+        # A new duplicate_leads record gets the lead_master row in slot 1 and the
+        # first new source in slot 2; the next sources take the free slots in
+        # order, which starts with slot 1 when the row has no source
+        later = ([1] if record.get('source') is None else []) + list(range(3, SOURCE_SLOTS + 1))
+        free.extend((phone, i) for i in [2] + later)
+    pairs = pd.DataFrame(pairs, columns=ROUTING_KEY, dtype=object).fillna(_NULL_KEY).drop_duplicates()
+    free = pd.DataFrame(free, columns=['phone', 'slot'])
+    free['rank'] = free.groupby('phone').cumcount()
+
+    # The k-th new pair of a phone takes the k-th free slot of its record
+    existing = frame[~unknown & ~frame['repeat']]
+    known_pos = existing.merge(pairs, on=ROUTING_KEY)['pos']
+    outcome[known_pos] = 'skip'
+    adding = existing[~existing['pos'].isin(known_pos)].copy()
+    adding['rank'] = adding.groupby('phone').cumcount()
+    placed = adding.merge(free, on=['phone', 'rank'], how='left')
+    has_slot = placed['slot'].notna()
+    outcome[placed.loc[has_slot, 'pos']] = 'append'
+    outcome[placed.loc[~has_slot, 'pos']] = 'full'
+
+    # Repeats of a pair on an existing record: skipped once the pair is on
+    # the record, out of slots again when it found none
+    repeats = frame[~unknown & frame['repeat']].merge(
+        existing[ROUTING_KEY + ['pos']], on=ROUTING_KEY, suffixes=('', '_first'))
+    outcome[repeats['pos']] = (outcome[repeats['pos_first']] == 'full').map({True: 'full', False: 'skip'}).values
+
+    routing.new_leads = lead_rows(frame.index[outcome == 'new'].tolist())
+    routing.deferred = lead_rows(frame.index[outcome == 'defer'].tolist())
+    routing.skipped_duplicates = int((outcome == 'skip').sum())
+    routing.slots_full = int((outcome == 'full').sum())
+    routing.duplicate_sources = int((outcome == 'append').sum())
+
+    # Rows are in lead order, so records come out in the order route_leads creates them
+    records = {}
+    appended = placed[has_slot]
+    for phone, lead, slot in zip(appended['phone'].tolist(), lead_rows(appended['pos'].tolist()),
+                                 appended['slot'].astype(int).tolist()):
+        record = records.get(phone)
+        if record is None and phone not in duplicate_records:
+            records[phone] = new_duplicate_record(master_records[phone], lead, now)
+            continue
+        if record is None:
+            record = records[phone] = dict(duplicate_records[phone])
+        record[f'source{slot}'] = lead.get('source')
+        record[f'sub_source{slot}'] = lead.get('sub_source')
+        record[f'date{slot}'] = lead.get('date')
+        record['duplicate_count'] = (record.get('duplicate_count') or 0) + 1
+        record['updated_at'] = now
+    for phone, record in records.items():
+        if phone not in duplicate_records:
+            routing.duplicate_inserts[phone] = record
+        elif 'id' in record:
+            routing.duplicate_updates[record['id']] = record
+
+    return routing
+
+
+def write_duplicate_changes(supabase_client, routing: LeadRouting) -> None:
+    """Store the duplicate_leads changes of a routing: one bulk upsert and one bulk insert"""
+    if routing.duplicate_updates:
+        supabase_client.table('duplicate_leads').upsert(
+            list(routing.duplicate_updates.values()), on_conflict='id'
+        ).execute()
+    if routing.duplicate_inserts:
+        supabase_client.table('duplicate_leads').insert(list(routing.duplicate_inserts.values())).execute()
+
+
+def _insert_leads(supabase_client, leads: List[Dict[str, Any]], batch_size: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Insert leads in batches and return the inserted rows and the leads that
+    failed. A failed batch is retried row by row, so one bad row does not
+    cost the whole batch.
+    """
+    inserted, failed = [], []
+    for start in range(0, len(leads), batch_size):
+        batch = leads[start:start + batch_size]
+        try:
+            inserted.extend(supabase_client.table('lead_master').insert(batch).execute().data or [])
+            continue
+        except Exception as e:
+            logger.warning(f"Batch insert of {len(batch)} leads failed, inserting them one by one: {e}")
+        for lead in batch:
+            try:
+                inserted.extend(supabase_client.table('lead_master').insert(lead).execute().data or [])
+            except Exception as e:
+                logger.error(f"Failed to insert lead {lead.get('uid')} ({lead['customer_mobile_number']}): {e}")
+                failed.append(lead)
+    return inserted, failed
+
+
+def _write_routing(supabase_client, routing: LeadRouting, uid_for: Callable[[Dict[str, Any], int], str],
+                   batch_size: int, summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Give the new leads of a routing their UIDs, insert them, route the
+    deferred leads against the inserted rows and write the duplicate_leads
+    changes, adding the counts to ``summary`` and the phones of every lead
+    that was not written to ``summary['failed_phones']``.
+    """
+    new_leads = routing.new_leads
+    sequences = get_uid_allocator(supabase_client).allocate(len(new_leads)) if new_leads else []
+    for lead, sequence in zip(new_leads, sequences):
+        lead['uid'] = uid_for(lead, sequence)
+    inserted, failed = _insert_leads(supabase_client, new_leads, batch_size)
+    summary['inserted'] = len(inserted)
+    summary['failed'] += len(failed)
+    summary['failed_phones'].update(lead['customer_mobile_number'] for lead in failed)
+
+    routings = [routing]
+    if routing.deferred:
+        # The phones are in lead_master now: route the other sources against the new rows
+        deferred_routing = route_leads(routing.deferred, {row['customer_mobile_number']: row for row in inserted}, {})
+        # Leads left over as "new" belong to phones whose insert failed
+        summary['failed'] += len(deferred_routing.new_leads)
+        summary['failed_phones'].update(lead['customer_mobile_number'] for lead in deferred_routing.new_leads)
+        routings.append(deferred_routing)
+
+    for batch_routing in routings:
+        summary['skipped_duplicates'] += batch_routing.skipped_duplicates
+        summary['slots_full'] += batch_routing.slots_full
+        try:
+            write_duplicate_changes(supabase_client, batch_routing)
+            summary['duplicate_sources'] += batch_routing.duplicate_sources
+        except Exception as e:
+            logger.error(f"Failed to write duplicate_leads changes: {e}")
+            summary['failed'] += batch_routing.duplicate_sources
+            summary['failed_phones'].update(batch_routing.duplicate_inserts)
+            summary['failed_phones'].update(record.get('customer_mobile_number')
+                                            for record in batch_routing.duplicate_updates.values())
+
+    summary['new_leads'] = inserted
+    return summary
+
+
+def ingest_leads(supabase_client, leads: Iterable[Dict[str, Any]],
+                 uid_for: Callable[[Dict[str, Any], int], str],
+                 batch_size: int = INSERT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Write a batch of mapped lead_master rows with duplicate routing.
+
+    ``uid_for(lead, sequence)`` builds the UID of a new lead from a sequence
+    number of the shared UID allocator. Leads giving another source for a
+    phone that is itself new in the batch are routed again once the new
+    leads are inserted, so they land in duplicate_leads in the same run.
+
+    Returns the counts of the run, ``new_leads``, the inserted rows, and
+    ``failed_phones``, the normalized phones with a lead that was not written
+    (callers that resume from a watermark hold it back for those leads).
+    """
+    summary = {'received': 0, 'invalid': 0, 'intra_batch_duplicates': 0, 'inserted': 0,
+               'duplicate_sources': 0, 'skipped_duplicates': 0, 'slots_full': 0, 'failed': 0,
+               'failed_phones': set()}
+
+    # Normalize and drop repeats of a phone/source/sub-source within the batch
+    unique_leads, seen = [], set()
+    for lead in leads:
+        summary['received'] += 1
+        phone = normalize_phone(lead.get('customer_mobile_number'))
+        if not phone:
+            summary['invalid'] += 1
+            continue
+        key = (phone, lead.get('source'), lead.get('sub_source'))
+        if key in seen:
+            summary['intra_batch_duplicates'] += 1
+            continue
+        seen.add(key)
+        unique_leads.append({**lead, 'customer_mobile_number': phone})
+
+    master_records, duplicate_records = fetch_existing_by_phone(
+        supabase_client, [lead['customer_mobile_number'] for lead in unique_leads])
+    routing = route_leads(unique_leads, master_records, duplicate_records)
+    return _write_routing(supabase_client, routing, uid_for, batch_size, summary)
+
+
+def ingest_lead_frame(supabase_client, frame: pd.DataFrame,
+                      uid_for: Callable[[Dict[str, Any], int], str],
+                      batch_size: int = INSERT_BATCH_SIZE,
+                      defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    ingest_leads for a DataFrame of lead_master rows, with the same routing
+    and counts. Phones are normalized and repeats dropped on whole columns,
+    and leads are routed by _route_frame, so row dicts are only built for
+    the leads that are written (new leads get ``defaults`` first). A batch
+    with a lead without a source is routed by route_leads instead.
+    """
+    summary = {'received': len(frame), 'invalid': 0, 'intra_batch_duplicates': 0, 'inserted': 0,
+               'duplicate_sources': 0, 'skipped_duplicates': 0, 'slots_full': 0, 'failed': 0,
+               'failed_phones': set()}
+
+    # Normalize and drop repeats of a phone/source/sub-source within the batch
+    # (each distinct number is normalized once, with normalize_phone's exact rules)
+    raw_phones = frame['customer_mobile_number']
+    phones = raw_phones.map({value: normalize_phone(value) for value in raw_phones.dropna().unique()}).fillna('')
+    valid = phones != ''
+    summary['invalid'] = int((~valid).sum())
+    frame = frame[valid].assign(customer_mobile_number=phones[valid])
+    repeat = frame.duplicated(['customer_mobile_number', 'source', 'sub_source'])
+    summary['intra_batch_duplicates'] = int(repeat.sum())
+    frame = frame[~repeat]
+
+    # Plain column lists: building dicts from them is much cheaper than to_dict per row.
+    # Missing values are None, as route_leads and the JSON payloads expect
+    columns = list(frame.columns)
+    cells = frame.astype(object).where(frame.notna(), None)
+    values = [cells[column].tolist() for column in columns]
+    base = defaults or {}
+
+    def lead_rows(positions: List[int]) -> List[Dict[str, Any]]:
+        return [{**base, **dict(zip(columns, [column[pos] for column in values]))} for pos in positions]
+
+    master_records, duplicate_records = fetch_existing_by_phone(supabase_client, frame['customer_mobile_number'])
+    keys = frame[['customer_mobile_number', 'source', 'sub_source']].set_axis(ROUTING_KEY, axis=1)
+    if keys['source'].isna().any():
+        routing = route_leads(lead_rows(list(range(len(keys)))), master_records, duplicate_records)
+    else:
+        routing = _route_frame(keys, master_records, duplicate_records, lead_rows)
+    return _write_routing(supabase_client, routing, uid_for, batch_size, summary)
@@ -0,0 +1,247 @@
+"""
+Lead Snapshots for Ather CRM System
+This module keeps an in-process, columnar copy of the lead tables used by the
+analytics endpoints (``lead_master`` and ``ps_followup_master``) so a request
+is answered with pandas/NumPy operations instead of downloading the tables.
+
+A snapshot is loaded once, then refreshed incrementally by polling rows whose
+``updated_at`` (or ``created_at``) is past the newest change already seen;
+the set_updated_at trigger of database_optimization.sql stamps ``updated_at``
+on every UPDATE, so no write is missed. Deletes leave nothing to poll: a
+local delete forces a full reload, and a full reload every hour drops rows
+deleted elsewhere. Timestamp
+columns are stored as datetime64 (UTC, tz-naive) and low-cardinality text
+columns as pandas categoricals.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+
+from query_utils import iter_table_rows
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CALL_ORDINALS = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh')
+
+# Rows changed shortly before the watermark may commit late; re-reading a
+# small overlap is harmless because changed rows replace their old version
+WATERMARK_OVERLAP = pd.Timedelta(minutes=2)
+
+
+class TableSnapshot:
+    """
+    Columnar in-memory copy of a table, refreshed from ``updated_at`` deltas.
+
+    ``frame`` is never modified in place: every refresh builds a new DataFrame
+    and swaps the reference, so readers can use it without locking.
+    """
+
+    def __init__(self, table_name: str, columns: Sequence[str], datetime_columns: Sequence[str] = (),
+                 categorical_columns: Sequence[str] = (), date_columns: Sequence[str] = (), key: str = 'id',
+                 change_column: str = 'updated_at', full_reload_seconds: float = 3600):
+        self.table_name = table_name
+        self.key = key
+        self.change_column = change_column
+        # date_columns are datetime64 too, but hold plain dates (YYYY-MM-DD in records())
+        self.date_columns = tuple(date_columns)
+        self.datetime_columns = tuple(datetime_columns) + self.date_columns
+        self.categorical_columns = tuple(categorical_columns)
+        self.full_reload_seconds = full_reload_seconds
+        # The key, change and creation columns are always needed for the refresh
+        wanted = [key, change_column, 'created_at'] + [c for c in columns]
+        self.columns = tuple(dict.fromkeys(wanted))
+
+        self.frame: Optional[pd.DataFrame] = None
+        self.watermark: Optional[pd.Timestamp] = None
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self._stale = False
+        self._full_reload_pending = False
+        self._refresh_lock = threading.Lock()
+
+    # -- conversion -----------------------------------------------------
+
+    def _to_frame(self, rows: List[Dict[str, Any]]) -> pd.DataFrame:
+        frame = pd.DataFrame.from_records(rows, columns=list(self.columns))
+        for column in self.datetime_columns + (self.change_column, 'created_at'):
+            frame[column] = _to_datetime(frame[column])
+        for column in self.categorical_columns:
+            frame[column] = frame[column].astype('category')
+        frame = frame.set_index(self.key, drop=False)
+        frame.index.name = None
+        return frame
+
+    def _newest_change(self, frame: pd.DataFrame) -> Optional[pd.Timestamp]:
+        newest = frame[[self.change_column, 'created_at']].max().max()
+        return None if pd.isna(newest) else newest
+
+    # -- refresh --------------------------------------------------------
+
+    def mark_stale(self, full: bool = False) -> None:
+        """
+        Ask the next get_frame() call to pick up recent changes first (e.g.
+        after a local write). ``full`` asks for a full reload instead, which
+        is the only way to see deleted rows.
+        """
+        if full:
+            self._full_reload_pending = True
+        self._stale = True
+
+    def _fetch_changes(self, supabase_client, since: pd.Timestamp) -> List[Dict[str, Any]]:
+        since_iso = since.isoformat()
+        rows = {}
+        # Rows never updated have no updated_at, so creations are polled as well
+        for column in (self.change_column, 'created_at'):
+            for row in iter_table_rows(supabase_client, self.table_name, None, ', '.join(self.columns),
+                                       order_by=column, query_hook=lambda query, column=column: query.gt(column, since_iso)):
+                rows[row[self.key]] = row
+        return list(rows.values())
+
+    def refresh(self, supabase_client, full: bool = False) -> Dict[str, Any]:
+        """
+        Bring the snapshot up to date. Loads the whole table on first use, when
+        ``full`` is set or when the last full load is older than
+        ``full_reload_seconds``; otherwise applies only the changed rows.
+        """
+        with self._refresh_lock:
+            start_time = time.time()
+            self._stale = False
+            full = full or self._full_reload_pending
+            self._full_reload_pending = False
+            reload_due = time.monotonic() - self.loaded_at > self.full_reload_seconds
+
+            if full or reload_due or self.frame is None or self.watermark is None:
+                rows = list(iter_table_rows(supabase_client, self.table_name, None, ', '.join(self.columns)))
+                frame = self._to_frame(rows)
+                self.loaded_at = time.monotonic()
+                changed = len(frame)
+                mode = 'full'
+            else:
+                rows = self._fetch_changes(supabase_client, self.watermark - WATERMARK_OVERLAP)
+                changed = len(rows)
+                mode = 'incremental'
+                frame = self.frame
+                if rows:
+                    delta = self._to_frame(rows)
+                    frame = pd.concat([frame.drop(index=delta.index, errors='ignore'), delta]).sort_index()
+                    for column in self.categorical_columns:
+                        # Concatenating categoricals with different categories yields objects
+                        frame[column] = frame[column].astype('category')
+
+            self.frame = frame
+            self.watermark = self._newest_change(frame) if len(frame) else self.watermark
+            self.refreshed_at = time.monotonic()
+            summary = {'table': self.table_name, 'mode': mode, 'changed': changed, 'rows': len(frame),
+                       'execution_time': round(time.time() - start_time, 3)}
+            if changed:
+                logger.info(f"snapshot refreshed: {summary}")
+            return summary
+
+    def get_frame(self, supabase_client) -> pd.DataFrame:
+        """Current snapshot, loading it (or applying pending local writes) first if needed"""
+        if self.frame is None or self._stale:
+            self.refresh(supabase_client)
+        return self.frame
+
+    # -- row view -------------------------------------------------------
+
+    def records(self, supabase_client, columns: Optional[Iterable[str]] = None,
+                mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Snapshot rows as plain dicts, shaped like Supabase rows (None for
+        missing values, ISO strings for timestamps), for row-oriented callers.
+        """
+        frame = self.get_frame(supabase_client)
+        if mask is not None:
+            frame = frame[mask]
+        if columns is not None:
+            frame = frame[[c.strip() for c in columns]]
+
+        values = {}
+        for column in frame.columns:
+            series = frame[column]
+            if column in self.date_columns:
+                values[column] = [None if pd.isna(v) else v.date().isoformat() for v in series]
+            elif column in self.datetime_columns or column in (self.change_column, 'created_at'):
+                values[column] = [None if pd.isna(v) else v.isoformat() for v in series]
+            else:
+                values[column] = [None if _is_missing(v) else v for v in series.tolist()]
+        names = list(values)
+        return [dict(zip(names, row)) for row in zip(*values.values())]
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """Parse Supabase date/timestamp strings into tz-naive UTC datetime64"""
+    parsed = pd.to_datetime(values, errors='coerce', utc=True, format='ISO8601')
+    return parsed.dt.tz_convert(None)
+
+
+def day_window_mask(series: pd.Series, start_date=None, end_date=None) -> np.ndarray:
+    """Boolean mask of datetime64 values whose day lies in [start_date, end_date] (open bounds when None)"""
+    mask = series.notna().to_numpy().copy()
+    if start_date is not None:
+        mask &= (series >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (series < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+    return mask
+
+
+def create_lead_snapshots() -> Dict[str, TableSnapshot]:
+    """Snapshots of lead_master and ps_followup_master with the columns the analytics endpoints read"""
+    call_dates = [f'{c}_call_date' for c in CALL_ORDINALS]
+    return {
+        'lead_master': TableSnapshot(
+            'lead_master',
+            columns=['uid', 'date', 'customer_name', 'source', 'campaign', 'cre_name', 'ps_name', 'branch',
+                     'lead_category', 'lead_status', 'final_status', 'cre_assigned_at', 'won_timestamp',
+                     'lost_timestamp'] + call_dates,
+            datetime_columns=['cre_assigned_at', 'won_timestamp', 'lost_timestamp'],
+            date_columns=['date'] + call_dates,
+            categorical_columns=['source', 'campaign', 'cre_name', 'ps_name', 'branch', 'lead_category',
+                                 'lead_status', 'final_status'],
+        ),
+        'ps_followup_master': TableSnapshot(
+            'ps_followup_master',
+            columns=['lead_uid', 'ps_name', 'ps_branch', 'ps_assigned_at', 'source', 'lead_status',
+                     'final_status', 'remark'],
+            datetime_columns=['ps_assigned_at'],
+            categorical_columns=['ps_name', 'ps_branch', 'source', 'lead_status', 'final_status'],
+        ),
+    }
+
+
+def start_snapshot_refresher(supabase_client, snapshots: Iterable[TableSnapshot],
+                             interval_seconds: int = 30) -> threading.Thread:
+    """
+    Poll every ``interval_seconds`` for changed rows in a daemon thread.
+
+    Under eventlet's monkey patching the thread is a green thread. Snapshots
+    are loaded lazily by the first request that needs them; the poller only
+    keeps loaded snapshots current.
+    """
+    snapshots = list(snapshots)
+
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            for snapshot in snapshots:
+                if snapshot.frame is None:
+                    continue
+                try:
+                    snapshot.refresh(supabase_client)
+                except Exception as e:
+                    logger.error(f"{snapshot.table_name} snapshot refresh failed: {e}")
+
+    thread = threading.Thread(target=loop, name='lead_snapshots', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,253 @@
+"""
+Lead Upload Pipeline for Ather CRM System
+This module imports uploaded CSV/Excel lead files as a stream: rows are parsed
+one at a time, validated and normalized in chunks, and each chunk is inserted
+into ``lead_master`` in batches by a small, bounded pool of workers. Memory is
+bounded by a few chunks whatever the size of the file, and a progress callback
+is called after every chunk so the caller can report it (over SocketIO).
+
+Phones already known are routed like the sync scripts do (see lead_dedup.py):
+a phone that already has the upload's source is skipped, any other source is
+recorded in its duplicate_leads record, and only unknown phones become new
+leads. Each chunk costs one lookup per table and chunk of phones.
+
+UploadJobs keeps the progress of the background upload jobs of the process
+and drops finished jobs after UPLOAD_JOB_TTL_SECONDS. It lives in memory, so
+the app must run as a single worker process (as railway.toml starts it):
+the job, its Socket.IO events and /api/upload_progress all stay in the
+process that received the upload.
+"""
+
+import csv
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+import openpyxl
+
+from lead_dedup import fetch_existing_by_phone, normalize_phone, route_leads, write_duplicate_changes
+from uid_allocator import APP_SOURCE_CODES, format_uid
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REQUIRED_UPLOAD_FIELDS = ('customer_name', 'customer_mobile_number', 'date')
+
+# Rows validated (and given UIDs) together
+UPLOAD_CHUNK_SIZE = 2000
+
+# Rows per insert request, and insert requests in flight at once
+UPLOAD_BATCH_SIZE = 500
+UPLOAD_CONCURRENCY = 4
+
+# How long a finished upload job stays available to /api/upload_progress
+UPLOAD_JOB_TTL_SECONDS = 3600
+
+
+def iter_csv_rows(filepath: str) -> Iterator[Dict[str, str]]:
+    """Rows of a CSV file as dicts of stripped, non-empty values (empty rows are dropped)"""
+    # utf-8-sig drops the byte order mark Excel writes in front of the header
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as file:
+        for row in csv.DictReader(file):
+            cleaned_row = {key.strip(): str(value).strip() for key, value in row.items() if key and value}
+            if cleaned_row:
+                yield cleaned_row
+
+
+def iter_excel_rows(filepath: str) -> Iterator[Dict[str, str]]:
+    """Rows of the active sheet of an Excel file, read in read-only mode, shaped like iter_csv_rows"""
+    workbook = openpyxl.load_workbook(filepath, read_only=True)
+    try:
+        sheet = workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        headers = [str(value).strip() if value else None for value in header]
+        for row in rows:
+            row_data = {
+                headers[i]: str(value).strip()
+                for i, value in enumerate(row)
+                if i < len(headers) and headers[i] and value is not None
+            }
+            if row_data:
+                yield row_data
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(filepath: str) -> Iterator[Dict[str, str]]:
+    if filepath.lower().endswith('.csv'):
+        return iter_csv_rows(filepath)
+    return iter_excel_rows(filepath)
+
+
+def iter_chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def normalize_upload_chunk(rows: List[Dict[str, str]], source: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    lead_master rows (without UIDs) for the valid rows of a chunk, and the
+    number of rows skipped because a required field is missing or blank or
+    the mobile number has no digits.
+    """
+    leads = []
+    for row in rows:
+        if not all(str(row.get(field, '')).strip() for field in REQUIRED_UPLOAD_FIELDS):
+            continue
+        phone = normalize_phone(row['customer_mobile_number'])
+        if not phone:
+            continue
+        leads.append({
+            'date': str(row['date']).strip(),
+            'customer_name': str(row['customer_name']).strip(),
+            'customer_mobile_number': phone,
+            'source': source,
+            'assigned': 'No',
+            'final_status': 'Pending'
+        })
+    return leads, len(rows) - len(leads)
+
+
+class UploadJobs:
+    """
+    Thread-safe registry of this process's upload jobs, by job id. A job is
+    dropped UPLOAD_JOB_TTL_SECONDS after it finishes; running jobs are kept.
+    """
+
+    def __init__(self, ttl_seconds: float = UPLOAD_JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        """Drop the jobs that finished more than ttl_seconds ago (lock held)"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        for job_id in [job_id for job_id, finished in self._finished_at.items() if finished < cutoff]:
+            del self._jobs[job_id]
+            del self._finished_at[job_id]
+
+    def create(self, job_id: str, **fields: Any) -> Dict[str, Any]:
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {'job_id': job_id, 'status': 'running', **fields}
+            return dict(self._jobs[job_id])
+
+    def update(self, job_id: str, progress: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge ``progress`` into the job and return a copy of it"""
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(progress)
+            return dict(job)
+
+    def finish(self, job_id: str, status: str, progress: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the final progress and ``status`` of a job and start its TTL"""
+        with self._lock:
+            self._finished_at[job_id] = time.monotonic()
+            job = self._jobs[job_id]
+            job.update(progress, status=status)
+            return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+def run_lead_upload(supabase_client, filepath: str, source: str, uid_allocator,
+                    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    chunk_size: int = UPLOAD_CHUNK_SIZE, batch_size: int = UPLOAD_BATCH_SIZE,
+                    max_workers: int = UPLOAD_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Stream ``filepath`` into lead_master and return the upload summary.
+
+    At most ``max_workers`` insert requests run at once, and parsing pauses
+    while twice that many batches are waiting, so a slow database slows the
+    reader down instead of filling memory. A failed batch is counted and
+    logged; the other batches still go in. ``progress`` receives the running
+    summary after every chunk.
+    """
+    start_time = time.time()
+    summary = {'rows_read': 0, 'inserted': 0, 'skipped': 0, 'duplicate_sources': 0, 'skipped_duplicates': 0,
+               'slots_full': 0, 'failed': 0, 'failed_batches': 0}
+    lock = threading.Lock()
+    source_char = APP_SOURCE_CODES.get(source, 'X')
+
+    def insert_batch(batch: List[Dict[str, Any]]) -> None:
+        try:
+            result = supabase_client.table('lead_master').insert(batch).execute()
+            inserted = len(result.data or [])
+            with lock:
+                summary['inserted'] += inserted
+        except Exception as e:
+            logger.error(f"Error inserting upload batch of {len(batch)} leads: {e}")
+            with lock:
+                summary['failed'] += len(batch)
+                summary['failed_batches'] += 1
+
+    def report() -> None:
+        if progress:
+            with lock:
+                snapshot = dict(summary)
+            progress(snapshot)
+
+    # Phones already taken by earlier chunks (every row has the same source,
+    # so a repeat in the file is always a duplicate to skip)
+    seen_phones = set()
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in iter_chunks(iter_upload_rows(filepath), chunk_size):
+            leads, skipped = normalize_upload_chunk(chunk, source)
+            fresh = []
+            for lead in leads:
+                if lead['customer_mobile_number'] not in seen_phones:
+                    seen_phones.add(lead['customer_mobile_number'])
+                    fresh.append(lead)
+
+            master_records, duplicate_records = fetch_existing_by_phone(
+                supabase_client, [lead['customer_mobile_number'] for lead in fresh])
+            routing = route_leads(fresh, master_records, duplicate_records)
+            try:
+                write_duplicate_changes(supabase_client, routing)
+                duplicates_failed = 0
+            except Exception as e:
+                logger.error(f"Error writing duplicate_leads changes of an upload chunk: {e}")
+                duplicates_failed = routing.duplicate_sources
+
+            new_leads = routing.new_leads
+            # One allocator call per chunk; the UIDs are unique without any lookup
+            sequences = uid_allocator.allocate(len(new_leads)) if new_leads else []
+            for lead, sequence in zip(new_leads, sequences):
+                lead['uid'] = format_uid(source_char, lead['customer_mobile_number'], sequence)
+            with lock:
+                summary['rows_read'] += len(chunk)
+                summary['skipped'] += skipped
+                summary['duplicate_sources'] += routing.duplicate_sources - duplicates_failed
+                summary['skipped_duplicates'] += routing.skipped_duplicates + len(leads) - len(fresh)
+                summary['slots_full'] += routing.slots_full
+                summary['failed'] += duplicates_failed
+
+            for batch in iter_chunks(new_leads, batch_size):
+                while len(pending) >= max_workers * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(executor.submit(insert_batch, batch))
+            report()
+
+        wait(pending)
+
+    summary['execution_time'] = round(time.time() - start_time, 3)
+    report()
+    return summary
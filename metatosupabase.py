@@ -1,4 +1,4 @@
-import os, requests, time, json, hashlib, threading, asyncio
+import os, requests, time, json, hashlib, threading, asyncio, random
 from dotenv import load_dotenv
 from supabase import create_client
 from datetime import datetime, timedelta, timezone
@@ -7,6 +7,8 @@ from typing import List, Dict, Set, Optional, Tuple
 import pandas as pd
 import aiohttp
 import warnings
+from lead_dedup import ingest_leads, normalize_phone
+from uid_allocator import format_uid
 warnings.filterwarnings("ignore")
 
 # Environment setup
@@ -32,29 +34,24 @@ def normalize_phone_number(phone: str) -> str:
 def generate_uid(source, mobile_number, sequence):
     """Generate UID following the same pattern"""
     source_map = {'GOOGLE': 'G', 'META': 'M', 'Affiliate': 'A', 'Know': 'K', 'Whatsapp': 'W', 'Tele': 'T', 'BTL': 'B'}
-    source_char = source_map.get(source, 'X')
-    sequence_char = chr(65 + (sequence % 26))
-    mobile_last4 = str(mobile_number).replace(" ", "").replace("-", "")[-4:].zfill(4)
-    seq_num = f"{(sequence % 9999) + 1:04d}"
-    return f"{source_char}{sequence_char}-{mobile_last4}-{seq_num}"
-
-def get_next_sequence_batch(supabase, batch_size=200):
-    """Get next sequence numbers in batch"""
-    try:
-        result = supabase.table("lead_master").select("id").order("id", desc=True).limit(1).execute()
-        if result.data:
-            start_seq = result.data[0]['id'] + 1
-        else:
-            start_seq = 1
-        return list(range(start_seq, start_seq + batch_size))
-    except Exception as e:
-        print(f"❌ Error getting sequence numbers: {e}")
-        return list(range(1, batch_size + 1))
+    return format_uid(source_map.get(source, 'X'), mobile_number, sequence)
+
+# Incremental sync: the newest created_time written per form is kept in
+# SYNC_STATE_TABLE, and each run only fetches leads created after it
+SYNC_STATE_TABLE = 'lead_sync_state'
+SYNC_SOURCE = 'meta'
+
+# How far back a form without a watermark (first run, new form) is fetched
+INITIAL_LOOKBACK = timedelta(hours=24)
 
-def is_within_past_24_hours(created_time_str: str) -> bool:
-    """Validate if lead is actually within past 24 hours"""
+# Leads can reach the API a little after their created_time, so every run
+# re-reads this much before the watermark; ingest_leads skips what is stored
+WATERMARK_OVERLAP = timedelta(minutes=30)
+
+def parse_created_time(created_time_str: str) -> Optional[datetime]:
+    """Lead created_time as a naive UTC datetime, or None when it cannot be parsed"""
     if not created_time_str:
-        return False
+        return None
     
     formats = [
         "%Y-%m-%dT%H:%M:%S%z",      # ISO with timezone
@@ -70,311 +67,222 @@ def is_within_past_24_hours(created_time_str: str) -> bool:
             
             # Handle timezone awareness
             if created_time.tzinfo:
-                created_time_utc = created_time.astimezone(timezone.utc).replace(tzinfo=None)
-            else:
-                created_time_utc = created_time
-            
-            now = datetime.now(timezone.utc).replace(tzinfo=None)
-            twenty_four_hours_ago = now - timedelta(hours=24)
-            
-            is_recent = twenty_four_hours_ago <= created_time_utc <= now
-            return is_recent
+                return created_time.astimezone(timezone.utc).replace(tzinfo=None)
+            return created_time
             
         except (ValueError, TypeError):
             continue
     
-    return False
-
-# ==================== DUPLICATE HANDLING FUNCTIONS ====================
+    return None
 
-def check_existing_leads_comprehensive(supabase, phone_numbers: List[str]):
-    """Comprehensive check for existing leads in both tables"""
-    try:
-        if not phone_numbers:
-            return {}, {}
-        
-        # Check lead_master table
-        existing_master = supabase.table("lead_master")\
-            .select("*")\
-            .in_("customer_mobile_number", phone_numbers)\
-            .execute()
-        
-        master_records = {row['customer_mobile_number']: row for row in existing_master.data}
-        
-        # Check duplicate_leads table
-        existing_duplicate = supabase.table("duplicate_leads")\
-            .select("*")\
-            .in_("customer_mobile_number", phone_numbers)\
-            .execute()
-        
-        duplicate_records = {row['customer_mobile_number']: row for row in existing_duplicate.data}
-        
-        print(f"📞 Found {len(master_records)} existing in lead_master and {len(duplicate_records)} in duplicate_leads")
-        
-        return master_records, duplicate_records
-        
-    except Exception as e:
-        print(f"❌ Error checking existing leads: {e}")
-        return {}, {}
-
-def find_next_available_source_slot(duplicate_record):
-    """Find the next available source slot (source1, source2, etc.) in duplicate_leads record"""
-    for i in range(1, 11):  # source1 to source10
-        if duplicate_record.get(f'source{i}') is None:
-            return i
-    return None  # All slots are full
-
-def add_source_to_duplicate_record(supabase, duplicate_record, new_source, new_sub_source, new_date):
-    """Add new source to existing duplicate_leads record"""
-    try:
-        slot = find_next_available_source_slot(duplicate_record)
-        if slot is None:
-            print(f"⚠️ All source slots full for phone: {duplicate_record['customer_mobile_number']}")
-            return False
-        
-        # Update the record with new source in the available slot
-        update_data = {
-            f'source{slot}': new_source,
-            f'sub_source{slot}': new_sub_source,
-            f'date{slot}': new_date,
-            'duplicate_count': duplicate_record['duplicate_count'] + 1,
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        supabase.table("duplicate_leads").update(update_data).eq('id', duplicate_record['id']).execute()
-        print(f"✅ Added source{slot} to duplicate record: {duplicate_record['uid']} | Phone: {duplicate_record['customer_mobile_number']} | New Source: {new_source}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to add source to duplicate record: {e}")
+def is_created_since(created_time_str: str, since: datetime) -> bool:
+    """Validate if lead was created between ``since`` (naive UTC) and now"""
+    created_time = parse_created_time(created_time_str)
+    if created_time is None:
         return False
+    return since <= created_time <= datetime.now(timezone.utc).replace(tzinfo=None)
 
-def create_duplicate_record(supabase, original_record, new_source, new_sub_source, new_date):
-    """Create new duplicate_leads record when a lead becomes duplicate"""
-    try:
-        duplicate_data = {
-            'uid': original_record['uid'],
-            'customer_mobile_number': original_record['customer_mobile_number'],
-            'customer_name': original_record['customer_name'],
-            'original_lead_id': original_record['id'],
-            'source1': original_record['source'],
-            'sub_source1': original_record['sub_source'],
-            'date1': original_record['date'],
-            'source2': new_source,
-            'sub_source2': new_sub_source,
-            'date2': new_date,
-            'duplicate_count': 2,
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
+def load_form_watermarks(supabase_client) -> Dict[str, datetime]:
+    """Watermark (naive UTC) of every form synced before"""
+    result = supabase_client.table(SYNC_STATE_TABLE).select('stream_key, watermark') \
+        .eq('source', SYNC_SOURCE).execute()
+    watermarks = {}
+    for row in result.data or []:
+        if row.get('watermark'):
+            watermarks[row['stream_key']] = pd.to_datetime(row['watermark'], utc=True).tz_convert(None).to_pydatetime()
+    return watermarks
+
+def save_form_watermarks(supabase_client, watermarks: Dict[str, datetime]) -> None:
+    """Store new form watermarks with one upsert"""
+    if not watermarks:
+        return
+    now_iso = datetime.now(timezone.utc).isoformat()
+    supabase_client.table(SYNC_STATE_TABLE).upsert([
+        {
+            'source': SYNC_SOURCE,
+            'stream_key': form_id,
+            'watermark': watermark.replace(tzinfo=timezone.utc).isoformat(),
+            'updated_at': now_iso
         }
-        
-        # Initialize remaining slots as None
-        for i in range(3, 11):
-            duplicate_data[f'source{i}'] = None
-            duplicate_data[f'sub_source{i}'] = None
-            duplicate_data[f'date{i}'] = None
-        
-        supabase.table("duplicate_leads").insert(duplicate_data).execute()
-        print(f"✅ Created duplicate record: {original_record['uid']} | Phone: {original_record['customer_mobile_number']} | Sources: {original_record['source']} + {new_source}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to create duplicate record: {e}")
-        return False
+        for form_id, watermark in watermarks.items()
+    ], on_conflict='source,stream_key').execute()
 
-def is_duplicate_source(existing_record, new_source, new_sub_source):
-    """Check if the new source/sub_source combination already exists in the record"""
-    # For lead_master, check direct fields
-    if 'source' in existing_record:
-        return (existing_record['source'] == new_source and 
-                existing_record['sub_source'] == new_sub_source)
-    
-    # For duplicate_leads, check all source slots
-    for i in range(1, 11):
-        if (existing_record.get(f'source{i}') == new_source and 
-            existing_record.get(f'sub_source{i}') == new_sub_source):
-            return True
-    
-    return False
+# ==================== META API CLASS ====================
+
+# Graph API host; point it at a local mock server to test the sync offline
+GRAPH_URL = os.getenv("META_GRAPH_URL", "https://graph.facebook.com")
 
-def insert_lead_safely(supabase, lead_data):
-    """Insert lead with duplicate check at database level"""
+# Requests in flight: the limit starts at META_INITIAL_CONCURRENCY and moves
+# between 1 and META_MAX_CONCURRENCY with the usage the API reports
+META_INITIAL_CONCURRENCY = 4
+META_MAX_CONCURRENCY = 16
+
+# Usage (percent of the app / business use case quota): above HIGH the limit
+# is halved, above CRITICAL it drops to 1, below LOW it grows by one
+USAGE_LOW, USAGE_HIGH, USAGE_CRITICAL = 50, 75, 90
+
+# Retry backoff (seconds) for throttled and failed requests, with jitter
+BACKOFF_BASE, BACKOFF_MAX = 2, 120
+
+# Graph API error codes meaning "rate limited" (sent with HTTP 400/403 as well as 429)
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+
+# Longest time a single form may take to fetch before it is given up (and its watermark kept)
+FORM_FETCH_TIMEOUT = 300
+
+def graph_usage(headers) -> Tuple[float, float]:
+    """
+    Highest usage percentage in the x-app-usage and x-business-use-case-usage
+    headers of a response, and the seconds until access is regained when the
+    business use case is throttled (0 otherwise).
+    """
+    usage, regain_seconds = 0.0, 0.0
     try:
-        # First, check if this exact combination already exists
-        existing = supabase.table("lead_master").select("id").eq(
-            "customer_mobile_number", lead_data['customer_mobile_number']
-        ).eq("source", lead_data['source']).eq("sub_source", lead_data['sub_source']).execute()
-        
-        if existing.data:
-            print(f"⚠️ Database-level duplicate detected: {lead_data['customer_mobile_number']} | {lead_data['source']} | {lead_data['sub_source']}")
-            return False
-        
-        # Insert if no duplicate found
-        supabase.table("lead_master").insert(lead_data).execute()
-        return True
-        
-    except Exception as e:
-        if "duplicate key" in str(e).lower() or "unique constraint" in str(e).lower():
-            print(f"🛡️ Database constraint prevented duplicate: {lead_data['customer_mobile_number']}")
-            return False
-        else:
-            print(f"❌ Database error: {e}")
-            return False
-
-def process_leads_with_duplicates(supabase, unique_leads, master_records, duplicate_records):
-    """Process leads with comprehensive duplicate handling"""
-    new_leads = []
-    updated_duplicates = 0
-    skipped_duplicates = 0
-    sequence_numbers = get_next_sequence_batch(supabase, len(unique_leads))
-    sequence_idx = 0
-    
-    for lead in unique_leads:
-        phone = lead['customer_mobile_number']
-        current_source = lead['source']
-        current_sub_source = lead['sub_source']
-        current_date = lead['date']
-        
-        try:
-            # Check if phone exists in lead_master
-            if phone in master_records:
-                master_record = master_records[phone]
-                
-                # Check if this is a duplicate source/sub_source combination
-                if is_duplicate_source(master_record, current_source, current_sub_source):
-                    print(f"⚠️ Skipping duplicate: {phone} | Source: {current_source}")
-                    skipped_duplicates += 1
-                    continue
-                
-                # Handle duplicate logic
-                if phone in duplicate_records:
-                    duplicate_record = duplicate_records[phone]
-                    
-                    if is_duplicate_source(duplicate_record, current_source, current_sub_source):
-                        print(f"⚠️ Skipping duplicate: {phone} | Source: {current_source}")
-                        skipped_duplicates += 1
-                        continue
-                    
-                    # Add to existing duplicate record
-                    if add_source_to_duplicate_record(supabase, duplicate_record, current_source, current_sub_source, current_date):
-                        updated_duplicates += 1
-                else:
-                    # Create new duplicate record
-                    if create_duplicate_record(supabase, master_record, current_source, current_sub_source, current_date):
-                        updated_duplicates += 1
-            
-            elif phone in duplicate_records:
-                # Phone exists in duplicate_leads but not in lead_master
-                duplicate_record = duplicate_records[phone]
-                
-                if is_duplicate_source(duplicate_record, current_source, current_sub_source):
-                    print(f"⚠️ Skipping duplicate: {phone} | Source: {current_source}")
-                    skipped_duplicates += 1
-                    continue
-                
-                # Add to existing duplicate record
-                if add_source_to_duplicate_record(supabase, duplicate_record, current_source, current_sub_source, current_date):
-                    updated_duplicates += 1
-            
-            else:
-                # Completely new lead - add UID and prepare for insertion
-                lead['uid'] = generate_uid(current_source, phone, sequence_numbers[sequence_idx])
-                sequence_idx += 1
-                new_leads.append(lead)
-                
-        except Exception as e:
-            print(f"❌ Error processing lead {phone}: {e}")
-            continue
-    
-    return new_leads, updated_duplicates, skipped_duplicates
+        app_usage = json.loads(headers.get("x-app-usage") or "{}")
+        usage = max([usage] + [float(app_usage.get(key) or 0) for key in ("call_count", "total_cputime", "total_time")])
+        business_usage = json.loads(headers.get("x-business-use-case-usage") or "{}")
+        for entries in business_usage.values():
+            for entry in entries:
+                usage = max([usage] + [float(entry.get(key) or 0) for key in ("call_count", "total_cputime", "total_time")])
+                regain_seconds = max(regain_seconds, float(entry.get("estimated_time_to_regain_access") or 0) * 60)
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return usage, regain_seconds
 
-def bulk_insert_with_individual_fallback(supabase, leads_data: List[dict], batch_size: int = 100):
-    """Bulk insert with individual fallback and comprehensive duplicate handling"""
-    successful = 0
-    failed = 0
-    
-    if not leads_data:
-        return 0, 0
-    
-    # Process in batches
-    for i in range(0, len(leads_data), batch_size):
-        batch = leads_data[i:i + batch_size]
-        
-        try:
-            # Attempt bulk insert
-            supabase.table("lead_master").insert(batch).execute()
-            successful += len(batch)
-            print(f"✅ Batch inserted: {len(batch)} leads")
-            
-        except Exception as e:
-            print(f"⚠️ Batch insert failed, trying individual inserts...")
-            
-            # Individual insert fallback with duplicate handling
-            for lead in batch:
-                if insert_lead_safely(supabase, lead):
-                    successful += 1
-                    print(f"✅ Inserted: {lead['uid']} | {lead['customer_name']} | {lead['customer_mobile_number']}")
-                else:
-                    failed += 1
-        
-        # Small delay between batches
-        if i + batch_size < len(leads_data):
-            time.sleep(0.2)
-    
-    return successful, failed
+class AdaptiveLimiter:
+    """
+    Semaphore whose size follows the API's headroom. Every response reports
+    its usage through ``observe``; a throttled response calls ``throttle``,
+    which drops the limit to 1 and holds every new request until the
+    backoff has passed.
+    """
+
+    def __init__(self, initial: int = META_INITIAL_CONCURRENCY, maximum: int = META_MAX_CONCURRENCY):
+        self.limit = initial
+        self.maximum = maximum
+        self.in_flight = 0
+        self.peak = 0
+        self.throttled = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
 
-# ==================== META API CLASS (Same as before) ====================
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def observe(self, usage: float):
+        async with self._condition:
+            if usage >= USAGE_CRITICAL:
+                self.limit = 1
+            elif usage >= USAGE_HIGH:
+                self.limit = max(1, self.limit // 2)
+            elif usage < USAGE_LOW:
+                self.limit = min(self.maximum, self.limit + 1)
+            self._condition.notify_all()
+
+    async def throttle(self, seconds: float):
+        async with self._condition:
+            self.limit = 1
+            self.throttled += 1
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
 
 class RobustMetaAPI:
-    def __init__(self, page_token: str):
+    """
+    Graph API client for the lead sync. Use it as an async context manager:
+    all requests share one aiohttp session and go through an AdaptiveLimiter,
+    so concurrency follows the rate-limit headers instead of fixed batches
+    and sleeps.
+    """
+
+    def __init__(self, page_token: str, graph_url: str = GRAPH_URL):
         self.page_token = page_token
         self.api_version = "v21.0"
+        self.graph_url = graph_url.rstrip("/")
         self._campaign_cache = {}
-        self.semaphore = asyncio.Semaphore(3)
+        self.limiter = AdaptiveLimiter()
+        self.session = None
     
-    async def _make_robust_request(self, session, url: str, params: dict = None, max_retries: int = 3) -> dict:
-        """Make API request with robust error handling and retries"""
-        
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=META_MAX_CONCURRENCY, limit_per_host=META_MAX_CONCURRENCY)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60))
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+    
+    async def _make_robust_request(self, url: str, params: dict = None, max_retries: int = 5) -> dict:
+        """
+        GET a Graph API URL and return its JSON body ({} after the retries).
+        Throttled responses back off for Retry-After, the business use case's
+        time to regain access or the jittered exponential delay, whichever is
+        known first; server and network errors retry with the jittered delay.
+        """
         for attempt in range(max_retries):
-            async with self.semaphore:
-                try:
-                    await asyncio.sleep(1 + attempt)
-                    
-                    async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                        
-                        if response.status == 200:
-                            return await response.json()
-                        elif response.status == 429:
-                            retry_after = int(response.headers.get('Retry-After', 300))
-                            print(f"⏳ Rate limited, waiting {retry_after}s...")
-                            await asyncio.sleep(retry_after)
-                            continue
-                        elif response.status == 500:
-                            wait_time = (2 ** attempt) * 5
-                            print(f"⚠️ Server error (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(wait_time)
-                                continue
-                            else:
-                                print(f"❌ Server error after {max_retries} attempts, skipping this request")
-                                return {}
-                        else:
-                            print(f"⚠️ HTTP {response.status} error")
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(2 ** attempt)
-                                continue
-                            return {}
+            try:
+                async with self.limiter:
+                    async with self.session.get(url, params=params) as response:
+                        usage, regain_seconds = graph_usage(response.headers)
+                        body = await response.json(content_type=None)
                 
-                except Exception as e:
-                    print(f"❌ Request error (attempt {attempt + 1}/{max_retries}): {str(e)[:100]}...")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2 ** attempt)
-                        continue
-                    else:
-                        return {}
+                if response.status == 200:
+                    await self.limiter.observe(usage)
+                    return body
+                
+                error_code = (body or {}).get("error", {}).get("code") if isinstance(body, dict) else None
+                if response.status == 429 or error_code in RATE_LIMIT_ERROR_CODES:
+                    retry_after = response.headers.get("Retry-After")
+                    delay = float(retry_after) if retry_after and retry_after.isdigit() else (regain_seconds or backoff_delay(attempt))
+                    print(f"⏳ Rate limited (usage {usage:.0f}%), backing off {delay:.1f}s...")
+                    await self.limiter.throttle(delay)
+                    continue
+                if response.status >= 500:
+                    delay = backoff_delay(attempt)
+                    print(f"⚠️ Server error {response.status} (attempt {attempt + 1}/{max_retries}), retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                    continue
+                print(f"⚠️ HTTP {response.status} error: {str(body)[:100]}")
+                return {}
+            
+            except Exception as e:
+                print(f"❌ Request error (attempt {attempt + 1}/{max_retries}): {str(e)[:100]}...")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(backoff_delay(attempt))
         
+        print(f"❌ Giving up on {url.split('?')[0]} after {max_retries} attempts")
         return {}
     
+    async def iter_pages(self, url: str, params: dict):
+        """
+        Yield the ``data`` list of every page of a Graph API edge, following
+        the cursor ``paging.next`` links one page at a time, so the caller can
+        stop early. Raises IOError when a page cannot be read.
+        """
+        while url:
+            response = await self._make_robust_request(url, params)
+            page = response.get("data")
+            if page is None:
+                raise IOError(f"could not read page of {url.split('?')[0]}")
+            yield page
+            url = response.get("paging", {}).get("next")
+            # The next link already carries the query (and the cursor)
+            params = None
+    
     def get_campaign_name_safe(self, form_id: str, form_name: str) -> str:
         """Safe campaign name generation with caching"""
         if form_id in self._campaign_cache:
@@ -392,136 +300,88 @@ class RobustMetaAPI:
         return result
     
     async def fetch_forms_robust(self):
-        """Fetch forms with robust error handling"""
-        connector = aiohttp.TCPConnector(limit=10, limit_per_host=5)
-        timeout = aiohttp.ClientTimeout(total=60)
+        """Fetch every form of the page with robust error handling"""
+        url = f"{self.graph_url}/{self.api_version}/{PAGE_ID}/leadgen_forms"
+        params = {
+            "access_token": self.page_token,
+            "fields": "id,name,status",
+            "limit": 100
+        }
         
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            url = f"https://graph.facebook.com/{self.api_version}/{PAGE_ID}/leadgen_forms"
-            params = {
-                "access_token": self.page_token,
-                "fields": "id,name,status",
-                "limit": 100
-            }
-            
-            response = await self._make_robust_request(session, url, params)
-            forms = response.get("data", [])
-            
-            enhanced_forms = []
-            for form in forms:
-                try:
-                    campaign_name = self.get_campaign_name_safe(form['id'], form.get('name', f'Form-{form["id"]}'))
-                    enhanced_forms.append({**form, 'campaign_name': campaign_name})
-                except Exception as e:
-                    continue
-            
-            return enhanced_forms
+        enhanced_forms = []
+        try:
+            async for forms in self.iter_pages(url, params):
+                for form in forms:
+                    try:
+                        campaign_name = self.get_campaign_name_safe(form['id'], form.get('name', f'Form-{form["id"]}'))
+                        enhanced_forms.append({**form, 'campaign_name': campaign_name})
+                    except Exception as e:
+                        continue
+        except IOError as e:
+            print(f"⚠️ Form list incomplete: {e}")
+        
+        return enhanced_forms
     
-    async def fetch_form_leads_robust(self, session, form_id: str, since_hours: int = 24):
-        """Fetch leads for a single form with validation"""
+    async def fetch_form_leads_robust(self, form_id: str, since: datetime):
+        """
+        Fetch the leads of a single form created since ``since`` (naive UTC).
+
+        The API returns leads newest first, so paging stops at the first lead
+        older than ``since``. Also returns whether the fetch completed: a form
+        whose pages could not all be read must not advance its watermark.
+        """
+        url = f"{self.graph_url}/{self.api_version}/{form_id}/leads"
+        params = {
+            "access_token": self.page_token,
+            "limit": 100,
+            "since": int(since.replace(tzinfo=timezone.utc).timestamp())
+        }
+        
+        all_leads = []
         try:
-            since_time = int((datetime.now(timezone.utc) - timedelta(hours=since_hours)).timestamp())
-            
-            url = f"https://graph.facebook.com/{self.api_version}/{form_id}/leads"
-            params = {
-                "access_token": self.page_token,
-                "limit": 50,
-                "since": since_time
-            }
-            
-            all_leads = []
-            page_count = 0
-            max_pages = 10
-            consecutive_old_pages = 0
-            
-            while url and page_count < max_pages and consecutive_old_pages < 3:
-                response = await self._make_robust_request(session, url, params)
-                
-                if not response.get("data"):
-                    break
-                
-                leads = response["data"]
-                recent_leads = []
-                
-                # Filter leads to ENSURE they're within 24 hours
-                for lead in leads:
-                    created_time = lead.get("created_time", "")
-                    if is_within_past_24_hours(created_time):
-                        recent_leads.append(lead)
-                
+            async for leads in self.iter_pages(url, params):
+                recent_leads = [lead for lead in leads if is_created_since(lead.get("created_time", ""), since)]
                 all_leads.extend(recent_leads)
-                page_count += 1
-                
-                if not recent_leads:
-                    consecutive_old_pages += 1
-                else:
-                    consecutive_old_pages = 0
-                
-                paging = response.get("paging", {})
-                url = paging.get("next")
-                params = None
-                
-                if not url:
+                if len(recent_leads) < len(leads):
                     break
-                
-                await asyncio.sleep(0.5)
-            
-            return form_id, all_leads
+            return form_id, all_leads, True
             
         except Exception as e:
             print(f"❌ Error fetching leads for form {form_id}: {str(e)[:100]}...")
-            return form_id, []
+            return form_id, all_leads, False
     
-    async def fetch_all_leads_batch_safe(self, form_ids: List[str]):
-        """Fetch all leads in safe batches"""
-        connector = aiohttp.TCPConnector(limit=10, limit_per_host=5)
-        timeout = aiohttp.ClientTimeout(total=120)
-        
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            all_results = {}
-            
-            # Process forms in small batches of 5
-            batch_size = 5
-            for i in range(0, len(form_ids), batch_size):
-                batch = form_ids[i:i + batch_size]
-                batch_num = i // batch_size + 1
-                total_batches = (len(form_ids) + batch_size - 1) // batch_size
-                
-                print(f"📥 Processing batch {batch_num}/{total_batches} ({len(batch)} forms)...")
-                
-                tasks = [self.fetch_form_leads_robust(session, form_id) for form_id in batch]
-                
-                try:
-                    results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True), 
-                        timeout=300
-                    )
-                    
-                    for result in results:
-                        if isinstance(result, tuple) and len(result) == 2:
-                            form_id, leads = result
-                            all_results[form_id] = leads
-                            if leads:
-                                print(f"   ✅ Form {form_id}: {len(leads)} recent leads")
-                        elif isinstance(result, Exception):
-                            print(f"   ❌ Exception: {str(result)[:100]}...")
-                
-                except asyncio.TimeoutError:
-                    print(f"   ⏰ Batch {batch_num} timeout, continuing with next batch...")
-                
-                if i + batch_size < len(form_ids):
-                    wait_time = 5
-                    print(f"   ⏳ Waiting {wait_time}s before next batch...")
-                    await asyncio.sleep(wait_time)
-            
-            return all_results
+    async def fetch_all_leads_batch_safe(self, form_since: Dict[str, datetime]):
+        """
+        Fetch the leads of every form since its own start time. All forms are
+        fetched at once; the limiter decides how many requests run. Returns
+        {form_id: (leads, complete)}.
+        """
+        async def fetch(form_id: str):
+            try:
+                return await asyncio.wait_for(self.fetch_form_leads_robust(form_id, form_since[form_id]),
+                                              timeout=FORM_FETCH_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"   ⏰ Form {form_id} timed out")
+                return form_id, [], False
+        
+        all_results = {}
+        for form_id, leads, complete in await asyncio.gather(*(fetch(form_id) for form_id in form_since)):
+            all_results[form_id] = (leads, complete)
+            if leads:
+                print(f"   ✅ Form {form_id}: {len(leads)} new leads")
+            if not complete:
+                print(f"   ⚠️ Form {form_id}: incomplete fetch, watermark kept")
+        
+        print(f"   📈 Peak concurrency {self.limiter.peak}, final limit {self.limiter.limit}, "
+              f"{self.limiter.throttled} throttled responses")
+        return all_results
 
 def map_lead_with_validation(raw: dict, campaign_name: str) -> Optional[dict]:
-    """Map lead with proper 24-hour validation"""
+    """Map lead with validation (the created_time window is checked while fetching)"""
     try:
         # First validate the timestamp
         created_time = raw.get("created_time", "")
-        if not is_within_past_24_hours(created_time):
+        if parse_created_time(created_time) is None:
             return None
         
         field_data = raw.get("field_data", [])
@@ -599,32 +459,41 @@ async def sync_complete_with_duplicates():
     start_time = time.time()
     
     try:
-        # Initialize API client
-        meta_api = RobustMetaAPI(PAGE_TOKEN)
-        
-        # Step 1: Fetch forms
-        print("📋 Fetching forms...")
-        forms = await meta_api.fetch_forms_robust()
-        
-        if not forms:
-            print("❌ No forms available")
-            return
-        
-        print(f"✅ Found {len(forms)} forms in {time.time() - start_time:.2f}s")
-        
-        # Step 2: Fetch leads
-        print(f"📥 Fetching leads from past 24 hours...")
-        form_leads = await meta_api.fetch_all_leads_batch_safe([f['id'] for f in forms])
+        # One API client (and HTTP session) for forms and leads
+        async with RobustMetaAPI(PAGE_TOKEN) as meta_api:
+            # Step 1: Fetch forms
+            print("📋 Fetching forms...")
+            forms = await meta_api.fetch_forms_robust()
+        
+            if not forms:
+                print("❌ No forms available")
+                return
+        
+            print(f"✅ Found {len(forms)} forms in {time.time() - start_time:.2f}s")
+        
+            # Step 2: Fetch leads newer than each form's watermark
+            watermarks = load_form_watermarks(supabase)
+            default_since = datetime.now(timezone.utc).replace(tzinfo=None) - INITIAL_LOOKBACK
+            form_since = {
+                f['id']: watermarks[f['id']] - WATERMARK_OVERLAP if f['id'] in watermarks else default_since
+                for f in forms
+            }
+            resumed = sum(1 for form_id in form_since if form_id in watermarks)
+            print(f"📥 Fetching new leads ({resumed} forms from their watermark, "
+                  f"{len(form_since) - resumed} from the past {INITIAL_LOOKBACK})...")
+            form_results = await meta_api.fetch_all_leads_batch_safe(form_since)
+        form_leads = {form_id: leads for form_id, (leads, _) in form_results.items()}
         
         total_raw_leads = sum(len(leads) for leads in form_leads.values())
         print(f"✅ Lead fetching completed in {time.time() - start_time:.2f}s")
         print(f"📊 Raw leads collected: {total_raw_leads}")
         
         # Step 3: Process and validate leads
-        print("⚡ Processing leads with 24-hour validation...")
+        print("⚡ Processing leads with validation...")
         all_leads = []
         form_data = {f['id']: f for f in forms}
         leads_by_form = {}
+        form_phones = {}
         
         for form_id, leads in form_leads.items():
             if not leads:
@@ -639,84 +508,63 @@ async def sync_complete_with_duplicates():
                 if mapped_lead and mapped_lead["customer_mobile_number"]:
                     all_leads.append(mapped_lead)
                     form_valid_leads.append(mapped_lead)
+            form_phones[form_id] = {normalize_phone(lead['customer_mobile_number']) for lead in form_valid_leads}
             
             if form_valid_leads:
                 leads_by_form[form_info.get('name', form_id)] = len(form_valid_leads)
         
-        if not all_leads:
-            print("📭 No valid leads from past 24 hours found")
-            return
-        
-        # Print leads by form
-        print(f"\n📊 Valid leads by form (past 24 hours only):")
-        for form_name, count in leads_by_form.items():
-            print(f"   • {form_name}: {count} leads")
-        
-        print(f"\n📊 Total valid leads: {len(all_leads)}")
-        
-        # Step 4: Intra-batch deduplication
-        print("🧹 Removing intra-batch duplicates...")
-        seen_combinations = set()
-        deduplicated_leads = []
-        intra_batch_duplicates = 0
-        
-        for lead in all_leads:
-            phone = lead['customer_mobile_number']
-            source = lead['source']
-            sub_source = lead['sub_source']
-            combination = (phone, source, sub_source)
+        if all_leads:
+            # Print leads by form
+            print(f"\n📊 Valid leads by form:")
+            for form_name, count in leads_by_form.items():
+                print(f"   • {form_name}: {count} leads")
             
-            if combination in seen_combinations:
-                print(f"🔄 Removing intra-batch duplicate: {phone} | Source: {source}")
-                intra_batch_duplicates += 1
-                continue
-            
-            seen_combinations.add(combination)
-            deduplicated_leads.append(lead)
-        
-        if intra_batch_duplicates > 0:
-            print(f"🧹 Removed {intra_batch_duplicates} intra-batch duplicates")
-        
-        print(f"✅ Unique leads after intra-batch deduplication: {len(deduplicated_leads)}")
-        
-        # Step 5: Check existing leads in both tables
-        print("🔍 Comprehensive duplicate checking...")
-        phone_numbers = [lead['customer_mobile_number'] for lead in deduplicated_leads]
-        master_records, duplicate_records = check_existing_leads_comprehensive(supabase, phone_numbers)
-        
-        # Step 6: Process leads with full duplicate handling
-        print("🔄 Processing leads with duplicate management...")
-        new_leads, updated_duplicates, skipped_duplicates = process_leads_with_duplicates(
-            supabase, deduplicated_leads, master_records, duplicate_records
-        )
-        
-        print(f"📝 New leads to insert: {len(new_leads)}")
-        
-        # Step 7: Insert new leads with safe handling
-        if new_leads:
-            print("💾 Inserting new leads...")
-            insert_start = time.time()
-            successful, failed = bulk_insert_with_individual_fallback(supabase, new_leads, batch_size=100)
+            print(f"\n📊 Total valid leads: {len(all_leads)}")
             
+            # Step 4: Deduplicate and write (see lead_dedup.ingest_leads)
+            print("💾 Routing leads against existing phones and writing...")
+            write_start = time.time()
+            results = ingest_leads(
+                supabase, all_leads,
+                uid_for=lambda lead, sequence: generate_uid(lead['source'], lead['customer_mobile_number'], sequence),
+                batch_size=100
+            )
+
             print(f"\n🎯 FINAL RESULTS:")
             print(f"   📥 Total raw leads collected: {total_raw_leads}")
-            print(f"   ✅ Valid 24h leads processed: {len(all_leads)}")
-            print(f"   🔄 After intra-batch deduplication: {len(deduplicated_leads)}")
-            print(f"   ➕ New leads inserted: {successful}")
-            print(f"   🔄 Duplicate sources updated: {updated_duplicates}")
-            print(f"   ⏭️ Duplicate sources skipped: {skipped_duplicates}")
-            print(f"   ❌ Failed insertions: {failed}")
-            print(f"   ⚡ Insert time: {time.time() - insert_start:.2f}s")
-            print(f"   🚀 TOTAL TIME: {time.time() - start_time:.2f}s")
+            print(f"   ✅ Valid new leads processed: {len(all_leads)}")
+            print(f"   🧹 Intra-batch duplicates removed: {results['intra_batch_duplicates']}")
+            print(f"   ➕ New leads inserted: {results['inserted']}")
+            print(f"   🔄 Duplicate sources updated: {results['duplicate_sources']}")
+            print(f"   ⏭️ Duplicate sources skipped: {results['skipped_duplicates']}")
+            if results['slots_full']:
+                print(f"   ⚠️ All source slots full: {results['slots_full']}")
+            print(f"   ❌ Failed writes: {results['failed']}")
+            print(f"   ⚡ Write time: {time.time() - write_start:.2f}s")
+            failed_phones = results['failed_phones']
         else:
-            print("📭 No new leads to insert")
-            print(f"\n🎯 SUMMARY:")
-            print(f"   📥 Total raw leads: {total_raw_leads}")
-            print(f"   ✅ Valid 24h leads: {len(all_leads)}")
-            print(f"   🔄 Duplicate sources updated: {updated_duplicates}")
-            print(f"   ⏭️ Duplicate sources skipped: {skipped_duplicates}")
-            print(f"   🚀 TOTAL TIME: {time.time() - start_time:.2f}s")
-            
+            print("📭 No valid new leads found")
+            failed_phones = set()
+
+        # Step 5: Advance the watermark of each form whose leads were all written;
+        # a form with a failed write keeps its watermark so the next run fetches
+        # its leads again (the ones already stored are skipped as duplicates)
+        new_watermarks, held_back = {}, 0
+        for form_id, (leads, complete) in form_results.items():
+            if not complete:
+                continue
+            if form_phones.get(form_id, set()) & failed_phones:
+                held_back += 1
+                continue
+            created_times = [t for t in (parse_created_time(lead.get('created_time', '')) for lead in leads) if t]
+            if created_times and (form_id not in watermarks or max(created_times) > watermarks[form_id]):
+                new_watermarks[form_id] = max(created_times)
+        save_form_watermarks(supabase, new_watermarks)
+        print(f"🔖 Watermarks advanced for {len(new_watermarks)} forms")
+        if held_back:
+            print(f"⚠️ {held_back} forms with failed writes kept their watermarks")
+        print(f"   🚀 TOTAL TIME: {time.time() - start_time:.2f}s")
+
     except Exception as e:
         print(f"❌ Critical error: {str(e)[:200]}...")
         import traceback
@@ -726,7 +574,7 @@ async def sync_complete_with_duplicates():
 if __name__ == "__main__":
     try:
         print(f"🕐 Current time: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        print(f"📅 Fetching leads from: {(datetime.now(timezone.utc) - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S UTC')} onwards")
+        print(f"📅 Fetching leads newer than each form's watermark (new forms: past {INITIAL_LOOKBACK})")
         print()
         
         asyncio.run(sync_complete_with_duplicates())
@@ -10,6 +10,8 @@ from typing import Dict, List, Optional, Tuple, Any
 from functools import wraps
 import logging
 
+from uid_allocator import APP_SOURCE_CODES, format_uid, get_uid_allocator
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -61,7 +63,7 @@ class OptimizedLeadOperations:
                     'execution_time': time.time() - start_time
                 }
             
-            # 2. Generate UID without database lookup
+            # 2. Generate UID from the leased sequence block (no lookup)
             uid = self._generate_uid_optimized(lead_data['source'], phone)
             lead_data['uid'] = uid
             
@@ -200,22 +202,11 @@ class OptimizedLeadOperations:
 
     def _generate_uid_optimized(self, source: str, phone: str) -> str:
         """
-        Generate UID without database lookup
+        Generate UID without database lookup: the sequence number comes from
+        the block leased by the shared UID allocator
         """
-        import hashlib
-        
-        # Create a deterministic UID based on source and phone
-        src_initial = source[0].upper() if source else 'X'
-        phone_part = phone[-5:] if len(phone) >= 5 else phone.zfill(5)
-        
-        # Add timestamp to ensure uniqueness
-        timestamp = str(int(time.time()))[-4:]
-        
-        # Create hash for additional uniqueness
-        hash_input = f"{source}{phone}{timestamp}"
-        hash_part = hashlib.md5(hash_input.encode()).hexdigest()[:3].upper()
-        
-        return f"{src_initial}-{phone_part}-{hash_part}"
+        sequence = get_uid_allocator(self.supabase).next()
+        return format_uid(APP_SOURCE_CODES.get(source, 'X'), phone, sequence)
 
     def _track_call_attempt_async(self, uid: str, cre_name: str, call_no: str, 
                                  lead_status: str, follow_up_date: Optional[str] = None, 
@@ -0,0 +1,522 @@
+"""
+Query Utilities for Ather CRM System
+This module provides shared Supabase read helpers that avoid pulling whole
+tables into memory in a single request.
+"""
+
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import g, has_request_context
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _apply_filter_spec(query, filters: Optional[Dict[str, Any]]):
+    """
+    Apply a filter spec (as used by count_rows and iter_table_chunks) to a query.
+
+    Plain values are equality filters (None is skipped, as in safe_get_data);
+    ``(operator, criteria)`` tuples are passed through as PostgREST operators,
+    e.g. ``('gte', '2024-01-01')`` or ``('not.is', 'null')``.
+    """
+    if filters:
+        for column, value in filters.items():
+            if isinstance(value, tuple):
+                operator, criteria = value
+                query = query.filter(column, operator, criteria)
+            elif value is not None:
+                query = query.eq(column, value)
+    return query
+
+
+def _with_columns(select_fields: str, columns: List[str]) -> str:
+    """Make sure the projection contains the columns needed for the cursor"""
+    if select_fields.strip() == '*':
+        return select_fields
+    selected = [c.strip() for c in select_fields.split(',') if c.strip()]
+    for column in columns:
+        if column not in selected:
+            selected.append(column)
+    return ','.join(selected)
+
+
+def iter_table_chunks(supabase_client, table_name: str, filters: Optional[Dict[str, Any]] = None,
+                      select_fields: str = '*', order_by: str = 'id',
+                      chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      query_hook: Optional[Callable] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield rows of a table in chunks using keyset pagination.
+
+    Pages are fetched with ``order_by > last_value`` instead of OFFSET so every
+    page costs the same regardless of depth. When ``order_by`` is not unique
+    (e.g. ``created_at``) ``id`` is used as tie-breaker so no row is skipped or
+    repeated. ``filters`` follows _apply_filter_spec (equality values or
+    ``(operator, criteria)`` tuples); ``query_hook`` may add extra predicates
+    to every page query.
+    """
+    cursor_columns = [order_by] if order_by == 'id' else [order_by, 'id']
+    projection = _with_columns(select_fields, cursor_columns)
+    last_row = None
+
+    while True:
+        query = supabase_client.table(table_name).select(projection)
+        query = _apply_filter_spec(query, filters)
+        if query_hook:
+            query = query_hook(query)
+
+        if last_row is not None:
+            if order_by == 'id':
+                query = query.gt('id', last_row['id'])
+            elif last_row.get(order_by) is None:
+                # NULLs sort last, so only the remaining NULL rows are left
+                query = query.is_(order_by, 'null').gt('id', last_row['id'])
+            else:
+                last_value = last_row.get(order_by)
+                # (order_by, id) > (last_value, last_id) expressed as a PostgREST
+                # logic tree; NULL cursor values sort last so they always follow
+                query.params = query.params.add(
+                    'or',
+                    f'({order_by}.gt."{last_value}",'
+                    f'and({order_by}.eq."{last_value}",id.gt.{last_row["id"]}),'
+                    f'{order_by}.is.null)'
+                )
+
+        query = query.order(','.join(cursor_columns)).limit(chunk_size)
+        rows = query.execute().data or []
+        if not rows:
+            break
+
+        yield rows
+
+        if len(rows) < chunk_size:
+            break
+        last_row = rows[-1]
+
+
+def iter_table_rows(supabase_client, table_name: str, filters: Optional[Dict[str, Any]] = None,
+                    select_fields: str = '*', order_by: str = 'id',
+                    chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    query_hook: Optional[Callable] = None) -> Iterator[Dict[str, Any]]:
+    """Yield rows one by one on top of iter_table_chunks"""
+    for chunk in iter_table_chunks(supabase_client, table_name, filters, select_fields,
+                                   order_by, chunk_size, query_hook):
+        for row in chunk:
+            yield row
+
+
+def date_range_hook(column: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                    include_null: bool = False) -> Optional[Callable]:
+    """
+    Build a ``query_hook`` restricting ``column`` to the days [start_date, end_date].
+
+    The end bound is exclusive on the following day, so timestamp columns keep
+    every row of the last day. With ``include_null`` rows without a value are
+    kept too. Returns None when there is nothing to restrict.
+    """
+    if start_date is None and end_date is None:
+        return None
+
+    bounds = []
+    if start_date is not None:
+        bounds.append(('gte', start_date.isoformat()))
+    if end_date is not None:
+        bounds.append(('lt', (end_date + timedelta(days=1)).isoformat()))
+
+    def hook(query):
+        if include_null:
+            in_range = ','.join(f'{column}.{operator}.{value}' for operator, value in bounds)
+            query.params = query.params.add('or', f'({column}.is.null,and({in_range}))')
+            return query
+        for operator, value in bounds:
+            query = query.filter(column, operator, value)
+        return query
+
+    return hook
+
+
+def quote_logic_value(value: Any) -> str:
+    """Double-quote a value for a PostgREST logic tree, so commas, dots and parentheses are literal"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def date_range_conditions(column: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                          include_null: bool = False) -> List[str]:
+    """
+    date_range_hook as PostgREST logic-tree conditions (for conditions_hook):
+    ``column`` within the days [start_date, end_date], or NULL with
+    ``include_null``. Empty when there is nothing to restrict.
+    """
+    if start_date is None and end_date is None:
+        return []
+    bounds = []
+    if start_date is not None:
+        bounds.append(f'{column}.gte.{start_date.isoformat()}')
+    if end_date is not None:
+        bounds.append(f'{column}.lt.{(end_date + timedelta(days=1)).isoformat()}')
+    if include_null:
+        return [f'or({column}.is.null,and({",".join(bounds)}))']
+    return bounds
+
+
+def conditions_hook(conditions: List[str]) -> Optional[Callable]:
+    """
+    Build a ``query_hook`` ANDing PostgREST logic-tree conditions such as
+    ``'final_status.eq.Won'`` or ``'or(lead_status.is.null,lead_status.eq.RNR)'``
+    into one ``and`` parameter. Returns None when there are no conditions.
+    """
+    if not conditions:
+        return None
+
+    def hook(query):
+        query.params = query.params.add('and', f'({",".join(conditions)})')
+        return query
+
+    return hook
+
+
+def first_date_range_hook(columns: List[str], start_date: Optional[date] = None,
+                          end_date: Optional[date] = None) -> Optional[Callable]:
+    """
+    Like date_range_hook, but on the first non-NULL column of ``columns``
+    (SQL ``COALESCE(columns...)``), e.g. ``['date', 'created_at']`` for leads
+    whose ``date`` may be missing. Rows where every column is NULL are excluded.
+    """
+    if start_date is None and end_date is None:
+        return None
+
+    bounds = []
+    if start_date is not None:
+        bounds.append(('gte', start_date.isoformat()))
+    if end_date is not None:
+        bounds.append(('lt', (end_date + timedelta(days=1)).isoformat()))
+
+    branches = []
+    for i, column in enumerate(columns):
+        conditions = [f'{previous}.is.null' for previous in columns[:i]]
+        conditions += [f'{column}.{operator}.{value}' for operator, value in bounds]
+        branches.append(f'and({",".join(conditions)})')
+
+    def hook(query):
+        query.params = query.params.add('or', f'({",".join(branches)})')
+        return query
+
+    return hook
+
+
+def parse_day(value: Any) -> Optional[date]:
+    """
+    Date of a date/timestamp value as stored by Supabase ('2024-05-01',
+    '2024-05-01T10:00:00+00:00', '2024-05-01 10:00:00'), or None.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+# Named date periods accepted by resolve_date_window (aliases used by the templates)
+_PERIOD_ALIASES = {'this_week': 'week', 'this_month': 'mtd', 'custom': 'range'}
+_TRAILING_PERIOD_DAYS = {'month': 30, 'quarter': 90, 'year': 365}
+
+
+def resolve_date_window(period: Optional[str], start_date: Any = None, end_date: Any = None,
+                        today: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Turn a named period into inclusive ``(start, end)`` dates for date_range_hook.
+
+    Periods: today, yesterday, week/this_week (since Monday), mtd/this_month,
+    last_month, month/quarter/year (trailing 30/90/365 days) and range/custom
+    (``start_date``/``end_date`` as YYYY-MM-DD strings or dates; a missing or
+    invalid bound is open). Anything else, including 'all', is ``(None, None)``.
+    """
+    today = today or date.today()
+    period = _PERIOD_ALIASES.get(period, period)
+
+    if period == 'today':
+        return today, today
+    if period == 'yesterday':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+    if period == 'week':
+        return today - timedelta(days=today.weekday()), today
+    if period == 'mtd':
+        return today.replace(day=1), today
+    if period == 'last_month':
+        last_month_end = today.replace(day=1) - timedelta(days=1)
+        return last_month_end.replace(day=1), last_month_end
+    if period in _TRAILING_PERIOD_DAYS:
+        return today - timedelta(days=_TRAILING_PERIOD_DAYS[period]), today
+    if period == 'range':
+        return parse_day(start_date), parse_day(end_date)
+    return None, None
+
+
+def count_rows(supabase_client, table_name: str, filters: Optional[Dict[str, Any]] = None,
+               count: str = 'exact', query_hook: Optional[Callable] = None) -> int:
+    """
+    Count rows with a PostgREST count header instead of downloading them.
+
+    ``count`` may be 'exact', 'planned' (planner estimate, cheap on very large
+    tables) or 'estimated'. ``query_hook`` may add extra predicates, as in
+    iter_table_chunks. At most one row is transferred.
+    """
+    query = supabase_client.table(table_name).select('*', count=count)
+    query = _apply_filter_spec(query, filters)
+    if query_hook:
+        query = query_hook(query)
+    result = query.limit(1).execute()
+    return result.count or 0
+
+
+# Operators understood by the crm_count_many database function
+_COUNT_RPC_OPERATORS = {'eq', 'neq', 'gt', 'gte', 'lt', 'lte', 'is', 'not.is'}
+_count_rpc_available = True
+
+
+def _spec_to_rpc(table_name: str, filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Serialize a (table, filters) spec for crm_count_many, or None if unsupported"""
+    rpc_filters = []
+    for column, value in (filters or {}).items():
+        if isinstance(value, tuple):
+            operator, criteria = value
+            if operator not in _COUNT_RPC_OPERATORS:
+                return None
+            if operator in ('is', 'not.is') and str(criteria).lower() != 'null':
+                return None
+            rpc_filters.append([column, operator, criteria])
+        elif value is not None:
+            rpc_filters.append([column, 'eq', value])
+    return {'table': table_name, 'filters': rpc_filters}
+
+
+def count_many(supabase_client, specs: List[Any], count: str = 'exact') -> List[int]:
+    """
+    Resolve several counts at once.
+
+    ``specs`` is a list of ``(table_name, filters)`` pairs using the same filter
+    format as count_rows. Exact counts are resolved in a single round trip via
+    the ``crm_count_many`` database function (see database_optimization.sql);
+    if that function is not installed, or ``count`` is not 'exact', each spec
+    falls back to its own count_rows call.
+    """
+    global _count_rpc_available
+
+    if not specs:
+        return []
+
+    if count == 'exact' and _count_rpc_available:
+        rpc_specs = [_spec_to_rpc(table_name, filters) for table_name, filters in specs]
+        if all(spec is not None for spec in rpc_specs):
+            try:
+                result = supabase_client.rpc('crm_count_many', {'specs': rpc_specs}).execute()
+                if isinstance(result.data, list) and len(result.data) == len(specs):
+                    return [int(value or 0) for value in result.data]
+                logger.warning("crm_count_many returned an unexpected payload, counting individually")
+            except Exception as e:
+                if 'PGRST202' in str(e) or '42883' in str(e):
+                    # Function not deployed: stop trying for the life of the process
+                    _count_rpc_available = False
+                logger.warning(f"crm_count_many failed, counting individually: {e}")
+
+    return [count_rows(supabase_client, table_name, filters, count) for table_name, filters in specs]
+
+
+class RequestQueryCache:
+    """
+    Request-scoped memo of Supabase reads, stored on ``flask.g``.
+
+    Identical reads (same table, filters and projection) within one request are
+    served from memory. Any write to a table drops that table's entries so a
+    read issued after a write always sees fresh data. Outside a request context
+    the cache is a no-op.
+    """
+
+    def __init__(self, attr_name: str = '_query_memo'):
+        self.attr_name = attr_name
+
+    def _store(self) -> Optional[Dict[Any, Any]]:
+        if not has_request_context():
+            return None
+        store = getattr(g, self.attr_name, None)
+        if store is None:
+            store = {}
+            setattr(g, self.attr_name, store)
+        return store
+
+    @staticmethod
+    def make_key(table_name: str, filters: Optional[Dict[str, Any]] = None, *extra: Any) -> tuple:
+        """Build a hashable key from table, filters and any other query arguments"""
+        frozen_filters = tuple(sorted((str(k), repr(v)) for k, v in (filters or {}).items()))
+        return (table_name, frozen_filters) + tuple(repr(e) for e in extra)
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the memoized rows, or None on a miss"""
+        store = self._store()
+        if store is None or key not in store:
+            return None
+        # Shallow-copy rows so callers annotating them do not leak into later reads
+        return [dict(row) for row in store[key]]
+
+    def set(self, key: tuple, rows: List[Dict[str, Any]]) -> None:
+        store = self._store()
+        if store is not None:
+            store[key] = [dict(row) for row in rows]
+
+    def invalidate(self, table_name: str) -> None:
+        """Drop every memoized read of ``table_name`` in the current request"""
+        store = self._store()
+        if store:
+            for key in [k for k in store if k[0] == table_name]:
+                del store[key]
+
+
+class TTLCache:
+    """
+    Process-wide cache of computed values with a time-to-live.
+
+    Unlike the Flask session (one copy per browser, sent with every request)
+    entries are shared by all requests of the worker process. Entries can be
+    dropped selectively with ``invalidate`` when the data behind them is
+    written.
+
+    A value computed while a write commits may predate it. Callers take
+    ``generation()`` before computing and pass it to ``set``, which then
+    drops the value if anything was invalidated in between.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        """Counter bumped by every invalidate() call"""
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: Any, value: Any, generation: Optional[int] = None) -> None:
+        """Store ``value``, unless ``generation`` is given and an invalidation happened since"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if len(self._entries) >= self.max_entries:
+                # Drop expired entries first, then the ones closest to expiry
+                now = time.monotonic()
+                for stale_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+                    del self._entries[stale_key]
+                while len(self._entries) >= self.max_entries:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, match: Optional[Callable[[Any], bool]] = None) -> None:
+        """Drop the entries whose key satisfies ``match`` (all entries if None)"""
+        with self._lock:
+            self._generation += 1
+            if match is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if match(k)]:
+                    del self._entries[key]
+
+
+def branch_write_invalidator(branch_columns: Dict[str, str],
+                             caches: List[TTLCache]) -> Callable[[str, str, Any], None]:
+    """
+    Build an ``on_write(table_name, method_name, payload)`` callback (for
+    track_table_writes with ``pass_payload``) for caches keyed by branch first.
+
+    ``branch_columns`` maps each table to its branch column. An insert whose
+    rows all name a branch drops only those branches' entries. Updates,
+    upserts, deletes and inserts without a branch may touch rows of any
+    branch, so they drop every entry. Writes to other tables are ignored.
+    """
+    def invalidate(table_name: str, method_name: str, payload: Any) -> None:
+        branch_column = branch_columns.get(table_name)
+        if not branch_column:
+            return
+        rows = payload if isinstance(payload, list) else [payload]
+        branches = {row.get(branch_column) for row in rows if isinstance(row, dict)}
+        for cache in caches:
+            if method_name != 'insert' or not branches or None in branches:
+                cache.invalidate()
+            else:
+                cache.invalidate(lambda key: key[0] in branches)
+
+    return invalidate
+
+
+def track_table_writes(supabase_client, on_write: Callable[..., None], pass_payload: bool = False) -> None:
+    """
+    Call ``on_write(table_name)`` after a write query on a table has executed.
+
+    Wraps ``client.table`` in place so the builders returned by
+    insert/update/upsert/delete notify the callback once their ``execute()``
+    returns (used to invalidate RequestQueryCache). Notifying only after the
+    write commits keeps a concurrent request from refilling a cache with the
+    pre-write data in between; a failed write notifies nobody. With
+    ``pass_payload`` the callback is called as
+    ``on_write(table_name, method_name, payload)``, where payload is the row
+    or list of rows written (None for delete). Can be applied several times
+    to the same client to register several callbacks.
+    """
+    original_table = supabase_client.table
+
+    def notify_after_execute(method, table_name, method_name):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            builder = method(*args, **kwargs)
+            payload = args[0] if args else kwargs.get('json')
+            execute = builder.execute
+
+            # Filter methods return the builder itself, so the wrapped execute
+            # survives chained .eq()/.in_() calls
+            @wraps(execute)
+            def execute_and_notify(*execute_args, **execute_kwargs):
+                result = execute(*execute_args, **execute_kwargs)
+                if pass_payload:
+                    on_write(table_name, method_name, payload)
+                else:
+                    on_write(table_name)
+                return result
+
+            builder.execute = execute_and_notify
+            return builder
+        return wrapper
+
+    @wraps(original_table)
+    def table(table_name: str):
+        builder = original_table(table_name)
+        for method_name in ('insert', 'update', 'upsert', 'delete'):
+            setattr(builder, method_name, notify_after_execute(getattr(builder, method_name), table_name, method_name))
+        return builder
+
+    supabase_client.table = table
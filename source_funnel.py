@@ -0,0 +1,184 @@
+"""
+Source Funnel for Ather CRM System
+This module builds the source analysis table (calls allocated, attempted and
+connected, pending and closed-lost breakdowns, sales pipeline) for any list of
+sources. Each lead is mapped once to a source index through the categorical
+codes of its ``source`` column, and the whole source × metric matrix is then
+summed in one group-by, so the work grows with the number of leads rather than
+leads × sources.
+"""
+
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+CALL_ORDINALS = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh')
+
+DEFAULT_SOURCES = (
+    'Google (KNOW)', 'Google', 'Meta(KNOW)', 'Know', 'OEM Web', 'OEM Tele',
+    'Affiliate Bikewale', 'Affiliate 91wheels', 'Affiliate Bikedekho',
+    'BTL (KNOW)', 'Meta'
+)
+
+# Call statuses that do not count as a connected call
+NOT_CONNECTED_STATUSES = ('rnr', 'busy', 'busy on another call')
+
+# Pending lead_status -> metric (all of them also count in pending_total)
+PENDING_STATUS_METRICS = {
+    'interested': 'pending_interested',
+    'call back': 'pending_callback',
+    'rnr': 'pending_rnr',
+    'call disconnected': 'pending_disconnected',
+}
+
+# lead_category of interested leads -> metric
+INTERESTED_CATEGORY_METRICS = {
+    'hot': 'pending_hot',
+    'warm': 'pending_warm',
+    'cold': 'pending_cold',
+}
+
+# lead_status of lost leads (the lost reason) -> metric
+LOST_REASON_METRICS = {
+    'lost to competition': 'closed_lost_competition',
+    'not interested': 'closed_lost_not_interested',
+    'did not enquire': 'closed_lost_did_not_enquire',
+    'wrong lead': 'closed_lost_wrong_lead',
+    'rnr-lost': 'closed_lost_rnr_lost',
+    'finance rejected': 'closed_lost_finance_reject',
+    'lost to co-dealer': 'closed_lost_co_dealer',
+}
+
+FUNNEL_METRICS = (
+    'calls_allocated', 'calls_attempted', 'calls_connected',
+    'pending_total', 'pending_interested', 'pending_hot', 'pending_warm', 'pending_cold',
+    'pending_callback', 'pending_rnr', 'pending_disconnected',
+    'closed_lost_total', 'closed_lost_competition', 'closed_lost_not_interested',
+    'closed_lost_did_not_enquire', 'closed_lost_wrong_lead', 'closed_lost_rnr_lost',
+    'closed_lost_finance_reject', 'closed_lost_co_dealer',
+    'sales_pipeline_total',
+)
+
+
+def match_source(value: Any, sources: Sequence[str]) -> int:
+    """
+    Index of the funnel source a lead source belongs to, or -1.
+
+    An exact (case-insensitive) match wins; otherwise the first source whose
+    name is contained in the lead source.
+    """
+    text = str(value or '').strip().lower()
+    lowered = [source.lower() for source in sources]
+    if text in lowered:
+        return lowered.index(text)
+    for index, source in enumerate(lowered):
+        if source in text:
+            return index
+    return -1
+
+
+def _source_codes(series: pd.Series, sources: Sequence[str]) -> np.ndarray:
+    """Funnel source index per row, matching each distinct source value only once"""
+    categorical = series.astype('category')
+    lookup = np.array([match_source(value, sources) for value in categorical.cat.categories] + [-1], dtype=np.int64)
+    # Missing values have code -1, which picks the trailing -1 of the lookup
+    return lookup[categorical.cat.codes.to_numpy()]
+
+
+def _normalized(series: pd.Series) -> pd.Series:
+    """Stripped, lower-cased text ('' for missing values)"""
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip().str.lower()
+
+
+def build_source_funnel(leads: pd.DataFrame, latest_followups: Optional[pd.DataFrame] = None,
+                        sources: Sequence[str] = DEFAULT_SOURCES) -> Dict[str, Dict[str, Any]]:
+    """
+    Source funnel for ``leads`` (lead_master rows with ``uid``, ``source``,
+    ``lead_status``, ``lead_category``, ``final_status`` and the call date
+    columns; ``{ordinal}_call_status`` columns are used when present).
+
+    ``latest_followups`` holds the latest ps_followup_master row per lead
+    (``lead_uid``, ``final_status``, ``lead_status``, ``remark``); its
+    statuses override the lead's own when set.
+
+    Returns ``{source: {metric: count, 'call_progress': {uid: ordinal},
+    'latest_remark': str}}`` for every source plus a 'Total' row, in plain
+    Python types.
+    """
+    sources = list(sources)
+    codes = _source_codes(leads['source'], sources)
+    matched = codes >= 0
+    leads = leads[matched]
+    codes = codes[matched]
+
+    call_date_columns = [f'{c}_call_date' for c in CALL_ORDINALS]
+    call_dates = leads[call_date_columns].notna().to_numpy()
+    status_columns = [f'{c}_call_status' for c in CALL_ORDINALS if f'{c}_call_status' in leads.columns]
+
+    lead_status = _normalized(leads['lead_status'])
+    lead_category = _normalized(leads['lead_category'])
+    latest_final_status = _normalized(leads['final_status'])
+    latest_lead_status = lead_status
+
+    has_followup = np.zeros(len(leads), dtype=bool)
+    remarks = pd.Series([None] * len(leads), index=leads.index, dtype=object)
+    if latest_followups is not None and len(latest_followups):
+        followups = latest_followups.drop_duplicates('lead_uid', keep='last').set_index('lead_uid')
+        uids = leads['uid']
+        has_followup = uids.isin(followups.index).to_numpy()
+        followup_final = _normalized(uids.map(followups['final_status']))
+        followup_status = _normalized(uids.map(followups['lead_status']))
+        latest_final_status = followup_final.where(followup_final != '', latest_final_status)
+        latest_lead_status = followup_status.where(followup_status != '', latest_lead_status)
+        remarks = uids.map(followups['remark']).astype(object)
+
+    flags = {
+        'calls_allocated': np.ones(len(leads), dtype=bool),
+        'calls_attempted': call_dates.any(axis=1),
+        'calls_connected': np.zeros(len(leads), dtype=bool),
+    }
+    for column in status_columns:
+        status = _normalized(leads[column])
+        flags['calls_connected'] |= ((status != '') & ~status.isin(NOT_CONNECTED_STATUSES)).to_numpy()
+
+    flags['pending_total'] = lead_status.isin(PENDING_STATUS_METRICS).to_numpy()
+    for status, metric in PENDING_STATUS_METRICS.items():
+        flags[metric] = (lead_status == status).to_numpy()
+    for category, metric in INTERESTED_CATEGORY_METRICS.items():
+        flags[metric] = flags['pending_interested'] & (lead_category == category).to_numpy()
+
+    is_lost = (latest_final_status == 'lost').to_numpy()
+    flags['closed_lost_total'] = is_lost
+    for reason, metric in LOST_REASON_METRICS.items():
+        flags[metric] = is_lost & (latest_lead_status == reason).to_numpy()
+    flags['sales_pipeline_total'] = (latest_final_status == 'won').to_numpy()
+
+    # The whole source x metric matrix in one group-by over the source codes
+    matrix = (pd.DataFrame({metric: flags[metric].astype(np.int64) for metric in FUNNEL_METRICS})
+              .groupby(codes).sum()
+              .reindex(range(len(sources)), fill_value=0))
+
+    data = {}
+    for index, source in enumerate(sources):
+        data[source] = {metric: int(matrix.at[index, metric]) for metric in FUNNEL_METRICS}
+        data[source]['call_progress'] = {}
+        data[source]['latest_remark'] = ''
+
+    # Furthest call reached per lead (only leads with at least one call date)
+    furthest = len(CALL_ORDINALS) - 1 - np.argmax(call_dates[:, ::-1], axis=1)
+    for code, uid, reached, attempted in zip(codes, leads['uid'], furthest, flags['calls_attempted']):
+        if attempted and pd.notna(uid):
+            data[sources[code]]['call_progress'][uid] = CALL_ORDINALS[reached].capitalize()
+
+    # Remark of the last lead per source that has a follow-up
+    if has_followup.any():
+        last_rows = pd.Series(np.flatnonzero(has_followup)).groupby(codes[has_followup]).last()
+        for code, row in last_rows.items():
+            remark = remarks.iloc[row]
+            data[sources[code]]['latest_remark'] = None if pd.isna(remark) else remark
+
+    data['Total'] = {metric: int(matrix[metric].sum()) for metric in FUNNEL_METRICS}
+    data['Total']['call_progress'] = {}
+    data['Total']['latest_remark'] = {}
+    return data
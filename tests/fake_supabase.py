@@ -0,0 +1,271 @@
+"""
+In-memory stand-in for the parts of the Supabase client the CRM modules use:
+select with counts, filters, PostgREST logic trees in ``and``/``or``
+parameters, order, limit and offset, IN lookups, and insert, upsert, update
+and delete, the crm_count_many RPC of query_utils and the lease_uid_blocks
+RPC of uid_allocator.
+"""
+
+import fnmatch
+
+import httpx
+
+
+def split_list(text):
+    """Split ``a,b(c,d),"e,f"`` at top-level commas"""
+    parts, depth, quoted, escaped, current = [], 0, False, False, ''
+    for char in text:
+        if escaped:
+            current += char
+            escaped = False
+            continue
+        if char == '\\' and quoted:
+            current += char
+            escaped = True
+            continue
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+def _compare(value, operator, criteria):
+    if operator == 'is':
+        return value is None if criteria == 'null' else value == (criteria == 'true')
+    if operator == 'in':
+        return value is not None and str(value) in [unquote(v) for v in split_list(criteria[1:-1])]
+    if value is None:
+        return False
+    criteria = unquote(criteria)
+    text = str(value)
+    if operator == 'eq':
+        return text == criteria
+    if operator == 'neq':
+        return text != criteria
+    if operator in ('like', 'ilike'):
+        pattern = criteria.replace('*', '%').replace('%', '*')
+        if operator == 'ilike':
+            return fnmatch.fnmatchcase(text.lower(), pattern.lower())
+        return fnmatch.fnmatchcase(text, pattern)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        text, criteria = value, float(criteria)
+    return {'gt': text > criteria, 'gte': text >= criteria, 'lt': text < criteria, 'lte': text <= criteria}[operator]
+
+
+def matches(row, condition):
+    """Evaluate one PostgREST logic-tree condition (``col.op.value``, ``or(...)``, ``and(...)``) on a row"""
+    for tree, combine in (('or(', any), ('and(', all), ('not.or(', None), ('not.and(', None)):
+        if condition.startswith(tree):
+            inner = [matches(row, part) for part in split_list(condition[len(tree):-1])]
+            if combine is None:
+                return not (any(inner) if 'or(' in tree else all(inner))
+            return combine(inner)
+    column, rest = condition.split('.', 1)
+    negate = rest.startswith('not.')
+    if negate:
+        rest = rest[4:]
+    operator, criteria = rest.split('.', 1)
+    # SQL: a comparison with NULL is never true, negated or not
+    if row.get(column) is None and operator != 'is':
+        return False
+    result = _compare(row.get(column), operator, criteria)
+    return not result if negate else result
+
+
+def _sort_rows(rows, order):
+    for part in reversed(order.split(',')):
+        pieces = part.split('.')
+        column, descending = pieces[0], 'desc' in pieces
+        nulls_first = 'nullsfirst' in pieces or (descending and 'nullslast' not in pieces)
+        present = [row for row in rows if row.get(column) is not None]
+        missing = [row for row in rows if row.get(column) is None]
+        present.sort(key=lambda row: row[column], reverse=descending)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+class Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.params = httpx.QueryParams()
+        self.fields = '*'
+        self.count = None
+        self.conditions = []
+        self.order_by = None
+        self.limit_to = None
+        self.action = 'select'
+        self.payload = None
+        self.on_conflict = None
+        self.negate = False
+
+    def select(self, fields='*', count=None):
+        self.fields, self.count = fields, count
+        return self
+
+    def insert(self, rows, returning=None):
+        self.action, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict=None, returning=None):
+        self.action, self.payload, self.on_conflict = 'upsert', rows, on_conflict
+        return self
+
+    def update(self, values, count=None, returning=None):
+        self.action, self.payload, self.count = 'update', values, count
+        return self
+
+    def delete(self, returning=None):
+        self.action = 'delete'
+        return self
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def filter(self, column, operator, criteria):
+        prefix = 'not.' if self.negate else ''
+        self.negate = False
+        self.conditions.append(f'{column}.{prefix}{operator}.{criteria}')
+        return self
+
+    def eq(self, column, value):
+        return self.filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self.filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self.filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self.filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self.filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self.filter(column, 'lte', value)
+
+    def is_(self, column, value):
+        return self.filter(column, 'is', value)
+
+    def in_(self, column, values):
+        return self.filter(column, 'in', '(' + ','.join(f'"{value}"' for value in values) + ')')
+
+    def order(self, column, desc=False, nullsfirst=False):
+        self.order_by = column + ('.desc' if desc else '') + ('.nullsfirst' if nullsfirst else '')
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def execute(self):
+        self.client.queries.append(self)
+        conditions = list(self.conditions)
+        for key, value in self.params.multi_items():
+            if key in ('and', 'or'):
+                conditions.append(f'{key}{value}')
+        table = self.client.tables.setdefault(self.table, [])
+        if self.action in ('insert', 'upsert'):
+            return Result(self.client.write(self.table, self.payload, self.on_conflict))
+        rows = [row for row in table if all(matches(row, condition) for condition in conditions)]
+        if self.action == 'update':
+            for row in rows:
+                row.update(self.payload)
+            return Result([dict(row) for row in rows], len(rows) if self.count else None)
+        if self.action == 'delete':
+            self.client.tables[self.table] = [row for row in table if not any(row is match for match in rows)]
+            return Result([dict(row) for row in rows])
+        total = len(rows)
+        if self.order_by:
+            rows = _sort_rows(rows, self.order_by)
+        offset = int(self.params.get('offset', 0))
+        rows = rows[offset:]
+        if self.limit_to is not None:
+            rows = rows[:self.limit_to]
+        if self.fields.strip() != '*':
+            columns = [field.strip() for field in self.fields.split(',') if field.strip()]
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return Result([dict(row) for row in rows], total if self.count else None)
+
+
+class FakeRPC:
+    def __init__(self, data):
+        self.data = data
+
+    def execute(self):
+        return Result(self.data)
+
+
+class FakeSupabase:
+    def __init__(self, tables, reject=None):
+        self.tables = tables
+        self.queries = []
+        # reject(table, row) -> True makes a write containing that row fail
+        self.reject = reject
+        self.next_block = 0
+        self.rpcs = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        self.rpcs.append(name)
+        if name == 'crm_count_many':
+            return FakeRPC([self.count_spec(spec) for spec in params['specs']])
+        assert name == 'lease_uid_blocks'
+        starts = [self.next_block + 100 * block for block in range(params['p_blocks'])]
+        self.next_block += 100 * params['p_blocks']
+        return FakeRPC(starts)
+
+    def count_spec(self, spec):
+        """Row count for one crm_count_many spec: ``{'table': ..., 'filters': [[column, operator, value]]}``"""
+        conditions = [f'{column}.{operator}.{value}' for column, operator, value in spec['filters']]
+        return sum(all(matches(row, condition) for condition in conditions) for row in self.tables.get(spec['table'], []))
+
+    def write(self, table_name, rows, on_conflict=None):
+        """Insert rows (upsert on the ``on_conflict`` columns), assigning ids to new rows"""
+        table = self.tables.setdefault(table_name, [])
+        rows = rows if isinstance(rows, list) else [rows]
+        if self.reject and any(self.reject(table_name, row) for row in rows):
+            raise RuntimeError(f'write to {table_name} rejected')
+        keys = on_conflict.split(',') if on_conflict else None
+        written = []
+        for row in rows:
+            existing = None
+            if keys:
+                existing = next((old for old in table if all(old.get(k) == row.get(k) for k in keys)), None)
+            if existing is not None:
+                existing.update(row)
+                written.append(dict(existing))
+                continue
+            new = dict(row)
+            new.setdefault('id', max((old.get('id') or 0 for old in table), default=0) + 1)
+            table.append(new)
+            written.append(dict(new))
+        return written
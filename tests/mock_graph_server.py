@@ -0,0 +1,128 @@
+"""
+Local stand-in for the Graph API endpoints the Meta sync reads: the page's
+leadgen_forms and each form's leads, newest first, with cursor paging
+(``paging.next``). Responses carry x-app-usage headers, and faults can be
+queued to answer the next requests with a 429, a Graph rate-limit error code
+or a server error.
+
+    python tests/mock_graph_server.py [forms] [leads per form] [port]
+
+then run the sync with META_GRAPH_URL=http://127.0.0.1:<port>.
+"""
+
+import asyncio
+import json
+import sys
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+API_VERSION = 'v21.0'
+
+
+class MockGraph:
+    def __init__(self, forms=10, leads_per_form=50, latency=0.005, usage=10, now=None):
+        now = now or datetime.now(timezone.utc)
+        self.forms = [{'id': f'form{i}', 'name': f'Form {i}', 'status': 'ACTIVE'} for i in range(forms)]
+        # One lead a minute, newest first, like the API
+        self.leads = {
+            form['id']: [
+                {
+                    'id': f"{form['id']}-lead{n}",
+                    'created_time': (now - timedelta(minutes=n + 1)).strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                    'field_data': [{'name': 'full_name', 'values': [f'Lead {n}']},
+                                   {'name': 'phone_number', 'values': [f'+9198{i:04d}{n:04d}']}],
+                }
+                for n in range(leads_per_form)
+            ]
+            for i, form in enumerate(self.forms)
+        }
+        self.latency = latency
+        self.usage = usage
+        # Each fault answers one request: {'status': 429, 'retry_after': '0'},
+        # {'status': 400, 'code': 613}, {'status': 500}, ...
+        self.faults = deque()
+        # Paths that always fail with a server error
+        self.broken_paths = set()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.base_url = None
+        self._runner = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/{version}/{node}/leadgen_forms', self.leadgen_forms)
+        app.router.add_get('/{version}/{node}/leads', self.form_leads)
+        return app
+
+    async def start(self, port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _headers(self):
+        return {'x-app-usage': json.dumps({'call_count': self.usage, 'total_cputime': 1, 'total_time': 1})}
+
+    async def _serve(self, request, rows):
+        self.requests += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if request.path in self.broken_paths:
+                return web.json_response({'error': {'message': 'Service unavailable'}}, status=503)
+            if self.faults:
+                fault = self.faults.popleft()
+                headers = self._headers()
+                if 'retry_after' in fault:
+                    headers['Retry-After'] = fault['retry_after']
+                if 'usage' in fault:
+                    headers['x-app-usage'] = json.dumps({'call_count': fault['usage']})
+                body = {'error': {'message': 'Injected fault', 'code': fault.get('code', 0)}}
+                return web.json_response(body, status=fault['status'], headers=headers)
+            return web.json_response(self._page(request, rows), headers=self._headers())
+        finally:
+            self.in_flight -= 1
+
+    def _page(self, request, rows):
+        limit = int(request.query.get('limit', 25))
+        since = request.query.get('since')
+        if since:
+            cutoff = datetime.fromtimestamp(int(since), timezone.utc)
+            rows = [row for row in rows if 'created_time' not in row or
+                    datetime.strptime(row['created_time'], '%Y-%m-%dT%H:%M:%S%z') >= cutoff]
+        start = int(request.query.get('after', 0))
+        page = {'data': rows[start:start + limit]}
+        if start + limit < len(rows):
+            query = dict(request.query, after=str(start + limit))
+            page['paging'] = {'cursors': {'after': str(start + limit)},
+                              'next': str(request.url.with_query(query))}
+        return page
+
+    async def leadgen_forms(self, request):
+        return await self._serve(request, self.forms)
+
+    async def form_leads(self, request):
+        return await self._serve(request, self.leads.get(request.match_info['node'], []))
+
+
+if __name__ == '__main__':
+    forms = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    leads_per_form = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+    web.run_app(MockGraph(forms, leads_per_form).app(), host='127.0.0.1', port=port)
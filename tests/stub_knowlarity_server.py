@@ -0,0 +1,126 @@
+"""
+Local stand-in for the Knowlarity call log endpoint
+(``/<channel>/v1/account/calllog``): records paged by limit and offset,
+optional ``meta.next`` links, a reported total_count that can differ from the
+records served, and queued faults (429 with Retry-After, 5xx) answering the
+next requests.
+
+    python tests/stub_knowlarity_server.py [records] [port]
+
+then run the sync with KNOWLARITY_BASE_URL=http://127.0.0.1:<port>.
+"""
+
+import json
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+KNOWN_NUMBERS = ['+918929841338', '+917353089911', '+919513249906', '+918071023606']
+
+
+def call_records(count, start=datetime(2025, 3, 14, 9, 0)):
+    """``count`` call log records, a few seconds apart, mostly to the known SR numbers"""
+    return [
+        {
+            'uuid': f'call-{n}',
+            'knowlarity_number': KNOWN_NUMBERS[n % 4] if n % 5 else '+911111111111',
+            'customer_number': f'+9198{n % 7919:08d}',
+            'start_time': (start + timedelta(seconds=7 * n)).strftime('%Y-%m-%d %H:%M:%S+05:30'),
+            'call_duration': n % 300,
+        }
+        for n in range(count)
+    ]
+
+
+class StubKnowlarity:
+    def __init__(self, records=0, channel='Basic'):
+        self.records = call_records(records) if isinstance(records, int) else records
+        self.path = f'/{channel}/v1/account/calllog'
+        # total_count to report instead of the number of records
+        self.total_count = None
+        # Serve meta.next links on the first pages (None: on every page but the last)
+        self.next_links = 0
+        # Each fault answers one request: {'status': 429, 'retry_after': '3'}, {'status': 503}, ...
+        self.faults = deque()
+        self.requests = []
+        self.base_url = None
+        self._server = None
+
+    def server(self, port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        return self._server
+
+    def start(self):
+        self.server()
+        self.base_url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, request):
+        url = urlsplit(request.path)
+        query = parse_qs(url.query)
+        self.requests.append(query)
+        if url.path != self.path:
+            return self._reply(request, 404, {'message': 'Not found'})
+        if not request.headers.get('x-api-key') or not request.headers.get('authorization'):
+            return self._reply(request, 401, {'message': 'Missing credentials'})
+        if self.faults:
+            fault = self.faults.popleft()
+            headers = {'Retry-After': fault['retry_after']} if 'retry_after' in fault else {}
+            return self._reply(request, fault['status'], {'message': 'Injected fault'}, headers)
+        # A repeated parameter means the client merged two queries
+        if any(len(values) > 1 for values in query.values()):
+            return self._reply(request, 400, {'message': f'Repeated parameters in {url.query}'})
+
+        limit = int(query.get('limit', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        page = self.records[offset:offset + limit]
+        total = len(self.records) if self.total_count is None else self.total_count
+        meta = {'total_count': total, 'limit': limit, 'offset': offset, 'next': None}
+        pages_served = offset // limit if limit else 0
+        more = offset + limit < len(self.records)
+        if more and (self.next_links is None or pages_served < self.next_links):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query['offset'] = offset + limit
+            meta['next'] = f'{self.path}?{urlencode(next_query)}'
+        self._reply(request, 200, {'meta': meta, 'objects': page})
+
+    @staticmethod
+    def _reply(request, status, body, headers=None):
+        data = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 12000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8766
+    print(f'Serving {records} call log records on http://127.0.0.1:{port}')
+    StubKnowlarity(records).server(port).serve_forever()
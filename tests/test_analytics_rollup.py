@@ -0,0 +1,135 @@
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from analytics_rollup import (
+    CAMPAIGN_ROLLUP,
+    DAILY_ROLLUP,
+    PROFILE_ROLLUP,
+    ROLLUPS,
+    STATE_TABLE,
+    build_facts,
+    claim_rebuild,
+    rebuild_partitions,
+    refresh_rollups,
+)
+from fake_supabase import FakeSupabase
+
+TODAY = date.today()
+
+
+def stamp(days_ago, hour=10):
+    return datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time()).replace(hour=hour) \
+        .astimezone().isoformat()
+
+
+def lead(i, days_ago, cre_name='Asha', final_status='Pending'):
+    return {'id': i, 'date': (TODAY - timedelta(days=days_ago)).isoformat(), 'created_at': stamp(days_ago),
+            'updated_at': None, 'source': 'META', 'campaign': None, 'cre_name': cre_name, 'ps_name': None,
+            'branch': 'PORUR', 'lead_category': None, 'model_interested': None, 'final_status': final_status,
+            'won_timestamp': None, 'lost_timestamp': None, 'test_drive_done': None}
+
+
+def leads_by_cre(client):
+    """Lead counts per (lead_day, cre_name) in the daily rollup"""
+    counts = Counter()
+    for fact in client.tables[DAILY_ROLLUP.table]:
+        if fact['source_table'] == 'lead_master':
+            counts[(fact['lead_day'], fact['cre_name'])] += fact['leads']
+    return +counts
+
+
+def expected_by_cre(client):
+    counts = Counter()
+    for fact in build_facts('lead_master', client.tables['lead_master'])[DAILY_ROLLUP.table]:
+        counts[(fact['lead_day'], fact['cre_name'])] += fact['leads']
+    return +counts
+
+
+def book():
+    tables = {
+        'lead_master': [lead(i, days_ago=1 + i % 10, cre_name=['Asha', 'Ravi'][i % 2]) for i in range(1, 41)],
+        'walkin_table': [],
+        STATE_TABLE: [],
+    }
+    tables.update({rollup.table: [] for rollup in ROLLUPS})
+    return FakeSupabase(tables)
+
+
+def test_reassignment_is_picked_up_incrementally():
+    client = book()
+    refresh_rollups(client)
+    assert leads_by_cre(client) == expected_by_cre(client)
+
+    # Transfer a lead to another CRE; the trigger stamps updated_at
+    row = client.tables['lead_master'][2]
+    row.update(cre_name='Meena', updated_at=datetime.now().astimezone().isoformat())
+    refresh_rollups(client)
+    assert leads_by_cre(client) == expected_by_cre(client)
+
+
+def test_trailing_rebuild_drops_deleted_rows():
+    client = book()
+    refresh_rollups(client)
+    client.tables['lead_master'] = [row for row in client.tables['lead_master'] if row['id'] not in (3, 13)]
+
+    refresh_rollups(client)
+    assert leads_by_cre(client) != expected_by_cre(client)  # nothing to scan for a delete
+
+    refresh_rollups(client, trailing_days=5)
+    assert leads_by_cre(client) == expected_by_cre(client)
+
+
+def test_each_rollup_is_keyed_only_by_its_own_dimensions():
+    leads = [lead(i, days_ago=1) for i in range(1, 7)]
+    for row, campaign, category, model, status in zip(
+            leads, ['Diwali', 'Diwali', 'Summer', None, 'Summer', 'Diwali'],
+            ['Hot', 'hot ', 'Warm', None, 'Cold', 'Hot'], ['450X', 'Rizta', '450X', '450S', None, '450X'],
+            ['Won', ' won', 'Lost', 'Pending', 'Pending', 'Won']):
+        row.update(campaign=campaign, lead_category=category, model_interested=model, final_status=status)
+    leads[0]['won_timestamp'] = stamp(0)
+    facts = build_facts('lead_master', leads)
+
+    # One daily fact per status; campaign, category and model are not part of the key
+    daily = {fact['final_status']: fact for fact in facts[DAILY_ROLLUP.table]}
+    assert set(daily) == {'Won', ' won', 'Lost', 'Pending'}
+    assert set(facts[DAILY_ROLLUP.table][0]) == set(DAILY_ROLLUP.dimensions + DAILY_ROLLUP.metrics)
+    assert (daily['Won']['leads'], daily['Won']['won'], daily['Won']['hot']) == (2, 2, 2)
+    assert (daily[' won']['won'], daily[' won']['hot'], daily['Pending']['cold']) == (1, 1, 1)
+
+    campaign = Counter({(fact['kind'], fact['campaign']): fact['leads'] for fact in facts[CAMPAIGN_ROLLUP.table]})
+    assert campaign == {('created', 'Diwali'): 3, ('created', 'Summer'): 2, ('created', ''): 1, ('won', 'Diwali'): 1}
+    profile = {(fact['lead_category'], fact['model_interested']): fact['leads'] for fact in facts[PROFILE_ROLLUP.table]}
+    assert profile == {('Hot', '450X'): 2, ('hot ', 'Rizta'): 1, ('Warm', '450X'): 1, ('', '450S'): 1, ('Cold', ''): 1}
+
+
+def test_a_refresher_skips_tables_another_one_is_rebuilding():
+    client = book()
+    assert claim_rebuild(client, 'lead_master', 'other-worker')
+    summary = refresh_rollups(client)
+    assert summary['lead_master'] == {'skipped': 'rebuilt by another refresher'}
+    assert client.tables[DAILY_ROLLUP.table] == []
+    with pytest.raises(RuntimeError, match='lease'):
+        rebuild_partitions(client, 'lead_master', [stamp(1)[:10]], 'this-worker')
+
+    # An expired lease is taken over, and released after the run
+    state = next(row for row in client.tables[STATE_TABLE] if row['source_table'] == 'lead_master')
+    state['claimed_until'] = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    refresh_rollups(client)
+    assert leads_by_cre(client) == expected_by_cre(client)
+    assert state['claimed_by'] is None and claim_rebuild(client, 'lead_master', 'next-worker')
+
+
+def test_facts_of_other_runs_are_replaced_whatever_their_stamp():
+    client = book()
+    refresh_rollups(client)
+    # A fact left by a refresher whose clock ran ahead
+    day = stamp(3)[:10]
+    client.tables[DAILY_ROLLUP.table].append({
+        'lead_day': day, 'source_table': 'lead_master', 'source': 'META', 'cre_name': 'Gone', 'ps_name': '',
+        'branch': 'PORUR', 'final_status': 'Pending', 'leads': 5, 'refreshed_at': '2999-01-01T00:00:00+00:00',
+    })
+    assert claim_rebuild(client, 'lead_master', 'me')
+    rebuild_partitions(client, 'lead_master', [day], 'me')
+    assert leads_by_cre(client) == expected_by_cre(client)
@@ -0,0 +1,46 @@
+"""
+build_branch_analytics on a hand-made branch: both days of the window are
+included in full, and each section counts the rows of its own window.
+"""
+
+from datetime import date
+
+from branch_analytics import build_branch_analytics
+from fake_supabase import FakeSupabase
+
+
+def ps_lead(i, assigned_at, created_at, final_status='Pending', source='META', lead_status=None, branch='PORUR'):
+    return {'id': i, 'ps_branch': branch, 'ps_name': 'ps1', 'ps_assigned_at': assigned_at, 'created_at': created_at,
+            'final_status': final_status, 'source': source, 'lead_status': lead_status}
+
+
+def test_the_window_includes_the_whole_last_day():
+    book = FakeSupabase({
+        'ps_followup_master': [
+            ps_lead(1, '2025-03-01T00:00:00+00:00', '2025-02-20T09:00:00+00:00', 'Won', lead_status='Interested'),
+            # Late on date_to: the old lte('ps_assigned_at', date_to) bound left these out
+            ps_lead(2, '2025-03-14T18:30:00+00:00', '2025-03-14T18:00:00+00:00', 'Won', 'GOOGLE'),
+            ps_lead(3, '2025-03-15T00:00:00+00:00', '2025-03-15T00:00:00+00:00', 'Lost'),
+            ps_lead(4, None, '2025-03-10T08:00:00+00:00', 'Lost'),
+            ps_lead(5, '2025-03-05T10:00:00+00:00', '2025-03-05T10:00:00+00:00', branch='OTHER'),
+        ],
+        'walkin_table': [
+            {'id': 1, 'branch': 'PORUR', 'ps_assigned': 'ps1', 'status': 'Pending',
+             'next_followup_date': '2025-03-14', 'created_at': '2025-03-14T23:59:59+00:00'},
+            {'id': 2, 'branch': 'PORUR', 'ps_assigned': 'ps1', 'status': 'Won',
+             'next_followup_date': None, 'created_at': '2025-02-28T23:59:59+00:00'},
+        ],
+    })
+    analytics = build_branch_analytics(book, 'PORUR', '2025-03-01', '2025-03-14', today=date(2025, 3, 14))
+
+    assert analytics['ps_performance'] == [{'ps_name': 'ps1', 'leads_assigned': 2, 'leads_contacted': 1, 'gap': 1}]
+    assert analytics['source_leads'] == [{
+        'ps_name': 'ps1', 'total_leads': 2, 'won_leads': 2,
+        'source_breakdown': {'META': {'total_leads': 1, 'won_leads': 1}, 'GOOGLE': {'total_leads': 1, 'won_leads': 1}},
+    }]
+    assert analytics['sources'] == ['GOOGLE', 'META']
+    # Leads 2 and 4 by created_at, plus the walk-in created on the last day
+    assert analytics['summary'] == {'total_leads_assigned': 3, 'total_pending_leads': 1, 'total_won_leads': 1,
+                                    'total_lost_leads': 1}
+    assert analytics['walkin_leads'] == [{'ps_name': 'ps1', 'total_walkin_leads': 1, 'pending_leads': 1,
+                                          'lost_leads': 0, 'won_leads': 0, 'today_followups': 1}]
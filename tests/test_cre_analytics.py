@@ -0,0 +1,280 @@
+"""
+build_cre_analytics against the per-CRE, per-metric loops of the old
+cre_analytics_data route, on the same leads: rows for the old code, the
+lead_master snapshot frame for the new one.
+"""
+
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from cre_analytics import build_cre_analytics
+from lead_snapshot import create_lead_snapshots
+from query_utils import parse_day
+
+TODAY = date(2025, 3, 15)
+ACTIVE_CRES = ['Asha', 'Ravi', 'Meena', 'Zoya']
+SOURCES = ['Google', 'META', 'Know', 'OEM Web']
+
+
+def legacy_cre_analytics(all_leads, active_cres, current_cre, from_date, to_date, today):
+    """The removed cre_analytics_data blocks (debug prints left out, summary loops folded into sums)"""
+    window_start, window_end = from_date, to_date
+    if window_start is None or window_end is None:
+        window_start, window_end = None, None
+
+    def is_within_date_filter(target_date):
+        if not target_date or window_start is None:
+            return True
+        return window_start <= target_date <= window_end
+
+    def get_filtered_all_cre_leaderboard():
+        cre_performance = {}
+        for cre_name in active_cres:
+            cre_performance[cre_name] = {'won': 0, 'pending_live': 0, 'lost': 0, 'total_leads_handled': 0}
+        for lead in all_leads:
+            cre_name = lead.get('cre_name')
+            if cre_name in cre_performance:
+                if lead.get('cre_assigned_at'):
+                    if is_within_date_filter(parse_day(lead.get('cre_assigned_at'))):
+                        cre_performance[cre_name]['total_leads_handled'] += 1
+                if lead.get('final_status') == 'Pending':
+                    cre_performance[cre_name]['pending_live'] += 1
+        for lead in all_leads:
+            cre_name = lead.get('cre_name')
+            if cre_name in cre_performance:
+                if lead.get('final_status') == 'Won':
+                    if is_within_date_filter(parse_day(lead.get('won_timestamp'))):
+                        cre_performance[cre_name]['won'] += 1
+                elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
+                    lost_date = parse_day(lead.get('lost_timestamp')) or parse_day(lead.get('won_timestamp'))
+                    if is_within_date_filter(lost_date):
+                        cre_performance[cre_name]['lost'] += 1
+        return sorted(cre_performance.items(), key=lambda x: x[1]['won'], reverse=True)
+
+    def get_filtered_cre_platform_conversion():
+        platform_data = {}
+        for lead in all_leads:
+            if lead.get('cre_name') == current_cre:
+                platform = lead.get('source', 'Unknown')
+                if platform not in platform_data:
+                    platform_data[platform] = {'won': 0, 'pending_live': 0, 'lost': 0, 'assigned': 0}
+                if lead.get('cre_assigned_at'):
+                    platform_data[platform]['assigned'] += 1
+                if lead.get('final_status') == 'Won':
+                    if is_within_date_filter(parse_day(lead.get('won_timestamp'))):
+                        platform_data[platform]['won'] += 1
+                elif lead.get('final_status') == 'Pending':
+                    platform_data[platform]['pending_live'] += 1
+                elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
+                    lost_date = parse_day(lead.get('lost_timestamp')) or parse_day(lead.get('won_timestamp'))
+                    if is_within_date_filter(lost_date):
+                        platform_data[platform]['lost'] += 1
+        for platform in platform_data:
+            all_won = len([lead for lead in all_leads
+                           if lead.get('cre_name') == current_cre
+                           and (lead.get('source') or 'Unknown') == platform
+                           and lead.get('final_status') == 'Won'])
+            assigned = platform_data[platform]['assigned']
+            conversion_rate = (all_won / assigned * 100) if assigned > 0 else 0
+            platform_data[platform]['conversion_rate'] = round(conversion_rate, 2)
+        return platform_data
+
+    def get_filtered_cre_overall_stats():
+        cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
+        total_won = 0
+        total_lost = 0
+        total_assigned = len([lead for lead in cre_leads if lead.get('cre_assigned_at')])
+        for lead in cre_leads:
+            if lead.get('final_status') == 'Won':
+                if is_within_date_filter(parse_day(lead.get('won_timestamp'))):
+                    total_won += 1
+            elif lead.get('final_status') == 'Lost' or lead.get('lost_timestamp'):
+                lost_date = parse_day(lead.get('lost_timestamp')) or parse_day(lead.get('won_timestamp'))
+                if is_within_date_filter(lost_date):
+                    total_lost += 1
+        overall_rate = (total_won / total_assigned * 100) if total_assigned > 0 else 0
+        return {'won': total_won, 'lost': total_lost, 'assigned': total_assigned,
+                'conversion_rate': round(overall_rate, 2)}
+
+    def get_cre_platform_conversion_live():
+        platform_data = {}
+        for lead in all_leads:
+            if lead.get('cre_name') == current_cre:
+                platform = lead.get('source', 'Unknown')
+                if platform not in platform_data:
+                    platform_data[platform] = {'won': 0, 'pending': 0, 'lost': 0, 'assigned': 0}
+                if lead.get('cre_assigned_at'):
+                    platform_data[platform]['assigned'] += 1
+                if lead.get('final_status') == 'Won':
+                    platform_data[platform]['won'] += 1
+                elif lead.get('final_status') == 'Pending':
+                    platform_data[platform]['pending'] += 1
+                elif lead.get('final_status') == 'Lost':
+                    platform_data[platform]['lost'] += 1
+        for platform in platform_data:
+            assigned = platform_data[platform]['assigned']
+            won = platform_data[platform]['won']
+            conversion_rate = (won / assigned * 100) if assigned > 0 else 0
+            platform_data[platform]['conversion_rate'] = round(conversion_rate, 2)
+        return platform_data
+
+    def get_leads_assigned_by_category():
+        category_data = {}
+        for cre_name in active_cres:
+            category_data[cre_name] = {'hot': 0, 'cold': 0, 'warm': 0, 'not_interested': 0, 'not_set': 0}
+        for lead in all_leads:
+            cre_name = lead.get('cre_name')
+            lead_category_raw = lead.get('lead_category')
+            lead_category = lead_category_raw.lower() if lead_category_raw else ''
+            if cre_name in category_data and lead.get('cre_assigned_at'):
+                if is_within_date_filter(parse_day(lead.get('cre_assigned_at'))):
+                    if lead_category in ['hot']:
+                        category_data[cre_name]['hot'] += 1
+                    elif lead_category in ['cold']:
+                        category_data[cre_name]['cold'] += 1
+                    elif lead_category in ['warm']:
+                        category_data[cre_name]['warm'] += 1
+                    elif lead_category in ['not interested', 'not_interested']:
+                        category_data[cre_name]['not_interested'] += 1
+                    elif lead_category in ['not set', 'not_set', ''] or not lead_category:
+                        category_data[cre_name]['not_set'] += 1
+        return category_data
+
+    def get_summary_metrics():
+        cre_leads = [lead for lead in all_leads if lead.get('cre_name') == current_cre]
+
+        def in_bounds(day):
+            return day and not (from_date and day < from_date) and not (to_date and day > to_date)
+
+        assigned_days = [parse_day(lead.get('cre_assigned_at')) for lead in cre_leads]
+        won_days = [parse_day(lead.get('won_timestamp')) if lead.get('final_status') == 'Won' else None
+                    for lead in cre_leads]
+        month_start = today.replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return {
+            'total_leads': sum(1 for day in assigned_days if in_bounds(day)),
+            'hot_leads': sum(1 for lead, day in zip(cre_leads, assigned_days)
+                             if lead.get('lead_category') == 'Hot' and in_bounds(day)),
+            'ftd_assigned': sum(1 for day in assigned_days if day and day == today),
+            'mtd_assigned': sum(1 for day in assigned_days if day and month_start <= day <= month_end),
+            'ftd_retails': sum(1 for day in won_days if day and day == today),
+            'mtd_retails': sum(1 for day in won_days if day and month_start <= day <= month_end),
+            'total_retails': sum(1 for day in won_days if in_bounds(day)),
+        }
+
+    return {
+        'top_5_leaderboard': get_filtered_all_cre_leaderboard()[:5],
+        'cre_platform_conversion': get_filtered_cre_platform_conversion(),
+        'cre_platform_conversion_live': get_cre_platform_conversion_live(),
+        'cre_overall_stats': get_filtered_cre_overall_stats(),
+        'leads_assigned_by_category': get_leads_assigned_by_category(),
+        'summary_metrics': get_summary_metrics(),
+    }
+
+
+def timestamp(rng, allow_none=True):
+    if allow_none and rng.random() < 0.3:
+        return None
+    day = TODAY + timedelta(days=rng.randint(-40, 3))
+    return f'{day.isoformat()}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00'
+
+
+def random_leads(seed, count=500, sources=SOURCES):
+    rng = random.Random(seed)
+    leads = []
+    for i in range(1, count + 1):
+        final_status = rng.choice([None, 'Pending', 'Pending', 'Won', 'Lost'])
+        created_at = timestamp(rng, allow_none=False)
+        leads.append({
+            'id': i, 'uid': f'C{i}', 'customer_name': f'Lead {i}', 'created_at': created_at, 'updated_at': created_at,
+            'cre_name': rng.choice(['Asha', 'Asha', 'Ravi', 'Meena', 'Inactive', None]),
+            'source': rng.choice(sources),
+            'lead_category': rng.choice([None, 'Hot', 'Warm', 'Cold', 'Not Interested', 'not_set', 'Not Set']),
+            'lead_status': rng.choice([None, 'Pending', 'RNR']),
+            'final_status': final_status,
+            'cre_assigned_at': timestamp(rng),
+            'won_timestamp': timestamp(rng) if final_status == 'Won' or rng.random() < 0.05 else None,
+            'lost_timestamp': timestamp(rng) if final_status == 'Lost' or rng.random() < 0.05 else None,
+        })
+    return leads
+
+
+def lead_frame(leads):
+    return create_lead_snapshots()['lead_master']._to_frame(leads)
+
+
+WINDOWS = [
+    (None, None),
+    (date(2025, 3, 1), date(2025, 3, 15)),
+    (date(2025, 2, 10), date(2025, 2, 20)),
+    (date(2025, 3, 5), None),
+    (None, date(2025, 2, 28)),
+]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('window', WINDOWS)
+@pytest.mark.parametrize('current_cre', ['Asha', 'Zoya'])
+def test_analytics_match_the_per_lead_loops(seed, window, current_cre):
+    leads = random_leads(seed)
+    expected = legacy_cre_analytics(leads, ACTIVE_CRES, current_cre, *window, TODAY)
+    actual = build_cre_analytics(lead_frame(leads), ACTIVE_CRES, current_cre, *window, TODAY)
+    for block in expected:
+        assert actual[block] == expected[block], block
+
+
+def test_leads_without_a_source_are_grouped_under_unknown():
+    leads = random_leads(4, count=200, sources=SOURCES + [None])
+    actual = build_cre_analytics(lead_frame(leads), ACTIVE_CRES, 'Asha', None, None, TODAY)
+    mine = [lead for lead in leads if lead['cre_name'] == 'Asha']
+    unknown = [lead for lead in mine if lead['source'] is None]
+    assert unknown
+    for block in ('cre_platform_conversion', 'cre_platform_conversion_live'):
+        assert None not in actual[block]
+        assert actual[block]['Unknown']['assigned'] == sum(1 for lead in unknown if lead['cre_assigned_at'])
+    assert actual['cre_platform_conversion_live']['Unknown']['won'] == \
+        sum(1 for lead in unknown if lead['final_status'] == 'Won')
+
+
+def test_hand_counted_example():
+    def lead(i, cre, source, final_status, assigned=None, won=None, lost=None, category=None):
+        return {'id': i, 'uid': f'C{i}', 'created_at': '2025-01-01T00:00:00+00:00', 'updated_at': None,
+                'cre_name': cre, 'source': source, 'final_status': final_status, 'lead_category': category,
+                'cre_assigned_at': assigned, 'won_timestamp': won, 'lost_timestamp': lost}
+
+    leads = [
+        lead(1, 'Asha', 'Google', 'Won', '2025-03-15T08:00:00+00:00', won='2025-03-15T10:00:00+00:00', category='Hot'),
+        lead(2, 'Asha', 'Google', 'Won', '2025-02-10T08:00:00+00:00', won='2025-02-12T10:00:00+00:00'),
+        lead(3, 'Asha', 'META', 'Pending', '2025-03-02T08:00:00+00:00', category='Hot'),
+        lead(4, 'Asha', 'META', 'Lost', '2025-03-03T08:00:00+00:00', lost='2025-03-04T10:00:00+00:00',
+             category='Cold'),
+        # A Pending lead with a lost timestamp counts as lost on the leaderboard
+        lead(5, 'Ravi', 'Google', 'Pending', None, lost='2025-03-05T10:00:00+00:00'),
+        lead(6, 'Ravi', 'Google', 'Won', '2025-03-01T08:00:00+00:00', won=None, category='Not Set'),
+        lead(7, 'Inactive', 'Google', 'Won', '2025-03-01T08:00:00+00:00', won='2025-03-01T10:00:00+00:00'),
+    ]
+    result = build_cre_analytics(lead_frame(leads), ['Asha', 'Ravi'], 'Asha',
+                                 date(2025, 3, 1), date(2025, 3, 31), TODAY)
+
+    assert result['top_5_leaderboard'] == [
+        ('Asha', {'won': 1, 'pending_live': 1, 'lost': 1, 'total_leads_handled': 3}),
+        # An undated win counts as in the window
+        ('Ravi', {'won': 1, 'pending_live': 1, 'lost': 1, 'total_leads_handled': 1}),
+    ]
+    assert result['cre_platform_conversion'] == {
+        'Google': {'won': 1, 'pending_live': 0, 'lost': 0, 'assigned': 2, 'conversion_rate': 100.0},
+        'META': {'won': 0, 'pending_live': 1, 'lost': 1, 'assigned': 2, 'conversion_rate': 0},
+    }
+    assert result['cre_platform_conversion_live']['Google'] == \
+        {'won': 2, 'pending': 0, 'lost': 0, 'assigned': 2, 'conversion_rate': 100.0}
+    assert result['cre_overall_stats'] == {'won': 1, 'lost': 1, 'assigned': 4, 'conversion_rate': 25.0}
+    assert result['leads_assigned_by_category'] == {
+        'Asha': {'hot': 2, 'cold': 1, 'warm': 0, 'not_interested': 0, 'not_set': 0},
+        'Ravi': {'hot': 0, 'cold': 0, 'warm': 0, 'not_interested': 0, 'not_set': 1},
+    }
+    assert result['summary_metrics'] == {
+        'total_leads': 3, 'hot_leads': 2, 'ftd_assigned': 1, 'mtd_assigned': 3,
+        'ftd_retails': 1, 'mtd_retails': 1, 'total_retails': 1,
+    }
@@ -0,0 +1,253 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from dashboard_tabs import (
+    PS_COUNT_TABS,
+    InvalidTabRequest,
+    cre_tab_sources,
+    load_tab_page,
+    narrow_sources,
+    ps_tab_sources,
+    tab_counts,
+)
+from fake_supabase import FakeSupabase, matches
+from lead_buckets import (
+    BUCKET_NAMES,
+    classify_cre_leads,
+    classify_ps_leads,
+    classify_walkin_leads,
+    cre_bucket_conditions,
+    ps_bucket_conditions,
+    walkin_bucket_conditions,
+)
+
+TODAY = date(2025, 3, 15)
+FINAL_STATUSES = [None, '', 'Pending', 'Won', 'Lost']
+LEAD_STATUSES = [None, '', 'Pending', 'RNR', 'Busy on another Call', 'Call me Back', 'Interested',
+                 'Dropped', 'Booked', 'Lost to Competition']
+
+
+def some_day(rng, allow_none=True):
+    if allow_none and rng.random() < 0.3:
+        return None
+    return (TODAY + timedelta(days=rng.randint(-5, 5))).isoformat()
+
+
+def ps_lead(rng, i):
+    return {
+        'id': i, 'lead_uid': f'L{i}', 'customer_name': rng.choice(['Asha', 'Ravi', 'Meena', 'Arjun']),
+        'customer_mobile_number': f'98{i:08d}', 'source': 'META', 'cre_name': 'cre',
+        'ps_name': rng.choice(['ps1', 'ps1', 'ps2']), 'final_status': rng.choice(FINAL_STATUSES),
+        'lead_status': rng.choice(LEAD_STATUSES), 'lead_category': rng.choice([None, 'Hot', 'Warm', 'Cold']),
+        'first_call_date': some_day(rng), 'follow_up_date': some_day(rng), 'ps_assigned_at': some_day(rng),
+        'created_at': some_day(rng, allow_none=False), 'won_timestamp': some_day(rng), 'lost_timestamp': some_day(rng),
+    }
+
+
+def ps_event(rng, i):
+    return {
+        'id': i, 'activity_uid': f'A{i}', 'customer_name': 'Event', 'customer_phone_number': f'97{i:08d}',
+        'ps_name': 'ps1', 'final_status': rng.choice(FINAL_STATUSES), 'lead_status': rng.choice(LEAD_STATUSES),
+        'lead_category': rng.choice([None, 'Hot']), 'ps_first_call_date': some_day(rng),
+        'ps_followup_date_ts': some_day(rng), 'created_at': some_day(rng, allow_none=False),
+        'won_timestamp': None, 'lost_timestamp': None,
+    }
+
+
+def walkin(rng, i):
+    row = {
+        'id': i, 'uid': f'W{i}', 'customer_name': 'Walk', 'mobile_number': f'96{i:08d}', 'ps_assigned': 'ps1',
+        'status': rng.choice(FINAL_STATUSES), 'lead_status': rng.choice(LEAD_STATUSES),
+        'lead_category': rng.choice([None, 'Hot', 'Cold']), 'next_followup_date': some_day(rng),
+        'created_at': some_day(rng, allow_none=False), 'updated_at': some_day(rng),
+    }
+    for call_no in range(1, 8):
+        row[f'{call_no}_call_date'] = some_day(rng) if rng.random() < 0.15 else None
+    return row
+
+
+def cre_lead(rng, i):
+    return {
+        'id': i, 'uid': f'C{i}', 'customer_name': 'Lead', 'customer_mobile_number': f'95{i:08d}',
+        'source': 'GOOGLE', 'campaign': None, 'branch': rng.choice(['PORUR', 'TIRUVOTTIYUR', None]),
+        'ps_name': rng.choice([None, '', 'ps1', 'ps2']), 'cre_name': 'cre',
+        'final_status': rng.choice(FINAL_STATUSES), 'lead_status': rng.choice(LEAD_STATUSES),
+        'lead_category': None, 'first_call_date': some_day(rng), 'follow_up_date': some_day(rng),
+        'date': some_day(rng), 'cre_assigned_at': some_day(rng), 'ps_assigned_at': some_day(rng),
+        'created_at': some_day(rng, allow_none=False), 'won_timestamp': None, 'lost_timestamp': None,
+    }
+
+
+def matching(rows, conditions):
+    return [row['id'] for row in rows if all(matches(row, condition) for condition in conditions)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_bucket_conditions_match_the_classifiers(seed):
+    rng = random.Random(seed)
+    ps_open = ('pending', 'untouched', 'called', 'follow_up')
+    cases = [
+        ([cre_lead(rng, i) for i in range(400)], classify_cre_leads, cre_bucket_conditions(),
+         ('pending', 'untouched', 'called', 'follow_up', 'other')),
+        ([ps_lead(rng, i) for i in range(400)], classify_ps_leads, ps_bucket_conditions(), ps_open),
+        ([ps_event(rng, i) for i in range(400)],
+         lambda rows: classify_ps_leads(rows, first_call_field='ps_first_call_date'),
+         ps_bucket_conditions(first_call_field='ps_first_call_date'), ps_open),
+        ([walkin(rng, i) for i in range(400)], classify_walkin_leads, walkin_bucket_conditions(),
+         ('untouched', 'pending')),
+    ]
+    for rows, classify, conditions, open_buckets in cases:
+        buckets = classify(rows)
+        for name in BUCKET_NAMES:
+            if name in conditions:
+                assert matching(rows, conditions[name]) == [rows[i]['id'] for i in buckets.indices(name)], name
+        if 'fresh' in conditions:
+            fresh = [rows[i]['id'] for i in buckets.indices('untouched', 'called', 'follow_up')]
+            assert matching(rows, conditions['fresh']) == fresh
+        assert matching(rows, conditions['open']) == [rows[i]['id'] for i in buckets.indices(*open_buckets)]
+
+
+@pytest.fixture
+def ps_book():
+    rng = random.Random(11)
+    return FakeSupabase({
+        'ps_followup_master': [ps_lead(rng, i) for i in range(1, 301)],
+        'activity_leads': [ps_event(rng, i) for i in range(1001, 1121)],
+        'walkin_table': [walkin(rng, i) for i in range(2001, 2081)],
+    })
+
+
+def test_tab_counts_match_the_paged_totals(ps_book):
+    counts = tab_counts(ps_book, lambda tab: ps_tab_sources('ps1', tab, today=TODAY), PS_COUNT_TABS)
+    for tab in ('untouched', 'called', 'follow_up', 'followups', 'pending', 'attended', 'won', 'lost',
+                'event', 'walkin'):
+        _, total, _ = load_tab_page(ps_book, ps_tab_sources('ps1', tab, today=TODAY), tab, per_page=10)
+        assert counts[tab] == total, tab
+    assert counts['fresh'] == counts['untouched'] + counts['called'] + counts['follow_up']
+    assert counts['followups_today'] + counts['followups_overdue'] == counts['followups']
+
+
+def page_through(client, sources, tab, per_page, sort=None, descending=True):
+    """Every page of a tab, following the cursors"""
+    pages, cursor, page = [], None, 1
+    while True:
+        rows, total, cursor = load_tab_page(client, sources, tab, page, per_page, sort, descending, cursor)
+        pages.append(rows)
+        if cursor is None:
+            return pages, total
+        page += 1
+
+
+@pytest.mark.parametrize('sort,descending', [(None, True), ('created_at', False), ('follow_up_date', True),
+                                             ('id', False)])
+def test_pages_of_a_multi_table_tab_cover_it_in_order(ps_book, sort, descending):
+    sources = ps_tab_sources('ps1', 'pending', today=TODAY)
+    everything, total, cursor = load_tab_page(ps_book, sources, 'pending', per_page=1000, sort=sort,
+                                              descending=descending)
+    assert len(everything) == total and cursor is None
+
+    pages, page_total = page_through(ps_book, sources, 'pending', 7, sort, descending)
+    assert page_total == total and len(pages) == (total + 6) // 7
+    paged = [lead for rows in pages for lead in rows]
+    assert [(lead['lead_uid'], lead.get('is_walkin')) for lead in paged] == \
+           [(lead['lead_uid'], lead.get('is_walkin')) for lead in everything]
+
+    # Rows with a value come first, in order; rows without one last
+    def sort_value(lead):
+        if sort == 'follow_up_date' and lead.get('is_walkin'):
+            return lead.get('next_followup_date')
+        if sort == 'follow_up_date' and lead.get('activity_uid'):
+            return lead.get('ps_followup_date_ts')
+        return lead.get(sort or 'created_at')
+
+    values = [sort_value(lead) for lead in everything]
+    present = [value for value in values if value is not None]
+    assert present == sorted(present, reverse=descending)
+    assert values[:len(present)] == present
+
+
+def test_deep_pages_read_one_page_per_table(ps_book):
+    sources = ps_tab_sources('ps1', 'pending', today=TODAY)
+    page_through(ps_book, sources, 'pending', 5)
+    # Slim reads are the ordered ones; counts and hydration are not
+    reads = [query for query in ps_book.queries if query.order_by]
+    assert reads and all(query.limit_to == 5 and 'offset' not in query.params for query in reads)
+
+
+def test_cursor_paging_across_equal_and_missing_values():
+    # Equal timestamps within and across tables, written with different offsets
+    book = FakeSupabase({
+        'ps_followup_master': [
+            {'id': i, 'lead_uid': f'L{i}', 'ps_name': 'ps1', 'final_status': 'Won', 'lead_status': None,
+             'won_timestamp': [None, '2025-03-14T10:00:00+00:00', '2025-03-14T12:00:00+00:00'][i % 3]}
+            for i in range(1, 12)
+        ],
+        'activity_leads': [
+            {'id': i, 'activity_uid': f'A{i}', 'ps_name': 'ps1', 'final_status': 'Won', 'lead_status': None,
+             'won_timestamp': ['2025-03-14T15:30:00+05:30', None][i % 2]}
+            for i in range(1, 6)
+        ],
+        'walkin_table': [],
+    })
+    sources = ps_tab_sources('ps1', 'won', today=TODAY)
+    pages, total = page_through(book, sources, 'won', 2)
+    uids = [lead['lead_uid'] for rows in pages for lead in rows]
+    assert total == len(uids) == len(set(uids)) == 16
+    # 12:00 UTC first, then 10:00 UTC (15:30 +05:30) from both tables, then the rows without one
+    assert uids[:4] == ['L2', 'L5', 'L8', 'L11']
+    assert set(uids[4:10]) == {'L1', 'L4', 'L7', 'L10', 'A2', 'A4'}
+    assert set(uids[10:]) == {'L3', 'L6', 'L9', 'A1', 'A3', 'A5'}
+    assert [uid for uid in uids if uid.startswith('L')] == \
+           ['L2', 'L5', 'L8', 'L11', 'L1', 'L4', 'L7', 'L10', 'L3', 'L6', 'L9']
+
+
+def test_multi_table_tabs_reject_text_sorts_and_pages_without_a_cursor(ps_book):
+    sources = ps_tab_sources('ps1', 'pending', today=TODAY)
+    with pytest.raises(InvalidTabRequest, match='cannot be sorted by customer_name'):
+        load_tab_page(ps_book, sources, 'pending', sort='customer_name')
+    with pytest.raises(InvalidTabRequest, match='cursor'):
+        load_tab_page(ps_book, sources, 'pending', page=2)
+    _, _, cursor = load_tab_page(ps_book, sources, 'pending', per_page=5)
+    with pytest.raises(InvalidTabRequest, match='cursor'):
+        load_tab_page(ps_book, sources, 'pending', page=2, per_page=5, sort='follow_up_date', cursor=cursor)
+    with pytest.raises(InvalidTabRequest, match='cursor'):
+        load_tab_page(ps_book, sources, 'pending', page=2, per_page=5, cursor='not-a-cursor')
+    # A single-table tab still sorts by text, paged by number
+    walkins = ps_tab_sources('ps1', 'walkin', today=TODAY)
+    first, total, cursor = load_tab_page(ps_book, walkins, 'walkin', 1, 10, 'customer_name', False)
+    second, _, _ = load_tab_page(ps_book, walkins, 'walkin', 2, 10, 'customer_name', False)
+    assert cursor is None and len(first) == len(second) == 10 and total == 80
+
+
+def test_followups_are_annotated_with_overdue_days(ps_book):
+    rows, _, _ = load_tab_page(ps_book, ps_tab_sources('ps1', 'followups', today=TODAY), 'followups',
+                               per_page=200)
+    assert rows
+    for lead in rows:
+        due = date.fromisoformat(str(lead['follow_up_date'])[:10])
+        assert due <= TODAY
+        if 'is_overdue' in lead:
+            assert lead['is_overdue'] == (due < TODAY)
+            assert lead['overdue_days'] == (TODAY - due).days
+
+
+def test_category_filter_and_search_are_applied_in_the_query(ps_book):
+    sources = narrow_sources(ps_tab_sources('ps1', 'pending', today=TODAY), filters={'lead_category': 'Hot'},
+                             search='98')
+    rows, total, _ = load_tab_page(ps_book, sources, 'pending', per_page=200)
+    assert total == len(rows) > 0
+    assert all(lead['lead_category'] == 'Hot' and '98' in lead['customer_mobile_number'] for lead in rows)
+
+
+def test_cre_tab_date_filter_drops_sources_without_the_column():
+    rng = random.Random(3)
+    book = FakeSupabase({'lead_master': [cre_lead(rng, i) for i in range(1, 201)], 'activity_leads': []})
+    sources = narrow_sources(cre_tab_sources('cre', 'followups', today=TODAY), 'cre_assigned_at',
+                             TODAY - timedelta(days=2), TODAY)
+    assert [source.table for source in sources] == ['lead_master']
+    rows, total, _ = load_tab_page(book, sources, 'followups', per_page=200)
+    assert total == len(rows)
+    assert all(TODAY - timedelta(days=2) <= date.fromisoformat(lead['cre_assigned_at']) <= TODAY for lead in rows)
+
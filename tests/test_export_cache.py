@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from export_cache import ExportCache
+
+
+def failing_stream(pieces, error):
+    yield from pieces
+    raise error
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExportCache(str(tmp_path), max_bytes=1024)
+
+
+def test_tee_stores_completed_stream(cache):
+    assert ''.join(cache.tee('done', iter(['a,b\r\n', '1,2\r\n']))) == 'a,b\r\n1,2\r\n'
+    with open(cache.get('done'), encoding='utf-8', newline='') as cached:
+        assert cached.read() == 'a,b\r\n1,2\r\n'
+
+
+def test_tee_does_not_store_stream_that_raised(cache):
+    pieces = cache.tee('failed', failing_stream(['a,b\r\n', '1,2\r\n'], IOError('page query failed')))
+    with pytest.raises(IOError):
+        list(pieces)
+    assert cache.get('failed') is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_tee_does_not_store_abandoned_stream(cache):
+    pieces = cache.tee('abandoned', iter(['a,b\r\n', '1,2\r\n']))
+    next(pieces)
+    # The client disconnected: the WSGI server closes the response iterator
+    pieces.close()
+    assert cache.get('abandoned') is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_put_skips_files_larger_than_the_cache(cache, tmp_path):
+    source = tmp_path / 'big.xlsx'
+    source.write_bytes(b'x' * 2048)
+    assert cache.put('big', str(source)) is None
+    assert source.exists()
+
+
+def test_eviction_keeps_the_cache_within_max_bytes(cache, tmp_path):
+    for name in ('first', 'second', 'third'):
+        source = tmp_path / f'{name}.bin'
+        source.write_bytes(b'x' * 400)
+        cache.put(name, str(source))
+    assert cache.get('first') is None
+    assert cache.get('third') is not None
+    assert cache.stats()['evictions'] == 1
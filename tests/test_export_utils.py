@@ -0,0 +1,44 @@
+import csv
+import io
+
+import pytest
+
+from export_utils import iter_csv, row_values
+
+HEADER = ['UID', 'Name']
+
+
+def chunks(count, size=3, fail_after=None):
+    for start in range(0, count, size):
+        if fail_after is not None and start >= fail_after:
+            raise IOError('page query failed')
+        yield [{'uid': f'U{n}', 'customer_name': f'Lead, {n}'} for n in range(start, min(start + size, count))]
+
+
+def audit():
+    calls = []
+    return calls, lambda exported_count, completed: calls.append((exported_count, completed))
+
+
+def test_complete_export_reports_every_row():
+    calls, on_finish = audit()
+    text = ''.join(iter_csv(HEADER, chunks(10), row_values(['uid', 'customer_name']), on_finish))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == HEADER
+    assert rows[1:] == [[f'U{n}', f'Lead, {n}'] for n in range(10)]
+    assert calls == [(10, True)]
+
+
+def test_cancelled_download_reports_the_rows_sent():
+    calls, on_finish = audit()
+    pieces = iter_csv(HEADER, chunks(10), row_values(['uid', 'customer_name']), on_finish)
+    next(pieces), next(pieces), next(pieces)
+    pieces.close()  # the server closes the response when the client goes away
+    assert calls == [(6, False)]
+
+
+def test_failed_read_reports_the_rows_sent_and_raises():
+    calls, on_finish = audit()
+    with pytest.raises(IOError):
+        list(iter_csv(HEADER, chunks(10, fail_after=6), row_values(['uid', 'customer_name']), on_finish))
+    assert calls == [(6, False)]
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import followup_rollover
+from followup_rollover import JOB_NAME, MARKER_TABLE, RETRY_MAX_SECONDS, run_daily_rollover, _retry_delay
+from fake_supabase import FakeSupabase
+
+TODAY = date(2025, 3, 15)
+
+
+def unique_markers(client):
+    """Reject a second marker for the same job and day, like the UNIQUE constraint"""
+    def reject(table, row):
+        if table != MARKER_TABLE:
+            return False
+        if any(old['job_name'] == row['job_name'] and old['run_date'] == row['run_date']
+               for old in client.tables[MARKER_TABLE]):
+            raise RuntimeError('23505 duplicate key value violates unique constraint')
+        return False
+    return reject
+
+
+@pytest.fixture
+def client():
+    followup_rollover._last_completed_date = None
+    book = FakeSupabase({
+        MARKER_TABLE: [],
+        'lead_master': [
+            {'id': 1, 'follow_up_date': '2025-03-10', 'cre_name': 'cre', 'final_status': 'Pending'},
+            {'id': 2, 'follow_up_date': '2025-03-10', 'cre_name': 'cre', 'final_status': 'Won'},
+            {'id': 3, 'follow_up_date': '2025-03-10', 'cre_name': None, 'final_status': None},
+        ],
+        'ps_followup_master': [],
+        'activity_leads': [],
+    })
+    book.reject = unique_markers(book)
+    yield book
+    followup_rollover._last_completed_date = None
+
+
+def marker(client):
+    return client.tables[MARKER_TABLE][0]
+
+
+def test_runs_once_a_day(client):
+    summary = run_daily_rollover(client, TODAY)
+    assert summary['updated']['lead_master.follow_up_date'] == 1
+    assert [row['follow_up_date'] for row in client.tables['lead_master']] == ['2025-03-15', '2025-03-10',
+                                                                               '2025-03-10']
+    assert marker(client)['status'] == 'done'
+
+    followup_rollover._last_completed_date = None  # another worker
+    assert run_daily_rollover(client, TODAY) == {'skipped': True, 'run_date': '2025-03-15'}
+
+
+def test_a_live_claim_is_left_alone_and_a_stale_one_taken_over(client):
+    started = datetime.now(timezone.utc) - timedelta(minutes=5)
+    client.tables[MARKER_TABLE].append({'job_name': JOB_NAME, 'run_date': '2025-03-15', 'status': 'running',
+                                        'started_at': started.isoformat()})
+    assert run_daily_rollover(client, TODAY)['in_progress']
+    assert client.tables['lead_master'][0]['follow_up_date'] == '2025-03-10'
+    # Not remembered as done, so the scheduler tries again
+    assert followup_rollover._last_completed_date is None
+
+    marker(client)['started_at'] = (started - timedelta(hours=1)).isoformat()
+    summary = run_daily_rollover(client, TODAY)
+    assert not summary['skipped']
+    assert client.tables['lead_master'][0]['follow_up_date'] == '2025-03-15'
+    assert marker(client)['status'] == 'done'
+
+
+def test_a_failed_run_releases_its_claim(client, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('statement timeout')
+    monkeypatch.setattr(followup_rollover, 'roll_forward_table', broken)
+    with pytest.raises(RuntimeError):
+        run_daily_rollover(client, TODAY)
+    assert client.tables[MARKER_TABLE] == []
+
+    monkeypatch.undo()
+    assert not run_daily_rollover(client, TODAY)['skipped']
+
+
+def test_retries_back_off_within_the_day():
+    now = datetime(2025, 3, 15, 9, 0)
+    assert _retry_delay(now, 1, 0) == 15 * 3600 + 60
+    assert [_retry_delay(now, 1, failures) for failures in (1, 2, 3)] == [60, 120, 240]
+    assert _retry_delay(now, 1, 20) == RETRY_MAX_SECONDS
+    # Never past the next midnight run
+    assert _retry_delay(datetime(2025, 3, 15, 23, 59, 30), 1, 5) == 90
@@ -0,0 +1,117 @@
+import pytest
+import requests
+
+import knowlaritytosupabase as know
+from fake_supabase import FakeSupabase
+from knowlaritytosupabase import KnowlarityAPI, call_logs_to_frame
+from stub_knowlarity_server import StubKnowlarity
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff sleeps, recorded instead of slept"""
+    slept = []
+    monkeypatch.setattr(know.time, 'sleep', slept.append)
+    return slept
+
+
+def fetch(stub, page_size=500):
+    api = KnowlarityAPI('sr-key', 'x-api-key', base_url=stub.base_url)
+    return [record['uuid'] for record in api.iter_call_logs('2025-03-14', '2025-03-15', page_size)]
+
+
+def test_offset_walk_reads_more_than_ten_thousand_records(delays):
+    with StubKnowlarity(12345) as stub:
+        uuids = fetch(stub)
+    assert uuids == [f'call-{n}' for n in range(12345)]
+    assert [int(query['offset'][0]) for query in stub.requests] == list(range(0, 12345, 500))
+    assert stub.requests[0]['start_time'] == ['2025-03-14 00:00:00+05:30']
+    assert not delays
+
+
+def test_total_count_ends_a_log_that_fills_its_last_page(delays):
+    with StubKnowlarity(10000) as stub:
+        assert len(fetch(stub)) == 10000
+    assert len(stub.requests) == 20
+
+
+@pytest.mark.parametrize('next_links', [None, 3])
+def test_next_links_are_followed_and_offsets_resume_after_them(delays, next_links):
+    with StubKnowlarity(4321) as stub:
+        stub.next_links = next_links
+        uuids = fetch(stub, page_size=250)
+    assert uuids == [f'call-{n}' for n in range(4321)]
+    # The stub rejects a request that repeats a parameter
+    assert all(len(values) == 1 for query in stub.requests for values in query.values())
+    assert len(stub.requests) == 18
+
+
+def test_429_and_server_errors_are_retried_with_retry_after(delays):
+    with StubKnowlarity(1200) as stub:
+        stub.faults.extend([{'status': 429, 'retry_after': '3'}, {'status': 503}, {'status': 500}])
+        uuids = fetch(stub)
+    assert uuids == [f'call-{n}' for n in range(1200)]
+    assert delays[0] == 3.0
+    # Jittered exponential backoff for the 5xx
+    assert know.BACKOFF_BASE * 0.5 * 2 <= delays[1] <= know.BACKOFF_BASE * 2
+    assert know.BACKOFF_BASE * 0.5 * 4 <= delays[2] <= know.BACKOFF_BASE * 4
+
+
+def test_a_page_that_keeps_failing_raises_after_the_records_before_it(delays):
+    with StubKnowlarity(1200) as stub:
+        api = KnowlarityAPI('sr-key', 'x-api-key', base_url=stub.base_url)
+        records = api.iter_call_logs('2025-03-14', '2025-03-15', 500)
+        first_page = [next(records) for _ in range(500)]
+        stub.faults.extend([{'status': 502}] * know.MAX_ATTEMPTS)
+        with pytest.raises(IOError):
+            list(records)
+    assert len(first_page) == 500
+    assert len(delays) == know.MAX_ATTEMPTS - 1
+
+
+def test_client_errors_are_not_retried(delays):
+    with StubKnowlarity(10) as stub:
+        stub.faults.append({'status': 403})
+        with pytest.raises(requests.HTTPError):
+            fetch(stub)
+    assert len(stub.requests) == 1 and not delays
+
+
+def test_a_short_log_is_reported_against_total_count(delays, capsys):
+    with StubKnowlarity(1234) as stub:
+        stub.total_count = 1500
+        assert len(fetch(stub)) == 1234
+    assert '⚠️ Fetched 1234 of 1500 call log records' in capsys.readouterr().out
+
+
+def test_base_url_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv('KNOWLARITY_BASE_URL', 'http://127.0.0.1:8766/')
+    import importlib
+    module = importlib.reload(know)
+    try:
+        assert module.KnowlarityAPI('sr-key', 'x-api-key').base_url == 'http://127.0.0.1:8766'
+    finally:
+        monkeypatch.delenv('KNOWLARITY_BASE_URL')
+        importlib.reload(know)
+
+
+def test_calls_to_known_numbers_become_lead_rows(delays):
+    with StubKnowlarity(100) as stub:
+        api = KnowlarityAPI('sr-key', 'x-api-key', base_url=stub.base_url)
+        frame = call_logs_to_frame(list(api.iter_call_logs('2025-03-14', '2025-03-15', 30)))
+    assert len(frame) == 80
+    assert set(frame['sub_source']) == {'Meta Know', 'Google Know', 'BTL Know'}
+    assert (frame['date'] == '2025-03-14').all()
+
+
+@pytest.mark.parametrize('faults', [[{'status': 403}], [{'status': 502}] * know.MAX_ATTEMPTS])
+def test_main_fails_when_the_call_log_cannot_be_read(delays, monkeypatch, capsys, faults):
+    with StubKnowlarity(10) as stub:
+        stub.faults.extend(faults)
+        monkeypatch.setattr(know, 'KNOW_SR_KEY', 'sr-key')
+        monkeypatch.setattr(know, 'KNOW_X_API_KEY', 'x-api-key')
+        monkeypatch.setattr(know, 'KnowlarityAPI', lambda *keys: KnowlarityAPI(*keys, base_url=stub.base_url))
+        monkeypatch.setattr(KnowlarityAPI, 'test_api_connection', lambda self: True)
+        monkeypatch.setattr(know, 'create_client', lambda url, key: FakeSupabase({}))
+        assert know.main() == 1
+    assert '❌ Call log fetch stopped' in capsys.readouterr().out
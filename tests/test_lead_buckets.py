@@ -0,0 +1,237 @@
+"""
+The vectorized classifiers of lead_buckets against the per-lead loops they
+replaced in the CRE dashboard, the PS dashboard (assigned and event leads),
+the walk-in section and the Won/Lost timestamp filter.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from lead_buckets import (
+    BUCKET_NAMES,
+    PS_EXCLUDED_STATUSES,
+    classify_cre_leads,
+    classify_ps_leads,
+    classify_walkin_leads,
+    dates_within,
+)
+
+TODAY = date(2025, 3, 15)
+FINAL_STATUSES = [None, '', 'Pending', 'Won', 'Lost', 'Dropped']
+LEAD_STATUSES = [None, '', 'Pending', ' Pending ', 'RNR', 'Busy on another Call', 'Call me Back', 'Call Disconnected',
+                 'Call not Connected', 'Interested', 'Dropped', 'Booked', 'Lost to Codealer', 'Retailed']
+CALL_DATES = [None, None, '', '2025-03-14', '2025-03-10T11:30:00+00:00']
+
+
+# -- the per-lead rules as they were written in app.py ---------------------
+
+def legacy_cre_bucket(lead):
+    """cre_dashboard: won/lost/attended/untouched/called/follow_up lists"""
+    non_contact_statuses = ['RNR', 'Busy on another Call', 'Call me Back', 'Call Disconnected', 'Call not Connected']
+    lead_status = (lead.get('lead_status') or '').strip()
+    final_status = lead.get('final_status')
+    has_first_call = lead.get('first_call_date') is not None
+
+    if final_status == 'Won':
+        return 'won'
+    if final_status == 'Lost':
+        return 'lost'
+    if final_status == 'Pending' and has_first_call:
+        return 'pending'
+    if not has_first_call and lead_status == 'Pending':
+        return 'untouched'
+    if lead_status in non_contact_statuses and not has_first_call:
+        if lead_status == 'Call me Back':
+            return 'follow_up'
+        return 'called'
+    return 'other'
+
+
+def legacy_ps_bucket(lead, first_call_field='first_call_date'):
+    """ps_dashboard: assigned leads (first_call_date) and event leads (ps_first_call_date)"""
+    excluded_statuses = ['Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed']
+    final_status = lead.get('final_status')
+    lead_status = lead.get('lead_status')
+
+    if final_status == 'Won':
+        return 'won'
+    if final_status == 'Lost':
+        return 'lost'
+    if final_status == 'Pending' or not final_status:
+        if not lead_status or lead_status not in excluded_statuses:
+            if lead.get(first_call_field):
+                return 'pending'
+            if lead_status == 'Call me Back':
+                return 'follow_up'
+            if lead_status in ['RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected']:
+                return 'called'
+            return 'untouched'
+    return 'other'
+
+
+def legacy_walkin_bucket(lead):
+    """ps_dashboard walk-ins: pending_leads (now 'untouched') and attended_leads (now 'pending')"""
+    excluded_statuses = ['Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed']
+    final_status = lead.get('status')
+    if final_status == 'Won':
+        return 'won'
+    if final_status == 'Lost':
+        return 'lost'
+    if final_status == 'Pending' or not final_status:
+        lead_status = lead.get('status') or lead.get('lead_status')
+        has_any_call = any(lead.get(f'{i}_call_date') for i in range(1, 8))
+        if not has_any_call and (not lead_status or lead_status not in excluded_statuses):
+            return 'untouched'
+        return 'pending'
+    return 'other'
+
+
+def legacy_in_filter(ts_str, start_date, end_date):
+    """The Won/Lost tab's _in_filter for a resolved window"""
+    if not ts_str:
+        return False
+    try:
+        ts_date = datetime.fromisoformat(str(ts_str).replace('Z', '+00:00')).date() if 'T' in str(ts_str) \
+            else datetime.strptime(str(ts_str)[:10], '%Y-%m-%d').date()
+        return start_date <= ts_date <= end_date
+    except Exception:
+        return False
+
+
+# -- fixed inputs ------------------------------------------------------------
+
+def random_leads(seed, count=600):
+    rng = random.Random(seed)
+    leads = []
+    for i in range(count):
+        lead = {
+            'id': i,
+            'final_status': rng.choice(FINAL_STATUSES),
+            'status': rng.choice(FINAL_STATUSES),
+            'lead_status': rng.choice(LEAD_STATUSES),
+            'first_call_date': rng.choice(CALL_DATES),
+            'ps_first_call_date': rng.choice(CALL_DATES),
+        }
+        for call_no in range(1, 8):
+            lead[f'{call_no}_call_date'] = rng.choice(CALL_DATES) if rng.random() < 0.15 else None
+        leads.append(lead)
+    return leads
+
+
+def bucket_names(buckets):
+    return [BUCKET_NAMES[code] for code in buckets.codes]
+
+
+def test_legacy_exclusions_are_the_shared_list():
+    assert legacy_ps_bucket({'final_status': 'Pending', 'lead_status': 'Booked'}) == 'other'
+    assert sorted(PS_EXCLUDED_STATUSES) == sorted(['Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked',
+                                                   'Retailed'])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cre_buckets_match_the_per_lead_rules(seed):
+    leads = random_leads(seed)
+    assert bucket_names(classify_cre_leads(leads)) == [legacy_cre_bucket(lead) for lead in leads]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('first_call_field', ['first_call_date', 'ps_first_call_date'])
+def test_ps_buckets_match_the_per_lead_rules(seed, first_call_field):
+    leads = random_leads(seed)
+    buckets = classify_ps_leads(leads, first_call_field=first_call_field)
+    assert bucket_names(buckets) == [legacy_ps_bucket(lead, first_call_field) for lead in leads]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_walkin_buckets_match_the_per_lead_rules(seed):
+    leads = random_leads(seed)
+    assert bucket_names(classify_walkin_leads(leads)) == [legacy_walkin_bucket(lead) for lead in leads]
+
+
+def test_bucket_counts_and_rows_follow_the_codes():
+    leads = random_leads(7)
+    buckets = classify_ps_leads(leads)
+    expected = [legacy_ps_bucket(lead) for lead in leads]
+    assert buckets.counts() == {name: expected.count(name) for name in BUCKET_NAMES}
+    assert buckets.rows(leads, 'won', 'lost') == [lead for lead, name in zip(leads, expected) if name in ('won', 'lost')]
+
+
+@pytest.mark.parametrize('window', [
+    (TODAY, TODAY),
+    (TODAY.replace(day=1), TODAY),
+    (date(2025, 2, 27), date(2025, 3, 2)),
+    (date(2025, 3, 20), date(2025, 3, 1)),
+])
+def test_won_lost_window_matches_the_per_lead_filter(window):
+    rng = random.Random(3)
+    values = [None, '', 'garbage', '2025-3-1', '2025-03-15T23:59:59Z', '2025-03-01 00:00:00']
+    for _ in range(300):
+        day = TODAY + timedelta(days=rng.randint(-20, 5))
+        values.append(rng.choice([
+            day.isoformat(),
+            f'{day.isoformat()}T{rng.randint(0, 23):02d}:15:00+00:00',
+            f'{day.isoformat()}T{rng.randint(0, 23):02d}:15:00.123456+05:30',
+        ]))
+    assert dates_within(values, *window).tolist() == [legacy_in_filter(value, *window) for value in values]
+
+
+# -- stated rules, one example each ------------------------------------------
+
+@pytest.mark.parametrize('lead,bucket', [
+    ({'final_status': 'Won', 'first_call_date': None, 'lead_status': 'Pending'}, 'won'),
+    ({'final_status': 'Lost', 'first_call_date': '2025-03-01', 'lead_status': 'RNR'}, 'lost'),
+    ({'final_status': 'Pending', 'first_call_date': '2025-03-01', 'lead_status': 'Interested'}, 'pending'),
+    ({'final_status': None, 'first_call_date': '2025-03-01', 'lead_status': 'Interested'}, 'other'),
+    ({'final_status': 'Pending', 'first_call_date': None, 'lead_status': ' Pending '}, 'untouched'),
+    ({'final_status': None, 'first_call_date': None, 'lead_status': 'Pending'}, 'untouched'),
+    ({'final_status': 'Pending', 'first_call_date': None, 'lead_status': 'Call me Back'}, 'follow_up'),
+    ({'final_status': 'Pending', 'first_call_date': None, 'lead_status': 'RNR'}, 'called'),
+    ({'final_status': 'Pending', 'first_call_date': '2025-03-01', 'lead_status': 'RNR'}, 'pending'),
+    ({'final_status': 'Pending', 'first_call_date': None, 'lead_status': 'Interested'}, 'other'),
+])
+def test_cre_examples(lead, bucket):
+    assert bucket_names(classify_cre_leads([lead])) == [bucket]
+
+
+@pytest.mark.parametrize('lead,bucket', [
+    ({'final_status': 'Won', 'lead_status': 'Booked'}, 'won'),
+    ({'final_status': 'Pending', 'lead_status': 'Interested', 'first_call_date': '2025-03-01'}, 'pending'),
+    ({'final_status': '', 'lead_status': None, 'first_call_date': '2025-03-01'}, 'pending'),
+    ({'final_status': 'Pending', 'lead_status': 'Booked', 'first_call_date': '2025-03-01'}, 'other'),
+    ({'final_status': 'Pending', 'lead_status': 'Call me Back', 'first_call_date': None}, 'follow_up'),
+    ({'final_status': None, 'lead_status': 'Busy on another Call', 'first_call_date': ''}, 'called'),
+    ({'final_status': 'Pending', 'lead_status': 'Interested', 'first_call_date': None}, 'untouched'),
+    ({'final_status': 'Pending', 'lead_status': None, 'first_call_date': None}, 'untouched'),
+    ({'final_status': 'Dropped', 'lead_status': 'Interested', 'first_call_date': None}, 'other'),
+])
+def test_ps_examples(lead, bucket):
+    assert bucket_names(classify_ps_leads([lead])) == [bucket]
+
+
+def test_ps_event_leads_use_their_own_first_call_column():
+    lead = {'final_status': 'Pending', 'lead_status': 'Interested', 'first_call_date': None,
+            'ps_first_call_date': '2025-03-01'}
+    assert bucket_names(classify_ps_leads([lead])) == ['untouched']
+    assert bucket_names(classify_ps_leads([lead], first_call_field='ps_first_call_date')) == ['pending']
+
+
+@pytest.mark.parametrize('lead,bucket', [
+    ({'status': 'Won'}, 'won'),
+    ({'status': 'Lost', '1_call_date': '2025-03-01'}, 'lost'),
+    ({'status': 'Pending', 'lead_status': 'Booked'}, 'untouched'),
+    ({'status': None, 'lead_status': 'Booked'}, 'pending'),
+    ({'status': '', 'lead_status': 'Interested'}, 'untouched'),
+    ({'status': 'Pending', '4_call_date': '2025-03-01'}, 'pending'),
+    ({'status': 'Closed'}, 'other'),
+])
+def test_walkin_examples(lead, bucket):
+    assert bucket_names(classify_walkin_leads([lead])) == [bucket]
+
+
+def test_dates_within_examples():
+    values = ['2025-03-01', '2025-03-15T23:59:59+00:00', '2025-02-28T23:59:59+00:00', '2025-03-16', None, 'soon']
+    assert dates_within(values, date(2025, 3, 1), TODAY).tolist() == [True, True, False, False, False, False]
+    assert dates_within(values, None, date(2025, 2, 28)).tolist() == [False, False, True, False, False, False]
+    assert dates_within([], TODAY, TODAY).tolist() == []
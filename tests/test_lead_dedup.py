@@ -0,0 +1,70 @@
+import pandas as pd
+
+from lead_dedup import ingest_lead_frame, ingest_leads
+from fake_supabase import FakeSupabase
+
+
+def uid_for(lead, sequence):
+    return f"U{sequence:05d}"
+
+
+def lead(phone, source='META', sub_source='Meta'):
+    return {'date': '2025-03-15', 'customer_name': 'Lead', 'customer_mobile_number': phone,
+            'source': source, 'sub_source': sub_source}
+
+
+def test_failed_phones_name_every_lead_that_was_not_written():
+    client = FakeSupabase({
+        'lead_master': [{'id': 3, 'uid': 'X1', 'customer_mobile_number': '9000000003', 'source': 'GOOGLE',
+                         'sub_source': 'Google', 'date': '2025-01-01'},
+                        {'id': 4, 'uid': 'X2', 'customer_mobile_number': '9000000004', 'source': 'GOOGLE',
+                         'sub_source': 'Google', 'date': '2025-01-01'}],
+        'duplicate_leads': [],
+    }, reject=lambda table, row: row.get('customer_mobile_number') in ('9000000001', '9000000004'))
+
+    summary = ingest_leads(client, [
+        lead('9000000001'),                    # insert fails
+        lead('9000000001', 'GOOGLE', 'Google'),  # deferred behind the failed insert
+        lead('+91 90000 00002'),               # written
+        lead('9000000004'),                    # duplicate_leads insert fails
+    ], uid_for, batch_size=10)
+
+    assert summary['inserted'] == 1
+    assert summary['failed'] == 3
+    assert summary['failed_phones'] == {'9000000001', '9000000004'}
+    assert [row['customer_mobile_number'] for row in client.tables['lead_master']][-1] == '9000000002'
+
+
+def test_a_clean_run_has_no_failed_phones():
+    client = FakeSupabase({'lead_master': [], 'duplicate_leads': []})
+    summary = ingest_leads(client, [lead('9000000001'), lead('9000000001', 'GOOGLE', 'Google')], uid_for)
+    assert summary['failed'] == 0 and summary['failed_phones'] == set()
+    assert len(client.tables['duplicate_leads']) == 1
+
+
+def test_a_frame_with_sourceless_leads_is_routed_like_ingest_leads():
+    def book():
+        record = {'id': 1, 'uid': 'X1', 'customer_mobile_number': '9000000003', 'original_lead_id': 3,
+                  'source1': 'GOOGLE', 'sub_source1': 'Google', 'source2': 'BTL', 'sub_source2': 'BTL Know',
+                  'duplicate_count': 2}
+        return FakeSupabase({
+            'lead_master': [{'id': 3, 'uid': 'X1', 'customer_mobile_number': '9000000003', 'source': 'GOOGLE',
+                             'sub_source': 'Google', 'date': '2025-01-01'}],
+            'duplicate_leads': [record],
+        })
+
+    # The sourceless lead takes slot 3, which route_leads then hands to META again
+    leads = [lead('9000000003', None, 'Legacy'), lead('9000000003'), lead('9000000005', None, None)]
+
+    def stored(client):
+        return {table: [{key: value for key, value in row.items() if key not in ('created_at', 'updated_at')}
+                        for row in rows] for table, rows in client.tables.items()}
+
+    expected_client, actual_client = book(), book()
+    expected = ingest_leads(expected_client, leads, uid_for)
+    actual = ingest_lead_frame(actual_client, pd.DataFrame(leads), uid_for)
+
+    assert {key: value for key, value in actual.items() if key != 'new_leads'} == \
+        {key: value for key, value in expected.items() if key != 'new_leads'}
+    assert stored(actual_client) == stored(expected_client)
+    assert stored(actual_client)['duplicate_leads'][0]['source3'] == 'META'
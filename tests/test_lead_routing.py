@@ -0,0 +1,71 @@
+import random
+
+import pandas as pd
+import pytest
+
+from lead_dedup import SOURCE_SLOTS, _route_frame, route_leads
+
+PHONES = [f'90000000{n:02d}' for n in range(40)]
+LEAD_PAIRS = [('META', 'Meta'), ('META', 'Meta Know'), ('GOOGLE', 'Google'), ('GOOGLE', 'Google Know'),
+              ('BTL', 'BTL Know'), ('Walk-in', 'Showroom'), ('Tele', None), ('Tele', 'Inbound')]
+# Stored rows may predate the sync scripts and lack a source
+RECORD_PAIRS = LEAD_PAIRS + [(None, None), (None, 'Legacy')]
+
+
+def random_batch(rng, size):
+    """Leads with repeated phones and pairs, and the existing records of some of their phones"""
+    leads = [
+        {'customer_mobile_number': rng.choice(PHONES), 'source': pair[0], 'sub_source': pair[1],
+         'date': f'2025-03-{rng.randint(1, 28):02d}', 'customer_name': f'Lead {n}'}
+        for n, pair in enumerate(rng.choice(LEAD_PAIRS) for _ in range(size))
+    ]
+    master_records, duplicate_records = {}, {}
+    for n, phone in enumerate(rng.sample(PHONES, 25)):
+        source, sub_source = rng.choice(RECORD_PAIRS)
+        master_records[phone] = {'id': n, 'uid': f'X-{n}', 'customer_mobile_number': phone, 'customer_name': 'Old',
+                                 'source': source, 'sub_source': sub_source, 'date': '2025-01-01'}
+        if rng.random() < 0.5:
+            # Records from empty to full, some with gaps left by cleared slots
+            record = {'id': 1000 + n, 'uid': f'X-{n}', 'customer_mobile_number': phone, 'original_lead_id': n}
+            used = 0
+            for slot in range(1, SOURCE_SLOTS + 1):
+                pair = rng.choice(RECORD_PAIRS) if rng.random() < 0.6 else (None, None)
+                record[f'source{slot}'], record[f'sub_source{slot}'] = pair
+                record[f'date{slot}'] = '2025-01-01' if pair != (None, None) else None
+                used += pair[0] is not None
+            record['duplicate_count'] = used
+            duplicate_records[phone] = record
+    return leads, master_records, duplicate_records
+
+
+def outcome(routing):
+    def strip(record):
+        return {key: value for key, value in record.items() if key not in ('created_at', 'updated_at')}
+    return {
+        'new_leads': routing.new_leads,
+        'deferred': routing.deferred,
+        'duplicate_updates': [(key, strip(record)) for key, record in routing.duplicate_updates.items()],
+        'duplicate_inserts': [(key, strip(record)) for key, record in routing.duplicate_inserts.items()],
+        'counts': routing.summary(),
+    }
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_route_frame_matches_route_leads(seed):
+    rng = random.Random(seed)
+    leads, master_records, duplicate_records = random_batch(rng, rng.randint(0, 120))
+    keys = pd.DataFrame({'phone': [lead['customer_mobile_number'] for lead in leads],
+                         'source': [lead['source'] for lead in leads],
+                         'sub_source': [lead['sub_source'] for lead in leads]})
+
+    expected = route_leads(leads, master_records, duplicate_records)
+    actual = _route_frame(keys, master_records, duplicate_records,
+                          lambda positions: [dict(leads[pos]) for pos in positions])
+    assert outcome(actual) == outcome(expected)
+
+
+def test_route_frame_rejects_leads_without_a_source():
+    keys = pd.DataFrame({'phone': ['9000000001', '9000000001'], 'source': ['META', None],
+                         'sub_source': ['Meta', 'Legacy']})
+    with pytest.raises(ValueError, match='route_leads'):
+        _route_frame(keys, {}, {}, lambda positions: [])
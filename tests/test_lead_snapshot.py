@@ -0,0 +1,40 @@
+from fake_supabase import FakeSupabase
+from lead_snapshot import TableSnapshot
+
+
+def lead(i, updated_at=None, status='Pending'):
+    return {'id': i, 'uid': f'L{i}', 'final_status': status, 'created_at': f'2025-03-01T10:00:{i:02d}+00:00',
+            'updated_at': updated_at}
+
+
+def snapshot():
+    return TableSnapshot('lead_master', columns=['uid', 'final_status'], categorical_columns=['final_status'])
+
+
+def test_incremental_refresh_applies_updated_rows():
+    client = FakeSupabase({'lead_master': [lead(i) for i in range(1, 6)]})
+    snap = snapshot()
+    assert len(snap.get_frame(client)) == 5
+
+    # An update stamped by the updated_at trigger, and a new row
+    client.tables['lead_master'][1] = lead(2, updated_at='2025-03-02T09:00:00+00:00', status='Won')
+    client.tables['lead_master'].append(lead(6))
+    assert snap.refresh(client)['mode'] == 'incremental'
+
+    frame = snap.frame
+    assert list(frame.index) == [1, 2, 3, 4, 5, 6]
+    assert frame.loc[2, 'final_status'] == 'Won'
+
+
+def test_local_delete_forces_a_full_reload():
+    client = FakeSupabase({'lead_master': [lead(i) for i in range(1, 6)]})
+    snap = snapshot()
+    snap.get_frame(client)
+
+    client.tables['lead_master'] = [row for row in client.tables['lead_master'] if row['id'] != 3]
+    snap.mark_stale()
+    assert 3 in snap.get_frame(client).index  # an incremental refresh cannot see the delete
+
+    snap.mark_stale(full=True)
+    assert 3 not in snap.get_frame(client).index
+    assert snap.refresh(client)['mode'] == 'incremental'
@@ -0,0 +1,122 @@
+import csv
+import threading
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED
+
+import lead_upload
+from fake_supabase import FakeSupabase
+from lead_upload import UploadJobs, run_lead_upload
+from uid_allocator import UIDAllocator
+
+
+def test_finished_jobs_are_dropped_after_the_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(lead_upload.time, 'monotonic', lambda: clock[0])
+    jobs = UploadJobs(ttl_seconds=60)
+
+    jobs.create('a', user_id=1, inserted=0)
+    jobs.create('b', user_id=1, inserted=0)
+    assert jobs.update('a', {'inserted': 5})['inserted'] == 5
+    assert jobs.finish('a', 'completed', {'inserted': 9}) == {'job_id': 'a', 'status': 'completed',
+                                                               'user_id': 1, 'inserted': 9}
+
+    clock[0] += 59
+    assert jobs.get('a')['status'] == 'completed'
+    clock[0] += 2
+    assert jobs.get('a') is None
+    # Running jobs are kept however old they are
+    assert jobs.get('b')['status'] == 'running'
+    assert len(jobs) == 1
+
+
+def test_jobs_are_returned_as_copies():
+    jobs = UploadJobs()
+    jobs.create('a', inserted=0)
+    jobs.get('a')['inserted'] = 100
+    assert jobs.get('a')['inserted'] == 0
+
+
+UPLOAD_ROWS = [
+    # chunk 1
+    ('Asha', '9100000001', '2025-03-15'),
+    ('Ravi', '+91 91000 00002', '2025-03-15'),
+    ('Old', '9000000001', '2025-03-15'),       # already a Meta lead: skipped duplicate
+    ('No Date', '9100000004', ''),             # missing date: skipped
+    ('Asha again', '9100000001', '2025-03-15'),  # repeat within the chunk
+    # chunk 2
+    ('Zoya', '9000000002', '2025-03-15'),      # a GOOGLE lead: new source in duplicate_leads
+    ('Full', '9000000003', '2025-03-15'),      # every source slot taken
+    ('Bad Phone', 'n/a', '2025-03-15'),        # no digits: skipped
+    ('Nine', '9100000009', '2025-03-15'),
+    ('Ten', '9100000010', '2025-03-15'),       # its batch is rejected
+    # chunk 3
+    ('Ravi again', '9100000002', '2025-03-16'),  # repeat of an earlier chunk
+    ('Twelve', '9100000012', '2025-03-16'),
+    ('Thirteen', '9100000013', '2025-03-16'),
+    ('Fourteen', '9100000014', '2025-03-16'),
+    ('Fifteen', '9100000015', '2025-03-16'),
+    # chunk 4
+    ('Sixteen', '9100000016', '2025-03-16'),
+]
+
+
+def test_a_csv_upload_end_to_end(tmp_path, monkeypatch):
+    path = tmp_path / 'leads.csv'
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['customer_name', 'customer_mobile_number', 'date', 'notes'])
+        writer.writerows([*row, ''] for row in UPLOAD_ROWS)
+
+    full_record = {'id': 7, 'uid': 'D7', 'customer_mobile_number': '9000000003', 'duplicate_count': 10}
+    full_record.update({f'source{i}': f'S{i}' for i in range(1, 11)})
+    full_record.update({f'sub_source{i}': None for i in range(1, 11)})
+    # The first insert batch waits until the reader has blocked on a full queue
+    reader_waited = threading.Event()
+
+    class SlowInserts(FakeSupabase):
+        def write(self, table_name, rows, on_conflict=None):
+            if table_name == 'lead_master':
+                assert reader_waited.wait(5)
+            return super().write(table_name, rows, on_conflict)
+
+    client = SlowInserts({
+        'lead_master': [
+            {'id': 1, 'uid': 'M1', 'customer_mobile_number': '9000000001', 'customer_name': 'Old', 'source': 'Meta',
+             'sub_source': None, 'date': '2025-01-01'},
+            {'id': 2, 'uid': 'G2', 'customer_mobile_number': '9000000002', 'customer_name': 'Zoya',
+             'source': 'GOOGLE', 'sub_source': None, 'date': '2025-01-01'},
+        ],
+        'duplicate_leads': [full_record],
+    }, reject=lambda table, row: table == 'lead_master' and row['customer_mobile_number'] == '9100000010')
+
+    queue_lengths = []
+
+    def recording_wait(futures, return_when=ALL_COMPLETED):
+        if return_when == FIRST_COMPLETED:
+            queue_lengths.append(len(futures))
+            reader_waited.set()
+        return real_wait(futures, return_when=return_when)
+
+    real_wait = lead_upload.wait
+    monkeypatch.setattr(lead_upload, 'wait', recording_wait)
+    reports = []
+    summary = run_lead_upload(client, str(path), 'Meta', UIDAllocator(client), reports.append,
+                              chunk_size=5, batch_size=2, max_workers=1)
+
+    assert {key: value for key, value in summary.items() if key != 'execution_time'} == {
+        'rows_read': 16, 'inserted': 7, 'skipped': 2, 'duplicate_sources': 1, 'skipped_duplicates': 3,
+        'slots_full': 1, 'failed': 2, 'failed_batches': 1,
+    }
+    # Two batches queued for the one worker, then the reader waits
+    assert queue_lengths and set(queue_lengths) == {2}
+    assert [len(query.payload) for query in client.queries
+            if query.table == 'lead_master' and query.action == 'insert'] == [2, 2, 2, 2, 1]
+    # One report per chunk, then the final summary
+    assert [report['rows_read'] for report in reports] == [5, 10, 15, 16, 16]
+
+    new_leads = client.tables['lead_master'][2:]
+    assert [lead['customer_mobile_number'] for lead in new_leads] == [
+        '9100000001', '9100000002', '9100000012', '9100000013', '9100000014', '9100000015', '9100000016']
+    assert all(lead['source'] == 'Meta' and lead['uid'].startswith('M') for lead in new_leads)
+    assert len({lead['uid'] for lead in new_leads}) == 7
+    added = [record for record in client.tables['duplicate_leads'] if record['customer_mobile_number'] == '9000000002']
+    assert len(added) == 1 and (added[0]['source1'], added[0]['source2']) == ('GOOGLE', 'Meta')
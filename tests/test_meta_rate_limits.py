@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# metatosupabase reads its settings at import time
+for key, value in (('META_PAGE_ACCESS_TOKEN', 'token'), ('PAGE_ID', 'page'),
+                   ('SUPABASE_URL', 'http://127.0.0.1:9'), ('SUPABASE_ANON_KEY', 'header.payload.signature')):
+    os.environ.setdefault(key, value)
+
+import metatosupabase as meta  # noqa: E402
+from mock_graph_server import MockGraph  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(meta, 'BACKOFF_BASE', 0.01)
+
+
+def sync(graph, lookback=timedelta(days=1)):
+    """Fetch the forms and their leads from ``graph`` the way sync_complete_with_duplicates does"""
+    async def run():
+        async with graph:
+            async with meta.RobustMetaAPI('token', graph_url=graph.base_url) as api:
+                forms = await api.fetch_forms_robust()
+                since = datetime.now(timezone.utc).replace(tzinfo=None) - lookback
+                results = await api.fetch_all_leads_batch_safe({form['id']: since for form in forms})
+                return forms, results, api.limiter
+    return asyncio.run(run())
+
+
+def test_many_forms_are_fetched_concurrently_in_seconds():
+    graph = MockGraph(forms=120, leads_per_form=250, latency=0.02)
+    start = time.perf_counter()
+    forms, results, limiter = sync(graph)
+    elapsed = time.perf_counter() - start
+
+    assert len(forms) == 120
+    assert all(complete and len(leads) == 250 for leads, complete in results.values())
+    # Low usage lets the limiter grow past its starting size
+    assert limiter.limit == meta.META_MAX_CONCURRENCY
+    assert meta.META_INITIAL_CONCURRENCY < graph.peak <= meta.META_MAX_CONCURRENCY
+    assert elapsed < 10
+
+
+def test_paging_stops_at_the_first_lead_older_than_since():
+    graph = MockGraph(forms=2, leads_per_form=500)
+    _, results, _ = sync(graph, lookback=timedelta(minutes=150))
+    for leads, complete in results.values():
+        assert complete
+        assert len(leads) == 149
+    # 2 pages of 100 per form, not all 5
+    assert graph.requests == 1 + 2 * 2
+
+
+def test_429s_and_rate_limit_codes_throttle_and_are_retried():
+    graph = MockGraph(forms=6, leads_per_form=120)
+    graph.faults.extend([
+        {'status': 429, 'retry_after': '0'},
+        {'status': 400, 'code': 613},
+        {'status': 403, 'code': 4},
+        {'status': 400, 'code': 80004},
+    ])
+    forms, results, limiter = sync(graph)
+    assert len(forms) == 6
+    assert all(complete and len(leads) == 120 for leads, complete in results.values())
+    assert limiter.throttled == 4
+
+
+@pytest.mark.parametrize('usage,limit', [(95, 1), (80, 1), (60, meta.META_INITIAL_CONCURRENCY), (10, 16)])
+def test_usage_headers_size_the_limiter(usage, limit):
+    graph = MockGraph(forms=40, leads_per_form=10, usage=usage)
+    _, results, limiter = sync(graph)
+    assert all(complete for _, complete in results.values())
+    assert limiter.limit == limit
+    if usage >= meta.USAGE_HIGH:
+        # Only the requests sent before the first response overlap
+        assert graph.peak <= meta.META_INITIAL_CONCURRENCY
+
+
+def test_a_form_whose_pages_keep_failing_is_incomplete():
+    graph = MockGraph(forms=3, leads_per_form=20)
+    graph.broken_paths.add(f'/{meta.RobustMetaAPI("token").api_version}/form1/leads')
+    _, results, _ = sync(graph)
+    assert results['form1'] == ([], False)
+    assert results['form0'][1] and results['form2'][1]
@@ -0,0 +1,459 @@
+"""
+query_utils on tests/fake_supabase.py: keyset paging, batched counts, the
+request memo, and the shared
+date-window builder and pushed-down date conditions against the per-route
+window helpers and per-row date filters they replaced.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import query_utils
+from fake_supabase import FakeRPC, FakeSupabase, matches
+from query_utils import (
+    RequestQueryCache,
+    TTLCache,
+    branch_write_invalidator,
+    count_many,
+    count_rows,
+    date_range_conditions,
+    date_range_hook,
+    first_date_range_hook,
+    iter_table_chunks,
+    iter_table_rows,
+    parse_day,
+    resolve_date_window,
+    track_table_writes,
+)
+
+TODAY = date(2025, 3, 12)
+
+
+# -- keyset paging -------------------------------------------------------------
+
+def keyed_rows():
+    """Few distinct created_at values (some NULL), ids out of insertion order"""
+    stamps = ['2025-03-01T10:00:00+00:00', '2025-03-01T10:00:00+00:00', None, '2025-03-02T09:00:00+00:00']
+    rows = []
+    for n, row_id in enumerate(random.Random(0).sample(range(1, 200), 23)):
+        rows.append({'id': row_id, 'created_at': stamps[n % len(stamps)], 'branch': 'PORUR' if n % 3 else 'AMBATTUR'})
+    return rows
+
+
+def in_key_order(rows, order_by='created_at'):
+    """Rows by (order_by, id) with NULLs last, as Postgres orders them"""
+    return sorted(rows, key=lambda row: (row[order_by] is None, row[order_by] or '', row['id']))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 22, 23, 24, 1000])
+def test_keyset_pages_on_a_non_unique_column_cover_every_row_once(chunk_size):
+    rows = keyed_rows()
+    client = FakeSupabase({'lead_master': rows})
+    chunks = list(iter_table_chunks(client, 'lead_master', order_by='created_at', chunk_size=chunk_size))
+    assert [row['id'] for chunk in chunks for row in chunk] == [row['id'] for row in in_key_order(rows)]
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    # Never OFFSET paging
+    assert all('offset' not in query.params for query in client.queries)
+
+
+def test_a_chunk_boundary_inside_equal_and_null_values():
+    rows = [{'id': i, 'created_at': value} for i, value in
+            [(5, 'b'), (1, 'a'), (3, 'a'), (2, 'a'), (9, None), (4, 'b'), (7, None), (8, None), (6, 'a')]]
+    client = FakeSupabase({'leads': rows})
+    chunks = list(iter_table_chunks(client, 'leads', order_by='created_at', chunk_size=2))
+    assert [[row['id'] for row in chunk] for chunk in chunks] == [[1, 2], [3, 6], [4, 5], [7, 8], [9]]
+    # The cursor after (6, 'a') resumes inside 'a'; after (8, NULL) only NULLs with a higher id are left
+    assert 'created_at.eq."a"' in client.queries[2].params['or']
+    assert client.queries[4].conditions == ['created_at.is.null', 'id.gt.8']
+
+
+def test_keyset_cursor_is_anded_with_the_hook_and_filters():
+    rows = keyed_rows()
+    client = FakeSupabase({'lead_master': rows})
+    hook = date_range_hook('created_at', date(2025, 3, 2), date(2025, 3, 2), include_null=True)
+    kept = list(iter_table_rows(client, 'lead_master', {'branch': 'PORUR'}, 'id', order_by='created_at',
+                                chunk_size=2, query_hook=hook))
+    expected = [row for row in in_key_order(rows)
+                if row['branch'] == 'PORUR' and (row['created_at'] is None or row['created_at'].startswith('2025-03-02'))]
+    assert [row['id'] for row in kept] == [row['id'] for row in expected]
+    # The projection gains the cursor columns, and both or= trees are sent
+    assert set(kept[0]) == {'id', 'created_at'}
+    assert any(len(query.params.get_list('or')) == 2 for query in client.queries)
+
+
+def test_id_ordered_paging_and_empty_tables():
+    client = FakeSupabase({'leads': [{'id': i} for i in (4, 1, 3, 2)], 'empty': []})
+    assert [[row['id'] for row in chunk] for chunk in iter_table_chunks(client, 'leads', chunk_size=2)] == \
+        [[1, 2], [3, 4]]
+    assert list(iter_table_chunks(client, 'empty')) == []
+
+
+def legacy_dashboard_date_window(filter_type, start_date=None, end_date=None, today=TODAY):
+    """_dashboard_date_window of the CRE and PS dashboards"""
+    if filter_type == 'today':
+        return today, today
+    if filter_type == 'range':
+        def parse(value):
+            try:
+                return datetime.strptime(value[:10], '%Y-%m-%d').date() if value else None
+            except ValueError:
+                return None
+        return parse(start_date), parse(end_date)
+    days_back = {'month': 30, 'quarter': 90, 'year': 365}
+    if filter_type == 'mtd':
+        return today.replace(day=1), today
+    if filter_type == 'week':
+        return today - timedelta(days=today.weekday()), today
+    if filter_type in days_back:
+        return today - timedelta(days=days_back[filter_type]), today
+    return None, None
+
+
+def legacy_day(value):
+    """The per-row 'T' in s / fromisoformat parsing of the old date filters"""
+    if 'T' in value:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+@pytest.mark.parametrize('filter_type,start,end', [
+    ('today', None, None), ('mtd', None, None), ('week', None, None), ('month', None, None),
+    ('quarter', None, None), ('year', None, None), ('all', None, None), (None, None, None),
+    ('range', '2025-02-01', '2025-02-28'), ('range', '2025-02-01T00:00:00', None), ('range', 'garbage', '2025-03-01'),
+])
+def test_resolve_date_window_matches_the_dashboard_windows(filter_type, start, end):
+    assert resolve_date_window(filter_type, start, end, today=TODAY) == \
+        legacy_dashboard_date_window(filter_type, start, end)
+
+
+def test_parse_day_matches_the_per_row_parsing():
+    values = ['2025-03-12', '2025-03-12T23:59:59+00:00', '2025-03-12T00:00:00Z', '2025-03-12T10:00:00.123456+05:30']
+    assert [parse_day(value) for value in values] == [legacy_day(value) for value in values]
+    assert parse_day(None) is None and parse_day('') is None and parse_day('not a date') is None
+
+
+def dated_rows(seed, count=400):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, count + 1):
+        day = TODAY + timedelta(days=rng.randint(-20, 5))
+        created_at = f'{day.isoformat()}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00'
+        rows.append({
+            'id': i,
+            'created_at': created_at if rng.random() < 0.7 else None,
+            'date': (day - timedelta(days=rng.randint(0, 3))).isoformat() if rng.random() < 0.8 else None,
+        })
+    return rows
+
+
+WINDOWS = [(TODAY, TODAY), (date(2025, 3, 1), TODAY), (date(2025, 2, 20), date(2025, 2, 28))]
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_date_range_conditions_match_the_per_row_filter(window):
+    start_date, end_date = window
+    rows = [row for row in dated_rows(1) if row['created_at']]
+    conditions = date_range_conditions('created_at', start_date, end_date)
+    kept = [row['id'] for row in rows if all(matches(row, condition) for condition in conditions)]
+    assert kept == [row['id'] for row in rows if start_date <= legacy_day(row['created_at']) <= end_date]
+
+
+@pytest.mark.parametrize('window', WINDOWS + [(date(2025, 3, 5), None)])
+def test_first_date_range_hook_matches_created_at_or_date(window):
+    """source_analysis_data filtered on ``created_at or date``; rows with neither are no longer kept"""
+    start_date, end_date = window
+    rows = dated_rows(2)
+
+    def legacy_in_date_range(lead):
+        lead_date_str = lead.get('created_at') or lead.get('date')
+        if not lead_date_str:
+            return True
+        lead_date = legacy_day(lead_date_str)
+        if start_date and end_date:
+            return start_date <= lead_date <= end_date
+        return lead_date >= start_date
+
+    client = FakeSupabase({'lead_master': rows})
+    query = first_date_range_hook(['created_at', 'date'], start_date, end_date)(client.table('lead_master').select('*'))
+    kept = [row['id'] for row in query.execute().data]
+    assert kept == [row['id'] for row in rows if legacy_in_date_range(row) and (row['created_at'] or row['date'])]
+
+
+@pytest.mark.parametrize('period,window', [
+    ('today', (date(2025, 3, 12), date(2025, 3, 12))),
+    ('yesterday', (date(2025, 3, 11), date(2025, 3, 11))),
+    ('this_week', (date(2025, 3, 10), date(2025, 3, 12))),
+    ('this_month', (date(2025, 3, 1), date(2025, 3, 12))),
+    ('last_month', (date(2025, 2, 1), date(2025, 2, 28))),
+    ('quarter', (date(2024, 12, 12), date(2025, 3, 12))),
+    ('custom', (date(2025, 1, 5), None)),
+])
+def test_resolve_date_window_examples(period, window):
+    assert resolve_date_window(period, '2025-01-05', '31-01-2025', today=TODAY) == window
+
+
+def test_date_range_conditions_examples():
+    assert date_range_conditions('won_timestamp') == []
+    assert date_range_conditions('won_timestamp', date(2025, 3, 1), date(2025, 3, 31)) == \
+        ['won_timestamp.gte.2025-03-01', 'won_timestamp.lt.2025-04-01']
+    assert date_range_conditions('won_timestamp', end_date=date(2025, 3, 31), include_null=True) == \
+        ['or(won_timestamp.is.null,and(won_timestamp.lt.2025-04-01))']
+    # The whole end day is kept
+    last_second = {'won_timestamp': '2025-03-31T23:59:59+00:00'}
+    assert all(matches(last_second, c) for c in date_range_conditions('won_timestamp', end_date=date(2025, 3, 31)))
+
+
+def test_first_date_range_hook_falls_back_to_the_next_column():
+    rows = [
+        {'id': 1, 'created_at': '2025-03-05T10:00:00+00:00', 'date': '2025-01-01'},
+        {'id': 2, 'created_at': None, 'date': '2025-03-06'},
+        {'id': 3, 'created_at': '2025-02-01T10:00:00+00:00', 'date': '2025-03-06'},
+        {'id': 4, 'created_at': None, 'date': None},
+    ]
+    client = FakeSupabase({'lead_master': rows})
+    hook = first_date_range_hook(['created_at', 'date'], date(2025, 3, 1), date(2025, 3, 31))
+    assert [row['id'] for row in hook(client.table('lead_master').select('*')).execute().data] == [1, 2]
+    assert first_date_range_hook(['created_at', 'date']) is None
+
+
+# -- batched counts ------------------------------------------------------------
+
+@pytest.fixture
+def count_book(monkeypatch):
+    monkeypatch.setattr(query_utils, '_count_rpc_available', True)
+    rows = [{'id': i, 'ps_name': f'ps{i % 3}', 'final_status': [None, 'Pending', 'Won', 'Lost'][i % 4],
+             'follow_up_date': f'2025-03-{i % 28 + 1:02d}'} for i in range(1, 101)]
+    return FakeSupabase({'ps_followup_master': rows, 'walkin_table': rows[:10]})
+
+
+COUNT_SPECS = [
+    ('ps_followup_master', {'ps_name': 'ps1'}),
+    ('ps_followup_master', {'ps_name': 'ps1', 'final_status': 'Won'}),
+    ('ps_followup_master', {'final_status': ('is', 'null'), 'cre_name': None}),
+    ('ps_followup_master', {'final_status': ('not.is', 'null'), 'follow_up_date': ('lte', '2025-03-10')}),
+    ('ps_followup_master', {'final_status': ('neq', 'Won')}),
+    ('walkin_table', None),
+]
+
+
+def test_count_many_resolves_every_spec_in_one_round_trip(count_book):
+    counts = count_many(count_book, COUNT_SPECS)
+    assert counts == [34, 8, 25, 28, 50, 10]
+    assert counts == [count_rows(count_book, table, filters) for table, filters in COUNT_SPECS]
+    assert count_book.rpcs == ['crm_count_many']
+    assert count_many(count_book, []) == []
+
+
+def test_count_many_counts_each_spec_when_the_rpc_cannot_take_it(count_book):
+    specs = COUNT_SPECS + [('ps_followup_master', {'ps_name': ('ilike', 'ps*')})]
+    expected = [34, 8, 25, 28, 50, 10, 100]
+    assert count_many(count_book, specs) == expected
+    assert count_many(count_book, COUNT_SPECS, count='planned') == expected[:-1]
+    assert count_book.rpcs == []
+    assert len(count_book.queries) == len(specs) + len(COUNT_SPECS)
+
+
+class MissingRPC(FakeSupabase):
+    def __init__(self, tables, error):
+        super().__init__(tables)
+        self.error = error
+
+    def rpc(self, name, params):
+        self.rpcs.append(name)
+        raise RuntimeError(self.error)
+
+
+def test_a_missing_rpc_falls_back_and_is_not_retried(count_book):
+    client = MissingRPC(count_book.tables, "{'code': 'PGRST202', 'message': 'Could not find the function'}")
+    assert count_many(client, COUNT_SPECS) == [34, 8, 25, 28, 50, 10]
+    assert count_many(client, COUNT_SPECS[:2]) == [34, 8]
+    assert client.rpcs == ['crm_count_many']
+    assert query_utils._count_rpc_available is False
+
+
+def test_other_rpc_errors_fall_back_for_that_call_only(count_book):
+    client = MissingRPC(count_book.tables, 'connection reset')
+    assert count_many(client, COUNT_SPECS[:2]) == [34, 8]
+    assert count_many(client, COUNT_SPECS[:2]) == [34, 8]
+    assert client.rpcs == ['crm_count_many', 'crm_count_many']
+    assert query_utils._count_rpc_available is True
+
+
+def test_an_unexpected_rpc_payload_falls_back(count_book):
+    class ShortRPC(FakeSupabase):
+        def rpc(self, name, params):
+            self.rpcs.append(name)
+            return FakeRPC([1])
+
+    client = ShortRPC(count_book.tables)
+    assert count_many(client, COUNT_SPECS[:2]) == [34, 8]
+    assert client.rpcs == ['crm_count_many'] and len(client.queries) == 2
+
+
+# -- request memo --------------------------------------------------------------
+
+@pytest.fixture
+def memo_client():
+    client = FakeSupabase({'lead_master': [{'id': 1, 'cre_name': 'Asha'}, {'id': 2, 'cre_name': 'Ravi'}],
+                           'cre_users': [{'id': 1, 'name': 'Asha'}]})
+    cache = RequestQueryCache()
+    track_table_writes(client, cache.invalidate)
+
+    def read(table_name, filters=None, select_fields='*'):
+        """safe_get_data's memoized read"""
+        key = cache.make_key(table_name, filters, select_fields, 10000)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        query = client.table(table_name).select(select_fields)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        rows = query.limit(10000).execute().data
+        cache.set(key, rows)
+        return rows
+
+    return client, read
+
+
+def reads(client):
+    return sum(1 for query in client.queries if query.action == 'select')
+
+
+def test_identical_reads_in_a_request_hit_the_database_once(memo_client):
+    client, read = memo_client
+    with Flask(__name__).test_request_context():
+        first = read('lead_master', {'cre_name': 'Asha'})
+        first[0]['annotated'] = True
+        assert read('lead_master', {'cre_name': 'Asha'}) == [{'id': 1, 'cre_name': 'Asha'}]
+        assert reads(client) == 1
+        # Other filters or projections are separate reads
+        read('lead_master', {'cre_name': 'Ravi'})
+        read('lead_master', {'cre_name': 'Asha'}, 'id')
+        assert reads(client) == 3
+    with Flask(__name__).test_request_context():
+        read('lead_master', {'cre_name': 'Asha'})
+        assert reads(client) == 4
+
+
+def test_a_write_drops_only_that_tables_reads(memo_client):
+    client, read = memo_client
+    with Flask(__name__).test_request_context():
+        read('lead_master')
+        read('cre_users')
+        client.table('lead_master').update({'cre_name': 'Meena'}).eq('id', 2).execute()
+        assert read('lead_master')[1]['cre_name'] == 'Meena'
+        client.table('lead_master').insert({'id': 3, 'cre_name': 'Zoya'}).execute()
+        assert [row['id'] for row in read('lead_master')] == [1, 2, 3]
+        read('cre_users')
+        assert reads(client) == 4
+
+
+def test_outside_a_request_nothing_is_memoized(memo_client):
+    client, read = memo_client
+    read('lead_master')
+    read('lead_master')
+    assert reads(client) == 2
+
+
+# -- branch caches -------------------------------------------------------------
+
+def test_ttl_cache_expiry_and_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_utils.time, 'monotonic', lambda: now[0])
+    cache = TTLCache(ttl_seconds=60, max_entries=3)
+    cache.set('a', 1)
+    now[0] += 30
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b')) == (1, 2)
+    # Full: the entry closest to expiry goes
+    cache.set('d', 4)
+    assert (cache.get('a'), cache.get('d')) == (None, 4)
+    now[0] += 61
+    assert cache.get('b') is None
+    # Expired entries are dropped before any live one is evicted
+    cache.set('e', 5)
+    now[0] += 30
+    cache.set('f', 6)
+    cache.set('g', 7)
+    assert (cache.get('e'), cache.get('f'), cache.get('g')) == (5, 6, 7)
+
+
+def test_ttl_cache_invalidation_and_generation():
+    cache = TTLCache()
+    for key in [('North', '2025-03-12'), ('South', '2025-03-12'), ('North', '2025-03-11')]:
+        cache.set(key, key[1])
+    cache.invalidate(lambda key: key[0] == 'North')
+    assert cache.get(('South', '2025-03-12')) == '2025-03-12'
+    assert cache.get(('North', '2025-03-12')) is None and cache.get(('North', '2025-03-11')) is None
+
+    # A value computed across an invalidation is not stored
+    generation = cache.generation()
+    cache.invalidate(lambda key: False)
+    cache.set(('North', '2025-03-12'), 'stale', generation)
+    assert cache.get(('North', '2025-03-12')) is None
+    cache.set(('North', '2025-03-12'), 'fresh', cache.generation())
+    assert cache.get(('North', '2025-03-12')) == 'fresh'
+    cache.invalidate()
+    assert cache.get(('South', '2025-03-12')) is None
+
+
+@pytest.fixture
+def branch_caches():
+    client = FakeSupabase({'walkin_table': [{'id': 1, 'branch': 'North'}]},
+                          reject=lambda table, row: row.get('branch') == 'Closed')
+    kpis, analytics = TTLCache(), TTLCache()
+    track_table_writes(client, branch_write_invalidator({'walkin_table': 'branch'}, [kpis, analytics]),
+                       pass_payload=True)
+
+    def fill():
+        for cache in (kpis, analytics):
+            for branch in ('North', 'South', 'East'):
+                cache.set((branch, '2025-03-12'), branch)
+
+    def cached(cache):
+        return sorted(key[0] for key in cache._entries)
+
+    return client, kpis, analytics, fill, cached
+
+
+def test_an_insert_drops_only_the_branches_it_names(branch_caches):
+    client, kpis, analytics, fill, cached = branch_caches
+    fill()
+    client.table('walkin_table').insert([{'id': 2, 'branch': 'North'}, {'id': 3, 'branch': 'South'}]).execute()
+    assert cached(kpis) == cached(analytics) == ['East']
+    # Writes to other tables leave the caches alone
+    client.table('lead_master').insert({'id': 1, 'branch': 'East'}).execute()
+    assert cached(kpis) == ['East']
+
+
+@pytest.mark.parametrize('write', [
+    lambda table: table.insert({'id': 2}),
+    lambda table: table.insert([{'id': 2, 'branch': 'North'}, {'id': 3}]),
+    lambda table: table.update({'branch': 'South'}).eq('id', 1),
+    lambda table: table.upsert({'id': 1, 'branch': 'North'}),
+    lambda table: table.delete().eq('id', 1),
+])
+def test_other_writes_drop_every_branch(branch_caches, write):
+    client, kpis, analytics, fill, cached = branch_caches
+    fill()
+    write(client.table('walkin_table')).execute()
+    assert cached(kpis) == cached(analytics) == []
+
+
+def test_branches_are_dropped_only_after_the_write_executes(branch_caches):
+    client, kpis, analytics, fill, cached = branch_caches
+    fill()
+    query = client.table('walkin_table').update({'branch': 'South'}).eq('id', 1)
+    # Built but not executed: a refill now would still see the old rows
+    assert cached(kpis) == ['East', 'North', 'South']
+    query.execute()
+    assert cached(kpis) == []
+
+    fill()
+    with pytest.raises(RuntimeError):
+        client.table('walkin_table').insert({'id': 4, 'branch': 'Closed'}).execute()
+    assert cached(kpis) == cached(analytics) == ['East', 'North', 'South']
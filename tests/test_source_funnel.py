@@ -0,0 +1,243 @@
+"""
+build_source_funnel against the per-lead loop of the old source_analysis_data
+route: the same leads and follow-ups as rows for the old code and as snapshot
+frames (with the latest follow-up per lead, as the route selects it) for the
+new one.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from lead_snapshot import create_lead_snapshots
+from source_funnel import CALL_ORDINALS, DEFAULT_SOURCES, FUNNEL_METRICS, build_source_funnel, match_source
+
+LEAD_SOURCES = ['Google (KNOW)', 'google', 'GOOGLE ADS', 'Meta(KNOW)', 'Meta', 'META FB', 'Know', 'OEM Web',
+                'OEM Tele', 'Affiliate Bikewale', 'Affiliate 91wheels', 'affiliate bikedekho', 'BTL (KNOW)',
+                ' Meta ', 'Walk-in', 'Referral']
+LEAD_STATUSES = [None, 'Interested', 'interested ', 'Call Back', 'RNR', 'Call Disconnected', 'Pending',
+                 'Lost to Competition', 'Not Interested', 'Did Not Enquire', 'Wrong Lead', 'RNR-Lost',
+                 'Finance Rejected', 'Lost to Co-Dealer']
+CALL_STATUSES = ['', '', 'RNR', 'Busy', 'busy on another call', 'Connected', 'Interested']
+
+
+def legacy_source_funnel(leads, latest_followups, sources):
+    """The removed source_analysis_data loop; ``latest_followups`` maps lead uid -> latest follow-up row"""
+    data = {}
+    for source in sources:
+        data[source] = {metric: 0 for metric in FUNNEL_METRICS}
+        data[source]['call_progress'] = {}
+        data[source]['latest_remark'] = ''
+
+    def get_source(lead):
+        s = lead.get('source', '').strip()
+        for src in sources:
+            if s.lower() == src.lower():
+                return src
+        for src in sources:
+            if src.lower() in s.lower():
+                return src
+        return None
+
+    for lead in leads:
+        src = get_source(lead)
+        if not src:
+            continue
+        data[src]['calls_allocated'] += 1
+        attempted = any(lead.get(f'{c}_call_date') for c in CALL_ORDINALS)
+        if attempted:
+            data[src]['calls_attempted'] += 1
+        call_statuses = [lead.get(f'{c}_call_status', '').lower() for c in CALL_ORDINALS]
+        connected = any(s and s not in ['rnr', 'busy', 'busy on another call'] for s in call_statuses)
+        if connected:
+            data[src]['calls_connected'] += 1
+        status = (lead.get('lead_status') or '').strip().lower()
+        if status in ['interested', 'call back', 'rnr', 'call disconnected']:
+            data[src]['pending_total'] += 1
+            if status == 'interested':
+                data[src]['pending_interested'] += 1
+                cat = (lead.get('lead_category') or '').strip().lower()
+                if cat == 'hot':
+                    data[src]['pending_hot'] += 1
+                elif cat == 'warm':
+                    data[src]['pending_warm'] += 1
+                elif cat == 'cold':
+                    data[src]['pending_cold'] += 1
+            elif status == 'call back':
+                data[src]['pending_callback'] += 1
+            elif status == 'rnr':
+                data[src]['pending_rnr'] += 1
+            elif status == 'call disconnected':
+                data[src]['pending_disconnected'] += 1
+        uid = lead.get('uid')
+        latest_final_status = (lead.get('final_status') or '').strip().lower()
+        latest_lead_status = (lead.get('lead_status') or '').strip().lower()
+        if uid:
+            latest_fu = latest_followups.get(uid)
+            if latest_fu:
+                if latest_fu.get('final_status'):
+                    latest_final_status = latest_fu.get('final_status').strip().lower()
+                if latest_fu.get('lead_status'):
+                    latest_lead_status = latest_fu.get('lead_status').strip().lower()
+        if latest_final_status == 'lost':
+            data[src]['closed_lost_total'] += 1
+            if latest_lead_status == 'rnr-lost':
+                data[src]['closed_lost_rnr_lost'] += 1
+            elif latest_lead_status == 'did not enquire':
+                data[src]['closed_lost_did_not_enquire'] += 1
+            elif latest_lead_status == 'not interested':
+                data[src]['closed_lost_not_interested'] += 1
+            elif latest_lead_status == 'lost to competition':
+                data[src]['closed_lost_competition'] += 1
+            elif latest_lead_status == 'lost to co-dealer':
+                data[src]['closed_lost_co_dealer'] += 1
+            elif latest_lead_status == 'finance rejected':
+                data[src]['closed_lost_finance_reject'] += 1
+            elif latest_lead_status == 'wrong lead':
+                data[src]['closed_lost_wrong_lead'] += 1
+        if latest_final_status == 'won':
+            data[src]['sales_pipeline_total'] += 1
+        call_progress = None
+        for c in reversed(CALL_ORDINALS):
+            if lead.get(f'{c}_call_date'):
+                call_progress = c.capitalize()
+                break
+        if call_progress:
+            data[src]['call_progress'][lead.get('uid')] = call_progress
+        if uid and uid in latest_followups:
+            data[src]['latest_remark'] = latest_followups[uid].get('remark', '')
+    total_row = {k: sum(data[src][k] for src in sources) if isinstance(data[sources[0]][k], int) else {}
+                 for k in data[sources[0]].keys()}
+    data['Total'] = total_row
+    return data
+
+
+START = datetime(2025, 3, 1, 9, 0)
+
+
+def random_book(seed, leads=600, with_call_status=False):
+    rng = random.Random(seed)
+    lead_rows = []
+    for i in range(1, leads + 1):
+        created_at = (START + timedelta(minutes=7 * i)).isoformat() + '+00:00'
+        lead = {
+            'id': i, 'uid': f'L{i}', 'created_at': created_at, 'updated_at': created_at,
+            'source': rng.choice(LEAD_SOURCES), 'lead_status': rng.choice(LEAD_STATUSES),
+            'lead_category': rng.choice([None, 'Hot', 'warm', ' Cold ', 'Not Set']),
+            'final_status': rng.choice([None, 'Pending', 'Won', 'Lost', ' lost ']),
+        }
+        calls = rng.randint(0, 7)
+        for n, ordinal in enumerate(CALL_ORDINALS):
+            # Mostly consecutive calls, sometimes with a gap
+            made = n < calls and rng.random() < 0.9
+            lead[f'{ordinal}_call_date'] = (START + timedelta(days=n)).date().isoformat() if made else None
+            if with_call_status:
+                lead[f'{ordinal}_call_status'] = rng.choice(CALL_STATUSES) if made else ''
+        lead_rows.append(lead)
+
+    followups = []
+    for i in range(1, 2 * leads // 3):
+        created_at = (START + timedelta(minutes=3 * i)).isoformat() + '+00:00'
+        followups.append({
+            'id': i, 'lead_uid': f'L{rng.randint(1, leads + 20)}', 'created_at': created_at,
+            'updated_at': created_at, 'final_status': rng.choice([None, '', 'Pending', 'Won', 'Lost']),
+            'lead_status': rng.choice(LEAD_STATUSES + [None, '']),
+            'remark': rng.choice([None, 'Visited showroom', 'Asked for a callback', f'Remark {i}']),
+        })
+    rng.shuffle(followups)
+    return lead_rows, followups
+
+
+def frames(lead_rows, followups, with_call_status=False):
+    snapshots = create_lead_snapshots()
+    lead_frame = snapshots['lead_master']._to_frame(lead_rows)
+    if with_call_status:
+        for ordinal in CALL_ORDINALS:
+            lead_frame[f'{ordinal}_call_status'] = [lead[f'{ordinal}_call_status'] for lead in lead_rows]
+    followup_frame = snapshots['ps_followup_master']._to_frame(followups)
+    # The route's selection of the latest follow-up per lead
+    latest = (followup_frame[followup_frame['lead_uid'].notna()]
+              .sort_values('created_at', na_position='first', kind='stable')
+              .drop_duplicates('lead_uid', keep='last'))
+    return lead_frame, latest
+
+
+def latest_by_uid(followups):
+    latest = {}
+    for followup in sorted(followups, key=lambda row: row['created_at']):
+        latest[followup['lead_uid']] = followup
+    return latest
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('with_call_status', [False, True])
+def test_funnel_matches_the_per_lead_loop(seed, with_call_status):
+    lead_rows, followups = random_book(seed, with_call_status=with_call_status)
+    expected = legacy_source_funnel(lead_rows, latest_by_uid(followups), list(DEFAULT_SOURCES))
+    actual = build_source_funnel(*frames(lead_rows, followups, with_call_status))
+    assert actual == expected
+
+
+def test_funnel_for_a_requested_source_list():
+    lead_rows, followups = random_book(9)
+    sources = ['Meta', 'Google', 'Referral']
+    expected = legacy_source_funnel(lead_rows, latest_by_uid(followups), sources)
+    assert build_source_funnel(*frames(lead_rows, followups), sources=sources) == expected
+
+
+def test_leads_without_a_source_are_skipped():
+    lead_rows, followups = random_book(5, leads=200)
+    with_source = [lead for lead in lead_rows if lead['id'] % 4]
+    for lead in lead_rows:
+        if not lead['id'] % 4:
+            lead['source'] = None
+    expected = legacy_source_funnel(with_source, latest_by_uid(followups), list(DEFAULT_SOURCES))
+    assert build_source_funnel(*frames(lead_rows, followups)) == expected
+
+
+def test_exact_source_names_win_over_substrings():
+    assert match_source('Google (KNOW)', DEFAULT_SOURCES) == DEFAULT_SOURCES.index('Google (KNOW)')
+    assert match_source(' meta ', DEFAULT_SOURCES) == DEFAULT_SOURCES.index('Meta')
+    assert match_source('Meta Lead Ads', DEFAULT_SOURCES) == DEFAULT_SOURCES.index('Meta')
+    assert match_source(None, DEFAULT_SOURCES) == -1
+
+
+def test_hand_counted_example():
+    def lead(i, source, lead_status=None, final_status=None, category=None, calls=0, statuses=()):
+        row = {'id': i, 'uid': f'L{i}', 'created_at': '2025-03-01T00:00:00+00:00', 'updated_at': None,
+               'source': source, 'lead_status': lead_status, 'final_status': final_status, 'lead_category': category}
+        for n, ordinal in enumerate(CALL_ORDINALS):
+            row[f'{ordinal}_call_date'] = f'2025-03-0{n + 1}' if n < calls else None
+            row[f'{ordinal}_call_status'] = statuses[n] if n < len(statuses) else ''
+        return row
+
+    lead_rows = [
+        lead(1, 'Meta', 'Interested', 'Pending', 'Hot', calls=2, statuses=('RNR', 'Connected')),
+        lead(2, 'META Lead Ads', 'RNR', 'Pending', calls=1, statuses=('Busy',)),
+        lead(3, 'Meta', 'Call Back', 'Lost'),
+        lead(4, 'Google', 'Not Interested', 'Pending', calls=3),
+        lead(5, 'Walk-in', 'Interested', 'Won'),
+    ]
+    followups = [
+        {'id': 1, 'lead_uid': 'L4', 'created_at': '2025-03-02T00:00:00+00:00', 'updated_at': None,
+         'final_status': 'Won', 'lead_status': None, 'remark': 'first'},
+        {'id': 2, 'lead_uid': 'L4', 'created_at': '2025-03-03T00:00:00+00:00', 'updated_at': None,
+         'final_status': 'Lost', 'lead_status': 'Wrong Lead', 'remark': 'latest'},
+    ]
+    data = build_source_funnel(*frames(lead_rows, followups, with_call_status=True), sources=['Meta', 'Google'])
+
+    meta, google = data['Meta'], data['Google']
+    assert (meta['calls_allocated'], meta['calls_attempted'], meta['calls_connected']) == (3, 2, 1)
+    assert (meta['pending_total'], meta['pending_interested'], meta['pending_hot'], meta['pending_rnr'],
+            meta['pending_callback']) == (3, 1, 1, 1, 1)
+    assert meta['closed_lost_total'] == 1 and meta['sales_pipeline_total'] == 0
+    assert meta['call_progress'] == {'L1': 'Second', 'L2': 'First'}
+    assert meta['latest_remark'] == ''
+    # The latest follow-up decides the closure and its reason
+    assert (google['closed_lost_total'], google['closed_lost_wrong_lead'], google['sales_pipeline_total']) == (1, 1, 0)
+    assert google['pending_total'] == 0
+    assert google['call_progress'] == {'L4': 'Third'} and google['latest_remark'] == 'latest'
+    # Walk-in matches neither source
+    assert data['Total']['calls_allocated'] == 4
+    assert data['Total']['call_progress'] == {} and data['Total']['latest_remark'] == {}
@@ -0,0 +1,94 @@
+"""
+UIDs from leased sequence blocks against the per-lead generate_uid they
+replaced: same shape, never one of the old values, and never repeated.
+"""
+
+import re
+import threading
+
+import pytest
+
+from fake_supabase import FakeSupabase
+from uid_allocator import APP_SOURCE_CODES, UID_BLOCK_SIZE, UIDAllocator, format_uid
+
+UID_SHAPE = re.compile(r'^[A-Z]{1,2}[A-Z]-\d{4}-\d{4,}$')
+# lead_uid_seq starts here (database_optimization.sql)
+SEQUENCE_START = 10000
+
+
+def legacy_generate_uid(source, mobile_number, sequence):
+    """generate_uid as it was in app.py"""
+    source_map = {
+        'Google': 'G', 'Meta': 'M', 'Affiliate': 'A', 'Know': 'K', 'Whatsapp': 'W', 'Tele': 'T',
+        'Activity': 'AC', 'Walk-in': 'W', 'Walkin': 'W',
+    }
+    source_char = source_map.get(source, 'X')
+    sequence_char = chr(65 + (sequence % 26))
+    mobile_str = str(mobile_number).replace(' ', '').replace('-', '')
+    mobile_last4 = mobile_str[-4:] if len(mobile_str) >= 4 else mobile_str.zfill(4)
+    seq_num = f"{(sequence % 9999) + 1:04d}"
+    return f"{source_char}{sequence_char}-{mobile_last4}-{seq_num}"
+
+
+def test_new_uids_keep_the_old_shape_but_never_an_old_value():
+    mobiles = ['98765 43210', '98765-43210', '123', '9876543210']
+    old = {legacy_generate_uid(source, mobile, sequence)
+           for source in APP_SOURCE_CODES for mobile in mobiles for sequence in range(1, 10000)}
+    for source, code in APP_SOURCE_CODES.items():
+        for mobile in mobiles:
+            for sequence in (SEQUENCE_START, SEQUENCE_START + 1, SEQUENCE_START + 25, 123456):
+                uid = format_uid(code, mobile, sequence)
+                assert UID_SHAPE.match(uid)
+                assert uid.split('-')[:2] == legacy_generate_uid(source, mobile, sequence).split('-')[:2]
+                assert uid not in old
+
+
+def test_allocations_are_unique_across_threads_and_allocators():
+    client = FakeSupabase({})
+    client.next_block = SEQUENCE_START
+    shared = UIDAllocator(client)
+    taken = []
+    lock = threading.Lock()
+
+    def worker():
+        for count in (1, 7, UID_BLOCK_SIZE + 3, 1):
+            numbers = shared.allocate(count)
+            assert len(numbers) == count
+            with lock:
+                taken.extend(numbers)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A second process leases its own blocks from the same sequence
+    taken.extend(UIDAllocator(client).allocate(250))
+
+    assert len(taken) == len(set(taken)) == 8 * (UID_BLOCK_SIZE + 12) + 250
+    assert min(taken) >= SEQUENCE_START
+
+
+def test_only_missing_blocks_are_leased():
+    client = FakeSupabase({})
+    allocator = UIDAllocator(client)
+    allocator.allocate(1)
+    allocator.allocate(UID_BLOCK_SIZE - 1)
+    assert client.next_block == UID_BLOCK_SIZE
+    allocator.allocate(2 * UID_BLOCK_SIZE + 1)
+    assert client.next_block == 4 * UID_BLOCK_SIZE
+
+
+def test_format_uid_examples():
+    assert format_uid('G', '98765 43210', 10020) == 'GK-3210-10020'
+    assert format_uid('AC', '98-76', 10000) == 'ACQ-9876-10000'
+    assert format_uid('W', '12', 7) == 'WH-0012-0007'
+
+
+def test_a_failed_lease_names_the_missing_function():
+    class NoRPC(FakeSupabase):
+        def rpc(self, name, params):
+            raise RuntimeError('function lease_uid_blocks does not exist')
+
+    with pytest.raises(RuntimeError, match='database_optimization.sql'):
+        UIDAllocator(NoRPC({})).next()
@@ -0,0 +1,92 @@
+"""
+UID Allocator for Ather CRM System
+This module hands out the sequence numbers used in lead UIDs. Numbers are
+leased from the ``lead_uid_seq`` database sequence in blocks: one call to the
+``lease_uid_blocks`` function reserves ``UID_BLOCK_SIZE`` numbers per block,
+atomically and without reading any table, and the numbers are then handed out
+from memory. Every number is given out at most once across all processes, so
+UIDs never collide and no lookup or retry is needed. Numbers left in a block
+when a process exits are skipped (UIDs are unique, not gap-free).
+
+The sequence starts at 10000, above every sequence the old generators could
+produce (they wrapped at 9999), so new UIDs cannot clash with existing ones.
+"""
+
+import threading
+from collections import deque
+from typing import List
+
+# Numbers per leased block; must match INCREMENT BY of lead_uid_seq
+UID_BLOCK_SIZE = 100
+
+# Source -> UID prefix used by the web app
+APP_SOURCE_CODES = {
+    'Google': 'G',
+    'Meta': 'M',
+    'Affiliate': 'A',
+    'Know': 'K',
+    'Whatsapp': 'W',
+    'Tele': 'T',
+    'Activity': 'AC',
+    'Walk-in': 'W',
+    'Walkin': 'W',
+}
+
+
+def format_uid(source_char: str, mobile_number, sequence: int) -> str:
+    """
+    UID in the usual ``{source}{letter}-{last 4 digits}-{sequence}`` shape,
+    e.g. ``GK-3210-10020``. The sequence is printed in full (at least four
+    digits), so distinct sequence numbers always give distinct UIDs.
+    """
+    sequence_char = chr(65 + (sequence % 26))  # A=65 in ASCII
+    mobile_last4 = str(mobile_number).replace(' ', '').replace('-', '')[-4:].zfill(4)
+    return f"{source_char}{sequence_char}-{mobile_last4}-{sequence:04d}"
+
+
+class UIDAllocator:
+    """Thread-safe pool of UID sequence numbers leased in blocks from the database"""
+
+    def __init__(self, supabase_client, block_size: int = UID_BLOCK_SIZE):
+        self.supabase = supabase_client
+        self.block_size = block_size
+        self._pool = deque()
+        self._lock = threading.Lock()
+
+    def _lease(self, blocks: int) -> None:
+        """Reserve ``blocks`` blocks in one round trip and add their numbers to the pool (lock held)"""
+        try:
+            result = self.supabase.rpc('lease_uid_blocks', {'p_blocks': blocks}).execute()
+        except Exception as e:
+            raise RuntimeError(
+                f"Could not lease UID blocks ({e}); is lease_uid_blocks from database_optimization.sql installed?"
+            ) from e
+        starts = result.data if isinstance(result.data, list) else [result.data]
+        if len(starts) != blocks:
+            raise RuntimeError(f"lease_uid_blocks returned {len(starts)} blocks, expected {blocks}")
+        for start in starts:
+            self._pool.extend(range(int(start), int(start) + self.block_size))
+
+    def allocate(self, count: int) -> List[int]:
+        """``count`` unique sequence numbers, leasing only as many blocks as are missing"""
+        with self._lock:
+            missing = count - len(self._pool)
+            if missing > 0:
+                self._lease(-(-missing // self.block_size))
+            return [self._pool.popleft() for _ in range(count)]
+
+    def next(self) -> int:
+        return self.allocate(1)[0]
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_uid_allocator(supabase_client) -> UIDAllocator:
+    """The allocator shared by everything in this process that uses ``supabase_client``"""
+    with _allocators_lock:
+        allocator = _allocators.get(id(supabase_client))
+        if allocator is None or allocator.supabase is not supabase_client:
+            allocator = _allocators[id(supabase_client)] = UIDAllocator(supabase_client)
+        return allocator